@@ -19,7 +19,7 @@ configurations. See main.py.
 """
 
 import os
-from typing import List
+from typing import List, Tuple
 import dataclasses
 
 from google.cloud import logging
@@ -78,6 +78,13 @@ class ExecutorConfig:
     # to the Identity-Aware Proxy of the Google Cloud project that hosts
     # the dashboard and clicking 'Edit OAuth Client'.
     dashboard_oauth_client_id: str = ''
+    # Maximum number of progress logs to post to the import progress dashboard
+    # in one request. Progress logs are posted asynchronously in batches.
+    # If 0, each progress log is posted synchronously on its own.
+    dashboard_log_batch_size: int = 0
+    # Maximum time in seconds a progress log waits to be posted to the import
+    # progress dashboard if dashboard_log_batch_size is not 0.
+    dashboard_log_flush_interval: float = 2
     # Oauth Client ID used to authenticate with the proxy.
     importer_oauth_client_id: str = ''
     # Access token of the account used to authenticate with GitHub. This is not
@@ -103,12 +110,84 @@ class ExecutorConfig:
     scheduler_location: str = 'us-central1'
     # Maximum time a user script can run for in seconds.
     user_script_timeout: float = 600
+    # Minimum time in seconds between two progress logs with the output of a
+    # running user script. The output is posted to the import progress
+    # dashboard as it is produced.
+    user_script_log_interval: float = 10
+    # Number of characters at the end of the stdout and stderr of a user
+    # script to include in the progress log posted when the script exits.
+    user_script_output_max_size: int = 64 * 1024
     # Maximum time venv creation can take in seconds.
     venv_create_timeout: float = 600
+    # Directory to cache Python virtual environments in. Imports with the
+    # same requirement files share a cached environment. If empty, a new
+    # environment is created for every import.
+    venv_cache_dir: str = ''
+    # Maximum total size in bytes of the cached virtual environments. Least
+    # recently used environments are evicted when it is exceeded.
+    venv_cache_max_size: int = 10 * 1024**3
     # Maximum time downloading a file can take in seconds.
     file_download_timeout: float = 600
+    # Maximum number of files listed in data_download_url of an import to
+    # download concurrently.
+    file_download_max_workers: int = 4
+    # Files of at least twice this size in bytes are split into segments of
+    # at least this size that are downloaded in parallel, if the host
+    # supports range requests.
+    file_download_segment_size: int = 64 * 1024**2
+    # Maximum number of segments of a file to download in parallel.
+    file_download_max_segments: int = 8
+    # Directory to cache the latest version of each file listed in
+    # data_download_url in. Cached files are only downloaded again if the
+    # host reports that they have changed, and scheduled updates of imports
+    # whose code and downloaded files are unchanged since they last succeeded
+    # are skipped. If empty, files are downloaded on every run.
+    source_cache_dir: str = ''
+    # Whether updates skip imports whose code and downloaded files are
+    # unchanged since they last succeeded. Only used if source_cache_dir is
+    # set.
+    skip_unchanged_imports: bool = True
+    # Whether updates also skip imports without data_download_url whose code
+    # is unchanged since they last succeeded. Their scripts may download
+    # their inputs themselves, so this is only set by the local executor
+    # when iterating on imports in a local checkout.
+    skip_unchanged_without_downloads: bool = False
+    # Maximum number of generated files of an import to upload concurrently.
+    upload_max_workers: int = 4
+    # Files of at least this size in bytes are uploaded to Cloud Storage in
+    # chunks of this size, so that a failed upload is resumed from the last
+    # chunk uploaded. Must be a multiple of 256 KiB.
+    upload_chunk_size: int = 32 * 1024**2
+    # Whether to store the generated files of each import in a
+    # content-addressed store under <output_dir>/blobs/ so that files
+    # identical to those of an earlier version are not uploaded again. Each
+    # version then also gets a manifest.json recording the SHA-256 of its
+    # files. The files of each version are still copied from the blobs, so
+    # this uses up to twice the storage, and blobs/ is never pruned. See
+    # "Deduplicating Outputs" in README.md before enabling it for a bucket.
+    output_dedup: bool = False
     # Maximum time downloading the repo can take in seconds.
     repo_download_timeout: float = 600
+    # Directory to cache downloaded snapshots of the repository in, keyed by
+    # commit SHA. If empty, the repository is downloaded for every run.
+    repo_cache_dir: str = ''
+    # Whether to only extract the directory of the import, the paths in
+    # repo_common_paths, and the paths listed in the repo_dependencies field
+    # of the manifest from the repository on updates. If False, the whole
+    # repository is extracted.
+    repo_sparse_extraction: bool = False
+    # Paths relative to the root directory of the repository that are always
+    # extracted when repo_sparse_extraction is set.
+    repo_common_paths: Tuple[str, ...] = ('util', 'requirements.txt')
+    # Path to the SQLite database of the queue of requests to the executor
+    # endpoints. If empty, <system temporary directory>/executor_jobs.sqlite
+    # is used. The queue is local to the host, so all requests must be
+    # served by the same instance (see "Request Queue" in README.md). This
+    # cannot be overridden by the configs field of a request.
+    job_queue_path: str = ''
+    # Number of queued requests to the executor endpoints to run at the same
+    # time. This cannot be overridden by the configs field of a request.
+    job_queue_workers: int = 2
     # Email account used to send notification emails about import progress
     email_account: str = ''
     # The corresponding password, app password, or access token.
@@ -119,6 +198,69 @@ class ExecutorConfig:
     # Maximum time a blocking call to the importer to
     # delete an import can take in seconds.
     importer_delete_timeout: float = 10 * 60
+    # Maximum number of imports a system run executes concurrently.
+    # 1 executes the imports one after another.
+    import_max_workers: int = 1
+    # Whether to stop starting new imports of a system run once one of them
+    # fails. If False, all imports are run to completion and their failures
+    # are reported together.
+    import_fail_fast: bool = True
+    # Total number of CPUs the user scripts of concurrently executing
+    # imports can reserve. The user scripts of an import wait until the
+    # resources they are expected to use are available (see
+    # app/executor/admission.py). If 0, the number of CPUs of the host is
+    # used.
+    admission_cpu_budget: float = 0
+    # Total memory in MiB the user scripts of concurrently executing imports
+    # can reserve. If 0, 90% of the memory of the host is used.
+    admission_memory_budget_mb: int = 0
+    # Number of CPUs reserved for the user scripts of an import that has no
+    # usage history and does not declare them in the 'resources' field of
+    # its import specification.
+    import_default_cpus: float = 1
+    # Memory in MiB reserved for the user scripts of an import that has no
+    # usage history and does not declare it in the 'resources' field of its
+    # import specification.
+    import_default_memory_mb: int = 1024
+    # Fraction added to the largest usage among the latest runs of an import
+    # to estimate the resources its next run reserves.
+    resource_estimate_headroom: float = 0.2
+    # Directory to keep the resource usage of the latest runs of each import
+    # in. If empty, the usage is only kept in memory by the process.
+    resource_history_dir: str = ''
+    # User scripts are limited to this multiple of the resources reserved
+    # for them, or of the resources declared in the import specification if
+    # larger, but never to less than the declared resources. If 0, user
+    # scripts are not limited. Reservations estimated from the history of an
+    # import do not account for its data growing, so this is off by default.
+    user_script_limit_factor: float = 0
+    # Path to a cgroup v2 directory delegated to the executor. If set, each
+    # user script runs in a child cgroup limiting the memory and CPUs of its
+    # whole process tree. Otherwise, only the memory of each process is
+    # limited, with RLIMIT_DATA.
+    user_script_cgroup_root: str = ''
+    # Whether to start user scripts by forking them from a zygote, a server
+    # process for each cached virtual environment that has the modules in
+    # user_script_preload_modules imported, instead of starting a new
+    # interpreter for each script (see app/executor/zygote.py). Only used if
+    # venv_cache_dir is set.
+    user_script_zygote: bool = False
+    # Modules the zygotes import before forking user scripts. Modules not
+    # installed in a virtual environment are skipped.
+    user_script_preload_modules: Tuple[str, ...] = ('numpy', 'pandas',
+                                                    'absl.app', 'absl.flags',
+                                                    'requests')
+    # Time in seconds after which a zygote that has not forked a user script
+    # exits. It is started again when needed.
+    user_script_zygote_idle_timeout: float = 600
+    # Path to a JSON-lines file to append the tracing spans of each system
+    # run to (see app/executor/tracing.py and view_traces.py). Spans are not
+    # written to a file if empty.
+    trace_file: str = ''
+    # URL of an OpenTelemetry collector's OTLP/HTTP traces endpoint to post
+    # the tracing spans to, e.g., http://localhost:4318/v1/traces. Spans are
+    # not posted if empty.
+    trace_collector_url: str = ''
 
 
 def _setup_logging():
@@ -0,0 +1,451 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Admission control of the user scripts of concurrent imports.
+
+Before running its user scripts, an import reserves the CPUs and memory it is
+expected to use from an AdmissionController holding the budget of the host,
+waiting in line until they are available. The expected usage is estimated
+from the usage of the latest runs of the import recorded in a UsageHistory,
+falling back to the 'resources' field of the import specification, e.g.,
+
+    "resources": {"cpus": 2, "memory_mb": 4096}
+
+and then to defaults. If user_script_limit_factor is set, the scripts run
+under ProcessLimits derived from the reservation so that an import using
+much more than expected fails on its own instead of exhausting the memory of
+the host.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import resource
+import threading
+import collections
+import dataclasses
+from typing import Dict, List, Optional
+
+from app import utils
+from app.executor import resource_usage
+from app.executor import tracing
+
+# Smallest reservation estimated from the usage history
+_MIN_CPUS = 0.1
+_MIN_MEMORY = 64 * 1024**2
+# Smallest memory limit of a user script in bytes
+_MIN_MEMORY_LIMIT = 256 * 1024**2
+# Period in microseconds of the CPU quota of a cgroup
+_CPU_PERIOD = 100000
+# Fraction of the memory of the host available to user scripts by default
+_HOST_MEMORY_FRACTION = 0.9
+_CGROUP_MEMORY_MAX = '/sys/fs/cgroup/memory.max'
+
+
+@dataclasses.dataclass
+class ResourceRequest:
+    """CPUs and memory used or reserved by the user scripts of an import.
+
+    Attributes:
+        cpus: Number of CPUs as a float.
+        memory: Memory in bytes as an int.
+    """
+    cpus: float
+    memory: int
+
+
+def get_declared_resources(import_spec: Dict) -> Dict:
+    """Returns the 'resources' field of an import specification, or an empty
+    dict if it has none."""
+    return import_spec.get('resources') or {}
+
+
+def estimate_request(import_spec: Dict,
+                     history_estimate: Optional[ResourceRequest],
+                     default: ResourceRequest) -> ResourceRequest:
+    """Estimates the resources used by the user scripts of an import.
+
+    Args:
+        import_spec: Specification of the import as a dict.
+        history_estimate: ResourceRequest estimated from the usage history of
+            the import, or None if there is no history.
+        default: ResourceRequest to use for the resources neither the
+            history nor the import specification gives.
+
+    Returns:
+        ResourceRequest object.
+    """
+    if history_estimate:
+        return history_estimate
+    declared = get_declared_resources(import_spec)
+    cpus = declared.get('cpus', default.cpus)
+    memory = default.memory
+    if 'memory_mb' in declared:
+        memory = int(declared['memory_mb'] * 1024**2)
+    return ResourceRequest(cpus=float(cpus), memory=memory)
+
+
+def get_observed_usage(
+        usage: resource_usage.StageUsage) -> Optional[ResourceRequest]:
+    """Returns the resources the user scripts used in a stage, or None if
+    their memory was not measured.
+
+    The CPUs used are the CPU time of the scripts over the wall time of the
+    stage, and the memory is their peak resident set size.
+    """
+    if not usage.child_peak_rss:
+        return None
+    cpus = usage.child_cpu_time / usage.wall_time if usage.wall_time else 0
+    return ResourceRequest(cpus=cpus, memory=usage.child_peak_rss)
+
+
+def get_host_budget() -> ResourceRequest:
+    """Returns the resources of the host available to user scripts by
+    default: all CPUs the executor may run on, and 90% of the physical
+    memory or of the memory limit of the cgroup of the executor, whichever
+    is smaller."""
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    try:
+        with open(_CGROUP_MEMORY_MAX) as file:
+            limit = file.read().strip()
+        if limit.isdigit():
+            memory = min(memory, int(limit))
+    except OSError:
+        pass
+    return ResourceRequest(cpus=float(cpus),
+                           memory=int(memory * _HOST_MEMORY_FRACTION))
+
+
+class UsageHistory:
+    """Resources used by the user scripts of the latest runs of each import.
+
+    The usage of an import is kept in <history_dir>/<key>.json, where <key>
+    is a hash of its absolute import name, or only in memory if history_dir
+    is empty.
+
+    Attributes:
+        history_dir: Path to the directory storing the usage, as a string.
+        max_samples: Number of latest runs to keep the usage of for each
+            import, as an int.
+    """
+
+    def __init__(self, history_dir: str = '', max_samples: int = 5):
+        self.history_dir = os.path.abspath(history_dir) if history_dir else ''
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples = {}
+        if self.history_dir:
+            os.makedirs(self.history_dir, exist_ok=True)
+
+    def get(self, absolute_import_name: str) -> List[ResourceRequest]:
+        """Returns the usage of the latest runs of an import, oldest first."""
+        with self._lock:
+            return list(self._load(absolute_import_name))
+
+    def record(self, absolute_import_name: str, usage: ResourceRequest) -> None:
+        """Records the usage of a run of an import, forgetting the oldest
+        run if there are more than max_samples."""
+        with self._lock:
+            samples = self._load(absolute_import_name) + [usage]
+            samples = samples[-self.max_samples:]
+            self._samples[absolute_import_name] = samples
+            if self.history_dir:
+                utils.write_json_atomically(
+                    self._path(absolute_import_name), {
+                        'absolute_import_name':
+                            absolute_import_name,
+                        'samples':
+                            [dataclasses.asdict(sample) for sample in samples]
+                    })
+
+    def estimate(self, absolute_import_name: str,
+                 headroom: float) -> Optional[ResourceRequest]:
+        """Estimates the resources the next run of an import will use.
+
+        Args:
+            absolute_import_name: Absolute import name of the import as a
+                string.
+            headroom: Fraction to add to the largest usage among the latest
+                runs, as a float.
+
+        Returns:
+            ResourceRequest object, or None if no run was recorded.
+        """
+        samples = self.get(absolute_import_name)
+        if not samples:
+            return None
+        factor = 1 + headroom
+        return ResourceRequest(
+            cpus=max(_MIN_CPUS,
+                     max(sample.cpus for sample in samples) * factor),
+            memory=max(_MIN_MEMORY,
+                       int(max(sample.memory for sample in samples) * factor)))
+
+    def _load(self, absolute_import_name: str) -> List[ResourceRequest]:
+        """Returns the samples of an import. Must be called with the lock
+        held."""
+        if absolute_import_name in self._samples or not self.history_dir:
+            return self._samples.get(absolute_import_name, [])
+        samples = []
+        try:
+            with open(self._path(absolute_import_name)) as file:
+                samples = [
+                    ResourceRequest(**sample)
+                    for sample in json.load(file)['samples']
+                ]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError):
+            logging.warning(
+                'UsageHistory._load: Ignoring corrupt history of '
+                '%s', absolute_import_name)
+        self._samples[absolute_import_name] = samples
+        return samples
+
+    def _path(self, absolute_import_name: str) -> str:
+        key = hashlib.sha256(absolute_import_name.encode('utf-8')).hexdigest()
+        return os.path.join(self.history_dir, key + '.json')
+
+
+class AdmissionController:
+    """Admits the user scripts of imports to run when the resources they
+    reserve fit in the budget of the host.
+
+    Imports are admitted in the order they ask, so a large import is not
+    starved by smaller ones behind it. A reservation larger than the budget
+    is reduced to the budget, so that the import can run on its own.
+
+    Attributes:
+        budget: ResourceRequest object with the total resources that can be
+            reserved at the same time.
+        history: UsageHistory object with the usage of the latest runs of
+            the imports.
+        in_use: ResourceRequest object with the resources currently
+            reserved.
+    """
+
+    def __init__(self, budget: ResourceRequest, history: UsageHistory = None):
+        self.budget = budget
+        self.history = history or UsageHistory()
+        self.in_use = ResourceRequest(cpus=0, memory=0)
+        self._condition = threading.Condition()
+        self._waiting = collections.deque()
+
+    def acquire(self, absolute_import_name: str,
+                request: ResourceRequest) -> ResourceRequest:
+        """Reserves resources, blocking until they are available.
+
+        Args:
+            absolute_import_name: Absolute import name of the import
+                reserving the resources, as a string. Only used for logging.
+            request: ResourceRequest object with the resources to reserve.
+
+        Returns:
+            ResourceRequest object with the resources reserved, to be passed
+            to release.
+        """
+        granted = ResourceRequest(cpus=min(request.cpus, self.budget.cpus),
+                                  memory=min(request.memory,
+                                             self.budget.memory))
+        ticket = object()
+        with self._condition:
+            self._waiting.append(ticket)
+            try:
+                start = time.monotonic()
+                logged = False
+                while not (self._waiting[0] is ticket and self._fits(granted)):
+                    if not logged:
+                        logging.info(
+                            'AdmissionController.acquire: %s waiting for %.2f '
+                            'CPUs and %d MiB', absolute_import_name,
+                            granted.cpus, granted.memory // 1024**2)
+                        logged = True
+                    self._condition.wait()
+                self.in_use.cpus += granted.cpus
+                self.in_use.memory += granted.memory
+            finally:
+                self._waiting.remove(ticket)
+                self._condition.notify_all()
+        if logged:
+            logging.info('AdmissionController.acquire: %s admitted after %.1fs',
+                         absolute_import_name,
+                         time.monotonic() - start)
+        return granted
+
+    def release(self, granted: ResourceRequest) -> None:
+        """Returns resources reserved by acquire."""
+        with self._condition:
+            self.in_use.cpus = max(0.0, self.in_use.cpus - granted.cpus)
+            self.in_use.memory = max(0, self.in_use.memory - granted.memory)
+            self._condition.notify_all()
+
+    def _fits(self, request: ResourceRequest) -> bool:
+        # Tolerates the rounding errors of adding and subtracting floats
+        return (self.in_use.cpus + request.cpus <= self.budget.cpus + 1e-6 and
+                self.in_use.memory + request.memory <= self.budget.memory)
+
+
+class ProcessLimits:
+    """Limits on the resources of a user script.
+
+    If cgroup_root is set, the script is moved to a new cgroup under it whose
+    memory.max and cpu.max are set to the limits, which bounds the memory and
+    CPUs of the script and its descendants as a whole. Otherwise, the memory
+    is bounded with RLIMIT_DATA, which each descendant inherits separately,
+    and the CPUs are not bounded. RLIMIT_DATA is set by the spawner of the
+    script before the script starts (see get_rlimits), or, if creating the
+    cgroup fails, right after.
+
+    Attributes:
+        memory: Maximum memory in bytes as an int.
+        cpus: Maximum number of CPUs as a float. Not bounded if 0.
+        cgroup_root: Path to a cgroup v2 directory delegated to the executor,
+            as a string.
+    """
+
+    def __init__(self, memory: int, cpus: float = 0, cgroup_root: str = ''):
+        self.memory = memory
+        self.cpus = cpus
+        self.cgroup_root = cgroup_root
+
+    def get_rlimits(self) -> Dict[str, int]:
+        """Returns the resource limits to set in the process before it
+        starts, as a dict mapping names of the RLIMIT_* constants of the
+        resource module to limits."""
+        if self.cgroup_root:
+            return {}
+        return {'RLIMIT_DATA': self.memory}
+
+    def apply(self, pid: int) -> Optional[str]:
+        """Applies the limits that cannot be set before the process starts
+        to the running process.
+
+        Failures are logged and leave the process unlimited.
+
+        Returns:
+            Path to the cgroup created for the process as a string, to be
+            passed to release, or None if no cgroup was created.
+        """
+        if not self.cgroup_root:
+            return None
+        cgroup = self._create_cgroup(pid)
+        if cgroup:
+            return cgroup
+        try:
+            resource.prlimit(pid, resource.RLIMIT_DATA,
+                             (self.memory, self.memory))
+        except (OSError, ValueError) as exc:
+            logging.warning(
+                'ProcessLimits.apply: Failed to limit memory of '
+                'process %d: %s', pid, exc)
+        return None
+
+    def release(self, cgroup: Optional[str]) -> None:
+        """Removes the cgroup created by apply, killing the processes left
+        in it, and records whether the memory limit was hit in the current
+        tracing span."""
+        if not cgroup:
+            return
+        try:
+            with open(os.path.join(cgroup, 'memory.events')) as file:
+                events = dict(line.split() for line in file if line.strip())
+            oom_kills = int(events.get('oom_kill', 0))
+            if oom_kills:
+                logging.warning(
+                    'ProcessLimits.release: Process killed for exceeding '
+                    'the memory limit of %d MiB', self.memory // 1024**2)
+                span = tracing.current_span()
+                if span:
+                    span.set_attribute('oom_kills', oom_kills)
+        except (OSError, ValueError):
+            pass
+        kill_path = os.path.join(cgroup, 'cgroup.kill')
+        if os.path.exists(kill_path):
+            _write(kill_path, '1')
+        for _ in range(10):
+            try:
+                os.rmdir(cgroup)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                time.sleep(0.1)
+        logging.warning('ProcessLimits.release: Failed to remove cgroup %s',
+                        cgroup)
+
+    def _create_cgroup(self, pid: int) -> Optional[str]:
+        cgroup = os.path.join(self.cgroup_root, f'import-{pid}')
+        try:
+            os.mkdir(cgroup)
+            _write(os.path.join(cgroup, 'memory.max'), str(self.memory))
+            if os.path.exists(os.path.join(cgroup, 'memory.swap.max')):
+                _write(os.path.join(cgroup, 'memory.swap.max'), '0')
+            if self.cpus:
+                quota = max(1000, int(self.cpus * _CPU_PERIOD))
+                _write(os.path.join(cgroup, 'cpu.max'),
+                       f'{quota} {_CPU_PERIOD}')
+            _write(os.path.join(cgroup, 'cgroup.procs'), str(pid))
+            return cgroup
+        except OSError as exc:
+            logging.warning(
+                'ProcessLimits._create_cgroup: Failed to limit process %d '
+                'with cgroup %s: %s', pid, cgroup, exc)
+            try:
+                os.rmdir(cgroup)
+            except OSError:
+                pass
+            return None
+
+
+def get_limits(request: ResourceRequest,
+               declared: Dict,
+               factor: float,
+               cgroup_root: str = '') -> Optional[ProcessLimits]:
+    """Returns the limits of the user scripts of an import.
+
+    Args:
+        request: ResourceRequest object with the resources reserved for the
+            scripts.
+        declared: The 'resources' field of the import specification as a
+            dict.
+        factor: Multiple of the reservation, or of the declared resources if
+            larger, to limit the scripts to, as a float. If 0, the scripts
+            are not limited. The limits are never below the declared
+            resources.
+        cgroup_root: See ProcessLimits.
+
+    Returns:
+        ProcessLimits object, or None if the scripts are not limited.
+    """
+    if factor <= 0:
+        return None
+    declared_memory = int(declared.get('memory_mb', 0) * 1024**2)
+    declared_cpus = declared.get('cpus', 0)
+    memory = max(request.memory, declared_memory) * factor
+    cpus = max(request.cpus, declared_cpus) * factor
+    return ProcessLimits(memory=max(_MIN_MEMORY_LIMIT, declared_memory,
+                                    int(memory)),
+                         cpus=max(cpus, declared_cpus),
+                         cgroup_root=cgroup_root)
+
+
+def _write(path: str, content: str) -> None:
+    with open(path, 'w') as file:
+        file.write(content)
@@ -0,0 +1,643 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Offline end-to-end benchmark of the import executor.
+
+The benchmark generates a synthetic repository with a number of manifests,
+each specifying a number of imports. Every import downloads a source file of
+a configurable size, runs a user script that converts it into a CSV and a
+template MCF, and imports them. The executor runs the imports of a commit
+touching all the manifests against local fakes of the services it talks to:
+
+- TarballGitHubRepoAPI serves the tarball of the synthetic repository in
+  place of GitHub, going through the same caching and extraction as
+  github_api.GitHubRepoAPI.
+- The source files are served over HTTP from a local server.
+- The generated files are uploaded with file_uploader.LocalFileUploader.
+- InProcessDashboard keeps the system runs, import attempts, and progress
+  logs in memory in place of the import progress dashboard.
+- FakeImportServiceClient takes a fixed time for each deletion and import
+  in place of the importer.
+
+The per-stage latencies recorded by the executor and the number of imports
+executed per hour are saved as JSON, so that the results of two versions of
+the executor can be compared.
+"""
+
+import os
+import json
+import time
+import shutil
+import tarfile
+import logging
+import platform
+import threading
+import functools
+import dataclasses
+from http import server
+from typing import Dict, List, Optional, Set
+
+from app import configs
+from app import utils
+from app.executor import import_executor
+from app.service import file_uploader
+from app.service import github_api
+from app.service import import_service
+
+_OWNER = 'benchmark'
+_REPO = 'data'
+_COMMIT_SHA = '0' * 40
+_IMPORTS_DIR = 'benchmark'
+_RESULT_SUFFIX = '.json'
+
+_SCRIPT_TEMPLATE = '''
+import_name = {import_name!r}
+with open({source_name!r}) as src:
+    with open(import_name + '.csv', 'w') as dest:
+        dest.write(src.readline().rstrip('\\n') + ',doubled\\n')
+        for line in src:
+            value = line.rstrip('\\n').rsplit(',', 1)[-1]
+            dest.write(line.rstrip('\\n') + ',' + str(2 * int(value)) + '\\n')
+with open(import_name + '.tmcf', 'w') as tmcf:
+    tmcf.write('Node: E:' + import_name + '->E0\\n'
+               'typeOf: dcs:StatVarObservation\\n'
+               'value: C:' + import_name + '->doubled\\n')
+'''.lstrip()
+
+
+@dataclasses.dataclass
+class BenchmarkParams:
+    """Parameters of the synthetic workload.
+
+    Attributes:
+        num_manifests: Number of directories with a manifest, as an int.
+        imports_per_manifest: Number of imports specified by each manifest,
+            as an int.
+        data_size: Size in bytes of the source file of each import, as
+            an int.
+        rounds: Number of times to execute all the imports, as an int.
+            Later rounds run with the caches filled by the earlier ones.
+        import_latency: Time in seconds the fake importer takes for each
+            deletion and import, as a float.
+    """
+    num_manifests: int = 4
+    imports_per_manifest: int = 2
+    data_size: int = 1024**2
+    rounds: int = 1
+    import_latency: float = 0
+
+
+@dataclasses.dataclass
+class StageStats:
+    """Latency of a stage over the imports that ran it.
+
+    Attributes:
+        count: Number of times the stage ran, as an int.
+        mean: Mean wall time in seconds as a float.
+        p50: Median wall time in seconds as a float.
+        p95: 95th percentile of the wall time in seconds as a float.
+        max: Maximum wall time in seconds as a float.
+    """
+    count: int
+    mean: float
+    p50: float
+    p95: float
+    max: float
+
+    @classmethod
+    def from_values(cls, values: List[float]) -> 'StageStats':
+        """Computes the statistics of a non-empty list of wall times."""
+        values = sorted(values)
+        return cls(count=len(values),
+                   mean=sum(values) / len(values),
+                   p50=_percentile(values, 50),
+                   p95=_percentile(values, 95),
+                   max=values[-1])
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    """Result of a benchmark.
+
+    Attributes:
+        params: BenchmarkParams of the workload as a dict.
+        config: Configurations of the executor that differ from the
+            defaults, as a dict.
+        environment: Python version, platform, and number of CPUs of the
+            machine the benchmark ran on, as a dict.
+        time_started: Time the benchmark started in ISO 8601 format, as
+            a string.
+        elapsed: Total time in seconds spent executing imports, excluding
+            generating the repository, as a float.
+        num_imports: Number of imports executed over all rounds, as an int.
+        num_succeeded: Number of those imports that succeeded, as an int.
+        imports_per_hour: Number of imports succeeded per hour, as a float.
+        import_latency: StageStats of the time from the start to the end of
+            each import attempt, as a dict.
+        stages: Dict mapping stage names to the StageStats of the stage as
+            a dict. Stages shared by the imports of a run, such as
+            repo_download, are counted once for each import.
+    """
+    params: Dict
+    config: Dict
+    environment: Dict
+    time_started: str
+    elapsed: float
+    num_imports: int
+    num_succeeded: int
+    imports_per_hour: float
+    import_latency: Dict
+    stages: Dict[str, Dict]
+
+    def to_json(self) -> str:
+        """Returns the result as a JSON string."""
+        return json.dumps(dataclasses.asdict(self), indent=2, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, string: str) -> 'BenchmarkResult':
+        """Parses a result returned by to_json."""
+        return cls(**json.loads(string))
+
+
+class TarballGitHubRepoAPI(github_api.GitHubRepoAPI):
+    """GitHubRepoAPI serving a local tarball of a repository at a single
+    commit that touches a set of directories.
+
+    Attributes:
+        tarball: Path to the tarball in the format downloaded from GitHub,
+            as a string.
+        commit_sha: SHA of the commit as a string.
+        commit_message: Message of the commit as a string.
+        changed_dirs: Set of paths to the directories touched by the commit,
+            each as a string relative to the root of the repository.
+    """
+
+    def __init__(self,
+                 tarball: str,
+                 commit_sha: str,
+                 commit_message: str,
+                 changed_dirs: Set[str],
+                 cache_dir: str = ''):
+        super().__init__(_OWNER, _REPO, cache_dir=cache_dir)
+        self.tarball = tarball
+        self.commit_sha = commit_sha
+        self.commit_message = commit_message
+        self.changed_dirs = set(changed_dirs)
+
+    def query_commit(self, commit_sha: str) -> Dict:
+        """Returns the message of the commit in the format of the GitHub API."""
+        return {'sha': commit_sha, 'commit': {'message': self.commit_message}}
+
+    def find_dirs_in_commit_containing_file(self, commit_sha: str,
+                                            containing: str) -> Set[str]:
+        """Returns the directories touched by the commit. All of them contain
+        the file."""
+        return set(self.changed_dirs)
+
+    def resolve_commit_sha(self, commit_sha: str = 'HEAD') -> str:
+        """Returns the SHA of the only commit."""
+        return self.commit_sha
+
+    def _download_tar(self, dest_dir: str, commit_sha: str,
+                      timeout: float) -> str:
+        """Copies the tarball into dest_dir."""
+        del commit_sha, timeout
+        return shutil.copy(self.tarball, dest_dir)
+
+
+class InProcessDashboard:
+    """In-memory replacement of dashboard_api.DashboardAPI.
+
+    Attributes:
+        runs: Dict mapping run IDs to system runs as dicts.
+        attempts: Dict mapping attempt IDs to import attempts as dicts.
+        logs: List of progress logs as dicts.
+        attempt_times: Dict mapping attempt IDs to lists of the
+            time.monotonic() at which the attempt was initialized and, if it
+            has finished, at which it finished.
+    """
+
+    _FINAL_STATUSES = ('succeeded', 'failed', 'unchanged')
+
+    def __init__(self):
+        self.runs = {}
+        self.attempts = {}
+        self.logs = []
+        self.attempt_times = {}
+        self._lock = threading.Lock()
+
+    def init_run(self, system_run: Dict) -> Dict:
+        """Stores a system run and returns it with a run_id."""
+        with self._lock:
+            run = dict(system_run,
+                       run_id=f'run{len(self.runs)}',
+                       status='created',
+                       time_created=utils.utctime())
+            self.runs[run['run_id']] = run
+            return dict(run)
+
+    def init_attempt(self, import_attempt: Dict) -> Dict:
+        """Stores an import attempt and returns it with an attempt_id."""
+        with self._lock:
+            attempt = dict(import_attempt,
+                           attempt_id=f'attempt{len(self.attempts)}',
+                           status='created',
+                           time_created=utils.utctime())
+            self.attempts[attempt['attempt_id']] = attempt
+            self.attempt_times[attempt['attempt_id']] = [time.monotonic()]
+            return dict(attempt)
+
+    def update_attempt(self, import_attempt: Dict, attempt_id: str) -> Dict:
+        """Updates some fields of an import attempt."""
+        with self._lock:
+            attempt = self.attempts[attempt_id]
+            attempt.update(import_attempt)
+            times = self.attempt_times[attempt_id]
+            if (import_attempt.get('status') in self._FINAL_STATUSES and
+                    len(times) == 1):
+                times.append(time.monotonic())
+            return dict(attempt)
+
+    def update_run(self, system_run: Dict, run_id: str) -> Dict:
+        """Updates some fields of a system run."""
+        with self._lock:
+            self.runs[run_id].update(system_run)
+            return dict(self.runs[run_id])
+
+    def critical(self, message: str, **kwargs) -> Dict:
+        """Stores a log with level CRITICAL."""
+        return self._log(message, 'critical', **kwargs)
+
+    def error(self, message: str, **kwargs) -> Dict:
+        """Stores a log with level ERROR."""
+        return self._log(message, 'error', **kwargs)
+
+    def warning(self, message: str, **kwargs) -> Dict:
+        """Stores a log with level WARNING."""
+        return self._log(message, 'warning', **kwargs)
+
+    def info(self, message: str, **kwargs) -> Dict:
+        """Stores a log with level INFO."""
+        return self._log(message, 'info', **kwargs)
+
+    def debug(self, message: str, **kwargs) -> Dict:
+        """Stores a log with level DEBUG."""
+        return self._log(message, 'debug', **kwargs)
+
+    def flush(self) -> None:
+        """Does nothing since logs are stored synchronously."""
+
+    def close(self) -> None:
+        """Does nothing since logs are stored synchronously."""
+
+    def _log(self,
+             message: str,
+             level: str,
+             attempt_id: str = None,
+             run_id: str = None,
+             time_logged: str = None) -> Dict:
+        log = {
+            'message': message,
+            'level': level,
+            'time_logged': time_logged or utils.utctime()
+        }
+        if attempt_id:
+            log['attempt_id'] = attempt_id
+        if run_id:
+            log['run_id'] = run_id
+        with self._lock:
+            self.logs.append(log)
+        return log
+
+
+class FakeImportServiceClient:
+    """Replacement of import_service.ImportServiceClient that takes a fixed
+    time for each request.
+
+    Attributes:
+        latency: Time in seconds each deletion and import takes, as a float.
+        imported: List of absolute import names imported, each as a string.
+    """
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.imported = []
+        self._lock = threading.Lock()
+
+    def smart_import(self,
+                     import_dir: str,
+                     import_inputs: import_service.ImportInputs,
+                     import_spec: Dict,
+                     block: bool = False,
+                     timeout: float = None) -> Dict:
+        """Waits for latency seconds and records the import."""
+        del import_inputs, block, timeout
+        time.sleep(self.latency)
+        with self._lock:
+            self.imported.append(f'{import_dir}:{import_spec["import_name"]}')
+        return {}
+
+    def delete_import(self,
+                      import_dir: str,
+                      import_spec: Dict,
+                      block: bool = False,
+                      timeout: float = None) -> Dict:
+        """Waits for latency seconds."""
+        del import_dir, import_spec, block, timeout
+        time.sleep(self.latency)
+        return {}
+
+    def delete_previous_output(self, import_dir: str,
+                               import_spec: Dict) -> None:
+        """Does nothing."""
+
+
+def generate_repo(dest_dir: str, params: BenchmarkParams,
+                  source_url: str) -> List[str]:
+    """Generates the synthetic repository and the source files.
+
+    The repository is written to <dest_dir>/repo/<owner>-<repo>-<commit>/
+    and its tarball in the format downloaded from GitHub to
+    <dest_dir>/repo.tar.gz. The source files are written to
+    <dest_dir>/sources/.
+
+    Args:
+        dest_dir: Directory to write the files into, as a string.
+        params: BenchmarkParams describing the workload.
+        source_url: URL under which the files in <dest_dir>/sources/ are
+            served, as a string.
+
+    Returns:
+        List of paths to the directories containing the manifests, relative
+        to the root of the repository, each as a string.
+    """
+    root_name = f'{_OWNER}-{_REPO}-{_COMMIT_SHA[:7]}'
+    repo_dir = os.path.join(dest_dir, 'repo', root_name)
+    sources_dir = os.path.join(dest_dir, 'sources')
+    os.makedirs(sources_dir, exist_ok=True)
+
+    manifest_dirs = []
+    for i in range(params.num_manifests):
+        manifest_dir = f'{_IMPORTS_DIR}/dir{i}'
+        absolute_dir = os.path.join(repo_dir, manifest_dir)
+        os.makedirs(absolute_dir, exist_ok=True)
+        specs = []
+        for j in range(params.imports_per_manifest):
+            import_name = f'import{j}'
+            source_name = f'dir{i}_{import_name}_source.csv'
+            _write_source(os.path.join(sources_dir, source_name),
+                          params.data_size,
+                          seed=i * 1000 + j)
+            with open(os.path.join(absolute_dir, f'{import_name}.py'),
+                      'w') as script:
+                script.write(
+                    _SCRIPT_TEMPLATE.format(import_name=import_name,
+                                            source_name=source_name))
+            specs.append({
+                'import_name':
+                    import_name,
+                'curator_emails': ['benchmark@example.com'],
+                'provenance_url':
+                    'https://example.com',
+                'provenance_description':
+                    'Synthetic benchmark import',
+                'data_download_url': [f'{source_url}/{source_name}'],
+                'scripts': [f'{import_name}.py'],
+                'import_inputs': [{
+                    'template_mcf': f'{import_name}.tmcf',
+                    'cleaned_csv': f'{import_name}.csv'
+                }]
+            })
+        with open(os.path.join(absolute_dir, 'manifest.json'), 'w') as file:
+            json.dump({'import_specifications': specs}, file, indent=2)
+        manifest_dirs.append(manifest_dir)
+
+    with tarfile.open(os.path.join(dest_dir, 'repo.tar.gz'), 'w:gz') as tar:
+        tar.add(repo_dir, arcname=root_name)
+    return manifest_dirs
+
+
+def _write_source(path: str, size: int, seed: int) -> None:
+    """Writes a CSV file of about size bytes with an integer column."""
+    written = 0
+    row = 0
+    with open(path, 'w') as file:
+        written += file.write('place,date,value\n')
+        while written < size:
+            lines = []
+            for _ in range(1000):
+                lines.append(f'geoId/{(row + seed) % 100000:05d},'
+                             f'{2000 + row % 20},{(row * 7919 + seed) % 1000}')
+                row += 1
+            written += file.write('\n'.join(lines) + '\n')
+
+
+class _QuietHandler(server.SimpleHTTPRequestHandler):
+    """Request handler serving a directory without logging each request."""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        del format, args
+
+
+def run_benchmark(work_dir: str,
+                  params: BenchmarkParams,
+                  config: configs.ExecutorConfig = None) -> BenchmarkResult:
+    """Runs the benchmark.
+
+    Args:
+        work_dir: Directory to generate the repository and write the outputs
+            into, as a string. It should be empty.
+        params: BenchmarkParams describing the workload.
+        config: ExecutorConfig of the executor. The GitHub and Google Cloud
+            configurations are ignored.
+
+    Returns:
+        BenchmarkResult object.
+    """
+    config = config or configs.ExecutorConfig()
+    sources_dir = os.path.join(work_dir, 'sources')
+    os.makedirs(sources_dir, exist_ok=True)
+    http_server = server.ThreadingHTTPServer(
+        ('127.0.0.1', 0), functools.partial(_QuietHandler,
+                                            directory=sources_dir))
+    server_thread = threading.Thread(target=http_server.serve_forever,
+                                     daemon=True)
+    server_thread.start()
+    try:
+        source_url = f'http://127.0.0.1:{http_server.server_address[1]}'
+        manifest_dirs = generate_repo(work_dir, params, source_url)
+        github = TarballGitHubRepoAPI(
+            tarball=os.path.join(work_dir, 'repo.tar.gz'),
+            commit_sha=_COMMIT_SHA,
+            commit_message='IMPORTS=all',
+            changed_dirs=manifest_dirs,
+            cache_dir=os.path.join(work_dir, 'repo_cache'))
+        dashboard = InProcessDashboard()
+        executor = import_executor.ImportExecutor(
+            uploader=file_uploader.LocalFileUploader(
+                os.path.join(work_dir, 'output')),
+            github=github,
+            config=config,
+            dashboard=dashboard,
+            importer=FakeImportServiceClient(params.import_latency))
+
+        time_started = utils.utctime()
+        start = time.monotonic()
+        for i in range(params.rounds):
+            result = executor.execute_imports_on_commit(_COMMIT_SHA)
+            logging.info('run_benchmark: Round %d of %d: %s', i + 1,
+                         params.rounds, result.status)
+        elapsed = time.monotonic() - start
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+        server_thread.join()
+
+    return _summarize(dashboard, params, config, time_started, elapsed)
+
+
+def _summarize(dashboard: InProcessDashboard, params: BenchmarkParams,
+               config: configs.ExecutorConfig, time_started: str,
+               elapsed: float) -> BenchmarkResult:
+    """Computes the BenchmarkResult from the import attempts."""
+    stage_times = {}
+    latencies = []
+    num_succeeded = 0
+    for attempt_id, attempt in dashboard.attempts.items():
+        if attempt.get('status') == 'succeeded':
+            num_succeeded += 1
+        times = dashboard.attempt_times[attempt_id]
+        if len(times) == 2:
+            latencies.append(times[1] - times[0])
+        for usage in attempt.get('resource_usage', []):
+            stage_times.setdefault(usage['stage'],
+                                   []).append(usage['wall_time'])
+    default_config = dataclasses.asdict(configs.ExecutorConfig())
+    return BenchmarkResult(
+        params=dataclasses.asdict(params),
+        config={
+            key: value
+            for key, value in dataclasses.asdict(config).items()
+            if value != default_config[key]
+        },
+        environment={
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        time_started=time_started,
+        elapsed=elapsed,
+        num_imports=len(dashboard.attempts),
+        num_succeeded=num_succeeded,
+        imports_per_hour=num_succeeded / elapsed * 3600 if elapsed else 0,
+        import_latency=dataclasses.asdict(StageStats.from_values(latencies))
+        if latencies else {},
+        stages={
+            stage: dataclasses.asdict(StageStats.from_values(values))
+            for stage, values in stage_times.items()
+        })
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Returns the nearest-rank percentile of a non-empty sorted list."""
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def save_result(result: BenchmarkResult, results_dir: str) -> str:
+    """Saves a result to <results_dir>/<time started><suffix>.
+
+    Returns:
+        Path to the saved result as a string.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    name = result.time_started.replace(':', '-').replace('+', '_')
+    path = os.path.join(results_dir, name + _RESULT_SUFFIX)
+    with open(path, 'w') as file:
+        file.write(result.to_json())
+    logging.info('save_result: Saved result to %s', path)
+    return path
+
+
+def load_latest_result(results_dir: str) -> Optional[BenchmarkResult]:
+    """Loads the most recently started result saved in a directory, or
+    returns None if there is none."""
+    if not os.path.isdir(results_dir):
+        return None
+    names = sorted(name for name in os.listdir(results_dir)
+                   if name.endswith(_RESULT_SUFFIX))
+    if not names:
+        return None
+    with open(os.path.join(results_dir, names[-1])) as file:
+        return BenchmarkResult.from_json(file.read())
+
+
+def compare_results(baseline: BenchmarkResult,
+                    result: BenchmarkResult,
+                    tolerance: float = 0.1,
+                    min_delta: float = 0.05) -> List[str]:
+    """Compares a result with a baseline.
+
+    Args:
+        baseline: BenchmarkResult to compare against.
+        result: BenchmarkResult to compare.
+        tolerance: Fraction by which a metric may get worse before it is
+            reported as a regression, as a float.
+        min_delta: Minimum increase in seconds of the latency of a stage
+            reported as a regression, as a float. This keeps the noise in
+            stages that take milliseconds from being reported.
+
+    Returns:
+        List of descriptions of regressions, each as a string. The list is
+        empty if there is none.
+    """
+    regressions = []
+    if baseline.params != result.params:
+        logging.warning(
+            'compare_results: Comparing results of different workloads: '
+            '%s and %s', baseline.params, result.params)
+    if result.imports_per_hour < baseline.imports_per_hour * (1 - tolerance):
+        regressions.append(
+            f'imports_per_hour: {baseline.imports_per_hour:.1f} -> '
+            f'{result.imports_per_hour:.1f}')
+    for stage, stats in sorted(result.stages.items()):
+        baseline_stats = baseline.stages.get(stage)
+        if not baseline_stats:
+            continue
+        for metric in ('p50', 'p95'):
+            if (stats[metric] > baseline_stats[metric] * (1 + tolerance) and
+                    stats[metric] - baseline_stats[metric] >= min_delta):
+                regressions.append(f'{stage} {metric}: '
+                                   f'{baseline_stats[metric]:.3f}s -> '
+                                   f'{stats[metric]:.3f}s')
+    return regressions
+
+
+def format_result(result: BenchmarkResult) -> str:
+    """Formats a result as a human-readable table."""
+    lines = [
+        f'{result.num_succeeded} of {result.num_imports} imports succeeded '
+        f'in {result.elapsed:.2f}s ({result.imports_per_hour:.1f} imports '
+        'per hour)',
+        f'{"stage":<28}{"count":>7}{"mean":>10}{"p50":>10}{"p95":>10}'
+        f'{"max":>10}'
+    ]
+    rows = sorted(result.stages.items())
+    if result.import_latency:
+        rows.append(('(whole import)', result.import_latency))
+    for stage, stats in rows:
+        lines.append(f'{stage:<28}{stats["count"]:>7}{stats["mean"]:>10.3f}'
+                     f'{stats["p50"]:>10.3f}{stats["p95"]:>10.3f}'
+                     f'{stats["max"]:>10.3f}')
+    return '\n'.join(lines)
@@ -0,0 +1,470 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Concurrent, resumable downloads of source data files.
+
+Files are downloaded into <path>.part and renamed to <path> once their sizes
+and checksums are verified. Large files served by hosts that accept HTTP
+range requests are split into segments that are downloaded in parallel. The
+progress of each segment is recorded in <path>.part.json, so a failed
+segment is retried from where it stopped, and a later download into the same
+directory resumes the file if the server still has the same version of it.
+
+If a SourceCache is given, files are downloaded with conditional requests and
+copied from the cache if the server responds that they have not changed.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import dataclasses
+from concurrent import futures
+from typing import Dict, List, Optional, Union
+
+import requests
+from requests import adapters
+
+from app import utils
+from app.executor import source_cache
+
+# See https://requests.readthedocs.io/en/master/user/advanced/#timeouts.
+_CONNECT_TIMEOUT = 9.05
+_READ_TIMEOUT = 27
+_PART_SUFFIX = '.part'
+_STATE_SUFFIX = '.part.json'
+# Minimum time in seconds between two writes of the progress of a file
+_STATE_SAVE_INTERVAL = 1
+
+
+@dataclasses.dataclass
+class DownloadSpec:
+    """File to download.
+
+    Attributes:
+        url: URL of the file as a string.
+        sha256: Expected hex SHA-256 digest of the file as a string. The
+            file is not checksummed if empty.
+        size: Expected size of the file in bytes as an int. If None, the
+            size is only checked against the Content-Length header.
+    """
+    url: str
+    sha256: str = ''
+    size: Optional[int] = None
+
+
+def parse_download_specs(entries: List[Union[str, Dict]]) -> List[DownloadSpec]:
+    """Parses the data_download_url field of an import specification.
+
+    Args:
+        entries: List of URLs, each either as a string or as a dict with the
+            key 'url' and optionally the keys 'sha256' and 'size'.
+
+    Returns:
+        List of DownloadSpec objects.
+
+    Raises:
+        ValueError: An entry is not a string or a dict with valid keys.
+    """
+    specs = []
+    for entry in entries:
+        if isinstance(entry, str):
+            specs.append(DownloadSpec(url=entry))
+            continue
+        try:
+            specs.append(DownloadSpec(**entry))
+        except TypeError as exc:
+            raise ValueError(f'Invalid data_download_url {entry}') from exc
+    return specs
+
+
+class _DownloadState:
+    """Progress of a file download, persisted to <path>.part.json.
+
+    Attributes:
+        path: Path to the JSON file as a string.
+        url: URL of the file as a string.
+        size: Size of the file in bytes as an int, or None if unknown.
+        validator: ETag or Last-Modified header of the file as a string. The
+            download is only resumed if the server returns the same one.
+        segments: List of dicts with the keys 'start', 'end', and 'done',
+            the latter being the number of bytes of the segment that have
+            been written. 'end' is exclusive and None if the size is unknown.
+    """
+
+    def __init__(self, path: str, url: str, size: Optional[int], validator: str,
+                 segments: List[Dict]):
+        self.path = path
+        self.url = url
+        self.size = size
+        self.validator = validator
+        self.segments = segments
+        self._lock = threading.Lock()
+        self._last_saved = 0
+
+    @classmethod
+    def load(cls, path: str, url: str, size: Optional[int],
+             validator: str) -> Optional['_DownloadState']:
+        """Loads the progress of a previous download of the same version of
+        a file, if any."""
+        if not validator or size is None:
+            return None
+        try:
+            with open(path) as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if (saved.get('url'), saved.get('size'),
+                saved.get('validator')) != (url, size, validator):
+            return None
+        return cls(path, url, size, validator, saved['segments'])
+
+    def save(self, force: bool = False) -> None:
+        """Writes the progress atomically, at most once per
+        _STATE_SAVE_INTERVAL unless force is set."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_saved < _STATE_SAVE_INTERVAL:
+                return
+            self._last_saved = now
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as file:
+                json.dump(
+                    {
+                        'url': self.url,
+                        'size': self.size,
+                        'validator': self.validator,
+                        'segments': self.segments
+                    }, file)
+            os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        """Deletes the persisted progress."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Downloader:
+    """Downloads files concurrently, splitting large files into segments
+    downloaded in parallel and retrying failed segments from where they
+    stopped.
+
+    Attributes:
+        max_workers: Maximum number of files to download concurrently, as
+            an int.
+        segment_size: Minimum size of a segment in bytes, as an int. Files
+            smaller than twice this size are downloaded in one request.
+        max_segments: Maximum number of segments of a file to download
+            concurrently, as an int.
+        buffer_size: Number of bytes to read from the network before each
+            write to disk, as an int.
+        max_retries: Number of times to retry a segment after a network
+            error before giving up, as an int.
+        session: requests.Session object used to send the requests.
+        source_cache: SourceCache object storing the latest downloaded
+            version of each file. If None, files are always downloaded.
+    """
+
+    def __init__(self,
+                 max_workers: int = 4,
+                 segment_size: int = 64 * 1024**2,
+                 max_segments: int = 8,
+                 buffer_size: int = 1024**2,
+                 max_retries: int = 3,
+                 session: requests.Session = None,
+                 cache: source_cache.SourceCache = None):
+        self.max_workers = max_workers
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.buffer_size = buffer_size
+        self.max_retries = max_retries
+        if not session:
+            session = requests.Session()
+            pool_size = max_workers * max_segments
+            adapter = adapters.HTTPAdapter(pool_connections=pool_size,
+                                           pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        self.source_cache = cache
+
+    def download_all(self,
+                     specs: List[DownloadSpec],
+                     dest_dir: str,
+                     timeout: float = None) -> List[str]:
+        """Downloads files concurrently into a directory.
+
+        Args:
+            specs: List of DownloadSpec objects describing the files.
+            dest_dir: Directory to download the files into, as a string.
+            timeout: Maximum time in seconds downloading each file can take,
+                as a float.
+
+        Returns:
+            List of paths to the downloaded files, in the order of specs.
+
+        Raises:
+            Same exceptions as download. If multiple downloads fail, the
+            exception of the first one in specs is raised after all
+            downloads have finished.
+        """
+        with futures.ThreadPoolExecutor(
+                max_workers=self.max_workers) as executor:
+            tasks = [
+                executor.submit(self.download, spec, dest_dir, timeout)
+                for spec in specs
+            ]
+        return [task.result() for task in tasks]
+
+    def download(self,
+                 spec: DownloadSpec,
+                 dest_dir: str,
+                 timeout: float = None) -> str:
+        """Downloads a file into a directory.
+
+        Args:
+            spec: DownloadSpec object describing the file.
+            dest_dir: Directory to download the file into, as a string.
+            timeout: Maximum time in seconds downloading the file can take,
+                as a float.
+
+        Returns:
+            Path to the downloaded file of the form
+            <dest_dir>/<basename of the downloaded file>.
+
+        Raises:
+            requests.Timeout: Downloading timed out.
+            requests.HTTPError: The server returned an error status code.
+            ValueError: The size or checksum of the file does not match the
+                expected one.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        headers = None
+        if self.source_cache:
+            headers = self.source_cache.get_conditional_headers(spec.url)
+        response = self._get(spec.url, deadline, headers)
+        if response.status_code == 304:
+            response.close()
+            entry = self.source_cache.get(spec.url)
+            if entry and (not spec.sha256 or
+                          entry.sha256 == spec.sha256.lower()):
+                logging.info('Downloader.download: %s is unchanged', spec.url)
+                return self.source_cache.restore(entry, dest_dir)
+            response = self._get(spec.url, deadline)
+        try:
+            # pylint: disable=protected-access
+            path = os.path.join(dest_dir, utils._get_filename(response))
+            size = _get_content_length(response)
+            if spec.size is not None and size is not None and size != spec.size:
+                raise ValueError(f'{spec.url} has {size} bytes, '
+                                 f'expected {spec.size}')
+            if size is None:
+                size = spec.size
+            ranged = (size is not None and
+                      response.headers.get('Accept-Ranges') == 'bytes')
+            etag = response.headers.get('ETag', '')
+            last_modified = response.headers.get('Last-Modified', '')
+            validator = etag or last_modified
+            state_path = path + _STATE_SUFFIX
+            part_path = path + _PART_SUFFIX
+            state = None
+            if ranged and os.path.exists(part_path):
+                state = _DownloadState.load(state_path, spec.url, size,
+                                            validator)
+            if state:
+                logging.info('Downloader.download: Resuming %s into %s',
+                             spec.url, path)
+            else:
+                state = _DownloadState(state_path, spec.url, size, validator,
+                                       self._split(size, ranged))
+                with open(part_path, 'wb') as part:
+                    if size:
+                        part.truncate(size)
+
+            fd = os.open(part_path, os.O_RDWR)
+            try:
+                pending = [
+                    segment for segment in state.segments
+                    if not _is_complete(segment)
+                ]
+                if (len(pending) == 1 and pending[0]['start'] == 0 and
+                        pending[0]['done'] == 0):
+                    # Reuse the response to the first request.
+                    self._fetch_segment(spec.url, fd, pending[0], state, ranged,
+                                        deadline, response)
+                else:
+                    response.close()
+                    self._fetch_segments(spec.url, fd, pending, state, ranged,
+                                         deadline)
+                state.save(force=True)
+            finally:
+                os.close(fd)
+        finally:
+            response.close()
+
+        written = sum(segment['done'] for segment in state.segments)
+        if size is not None and written != size:
+            raise ValueError(f'Downloaded {written} bytes from {spec.url}, '
+                             f'expected {size}')
+        digest = None
+        if spec.sha256 or self.source_cache:
+            digest = source_cache.sha256_file(part_path, self.buffer_size)
+        if spec.sha256:
+            if digest != spec.sha256.lower():
+                os.remove(part_path)
+                state.remove()
+                raise ValueError(f'{spec.url} has SHA-256 {digest}, '
+                                 f'expected {spec.sha256}')
+        os.replace(part_path, path)
+        state.remove()
+        if self.source_cache:
+            self.source_cache.put(spec.url, path, digest, etag, last_modified)
+        logging.info('Downloader.download: Downloaded %s to %s', spec.url, path)
+        return path
+
+    def _split(self, size: Optional[int], ranged: bool) -> List[Dict]:
+        """Splits a file into segments to download in parallel."""
+        if not ranged or size < 2 * self.segment_size:
+            return [{'start': 0, 'end': size, 'done': 0}]
+        num_segments = min(self.max_segments, size // self.segment_size)
+        step = -(-size // num_segments)
+        return [{
+            'start': start,
+            'end': min(start + step, size),
+            'done': 0
+        } for start in range(0, size, step)]
+
+    def _fetch_segments(self, url: str, fd: int, segments: List[Dict],
+                        state: _DownloadState, ranged: bool,
+                        deadline: Optional[float]) -> None:
+        """Downloads segments of a file in parallel."""
+        if not segments:
+            return
+        with futures.ThreadPoolExecutor(
+                max_workers=min(self.max_segments, len(segments))) as executor:
+            tasks = [
+                executor.submit(self._fetch_segment, url, fd, segment, state,
+                                ranged, deadline) for segment in segments
+            ]
+        for task in tasks:
+            task.result()
+
+    def _fetch_segment(self,
+                       url: str,
+                       fd: int,
+                       segment: Dict,
+                       state: _DownloadState,
+                       ranged: bool,
+                       deadline: Optional[float],
+                       response: requests.Response = None) -> None:
+        """Downloads the rest of a segment, retrying on network errors.
+
+        If ranged is not set, the server does not support range requests
+        and the segment is the whole file, which is downloaded again from
+        the start on every retry.
+        """
+        for retry in range(self.max_retries + 1):
+            try:
+                if not response:
+                    if not ranged:
+                        segment['done'] = 0
+                        os.ftruncate(fd, 0)
+                        response = self._get(url, deadline)
+                    else:
+                        first = segment['start'] + segment['done']
+                        last = segment['end'] - 1
+                        response = self._get(url, deadline,
+                                             {'Range': f'bytes={first}-{last}'})
+                        if response.status_code != 206:
+                            raise ValueError(
+                                f'{url} does not support range requests')
+                with response:
+                    self._write(url, response, fd, segment, state, deadline)
+                return
+            except (requests.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ReadTimeout) as exc:
+                response = None
+                _check_deadline(url, deadline)
+                if retry == self.max_retries:
+                    raise
+                logging.warning(
+                    'Downloader._fetch_segment: Retrying %s from byte %d '
+                    'after %s', url, segment['start'] + segment['done'], exc)
+                time.sleep(2**retry)
+
+    def _write(self, url: str, response: requests.Response, fd: int,
+               segment: Dict, state: _DownloadState,
+               deadline: Optional[float]) -> None:
+        """Writes the body of a response to a segment of a file."""
+        offset = segment['start'] + segment['done']
+        for data in response.iter_content(chunk_size=self.buffer_size):
+            if segment['end'] is not None:
+                data = data[:segment['end'] - offset]
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+                segment['done'] += written
+            state.save()
+            _check_deadline(url, deadline)
+
+    def _get(self,
+             url: str,
+             deadline: Optional[float],
+             headers: Dict = None) -> requests.Response:
+        """Sends a streaming GET request for the unencoded file."""
+        _check_deadline(url, deadline)
+        headers = dict(headers or {})
+        # Content-Length and ranges then refer to the bytes written to disk.
+        headers['Accept-Encoding'] = 'identity'
+        response = self.session.get(url,
+                                    headers=headers,
+                                    stream=True,
+                                    timeout=(_CONNECT_TIMEOUT, _READ_TIMEOUT))
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        return response
+
+
+def _get_content_length(response: requests.Response) -> Optional[int]:
+    """Returns the size of the file a response is for, or None if it is not
+    known."""
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _is_complete(segment: Dict) -> bool:
+    """Returns whether all bytes of a segment of known size are written."""
+    if segment['end'] is None:
+        return False
+    return segment['start'] + segment['done'] >= segment['end']
+
+
+def _check_deadline(url: str, deadline: Optional[float]) -> None:
+    """Raises requests.Timeout if the deadline has passed."""
+    if deadline is not None and time.monotonic() > deadline:
+        raise requests.Timeout(f'Downloading {url} timed out')
@@ -16,19 +16,34 @@ Import executor that downloads GitHub repositories and executes data imports
 based on manifests.
 """
 
+import contextlib
+import functools
 import json
 import os
+import signal
 import subprocess
 import tempfile
 import logging
+import threading
 import traceback
-from typing import Tuple, List, Dict, Optional, Callable, Iterable
+from concurrent import futures
+from typing import (Tuple, List, Dict, Optional, Callable, Iterable, Iterator,
+                    Union)
 import dataclasses
 
 from app import utils
 from app import configs
 from app.service import dashboard_api
+from app.executor import admission
+from app.executor import downloader
 from app.executor import import_target
+from app.executor import output_store
+from app.executor import resource_usage
+from app.executor import source_cache
+from app.executor import subprocess_runner
+from app.executor import tracing
+from app.executor import venv_cache
+from app.executor import zygote
 from app.service import github_api
 from app.service import file_uploader
 from app.service import email_notifier
@@ -45,7 +60,8 @@ _SEE_DASHBOARD_MESSAGE = (
 @dataclasses.dataclass
 class ExecutionResult:
     """Describes the result of the execution of an import."""
-    # Status of the execution, one of 'succeeded', 'failed', or 'pass'
+    # Status of the execution, one of 'succeeded', 'failed', 'pass', or
+    # 'cancelled'
     status: str
     # Absolute import names of the imports executed
     imports_executed: List[str]
@@ -83,6 +99,31 @@ class ImportExecutor:
         notifier: EmailNotifier object for sending notificaiton emails.
         importer: ImportServiceClient object for invoking the
             Data Commons importer.
+        downloader: Downloader object for downloading the files listed in
+            the data_download_url fields of the manifests.
+        source_cache: SourceCache object for skipping downloads of unchanged
+            files and updates of unchanged imports. This is None if
+            config.source_cache_dir is empty.
+        output_store: OutputStore object for storing the generated files
+            without uploading unchanged files again. Only used if
+            config.output_dedup is set.
+        venv_cache: VenvCache object for reusing virtual environments across
+            imports. This is None if config.venv_cache_dir is empty.
+        tracer: Tracer object exporting the tracing spans of each system run
+            as configured by config.trace_file and config.trace_collector_url.
+        admission_controller: AdmissionController object admitting the user
+            scripts of imports to run within the resource budget of the host.
+            Executors running in the same process should share one.
+        zygotes: ZygotePool object forking user scripts from zygotes with
+            modules preloaded. This is None if config.user_script_zygote is
+            not set or venv_cache is None. Executors running in the same
+            process should share one.
+        progress_callback: Function called with the progress of the imports
+            of the current system run whenever an import starts a stage or
+            finishes, or None. The progress is a dict mapping the absolute
+            import name of each import to a dict with its 'status', one of
+            'queued', 'running', and the statuses of ExecutionResult, and
+            the 'stage' it last started, if any.
     """
 
     def __init__(self,
@@ -91,13 +132,42 @@ class ImportExecutor:
                  config: configs.ExecutorConfig,
                  dashboard: dashboard_api.DashboardAPI = None,
                  notifier: email_notifier.EmailNotifier = None,
-                 importer: 'import_service.ImportServiceClient' = None):
+                 importer: 'import_service.ImportServiceClient' = None,
+                 admission_controller: admission.AdmissionController = None,
+                 zygotes: zygote.ZygotePool = None,
+                 progress_callback: Callable[[Dict[str, Dict]], None] = None):
         self.uploader = uploader
         self.github = github
         self.config = config
         self.dashboard = dashboard
         self.notifier = notifier
         self.importer = importer
+        self.source_cache = None
+        if config.source_cache_dir:
+            self.source_cache = source_cache.SourceCache(
+                config.source_cache_dir)
+        self.downloader = downloader.Downloader(
+            max_workers=config.file_download_max_workers,
+            segment_size=config.file_download_segment_size,
+            max_segments=config.file_download_max_segments,
+            cache=self.source_cache)
+        self.output_store = output_store.OutputStore(uploader)
+        self.venv_cache = None
+        if config.venv_cache_dir:
+            self.venv_cache = venv_cache.VenvCache(config.venv_cache_dir,
+                                                   config.venv_cache_max_size)
+        self.tracer = tracing.create_tracer(config.trace_file,
+                                            config.trace_collector_url)
+        self.admission_controller = (admission_controller or
+                                     create_admission_controller(config))
+        self.zygotes = None
+        if config.user_script_zygote and self.venv_cache:
+            self.zygotes = zygotes or zygote.ZygotePool(
+                config.user_script_preload_modules,
+                config.user_script_zygote_idle_timeout)
+        self.progress_callback = progress_callback
+        self._progress = {}
+        self._progress_lock = threading.Lock()
 
     def execute_imports_on_commit(self,
                                   commit_sha: str,
@@ -118,24 +188,34 @@ class ImportExecutor:
         Returns:
             ExecutionResult object describing the results of the imports.
         """
-        run_id = None
-        try:
-            if self.dashboard:
-                run_id = _init_run_helper(dashboard=self.dashboard,
-                                          commit_sha=commit_sha,
-                                          repo_name=repo_name,
-                                          branch_name=branch_name,
-                                          pr_number=pr_number)['run_id']
-        except Exception:
-            logging.exception(_SYSTEM_RUN_INIT_FAILED_MESSAGE)
-            return _create_system_run_init_failed_result(traceback.format_exc())
-
-        return run_and_handle_exception(run_id, self.dashboard,
-                                        self._execute_imports_on_commit_helper,
-                                        commit_sha, run_id)
-
-    def execute_imports_on_update(self,
-                                  absolute_import_name: str) -> ExecutionResult:
+        with self.tracer.trace('execute_imports_on_commit',
+                               commit_sha=commit_sha,
+                               repo_name=repo_name,
+                               branch_name=branch_name,
+                               pr_number=pr_number) as root:
+            run_id = None
+            try:
+                if self.dashboard:
+                    run_id = _init_run_helper(dashboard=self.dashboard,
+                                              commit_sha=commit_sha,
+                                              repo_name=repo_name,
+                                              branch_name=branch_name,
+                                              pr_number=pr_number)['run_id']
+            except Exception:
+                logging.exception(_SYSTEM_RUN_INIT_FAILED_MESSAGE)
+                return _create_system_run_init_failed_result(
+                    traceback.format_exc())
+            root.set_attribute('run_id', run_id)
+
+            result = run_and_handle_exception(
+                run_id, self.dashboard, self._execute_imports_on_commit_helper,
+                commit_sha, run_id)
+            root.set_attribute('result', result.status)
+            return result
+
+    def execute_imports_on_update(
+            self, absolute_import_name: Union[str,
+                                              List[str]]) -> ExecutionResult:
         """Executes imports upon a scheduled update.
 
         Args:
@@ -143,31 +223,43 @@ class ImportExecutor:
                 execute of the form <path to dir with manifest>:<import name>
                 as a string. E.g., scripts/us_fed/treasury:USFed_MaturityRates.
                 <import name> can be 'all' to execute all imports within
-                the directory.
+                the directory. Can also be a list of absolute import names,
+                possibly in different directories, whose imports are executed
+                in the same system run.
 
         Returns:
             ExecutionResult object describing the results of the imports.
         """
-        run_id = None
-        try:
-            if self.dashboard:
-                run_id = _init_run_helper(self.dashboard)['run_id']
-        except Exception:
-            logging.exception(_SYSTEM_RUN_INIT_FAILED_MESSAGE)
-            return _create_system_run_init_failed_result(traceback.format_exc())
-
-        return run_and_handle_exception(run_id, self.dashboard,
-                                        self._execute_imports_on_update_helper,
-                                        absolute_import_name, run_id)
+        if isinstance(absolute_import_name, str):
+            absolute_import_name = [absolute_import_name]
+        with self.tracer.trace(
+                'execute_imports_on_update',
+                absolute_import_name=','.join(absolute_import_name)) as root:
+            run_id = None
+            try:
+                if self.dashboard:
+                    run_id = _init_run_helper(self.dashboard)['run_id']
+            except Exception:
+                logging.exception(_SYSTEM_RUN_INIT_FAILED_MESSAGE)
+                return _create_system_run_init_failed_result(
+                    traceback.format_exc())
+            root.set_attribute('run_id', run_id)
+
+            result = run_and_handle_exception(
+                run_id, self.dashboard, self._execute_imports_on_update_helper,
+                absolute_import_name, run_id)
+            root.set_attribute('result', result.status)
+            return result
 
     def _execute_imports_on_update_helper(
             self,
-            absolute_import_name: str,
+            absolute_import_names: List[str],
             run_id: str = None) -> ExecutionResult:
         """Helper for execute_imports_on_update.
 
         Args:
-            absolute_import_name: See execute_imports_on_update.
+            absolute_import_names: List of absolute import names as in
+                execute_imports_on_update, each as a string.
             run_id: ID of the system run as a string. This is only used to
                 communicate with the import progress dashboard.
 
@@ -177,49 +269,161 @@ class ImportExecutor:
         Raises:
             ExecutionError: The execution of an import failed for any reason.
         """
-        logging.info('%s: BEGIN', absolute_import_name)
+        run_name = ', '.join(absolute_import_names)
+        logging.info('%s: BEGIN', run_name)
+        # An example import_dir is 'scripts/us_fed/treasury'
+        targets = [
+            import_target.split_absolute_import_name(name)
+            for name in absolute_import_names
+        ]
+        import_dirs = []
+        for import_dir, _ in targets:
+            if import_dir not in import_dirs:
+                import_dirs.append(import_dir)
+        commit_sha = None
+        paths = None
+        if self.config.repo_sparse_extraction:
+            # Pin the commit so that extracting the dependencies below
+            # uses the same version of the repository.
+            commit_sha = self.github.resolve_commit_sha()
+            paths = import_dirs + list(self.config.repo_common_paths)
+
+        recorder = resource_usage.ResourceRecorder()
         with tempfile.TemporaryDirectory() as tmpdir:
-            logging.info('%s: downloading repo', absolute_import_name)
-            repo_dir = self.github.download_repo(
-                tmpdir, timeout=self.config.repo_download_timeout)
-            logging.info('%s: downloaded repo %s', absolute_import_name,
-                         repo_dir)
+            logging.info('%s: downloading repo', run_name)
+            with recorder.stage('repo_download'):
+                with tracing.span('download_repo',
+                                  commit_sha=commit_sha,
+                                  paths=paths):
+                    repo_dir = self.github.download_repo(
+                        tmpdir,
+                        commit_sha,
+                        timeout=self.config.repo_download_timeout,
+                        paths=paths)
+            logging.info('%s: downloaded repo %s', run_name, repo_dir)
             if self.dashboard:
                 self.dashboard.info(f'Downloaded repo: {repo_dir}',
                                     run_id=run_id)
 
-            executed_imports = []
-
-            # An example import_dir is 'scripts/us_fed/treasury'
-            import_dir, import_name = import_target.split_absolute_import_name(
-                absolute_import_name)
-            absolute_import_dir = os.path.join(repo_dir, import_dir)
-            manifest_path = os.path.join(absolute_import_dir,
-                                         self.config.manifest_filename)
-            manifest = parse_manifest(manifest_path)
-            logging.info('%s: loaded manifest %s', absolute_import_name,
-                         manifest_path)
-
-            for spec in manifest['import_specifications']:
-                import_name_in_spec = spec['import_name']
-                if import_name in ('all', import_name_in_spec):
+            manifests = {}
+            for import_dir in import_dirs:
+                manifest_path = os.path.join(repo_dir, import_dir,
+                                             self.config.manifest_filename)
+                manifests[import_dir] = parse_manifest(manifest_path)
+                logging.info('%s: loaded manifest %s', run_name, manifest_path)
+
+            imports_to_execute = []
+            executed = set()
+            for import_dir, import_name in targets:
+                for spec in manifests[import_dir]['import_specifications']:
+                    key = (import_dir, spec['import_name'])
+                    if (import_name in ('all', spec['import_name']) and
+                            key not in executed):
+                        executed.add(key)
+                        imports_to_execute.append((import_dir, spec))
+
+            if paths is not None:
+                with recorder.stage('repo_download_dependencies'):
+                    self._extract_dependencies(tmpdir, repo_dir, commit_sha,
+                                               manifests, imports_to_execute)
+
+            imports_to_execute = import_target.add_dependencies(
+                imports_to_execute, self.config.manifest_filename, repo_dir)
+
+            results = self._import_all(
+                repo_dir,
+                imports_to_execute,
+                run_id,
+                skip_unchanged=self.config.skip_unchanged_imports,
+                shared_stages=recorder.stages)
+            result = _summarize_results(results)
+            if result.status == 'failed':
+                raise ExecutionError(result)
+
+        logging.info('%s: END', run_name)
+        return result
+
+    def _extract_dependencies(self, dest_dir: str, repo_dir: str,
+                              commit_sha: str, manifests: Dict[str, Dict],
+                              imports: List[Tuple[str, Dict]]) -> None:
+        """Extracts what a sparsely extracted repository is missing for a
+        list of imports and their dependencies.
+
+        These are the directories of the imports the imports depend on,
+        directly or indirectly, and the paths in the repo_dependencies
+        field of the manifests of the imports and their dependencies. The
+        manifests of the dependencies are only known once their directories
+        are extracted, so the repository is extracted again for each level
+        of dependencies until nothing new is found.
+
+        Args:
+            dest_dir: Directory the repository was downloaded into, as a
+                string.
+            repo_dir: Absolute path to the extracted repository as a string.
+            commit_sha: Commit the repository was extracted at, as a string.
+            manifests: Dict mapping the directories of the imports to their
+                parsed manifests.
+            imports: List of tuples each consisting of the directory of an
+                import and its import specification.
+        """
+        manifests = dict(manifests)
+        extracted = set(manifests).union(self.config.repo_common_paths)
+        found = {
+            import_target.get_absolute_import_name(import_dir,
+                                                   spec['import_name'])
+            for import_dir, spec in imports
+        }
+        new_manifests = list(manifests.values())
+        pending = list(imports)
+        while new_manifests or pending:
+            paths = []
+            for manifest in new_manifests:
+                for path in manifest.get('repo_dependencies') or []:
+                    if path not in extracted and path not in paths:
+                        paths.append(path)
+            dependencies = []
+            for import_dir, spec in pending:
+                for name in import_target.get_dependencies(import_dir, spec):
+                    if name in found:
+                        continue
+                    found.add(name)
+                    dependencies.append(name)
+                    dependency_dir, _ = (
+                        import_target.split_absolute_import_name(name))
+                    if (dependency_dir not in extracted and
+                            dependency_dir not in paths):
+                        paths.append(dependency_dir)
+            if paths:
+                with tracing.span('download_repo',
+                                  commit_sha=commit_sha,
+                                  paths=paths):
+                    self.github.download_repo(
+                        dest_dir,
+                        commit_sha,
+                        timeout=self.config.repo_download_timeout,
+                        paths=paths)
+                extracted.update(paths)
+                logging.info(
+                    'ImportExecutor._extract_dependencies: Extracted %s', paths)
+
+            new_manifests = []
+            pending = []
+            for name in dependencies:
+                dependency_dir, dependency_name = (
+                    import_target.split_absolute_import_name(name))
+                if dependency_dir not in manifests:
                     try:
-                        self._import_one(
-                            repo_dir=repo_dir,
-                            relative_import_dir=import_dir,
-                            absolute_import_dir=absolute_import_dir,
-                            import_spec=spec,
-                            run_id=run_id)
-                    except Exception:
-                        raise ExecutionError(
-                            ExecutionResult('failed', executed_imports,
-                                            traceback.format_exc()))
-                    executed_imports.append(
-                        import_target.get_absolute_import_name(
-                            import_dir, import_name_in_spec))
-
-        logging.info('%s: END', absolute_import_name)
-        return ExecutionResult('succeeded', executed_imports, 'No issues')
+                        manifests[dependency_dir] = parse_manifest(
+                            os.path.join(repo_dir, dependency_dir,
+                                         self.config.manifest_filename))
+                    except FileNotFoundError:
+                        # Reported by import_target.add_dependencies
+                        manifests[dependency_dir] = {}
+                    new_manifests.append(manifests[dependency_dir])
+                for spec in manifests[dependency_dir].get(
+                        'import_specifications', []):
+                    if spec['import_name'] == dependency_name:
+                        pending.append((dependency_dir, spec))
 
     def _execute_imports_on_commit_helper(self,
                                           commit_sha: str,
@@ -251,36 +455,33 @@ class ImportExecutor:
         manifest_dirs = self.github.find_dirs_in_commit_containing_file(
             commit_sha, self.config.manifest_filename)
 
+        recorder = resource_usage.ResourceRecorder()
         with tempfile.TemporaryDirectory() as tmpdir:
-            repo_dir = self.github.download_repo(
-                tmpdir, commit_sha, self.config.repo_download_timeout)
+            with recorder.stage('repo_download'):
+                with tracing.span('download_repo', commit_sha=commit_sha):
+                    repo_dir = self.github.download_repo(
+                        tmpdir, commit_sha, self.config.repo_download_timeout)
             if self.dashboard:
                 self.dashboard.info(f'Downloaded repo: {repo_dir}',
                                     run_id=run_id)
 
-            imports_to_execute = import_target.find_imports_to_execute(
-                targets=targets,
-                manifest_dirs=manifest_dirs,
-                manifest_filename=self.config.manifest_filename,
-                repo_dir=repo_dir)
-
-            executed_imports = []
-            for relative_dir, spec in imports_to_execute:
-                try:
-                    self._import_one(repo_dir=repo_dir,
-                                     relative_import_dir=relative_dir,
-                                     absolute_import_dir=os.path.join(
-                                         repo_dir, relative_dir),
-                                     import_spec=spec,
-                                     run_id=run_id)
-
-                except Exception:
-                    raise ExecutionError(
-                        ExecutionResult('failed', executed_imports,
-                                        traceback.format_exc()))
-                absolute_name = import_target.get_absolute_import_name(
-                    relative_dir, spec['import_name'])
-                executed_imports.append(absolute_name)
+            with tracing.span('find_imports_to_execute',
+                              targets=','.join(targets)) as span:
+                imports_to_execute = import_target.find_imports_to_execute(
+                    targets=targets,
+                    manifest_dirs=manifest_dirs,
+                    manifest_filename=self.config.manifest_filename,
+                    repo_dir=repo_dir,
+                    with_dependencies=True)
+                span.set_attribute('num_imports', len(imports_to_execute))
+
+            results = self._import_all(repo_dir,
+                                       imports_to_execute,
+                                       run_id,
+                                       shared_stages=recorder.stages)
+            result = _summarize_results(results)
+            if result.status == 'failed':
+                raise ExecutionError(result)
 
             if self.dashboard:
                 self.dashboard.update_run(
@@ -289,16 +490,158 @@ class ImportExecutor:
                         'time_completed': utils.utctime()
                     }, run_id)
 
-            return ExecutionResult('succeeded', executed_imports, 'No issues')
+            return result
+
+    def _import_all(
+        self,
+        repo_dir: str,
+        imports_to_execute: List[Tuple[str, Dict]],
+        run_id: str = None,
+        skip_unchanged: bool = False,
+        shared_stages: List[resource_usage.StageUsage] = None
+    ) -> List[ExecutionResult]:
+        """Executes a list of imports using a pool of at most
+        config.import_max_workers threads.
+
+        An import starts as soon as the imports in the list it depends on
+        (see import_target.get_dependency_graph) have succeeded, so
+        independent imports run concurrently. If one of them fails or is
+        cancelled, the imports that depend on it, directly or indirectly,
+        are cancelled. If config.import_fail_fast is set, all imports that
+        have not started when an import fails are cancelled. Imports that
+        have already started are always run to completion.
+
+        Imports in the same directory share the directory, so imports that
+        download or generate files with the same names should not be
+        executed concurrently unless one depends on the other.
 
-    def _import_one(self,
-                    repo_dir: str,
-                    relative_import_dir: str,
-                    absolute_import_dir: str,
-                    import_spec: dict,
-                    run_id: str = None) -> None:
+        Args:
+            repo_dir: Absolute path to the repository, as a string.
+            imports_to_execute: List of tuples each consisting of 1) the path,
+                as a string, to the directory containing an import to
+                execute, relative to the root directory of the repository
+                and 2) the import specification, as a dict.
+            run_id: ID of the system run as a string. This is only used to
+                communicate with the import progress dashboard.
+            skip_unchanged: See _import_one. Imports that other imports in
+                the list depend on are never skipped, since the imports
+                depending on them may need the files they generate.
+            shared_stages: See _import_one.
+
+        Returns:
+            List of ExecutionResult objects, one for each import in the same
+            order as imports_to_execute. The imports_executed field of each
+            result contains the absolute import name of the import. The status
+            of an import not started because of a failure is 'cancelled'.
+        """
+        stop = threading.Event()
+        parent_span = tracing.current_span()
+
+        def import_one(relative_dir: str, spec: Dict,
+                       skip: bool) -> ExecutionResult:
+            absolute_name = import_target.get_absolute_import_name(
+                relative_dir, spec['import_name'])
+            if stop.is_set():
+                return ExecutionResult('cancelled', [absolute_name],
+                                       'Cancelled because an import failed')
+            try:
+                with tracing.span('import_one',
+                                  parent=parent_span,
+                                  absolute_import_name=absolute_name):
+                    self._import_one(repo_dir=repo_dir,
+                                     relative_import_dir=relative_dir,
+                                     absolute_import_dir=os.path.join(
+                                         repo_dir, relative_dir),
+                                     import_spec=spec,
+                                     run_id=run_id,
+                                     skip_unchanged=skip,
+                                     shared_stages=shared_stages)
+            except Exception:
+                logging.exception('%s: import failed', absolute_name)
+                if self.config.import_fail_fast:
+                    stop.set()
+                return ExecutionResult('failed', [absolute_name],
+                                       traceback.format_exc())
+            return ExecutionResult('succeeded', [absolute_name], 'No issues')
+
+        names = [
+            import_target.get_absolute_import_name(relative_dir,
+                                                   spec['import_name'])
+            for relative_dir, spec in imports_to_execute
+        ]
+        imports = dict(zip(names, imports_to_execute))
+        with self._progress_lock:
+            self._progress = {name: {'status': 'queued'} for name in names}
+        graph = import_target.get_dependency_graph(imports_to_execute)
+        waiting = {name: set(graph[name]) for name in names}
+        dependents = {name: [] for name in names}
+        for name in names:
+            for dependency in graph[name]:
+                dependents[dependency].append(name)
+        results = {}
+
+        def cancel_dependents(name: str) -> None:
+            pending = list(dependents[name])
+            while pending:
+                dependent = pending.pop()
+                if dependent in results:
+                    continue
+                results[dependent] = ExecutionResult(
+                    'cancelled', [dependent],
+                    f'Cancelled because {name}, which it depends on, did not '
+                    f'succeed')
+                self._report_progress(dependent, status='cancelled')
+                pending.extend(dependents[dependent])
+
+        max_workers = max(1, self.config.import_max_workers)
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            running = {}
+
+            def start(name: str) -> None:
+                relative_dir, spec = imports[name]
+                skip = skip_unchanged and not dependents[name]
+                running[pool.submit(import_one, relative_dir, spec,
+                                    skip)] = name
+
+            for name in names:
+                if not waiting[name]:
+                    start(name)
+            while running:
+                done, _ = futures.wait(running,
+                                       return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    self._report_progress(name, status=results[name].status)
+                    if results[name].status != 'succeeded':
+                        cancel_dependents(name)
+                        continue
+                    for dependent in dependents[name]:
+                        waiting[dependent].discard(name)
+                        if not waiting[dependent] and dependent not in results:
+                            start(dependent)
+        for name in names:
+            if name not in results:
+                # Only possible if the dependencies form a cycle
+                results[name] = ExecutionResult(
+                    'cancelled', [name],
+                    'Cancelled because its dependencies form a cycle')
+        return [results[name] for name in names]
+
+    def _import_one(
+            self,
+            repo_dir: str,
+            relative_import_dir: str,
+            absolute_import_dir: str,
+            import_spec: dict,
+            run_id: str = None,
+            skip_unchanged: bool = False,
+            shared_stages: List[resource_usage.StageUsage] = None) -> None:
         """Executes an import.
 
+        The resources used by each stage of the import are recorded in the
+        resource_usage field of the import attempt.
+
         Args:
             repo_dir: Absolute path to the repository, as a string.
             relative_import_dir: Path to the directory containing the manifest
@@ -308,6 +651,16 @@ class ImportExecutor:
             import_spec: Specification of the import as a dict.
             run_id: ID of the system run that executes the import. This is only
                 used to communicate with the import progress dashboard.
+            skip_unchanged: Whether to skip the import if its code and
+                downloaded files have not changed since it last succeeded
+                with skip_unchanged set. This requires source_cache to be
+                set. Imports without data_download_url are only skipped if
+                config.skip_unchanged_without_downloads is set, since their
+                scripts may download their inputs themselves.
+            shared_stages: List of resource_usage.StageUsage objects of the
+                stages shared by all imports of the system run, e.g.,
+                downloading the repository. These are recorded for the
+                import in addition to its own stages.
         """
         import_name = import_spec['import_name']
         absolute_import_name = import_target.get_absolute_import_name(
@@ -323,14 +676,24 @@ class ImportExecutor:
                 provenance_url=import_spec['provenance_url'],
                 provenance_description=import_spec['provenance_description'])
             attempt_id = attempt['attempt_id']
+        recorder = resource_usage.ResourceRecorder(shared_stages,
+                                                   on_stage=functools.partial(
+                                                       self._report_stage,
+                                                       absolute_import_name))
         try:
-            self._import_one_helper(repo_dir=repo_dir,
-                                    relative_import_dir=relative_import_dir,
-                                    absolute_import_dir=absolute_import_dir,
-                                    import_spec=import_spec,
-                                    run_id=run_id,
-                                    attempt_id=attempt_id)
-            if self.notifier:
+            executed = self._import_one_helper(
+                repo_dir=repo_dir,
+                relative_import_dir=relative_import_dir,
+                absolute_import_dir=absolute_import_dir,
+                import_spec=import_spec,
+                run_id=run_id,
+                attempt_id=attempt_id,
+                skip_unchanged=skip_unchanged,
+                recorder=recorder)
+            _report_resource_usage(recorder=recorder,
+                                   attempt_id=attempt_id,
+                                   dashboard=self.dashboard)
+            if self.notifier and executed:
                 self.notifier.send(
                     subject=(f'Import Automation - {absolute_import_name} '
                              f'- Succeeded'),
@@ -341,7 +704,15 @@ class ImportExecutor:
             if self.dashboard:
                 _mark_import_attempt_failed(attempt_id=attempt_id,
                                             message=traceback.format_exc(),
-                                            dashboard=self.dashboard)
+                                            dashboard=self.dashboard,
+                                            run_id=run_id)
+            try:
+                _report_resource_usage(recorder=recorder,
+                                       attempt_id=attempt_id,
+                                       dashboard=self.dashboard)
+            except Exception:
+                logging.exception('%s: failed to report resource usage',
+                                  absolute_import_name)
             if self.notifier:
                 self.notifier.send(
                     subject=(f'Import Automation - {absolute_import_name} '
@@ -350,13 +721,16 @@ class ImportExecutor:
                     receiver_addresses=curator_emails)
             raise exc
 
-    def _import_one_helper(self,
-                           repo_dir: str,
-                           relative_import_dir: str,
-                           absolute_import_dir: str,
-                           import_spec: dict,
-                           run_id: str = None,
-                           attempt_id: str = None) -> None:
+    def _import_one_helper(
+            self,
+            repo_dir: str,
+            relative_import_dir: str,
+            absolute_import_dir: str,
+            import_spec: dict,
+            run_id: str = None,
+            attempt_id: str = None,
+            skip_unchanged: bool = False,
+            recorder: resource_usage.ResourceRecorder = None) -> bool:
         """Helper for _import_one.
 
         Args:
@@ -364,71 +738,166 @@ class ImportExecutor:
             attempt_id: ID of the import attempt executed by the system run
                 with the run_id, as a string. This is only used to communicate
                 with the import progress dashboard.
+            recorder: ResourceRecorder object to record the resources used by
+                each stage of the import in.
+
+        Returns:
+            False if the import is skipped because it is unchanged, True
+            otherwise.
         """
+        absolute_import_name = import_target.get_absolute_import_name(
+            relative_import_dir, import_spec['import_name'])
+        recorder = recorder or resource_usage.ResourceRecorder()
+        requirements_path = os.path.join(absolute_import_dir,
+                                         self.config.requirements_filename)
+        central_requirements_path = os.path.join(
+            repo_dir, self.config.requirements_filename)
+        fingerprint = None
         urls = import_spec.get('data_download_url')
-        if urls:
-            for url in urls:
-                utils.download_file(url, absolute_import_dir,
-                                    self.config.file_download_timeout)
-                if self.dashboard:
-                    self.dashboard.info(f'Downloaded: {url}',
+        specs = downloader.parse_download_specs(urls) if urls else []
+        code_digest = None
+        if (skip_unchanged and self.source_cache and
+            (specs or self.config.skip_unchanged_without_downloads)):
+            # Computed before the downloads add files to the directory.
+            # Scripts outside the directory, e.g., '../common/clean.py',
+            # are part of the code of the import too.
+            outside_paths = [central_requirements_path]
+            for path in import_spec.get('scripts') or []:
+                path = os.path.normpath(os.path.join(absolute_import_dir, path))
+                if not path.startswith(
+                        os.path.normpath(absolute_import_dir) + os.sep):
+                    outside_paths.append(path)
+            code_digest = source_cache.get_code_digest(absolute_import_dir,
+                                                       import_spec,
+                                                       outside_paths)
+        if specs:
+            with recorder.stage('download'):
+                self.downloader.download_all(specs, absolute_import_dir,
+                                             self.config.file_download_timeout)
+            if self.dashboard:
+                for spec in specs:
+                    self.dashboard.info(f'Downloaded: {spec.url}',
                                         attempt_id=attempt_id,
                                         run_id=run_id)
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            requirements_path = os.path.join(absolute_import_dir,
-                                             self.config.requirements_filename)
-            central_requirements_path = os.path.join(
-                repo_dir, self.config.requirements_filename)
-            interpreter_path, process = _create_venv(
-                (central_requirements_path, requirements_path),
-                tmpdir,
-                timeout=self.config.venv_create_timeout)
-
-            _log_process(process=process,
-                         dashboard=self.dashboard,
-                         attempt_id=attempt_id,
-                         run_id=run_id)
-            process.check_returncode()
-
-            script_paths = import_spec.get('scripts')
-            for path in script_paths:
-                process = _run_user_script(
-                    interpreter_path=interpreter_path,
-                    script_path=os.path.join(absolute_import_dir, path),
-                    timeout=self.config.user_script_timeout,
-                    cwd=absolute_import_dir)
+        if code_digest:
+            fingerprint = self.source_cache.get_fingerprint(
+                code_digest, [spec.url for spec in specs])
+        if self.source_cache and self.source_cache.is_unchanged(
+                absolute_import_name, fingerprint):
+            logging.info('%s: unchanged since it last succeeded',
+                         absolute_import_name)
+            if self.dashboard:
+                self.dashboard.info(
+                    'Code and downloaded files are unchanged since the '
+                    'import last succeeded. Skipping the import.',
+                    attempt_id=attempt_id,
+                    run_id=run_id)
+                self.dashboard.update_attempt(
+                    {
+                        'status': 'unchanged',
+                        'time_completed': utils.utctime()
+                    }, attempt_id)
+            return False
+        with contextlib.ExitStack() as venv_context:
+            with recorder.stage('venv'):
+                interpreter_path, process = venv_context.enter_context(
+                    self._venv((central_requirements_path, requirements_path)))
+            if process:
                 _log_process(process=process,
                              dashboard=self.dashboard,
                              attempt_id=attempt_id,
                              run_id=run_id)
                 process.check_returncode()
-
-        inputs = self._upload_import_inputs(
-            import_dir=absolute_import_dir,
-            output_dir=f'{relative_import_dir}/{import_spec["import_name"]}',
-            import_inputs=import_spec.get('import_inputs', []),
-            attempt_id=attempt_id)
-
-        if self.importer:
-            self.importer.delete_previous_output(relative_import_dir,
-                                                 import_spec)
-
-            if self.dashboard:
+            elif self.dashboard:
                 self.dashboard.info(
-                    f'Submitting job to delete the previous import',
+                    f'Reusing cached virtual environment: {interpreter_path}',
                     attempt_id=attempt_id,
                     run_id=run_id)
+
+            output_callback = None
+            if self.dashboard:
+                output_callback = functools.partial(_log_output,
+                                                    dashboard=self.dashboard,
+                                                    attempt_id=attempt_id,
+                                                    run_id=run_id)
+
+            script_paths = import_spec.get('scripts')
+            request = self._estimate_resources(absolute_import_name,
+                                               import_spec)
+            with recorder.stage('admission'):
+                granted = self.admission_controller.acquire(
+                    absolute_import_name, request)
+            limits = admission.get_limits(
+                granted, admission.get_declared_resources(import_spec),
+                self.config.user_script_limit_factor,
+                self.config.user_script_cgroup_root)
+            # Only the usage of scripts that succeeded, or were killed for
+            # exceeding the memory limit, says how much the import needs.
+            record_usage = False
             try:
-                self.importer.delete_import(
-                    relative_import_dir,
-                    import_spec,
-                    block=True,
-                    timeout=self.config.importer_delete_timeout)
-            except import_service.ImportNotFoundError as exc:
-                # If this is the first time executing this import,
-                # there will be no previous import
-                logging.warning(str(exc))
+                with recorder.stage('scripts') as scripts_usage:
+                    spawner = self._get_zygote(interpreter_path)
+                    for path in script_paths:
+                        process = _run_user_script(
+                            interpreter_path=interpreter_path,
+                            script_path=os.path.join(absolute_import_dir, path),
+                            timeout=self.config.user_script_timeout,
+                            cwd=absolute_import_dir,
+                            output_callback=output_callback,
+                            callback_interval=self.config.
+                            user_script_log_interval,
+                            max_output_size=self.config.
+                            user_script_output_max_size,
+                            limits=limits,
+                            spawner=spawner)
+                        _log_process(process=process,
+                                     dashboard=self.dashboard,
+                                     attempt_id=attempt_id,
+                                     run_id=run_id)
+                        if process.returncode == -signal.SIGKILL:
+                            record_usage = True
+                        process.check_returncode()
+                    record_usage = True
+            finally:
+                self.admission_controller.release(granted)
+                usage = None
+                if record_usage:
+                    usage = admission.get_observed_usage(scripts_usage)
+                if usage:
+                    self.admission_controller.history.record(
+                        absolute_import_name, usage)
+
+        output_dir = f'{relative_import_dir}/{import_spec["import_name"]}'
+        with recorder.stage('upload'):
+            inputs = self._upload_import_inputs(import_dir=absolute_import_dir,
+                                                output_dir=output_dir,
+                                                import_inputs=import_spec.get(
+                                                    'import_inputs', []),
+                                                attempt_id=attempt_id,
+                                                run_id=run_id)
+
+        if self.importer:
+            with recorder.stage('delete_previous_import'):
+                self.importer.delete_previous_output(relative_import_dir,
+                                                     import_spec)
+
+                if self.dashboard:
+                    self.dashboard.info(
+                        f'Submitting job to delete the previous import',
+                        attempt_id=attempt_id,
+                        run_id=run_id)
+                try:
+                    with tracing.span('delete_import',
+                                      import_dir=relative_import_dir):
+                        self.importer.delete_import(
+                            relative_import_dir,
+                            import_spec,
+                            block=True,
+                            timeout=self.config.importer_delete_timeout)
+                except import_service.ImportNotFoundError as exc:
+                    # If this is the first time executing this import,
+                    # there will be no previous import
+                    logging.warning(str(exc))
             if self.dashboard:
                 self.dashboard.info(f'Deleted previous import',
                                     attempt_id=attempt_id,
@@ -436,35 +905,126 @@ class ImportExecutor:
                 self.dashboard.info(f'Submitting job to perform the import',
                                     attempt_id=attempt_id,
                                     run_id=run_id)
-            self.importer.smart_import(
-                relative_import_dir,
-                inputs,
-                import_spec,
-                block=True,
-                timeout=self.config.importer_import_timeout)
+            with recorder.stage('import'):
+                with tracing.span('smart_import',
+                                  import_dir=relative_import_dir):
+                    self.importer.smart_import(
+                        relative_import_dir,
+                        inputs,
+                        import_spec,
+                        block=True,
+                        timeout=self.config.importer_import_timeout)
             if self.dashboard:
                 self.dashboard.info(f'Import succeeded',
                                     attempt_id=attempt_id,
                                     run_id=run_id)
 
+        if self.source_cache:
+            self.source_cache.record_success(absolute_import_name, fingerprint)
         if self.dashboard:
             self.dashboard.update_attempt(
                 {
                     'status': 'succeeded',
                     'time_completed': utils.utctime()
                 }, attempt_id)
+        return True
+
+    def _report_stage(self, absolute_import_name: str, stage: str) -> None:
+        """Reports that an import started a stage."""
+        self._report_progress(absolute_import_name,
+                              status='running',
+                              stage=stage)
+
+    def _report_progress(self, absolute_import_name: str, **fields) -> None:
+        """Updates the progress of an import and calls progress_callback
+        with the progress of all imports of the system run. Failures of the
+        callback are logged and ignored."""
+        if not self.progress_callback:
+            return
+        # Held while calling the callback so that it sees the updates in
+        # order
+        with self._progress_lock:
+            self._progress.setdefault(absolute_import_name, {}).update(fields)
+            progress = {
+                name: dict(fields) for name, fields in self._progress.items()
+            }
+            try:
+                self.progress_callback(progress)
+            except Exception:
+                logging.exception('ImportExecutor._report_progress: Failed to '
+                                  'report progress')
+
+    def _estimate_resources(self, absolute_import_name: str,
+                            import_spec: dict) -> admission.ResourceRequest:
+        """Estimates the resources the user scripts of an import will use
+        from its usage history, its import specification, or the defaults
+        in config, in that order."""
+        return admission.estimate_request(
+            import_spec,
+            self.admission_controller.history.estimate(
+                absolute_import_name, self.config.resource_estimate_headroom),
+            admission.ResourceRequest(
+                cpus=self.config.import_default_cpus,
+                memory=self.config.import_default_memory_mb * 1024**2))
+
+    def _get_zygote(self, interpreter_path: str) -> Optional[zygote.Zygote]:
+        """Returns the zygote to fork user scripts run with an interpreter
+        from, or None if user scripts are not forked or the zygote failed to
+        start."""
+        if not self.zygotes:
+            return None
+        try:
+            return self.zygotes.get(interpreter_path)
+        except zygote.ZygoteError:
+            logging.exception(
+                'ImportExecutor._get_zygote: Running user scripts in new '
+                'interpreters')
+            return None
+
+    @contextlib.contextmanager
+    def _venv(
+        self, requirements_path: Iterable[str]
+    ) -> Iterator[Tuple[str, Optional[subprocess.CompletedProcess]]]:
+        """Gets a Python virtual environment with the requirements installed.
+
+        The environment is taken from venv_cache if it is set. Otherwise, it
+        is created in a temporary directory removed when the context exits.
+
+        Args:
+            requirements_path: List of paths to pip requirement files listing
+                the dependencies to install, each as a string.
+
+        Yields:
+            A tuple consisting of the path to the interpreter as a string and
+            the subprocess.CompletedProcess object used to create the
+            environment. The latter is None if a cached environment is reused.
+        """
+        if self.venv_cache:
+            with self.venv_cache.venv(
+                    requirements_path,
+                    timeout=self.config.venv_create_timeout) as result:
+                yield result
+        else:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                yield venv_cache.create_venv(
+                    requirements_path,
+                    tmpdir,
+                    timeout=self.config.venv_create_timeout)
 
     def _upload_import_inputs(
             self,
             import_dir: str,
             output_dir: str,
             import_inputs: List[Dict[str, str]],
-            attempt_id: str = None) -> 'import_service.ImportInputs':
+            attempt_id: str = None,
+            run_id: str = None) -> 'import_service.ImportInputs':
         """Uploads the generated import data files.
 
         Data files are uploaded to <output_dir>/<version>/, where <version> is a
         time string and is written to <output_dir>/<storage_version_filename>
-        after the uploads are complete.
+        after the uploads are complete. If config.output_dedup is set, files
+        are stored in the content-addressed output store, see
+        output_store.OutputStore.
 
         Args:
             import_dir: Absolute path to the directory with the manifest,
@@ -476,45 +1036,89 @@ class ImportExecutor:
             attempt_id: ID of the import attempt executed by the system run
                 with the run_id, as a string. This is only used to communicate
                 with the import progress dashboard.
+            run_id: ID of the system run as a string. This is only used to
+                communicate with the import progress dashboard.
 
         Returns:
             ImportInputs object containing the paths to the uploaded inputs.
         """
         uploaded = import_service.ImportInputs()
         version = _clean_time(utils.pacific_time())
+        files = []
         for import_input in import_inputs:
             for input_type in self.config.import_input_types:
                 path = import_input.get(input_type)
                 if path:
                     dest = f'{output_dir}/{version}/{os.path.basename(path)}'
-                    self._upload_file_helper(src=os.path.join(import_dir, path),
-                                             dest=dest,
-                                             attempt_id=attempt_id)
+                    files.append((os.path.join(import_dir, path), dest))
                     setattr(uploaded, input_type, dest)
+        self._upload_files_helper(files,
+                                  output_dir=output_dir,
+                                  version=version,
+                                  attempt_id=attempt_id,
+                                  run_id=run_id)
         self.uploader.upload_string(
             version,
             os.path.join(output_dir, self.config.storage_version_filename))
         return uploaded
 
-    def _upload_file_helper(self,
-                            src: str,
-                            dest: str,
-                            attempt_id: str = None) -> None:
-        """Uploads a file from src to dest.
+    def _upload_files_helper(self,
+                             files: List[Tuple[str, str]],
+                             output_dir: str,
+                             version: str,
+                             attempt_id: str = None,
+                             run_id: str = None) -> None:
+        """Uploads files concurrently.
 
         Args:
-            src: Path to the file to upload, as a string.
-            dest: Path to where the file is to be uploaded to, as a string.
+            files: List of tuples each consisting of the path to a file to
+                upload and the path to where it is to be uploaded to, both as
+                strings.
+            output_dir: Path to the output directory, as a string.
+            version: Version of the outputs the files belong to, as a string.
             attempt_id: ID of the import attempt executed by the system run
                 with the run_id, as a string. This is only used to communicate
                 with the import progress dashboard.
+            run_id: ID of the system run as a string. This is only used to
+                communicate with the import progress dashboard.
         """
         if self.dashboard:
-            with open(src) as file:
+            for src, _ in files:
+                with open(src) as file:
+                    self.dashboard.info(
+                        f'Uploading {src}: {file.readline().strip()}',
+                        attempt_id=attempt_id,
+                        run_id=run_id)
+        with tracing.span('upload_files', num_files=len(files)) as span:
+            if self.config.output_dedup:
+                manifest = self.output_store.put_version(
+                    files,
+                    output_dir=output_dir,
+                    version=version,
+                    max_workers=self.config.upload_max_workers)
+                results = manifest.uploads
+            else:
+                results = self.uploader.upload_files(
+                    files, max_workers=self.config.upload_max_workers)
+            span.set_attribute('num_uploaded', len(results))
+            span.set_attribute('size', sum(result.size for result in results))
+        if self.dashboard and self.config.output_dedup:
+            for output_file in manifest.files:
+                if output_file.reused:
+                    self.dashboard.info(
+                        f'Reused {output_file.blob} for '
+                        f'{output_file.dest}: unchanged since an earlier '
+                        'version',
+                        attempt_id=attempt_id,
+                        run_id=run_id)
+        if self.dashboard:
+            for result in results:
                 self.dashboard.info(
-                    f'Uploaded {src}: {file.readline().strip()}',
-                    attempt_id=attempt_id)
-        self.uploader.upload_file(src, dest)
+                    f'Uploaded {result.src} to {result.dest}: '
+                    f'{result.size} bytes in {result.duration:.2f} seconds '
+                    f'({result.throughput / 1024**2:.2f} MiB/s)',
+                    attempt_id=attempt_id,
+                    run_id=run_id)
 
 
 def parse_manifest(path: str) -> dict:
@@ -534,6 +1138,20 @@ def parse_manifest(path: str) -> dict:
         return json.load(file)
 
 
+def create_admission_controller(
+        config: configs.ExecutorConfig) -> admission.AdmissionController:
+    """Creates an AdmissionController with the budget and usage history
+    configured by config.admission_cpu_budget,
+    config.admission_memory_budget_mb, and config.resource_history_dir."""
+    budget = admission.get_host_budget()
+    if config.admission_cpu_budget:
+        budget.cpus = config.admission_cpu_budget
+    if config.admission_memory_budget_mb:
+        budget.memory = config.admission_memory_budget_mb * 1024**2
+    return admission.AdmissionController(
+        budget, admission.UsageHistory(config.resource_history_dir))
+
+
 def run_and_handle_exception(run_id: Optional[str],
                              dashboard: Optional[dashboard_api.DashboardAPI],
                              exec_func: Callable, *args) -> ExecutionResult:
@@ -565,73 +1183,83 @@ def run_and_handle_exception(run_id: Optional[str],
         if dashboard:
             _mark_system_run_failed(run_id, message, dashboard)
         return ExecutionResult('failed', [], message)
+    finally:
+        # Progress logs may be posted asynchronously
+        if dashboard:
+            dashboard.flush()
 
 
-def _run_with_timeout(args: List[str],
-                      timeout: float,
-                      cwd: str = None) -> subprocess.CompletedProcess:
-    """Runs a command in a subprocess.
+def _report_resource_usage(recorder: resource_usage.ResourceRecorder,
+                           attempt_id: Optional[str],
+                           dashboard: Optional[dashboard_api.DashboardAPI]):
+    """Logs the resources used by the stages of an import and records them
+    in the import attempt."""
+    for usage in recorder.stages:
+        logging.info(
+            '%s: %.2fs wall, %.2fs CPU, %.2fs child CPU, %d MiB child peak '
+            'RSS', usage.stage, usage.wall_time, usage.cpu_time,
+            usage.child_cpu_time, usage.child_peak_rss // 1024**2)
+    if dashboard:
+        dashboard.update_attempt({'resource_usage': recorder.to_list()},
+                                 attempt_id)
+
+
+def _summarize_results(results: List[ExecutionResult]) -> ExecutionResult:
+    """Combines the results of individual imports into one result.
 
     Args:
-        args: Command to run as a list. Each element is a string.
-        timeout: Maximum time the command can run for in seconds as a float.
-        cwd: Current working directory of the process as a string.
+        results: List of ExecutionResult objects each describing the result
+            of an import, as returned by ImportExecutor._import_all.
 
     Returns:
-        subprocess.CompletedProcess object used to run the command.
-
-    Raises:
-        Same exceptions as subprocess.run.
+        ExecutionResult object with status 'failed' if any import failed and
+        'succeeded' otherwise. Its imports_executed field contains the absolute
+        import names of the imports that succeeded. If any import failed, its
+        message field contains the messages of the failed imports.
     """
-    return subprocess.run(args,
-                          capture_output=True,
-                          text=True,
-                          timeout=timeout,
-                          cwd=cwd)
+    executed_imports = []
+    failure_messages = []
+    for result in results:
+        if result.status == 'succeeded':
+            executed_imports.extend(result.imports_executed)
+        elif result.status == 'failed':
+            failure_messages.append(result.message)
+    if failure_messages:
+        return ExecutionResult('failed', executed_imports,
+                               '\n'.join(failure_messages))
+    return ExecutionResult('succeeded', executed_imports, 'No issues')
 
 
-def _create_venv(requirements_path: Iterable[str], venv_dir: str,
-                 timeout: float) -> Tuple[str, subprocess.CompletedProcess]:
-    """Creates a Python virtual environment.
+def _run_with_timeout(args: List[str],
+                      timeout: float,
+                      cwd: str = None,
+                      **kwargs) -> subprocess.CompletedProcess:
+    """Runs a command in a subprocess.
 
-    The virtual environment is created with --system-site-packages set,
-    which allows it to access modules installed on the host. This provides
-    the opportunity to use the requirements.txt file for this project as
-    a central requirement file for all user scripts.
+    The output is read as it is produced and only its end is kept in memory.
+    See subprocess_runner.run.
 
     Args:
-        requirements_path: List of paths to pip requirement files listing the
-            dependencies to install, each as a string.
-        venv_dir: Path to the directory to create the virtual environment in
-            as a string.
-        timeout: Maximum time the creation script can run for in seconds
-            as a float.
+        args: Command to run as a list. Each element is a string.
+        timeout: Maximum time the command can run for in seconds as a float.
+        cwd: Current working directory of the process as a string.
+        **kwargs: Any of the other parameters of subprocess_runner.run.
 
     Returns:
-        A tuple consisting of the path to the created interpreter as a string
-        and a subprocess.CompletedProcess object used to create the environment.
+        subprocess.CompletedProcess object used to run the command.
 
     Raises:
-        Same exceptions as subprocess.run.
+        Same exceptions as subprocess_runner.run.
     """
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.sh') as script:
-        script.write(f'python3 -m venv --system-site-packages {venv_dir}\n')
-        script.write(f'. {venv_dir}/bin/activate\n')
-        for path in requirements_path:
-            if os.path.exists(path):
-                script.write('python3 -m pip install --no-cache-dir '
-                             f'--requirement {path}\n')
-        script.flush()
-
-        process = _run_with_timeout(['bash', script.name], timeout)
-        return os.path.join(venv_dir, 'bin/python3'), process
+    return subprocess_runner.run(args, timeout, cwd, **kwargs)
 
 
 def _run_user_script(interpreter_path: str,
                      script_path: str,
                      timeout: float,
                      args: list = None,
-                     cwd: str = None) -> subprocess.CompletedProcess:
+                     cwd: str = None,
+                     **kwargs) -> subprocess.CompletedProcess:
     """Runs a user Python script.
 
     Args:
@@ -643,6 +1271,9 @@ def _run_user_script(interpreter_path: str,
         args: A list of arguments each as a string to pass to the
             user script on the command line.
         cwd: Current working directory of the process as a string.
+        **kwargs: Any of the other parameters of subprocess_runner.run. If
+            the spawner fails to start the script, it is started in a new
+            interpreter instead.
 
     Returns:
         subprocess.CompletedProcess object used to run the script.
@@ -653,8 +1284,21 @@ def _run_user_script(interpreter_path: str,
     """
     if args is None:
         args = []
-    return _run_with_timeout([interpreter_path, script_path] + list(args),
-                             timeout, cwd)
+    with tracing.span('run_user_script',
+                      script_path=script_path,
+                      forked=kwargs.get('spawner') is not None) as span:
+        try:
+            process = _run_with_timeout([interpreter_path, script_path] +
+                                        list(args), timeout, cwd, **kwargs)
+        except zygote.ZygoteError:
+            logging.exception(
+                '_run_user_script: Running %s in a new interpreter',
+                script_path)
+            kwargs.pop('spawner')
+            process = _run_with_timeout([interpreter_path, script_path] +
+                                        list(args), timeout, cwd, **kwargs)
+        span.set_attribute('returncode', process.returncode)
+        return process
 
 
 def _init_run_helper(dashboard: dashboard_api.DashboardAPI,
@@ -711,8 +1355,10 @@ def _mark_system_run_failed(run_id: str, message: str,
         }, run_id=run_id)
 
 
-def _mark_import_attempt_failed(attempt_id: str, message: str,
-                                dashboard: dashboard_api.DashboardAPI) -> Dict:
+def _mark_import_attempt_failed(attempt_id: str,
+                                message: str,
+                                dashboard: dashboard_api.DashboardAPI,
+                                run_id: str = None) -> Dict:
     """Communicates with the import progress dashboard that an import attempt
     has failed.
     
@@ -721,11 +1367,12 @@ def _mark_import_attempt_failed(attempt_id: str, message: str,
         message: An additional message to log to the dashboard
             with level critical.
         dashboard: DashboardAPI object for the communicaiton.
+        run_id: ID of the system run that executes the import attempt.
     
     Returns:
         Updated import attempt returned from the dashboard.
     """
-    dashboard.critical(message, attempt_id=attempt_id)
+    dashboard.critical(message, attempt_id=attempt_id, run_id=run_id)
     return dashboard.update_attempt(
         {
             'status': 'failed',
@@ -777,6 +1424,26 @@ def _construct_process_message(message: str,
     return message
 
 
+def _log_output(stream: str,
+                text: str,
+                dashboard: dashboard_api.DashboardAPI,
+                attempt_id: str = None,
+                run_id: str = None) -> None:
+    """Logs output of a running subprocess to the import progress dashboard.
+
+    Args:
+        stream: Name of the stream the output is from, 'stdout' or 'stderr'.
+        text: The output as a string.
+        dashboard: DashboardAPI object to communicate with the
+            import progress dashboard.
+        attempt_id: ID of the import attempt as a string.
+        run_id: ID of the system run as a string.
+    """
+    dashboard.info(f'[Subprocess {stream}]:\n{text}',
+                   attempt_id=attempt_id,
+                   run_id=run_id)
+
+
 def _log_process(process: subprocess.CompletedProcess,
                  dashboard: dashboard_api.DashboardAPI = None,
                  attempt_id: str = None,
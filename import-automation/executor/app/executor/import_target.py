@@ -22,6 +22,11 @@ Import targets specified in the commit message are of the form:
     All imports in the directory are executed.
 4) all
     All imports in directories touched by the commit are executed.
+
+An import specification can list the imports it depends on in its depends_on
+field, by relative import name for imports in the same manifest or by
+absolute import name. An import only starts once its dependencies executed in
+the same system run have succeeded.
 """
 
 import os
@@ -147,9 +152,12 @@ def find_targets_in_commit(commit_sha: str, tag: str,
     return parse_commit_message_targets(commit_message, tag)
 
 
-def find_imports_to_execute(targets: List[str], manifest_dirs: Set[str],
-                            manifest_filename: str,
-                            repo_dir: str) -> List[Tuple[str, Dict]]:
+def find_imports_to_execute(
+        targets: List[str],
+        manifest_dirs: Set[str],
+        manifest_filename: str,
+        repo_dir: str,
+        with_dependencies: bool = False) -> List[Tuple[str, Dict]]:
     """Finds imports to execute on a GitHub commit.
 
     Args:
@@ -159,17 +167,22 @@ def find_imports_to_execute(targets: List[str], manifest_dirs: Set[str],
             commit each as a string.
         manifest_filename: Filename of the manifest as a string.
         repo_dir: Absolute path to the repository as a string.
+        with_dependencies: Whether to also return the imports the targeted
+            imports depend on, directly or indirectly (see
+            add_dependencies).
 
     Returns:
         List of tuples each consisting of 1) the path, as a string, to the
         directory containing an import to execute, relative to the root
         directory of the repository and 2) the import specification, as a dict,
-        of the import to execute.
+        of the import to execute. Each import follows the imports in the list
+        it depends on.
 
     Raises:
         ValueError: The import targets are not valid (see
-            are_import_targets_valid) or the manifest is not valid (see
-            is_manifest_valid).
+            are_import_targets_valid), the manifest is not valid (see
+            is_manifest_valid), or the dependencies are not valid (see
+            add_dependencies and sort_imports).
     """
     validation.are_import_targets_valid(targets, list(manifest_dirs), repo_dir,
                                         manifest_filename)
@@ -197,4 +210,151 @@ def find_imports_to_execute(targets: List[str], manifest_dirs: Set[str],
                                                  spec['import_name'], targets):
                 continue
             imports_to_execute.append((import_dir, spec))
-    return imports_to_execute
+    if with_dependencies:
+        return add_dependencies(imports_to_execute, manifest_filename, repo_dir)
+    return sort_imports(imports_to_execute)
+
+
+def get_dependencies(import_dir: str, import_spec: Dict) -> List[str]:
+    """Returns the absolute import names of the imports an import depends on,
+    as listed in the depends_on field of its import specification.
+
+    Args:
+        import_dir: Path to the directory containing the manifest as a string,
+            relative to the root directory of the repository.
+        import_spec: Import specification as a dict.
+
+    Returns:
+        List of absolute import names each as a string.
+    """
+    dependencies = []
+    for name in import_spec.get('depends_on', []):
+        if is_relative_import_name(name):
+            name = get_absolute_import_name(import_dir, name)
+        dependencies.append(name)
+    return dependencies
+
+
+def get_dependency_graph(
+        imports: List[Tuple[str, Dict]]) -> Dict[str, List[str]]:
+    """Returns the dependencies of a list of imports among themselves.
+
+    Args:
+        imports: List of tuples each consisting of the path to the directory
+            containing the manifest and the import specification, as in the
+            return value of find_imports_to_execute.
+
+    Returns:
+        Dict mapping the absolute import name of each import to the list of
+        absolute import names of the imports in the list it depends on.
+        Dependencies not in the list are left out.
+    """
+    names = {
+        get_absolute_import_name(import_dir, spec['import_name'])
+        for import_dir, spec in imports
+    }
+    graph = {}
+    for import_dir, spec in imports:
+        name = get_absolute_import_name(import_dir, spec['import_name'])
+        graph[name] = [
+            dependency for dependency in get_dependencies(import_dir, spec)
+            if dependency in names
+        ]
+    return graph
+
+
+def sort_imports(imports: List[Tuple[str, Dict]]) -> List[Tuple[str, Dict]]:
+    """Sorts a list of imports so that each import follows the imports in the
+    list it depends on. Otherwise, the imports stay in the same order.
+
+    Args:
+        imports: See get_dependency_graph.
+
+    Returns:
+        The sorted list.
+
+    Raises:
+        ValueError: The dependencies form a cycle.
+    """
+    graph = get_dependency_graph(imports)
+    remaining = list(imports)
+    done = set()
+    sorted_imports = []
+    while remaining:
+        ready = [(import_dir, spec)
+                 for import_dir, spec in remaining
+                 if done.issuperset(graph[get_absolute_import_name(
+                     import_dir, spec['import_name'])])]
+        if not ready:
+            names = sorted(
+                get_absolute_import_name(import_dir, spec['import_name'])
+                for import_dir, spec in remaining)
+            raise ValueError(f'Dependency cycle among '
+                             f'{utils.list_to_str(names)}')
+        for import_dir, spec in ready:
+            done.add(get_absolute_import_name(import_dir, spec['import_name']))
+            sorted_imports.append((import_dir, spec))
+            remaining.remove((import_dir, spec))
+    return sorted_imports
+
+
+def add_dependencies(imports: List[Tuple[str, Dict]], manifest_filename: str,
+                     repo_dir: str) -> List[Tuple[str, Dict]]:
+    """Adds the imports a list of imports depends on, directly or indirectly,
+    to the list.
+
+    The dependencies are looked up in the manifests of the repository.
+
+    Args:
+        imports: See get_dependency_graph.
+        manifest_filename: Filename of the manifest as a string.
+        repo_dir: Absolute path to the repository as a string.
+
+    Returns:
+        The list of imports and their dependencies, sorted by sort_imports.
+
+    Raises:
+        ValueError: A dependency is not found in its manifest, the manifest
+            is not valid (see is_manifest_valid), or the dependencies form a
+            cycle.
+    """
+    result = list(imports)
+    found = {
+        get_absolute_import_name(import_dir, spec['import_name'])
+        for import_dir, spec in imports
+    }
+    manifests = {}
+    pending = list(imports)
+    while pending:
+        import_dir, spec = pending.pop()
+        for dependency in get_dependencies(import_dir, spec):
+            if dependency in found:
+                continue
+            dependency_dir, dependency_name = split_absolute_import_name(
+                dependency)
+            if dependency_dir not in manifests:
+                manifest_path = os.path.join(repo_dir, dependency_dir,
+                                             manifest_filename)
+                try:
+                    manifest = import_executor.parse_manifest(manifest_path)
+                except FileNotFoundError:
+                    raise ValueError(
+                        f'{spec["import_name"]} depends on {dependency} but '
+                        f'{os.path.join(dependency_dir, manifest_filename)} '
+                        f'does not exist')
+                validation.is_manifest_valid(manifest, repo_dir, dependency_dir)
+                manifests[dependency_dir] = manifest
+            specs = [
+                dependency_spec for dependency_spec in manifests[dependency_dir]
+                ['import_specifications']
+                if dependency_spec['import_name'] == dependency_name
+            ]
+            if not specs:
+                raise ValueError(
+                    f'{spec["import_name"]} depends on {dependency} but it is '
+                    f'not found in '
+                    f'{os.path.join(dependency_dir, manifest_filename)}')
+            found.add(dependency)
+            result.append((dependency_dir, specs[0]))
+            pending.append((dependency_dir, specs[0]))
+    return sort_imports(result)
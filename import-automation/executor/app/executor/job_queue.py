@@ -0,0 +1,377 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Durable queue of jobs backed by SQLite and a pool of workers draining it.
+
+The executor endpoints enqueue a job for each request and return its ID
+right away. Workers claim queued jobs in the order they were enqueued and
+record their progress, result, or error in the database, where they can be
+looked up by ID.
+
+Jobs survive restarts of the process. Each JobQueue has a random token, and
+a running job records the token of the queue that claimed it and a lease
+that the workers of that queue renew while the job runs. Running jobs whose
+lease has expired and that were claimed by another queue, e.g., one in a
+process that crashed, are queued again. Process IDs are not used since a
+restarted container usually reuses the ID of the crashed process.
+"""
+
+import os
+import json
+import functools
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+import traceback
+import contextlib
+import dataclasses
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '',
+    result TEXT,
+    error TEXT,
+    worker_pid INTEGER,
+    worker_token TEXT,
+    lease_expires REAL,
+    details TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+'''
+
+# Columns added after the table was first created, with their types
+_ADDED_COLUMNS = (('worker_token', 'TEXT'), ('lease_expires', 'REAL'),
+                  ('details', 'TEXT'))
+
+
+@dataclasses.dataclass
+class Job:
+    """Job in the queue.
+
+    Attributes:
+        id: ID of the job as a string.
+        kind: Kind of the job, which determines the handler that runs it, as
+            a string.
+        payload: Arguments of the job as a dict.
+        status: One of 'queued', 'running', 'succeeded', and 'failed'.
+        progress: Latest progress message as a string.
+        details: Structured progress of a running or finished job as a
+            dict, e.g., the status and stage of each import of a system
+            run, or None if the job has not reported any.
+        result: Result of a succeeded job as a dict.
+        error: Error message of a failed job as a string.
+        created_at: Time the job was enqueued in seconds since epoch.
+        started_at: Time the job was last claimed in seconds since epoch.
+        finished_at: Time the job finished in seconds since epoch.
+    """
+    id: str
+    kind: str
+    payload: Dict
+    status: str
+    progress: str = ''
+    details: Optional[Dict] = None
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    created_at: float = 0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class JobQueue:
+    """Durable queue of jobs stored in an SQLite database.
+
+    Safe to use from multiple threads and processes.
+
+    Attributes:
+        path: Path to the database file as a string.
+        lease_duration: Time in seconds a claimed job stays leased to this
+            queue without being renewed by renew_leases, as a float.
+        token: Random ID of this queue as a string, recorded with the jobs
+            it claims.
+    """
+
+    def __init__(self, path: str, lease_duration: float = 60):
+        self.path = os.path.abspath(path)
+        self.lease_duration = lease_duration
+        self.token = uuid.uuid4().hex
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+        with self._transaction() as connection:
+            columns = {
+                row[1] for row in connection.execute(
+                    'PRAGMA table_info(jobs)').fetchall()
+            }
+            for column, column_type in _ADDED_COLUMNS:
+                if column not in columns:
+                    connection.execute(
+                        f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+            self._requeue_orphans(connection)
+        logging.info('JobQueue.__init__: Initialized with database %s',
+                     self.path)
+
+    def enqueue(self, kind: str, payload: Dict) -> str:
+        """Adds a job to the queue.
+
+        Args:
+            kind: Kind of the job as a string.
+            payload: Arguments of the job as a JSON-serializable dict.
+
+        Returns:
+            ID of the job as a string.
+        """
+        job_id = uuid.uuid4().hex
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT INTO jobs (id, kind, payload, status, created_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(payload), QUEUED, time.time()))
+        logging.info('JobQueue.enqueue: Enqueued %s job %s', kind, job_id)
+        return job_id
+
+    def claim(self) -> Optional[Job]:
+        """Marks the oldest queued job as running by this queue, after
+        queueing orphaned jobs again.
+
+        Returns:
+            The claimed Job, or None if no job is queued.
+        """
+        with self._transaction() as connection:
+            self._requeue_orphans(connection)
+            row = connection.execute(
+                'SELECT id FROM jobs WHERE status = ? '
+                'ORDER BY created_at LIMIT 1', (QUEUED,)).fetchone()
+            if not row:
+                return None
+            now = time.time()
+            connection.execute(
+                'UPDATE jobs SET status = ?, worker_pid = ?, worker_token = ?, '
+                'lease_expires = ?, started_at = ? WHERE id = ?',
+                (RUNNING, os.getpid(), self.token, now + self.lease_duration,
+                 now, row[0]))
+        return self.get(row[0])
+
+    def renew_leases(self) -> None:
+        """Extends the leases of the running jobs claimed by this queue."""
+        with self._connect() as connection:
+            connection.execute(
+                'UPDATE jobs SET lease_expires = ? '
+                'WHERE status = ? AND worker_token = ?',
+                (time.time() + self.lease_duration, RUNNING, self.token))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Returns the job with the ID, or None if it does not exist."""
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT id, kind, payload, status, progress, details, result, '
+                'error, created_at, started_at, finished_at FROM jobs '
+                'WHERE id = ?', (job_id,)).fetchone()
+        if not row:
+            return None
+        return Job(id=row[0],
+                   kind=row[1],
+                   payload=json.loads(row[2]),
+                   status=row[3],
+                   progress=row[4],
+                   details=json.loads(row[5]) if row[5] else None,
+                   result=json.loads(row[6]) if row[6] else None,
+                   error=row[7],
+                   created_at=row[8],
+                   started_at=row[9],
+                   finished_at=row[10])
+
+    def set_progress(self,
+                     job_id: str,
+                     progress: str,
+                     details: Dict = None) -> None:
+        """Records the latest progress message of a job and, if given, its
+        structured progress as a JSON-serializable dict."""
+        with self._connect() as connection:
+            if details is None:
+                connection.execute('UPDATE jobs SET progress = ? WHERE id = ?',
+                                   (progress, job_id))
+            else:
+                connection.execute(
+                    'UPDATE jobs SET progress = ?, details = ? WHERE id = ?',
+                    (progress, json.dumps(details), job_id))
+
+    def succeed(self, job_id: str, result: Dict) -> None:
+        """Marks a job as succeeded with a JSON-serializable result."""
+        self._finish(job_id, SUCCEEDED, result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str) -> None:
+        """Marks a job as failed with an error message."""
+        self._finish(job_id, FAILED, error=error)
+
+    def _finish(self,
+                job_id: str,
+                status: str,
+                result: str = None,
+                error: str = None) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, '
+                'finished_at = ? WHERE id = ?',
+                (status, result, error, time.time(), job_id))
+
+    def _requeue_orphans(self, connection: sqlite3.Connection) -> None:
+        """Queues jobs again that were claimed by other queues and whose
+        lease has expired, within the transaction of connection."""
+        rows = connection.execute(
+            'SELECT id, worker_token FROM jobs WHERE status = ? AND '
+            '(worker_token IS NULL OR worker_token != ?) AND '
+            '(lease_expires IS NULL OR lease_expires < ?)',
+            (RUNNING, self.token, time.time())).fetchall()
+        for job_id, token in rows:
+            logging.warning(
+                'JobQueue._requeue_orphans: Requeuing job %s of '
+                'queue %s', job_id, token)
+            connection.execute(
+                'UPDATE jobs SET status = ?, worker_pid = NULL, '
+                'worker_token = NULL, lease_expires = NULL WHERE id = ?',
+                (QUEUED, job_id))
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Yields a connection in autocommit mode."""
+        connection = sqlite3.connect(self.path,
+                                     timeout=30,
+                                     isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Yields a connection in a transaction that holds the write lock of
+        the database, committing it if no exception is raised."""
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+
+# Function that runs a job given its payload and a function that records a
+# progress message and, optionally, a dict of structured progress (see
+# JobQueue.set_progress), and returns the result
+JobHandler = Callable[[Dict, Callable[..., None]], Dict[str, Any]]
+
+
+class JobWorkerPool:
+    """Pool of threads running the jobs in a JobQueue.
+
+    Attributes:
+        queue: JobQueue object to take jobs from.
+        handlers: Dict mapping job kinds to the JobHandler running them.
+        num_workers: Number of jobs to run at the same time, as an int.
+        poll_interval: Time in seconds between checks of the queue by an
+            idle worker, as a float. Idle workers are also woken up by
+            notify.
+
+    While the workers run, a thread renews the leases of the running jobs
+    three times per JobQueue.lease_duration.
+    """
+
+    def __init__(self,
+                 queue: JobQueue,
+                 handlers: Dict[str, JobHandler],
+                 num_workers: int = 1,
+                 poll_interval: float = 5):
+        self.queue = queue
+        self.handlers = handlers
+        self.num_workers = max(1, num_workers)
+        self.poll_interval = poll_interval
+        self._wake_up = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """Starts the workers."""
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._work,
+                                      name=f'job-worker-{i}',
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._renew_leases,
+                                  name='job-lease-renewer',
+                                  daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def notify(self) -> None:
+        """Wakes up an idle worker to check the queue."""
+        with self._wake_up:
+            self._wake_up.notify()
+
+    def stop(self, timeout: float = None) -> None:
+        """Stops the workers after they finish their current jobs."""
+        self._stopped.set()
+        with self._wake_up:
+            self._wake_up.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                job = self.queue.claim()
+            except sqlite3.Error:
+                logging.exception('JobWorkerPool._work: Failed to claim a job')
+                job = None
+            if not job:
+                with self._wake_up:
+                    self._wake_up.wait(self.poll_interval)
+                continue
+            self._run(job)
+
+    def _renew_leases(self) -> None:
+        while not self._stopped.wait(self.queue.lease_duration / 3):
+            try:
+                self.queue.renew_leases()
+            except sqlite3.Error:
+                logging.exception(
+                    'JobWorkerPool._renew_leases: Failed to renew leases')
+
+    def _run(self, job: Job) -> None:
+        logging.info('JobWorkerPool._run: Running %s job %s', job.kind, job.id)
+        try:
+            handler = self.handlers[job.kind]
+            result = handler(job.payload,
+                             functools.partial(self.queue.set_progress, job.id))
+            self.queue.succeed(job.id, result)
+            logging.info('JobWorkerPool._run: Job %s succeeded', job.id)
+        except Exception:
+            logging.exception('JobWorkerPool._run: Job %s failed', job.id)
+            self.queue.fail(job.id, traceback.format_exc())
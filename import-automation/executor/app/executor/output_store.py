@@ -0,0 +1,155 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Content-addressed store of the generated files of imports.
+
+The generated files of an import are uploaded once to
+<output_dir>/blobs/<sha256><extension>, where <sha256> is the SHA-256 digest
+of the file. Each version of the outputs at <output_dir>/<version>/ consists
+of copies of the blobs made by the storage service, so a file identical to
+one generated by an earlier version is never uploaded again, and a
+<output_dir>/<version>/manifest.json recording the digest of each file.
+"""
+
+import os
+import json
+import logging
+import dataclasses
+from concurrent import futures
+from typing import List, Tuple
+
+from app.executor import source_cache
+from app.service import file_uploader
+
+_BLOBS_DIR = 'blobs'
+MANIFEST_FILENAME = 'manifest.json'
+
+
+@dataclasses.dataclass
+class OutputFile:
+    """Generated file in a version of the outputs of an import.
+
+    Attributes:
+        dest: Path to the file in the version, as a string.
+        blob: Path to the blob with the content of the file, as a string.
+        sha256: Hex SHA-256 digest of the file as a string.
+        size: Size of the file in bytes as an int.
+        reused: Whether the blob was uploaded by an earlier version instead
+            of this one, as a boolean.
+    """
+    dest: str
+    blob: str
+    sha256: str
+    size: int
+    reused: bool
+
+
+@dataclasses.dataclass
+class VersionManifest:
+    """Files in a version of the outputs of an import.
+
+    Attributes:
+        version: The version as a string.
+        files: List of OutputFile objects.
+        uploads: List of file_uploader.UploadResult objects, one for each
+            blob uploaded.
+    """
+    version: str
+    files: List[OutputFile]
+    uploads: List[file_uploader.UploadResult]
+
+    def to_json(self) -> str:
+        """Returns the manifest as a JSON string, without the uploads."""
+        return json.dumps(
+            {
+                'version':
+                    self.version,
+                'files': [
+                    dataclasses.asdict(output_file)
+                    for output_file in self.files
+                ]
+            },
+            indent=2)
+
+
+class OutputStore:
+    """Content-addressed store of the generated files of imports.
+
+    Attributes:
+        uploader: FileUploader object for uploading and copying the files.
+    """
+
+    def __init__(self, uploader: file_uploader.FileUploader):
+        self.uploader = uploader
+
+    def put_version(self,
+                    files: List[Tuple[str, str]],
+                    output_dir: str,
+                    version: str,
+                    max_workers: int = 1) -> VersionManifest:
+        """Stores a version of the outputs of an import.
+
+        Args:
+            files: List of tuples each consisting of the path to a generated
+                file and its destination, both as strings. The destinations
+                must be in <output_dir>/<version>/.
+            output_dir: Path to the output directory of the import, as a
+                string.
+            version: The version as a string.
+            max_workers: Maximum number of files to hash and upload at the
+                same time, as an int.
+
+        Returns:
+            VersionManifest object describing the version. It is also
+            uploaded to <output_dir>/<version>/manifest.json.
+
+        Raises:
+            Same exceptions as the methods of the uploader.
+        """
+        with futures.ThreadPoolExecutor(
+                max_workers=max(1, max_workers)) as executor:
+            digests = list(
+                executor.map(lambda file: source_cache.sha256_file(file[0]),
+                             files))
+
+        output_files = []
+        to_upload = {}
+        for (src, dest), sha256 in zip(files, digests):
+            extension = os.path.splitext(src)[1]
+            blob = f'{output_dir}/{_BLOBS_DIR}/{sha256}{extension}'
+            reused = blob not in to_upload and self.uploader.exists(blob)
+            if not reused:
+                to_upload[blob] = src
+            output_files.append(
+                OutputFile(dest=dest,
+                           blob=blob,
+                           sha256=sha256,
+                           size=os.path.getsize(src),
+                           reused=reused))
+        logging.info(
+            'OutputStore.put_version: Uploading %d of %d files for version '
+            '%s of %s', len(to_upload), len(files), version, output_dir)
+
+        uploads = self.uploader.upload_files(
+            [(src, blob) for blob, src in to_upload.items()],
+            max_workers=max_workers)
+        for output_file in output_files:
+            self.uploader.copy(output_file.blob, output_file.dest)
+
+        manifest = VersionManifest(version=version,
+                                   files=output_files,
+                                   uploads=uploads)
+        self.uploader.upload_string(
+            manifest.to_json(), f'{output_dir}/{version}/{MANIFEST_FILENAME}')
+        return manifest
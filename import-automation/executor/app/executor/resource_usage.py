@@ -0,0 +1,330 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Accounting of the resources used by the stages of an import.
+
+A ResourceRecorder measures the wall time, CPU time, peak resident set size,
+and bytes read from and written to storage of each stage run within its
+stage context. The executor process itself is measured with getrusage and
+/proc/self/io. The subprocesses that subprocess_runner.run runs in the same
+thread as the stage are measured with the rusage returned by wait4, which
+covers the subprocess and all its waited-for descendants, and by sampling
+/proc for the subprocess and its descendants while they run, which catches
+the peak memory of the process tree as a whole.
+
+Stages of imports running concurrently in the same process share the
+executor process, so the measurements of the executor process itself
+include the work of all of them.
+"""
+
+import os
+import time
+import logging
+import resource
+import threading
+import contextlib
+import dataclasses
+from typing import Callable, Dict, Iterator, List, Optional
+
+from app.executor import tracing
+
+# Size in bytes of the blocks counted by ru_inblock and ru_oublock
+_BLOCK_SIZE = 512
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+_LOCAL = threading.local()
+
+
+@dataclasses.dataclass
+class StageUsage:
+    """Resources used by a stage of an import.
+
+    Attributes:
+        stage: Name of the stage as a string.
+        wall_time: Elapsed time in seconds as a float.
+        cpu_time: User and system CPU time in seconds of the executor
+            process as a float.
+        child_cpu_time: User and system CPU time in seconds of the
+            subprocesses run by the stage as a float.
+        peak_rss: Peak resident set size in bytes of the executor process by
+            the end of the stage, as an int.
+        child_peak_rss: Peak resident set size in bytes of the subprocesses
+            run by the stage, as an int. For each subprocess, this is the
+            largest total of the process tree at a sample, or the largest
+            single process, whichever is larger.
+        read_bytes: Bytes read from storage by the executor process,
+            including the subprocesses it waited for, as an int.
+        write_bytes: Bytes written to storage by the executor process,
+            including the subprocesses it waited for, as an int.
+        child_read_bytes: Bytes read from storage by the subprocesses run by
+            the stage, as an int.
+        child_write_bytes: Bytes written to storage by the subprocesses run
+            by the stage, as an int.
+    """
+    stage: str
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    child_cpu_time: float = 0.0
+    peak_rss: int = 0
+    child_peak_rss: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    child_read_bytes: int = 0
+    child_write_bytes: int = 0
+
+    def add_child(self, usage: 'ProcessUsage') -> None:
+        """Adds the resources used by a subprocess to the stage."""
+        self.child_cpu_time += usage.cpu_time
+        self.child_peak_rss = max(self.child_peak_rss, usage.peak_rss)
+        self.child_read_bytes += usage.read_bytes
+        self.child_write_bytes += usage.write_bytes
+
+
+@dataclasses.dataclass
+class ProcessUsage:
+    """Resources used by a subprocess and its descendants.
+
+    Attributes:
+        cpu_time: User and system CPU time in seconds as a float.
+        peak_rss: Peak resident set size in bytes as an int.
+        read_bytes: Bytes read from storage as an int.
+        write_bytes: Bytes written to storage as an int.
+    """
+    cpu_time: float = 0.0
+    peak_rss: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+
+
+class ResourceRecorder:
+    """Records the resources used by the stages of an import.
+
+    Attributes:
+        stages: List of StageUsage objects, one for each stage in the order
+            they started.
+        on_stage: Function called with the name of each stage as it starts,
+            or None.
+    """
+
+    def __init__(self,
+                 stages: List[StageUsage] = None,
+                 on_stage: Callable[[str], None] = None):
+        self.stages = list(stages or [])
+        self.on_stage = on_stage
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[StageUsage]:
+        """Measures the resources used within the context as a stage.
+
+        Subprocesses run by subprocess_runner.run in the calling thread
+        within the context are added to the stage. Stages may not be nested.
+        The stage is also a tracing span with the resources used as
+        attributes.
+
+        Yields:
+            The StageUsage of the stage, which is filled in when the context
+            exits, also if it raises an exception.
+        """
+        usage = StageUsage(stage=name)
+        self.stages.append(usage)
+        if self.on_stage:
+            self.on_stage(name)
+        previous = getattr(_LOCAL, 'stage', None)
+        _LOCAL.stage = usage
+        start_wall = time.monotonic()
+        start_rusage = resource.getrusage(resource.RUSAGE_SELF)
+        start_io = _read_io('self')
+        with tracing.span(name) as span:
+            try:
+                yield usage
+            finally:
+                _LOCAL.stage = previous
+                end_rusage = resource.getrusage(resource.RUSAGE_SELF)
+                end_io = _read_io('self')
+                usage.wall_time = time.monotonic() - start_wall
+                usage.cpu_time = (end_rusage.ru_utime + end_rusage.ru_stime -
+                                  start_rusage.ru_utime - start_rusage.ru_stime)
+                usage.peak_rss = end_rusage.ru_maxrss * 1024
+                usage.read_bytes = max(0, end_io[0] - start_io[0])
+                usage.write_bytes = max(0, end_io[1] - start_io[1])
+                logging.info('ResourceRecorder.stage: %s', usage)
+                for key, value in dataclasses.asdict(usage).items():
+                    if key != 'stage':
+                        span.set_attribute(key, value)
+
+    def to_list(self) -> List[Dict]:
+        """Returns the stages as a list of dicts."""
+        return [dataclasses.asdict(usage) for usage in self.stages]
+
+
+def is_recording() -> bool:
+    """Returns whether the calling thread is in a stage context."""
+    return getattr(_LOCAL, 'stage', None) is not None
+
+
+def record_process(usage: ProcessUsage) -> None:
+    """Adds the resources used by a subprocess to the stage of the calling
+    thread, if any."""
+    stage = getattr(_LOCAL, 'stage', None)
+    if stage:
+        stage.add_child(usage)
+
+
+def from_rusage(rusage: Optional[resource.struct_rusage],
+                sampled: ProcessUsage = None) -> ProcessUsage:
+    """Combines the rusage of a waited-for subprocess with the measurements
+    of a ProcessSampler into a ProcessUsage.
+
+    Args:
+        rusage: The rusage returned by os.wait4, or None if it is not
+            available.
+        sampled: ProcessUsage returned by ProcessSampler.stop, if sampled.
+
+    Returns:
+        ProcessUsage object taking the larger of the two values of each
+        resource.
+    """
+    sampled = sampled or ProcessUsage()
+    if not rusage:
+        return sampled
+    return ProcessUsage(cpu_time=max(rusage.ru_utime + rusage.ru_stime,
+                                     sampled.cpu_time),
+                        peak_rss=max(rusage.ru_maxrss * 1024, sampled.peak_rss),
+                        read_bytes=max(rusage.ru_inblock * _BLOCK_SIZE,
+                                       sampled.read_bytes),
+                        write_bytes=max(rusage.ru_oublock * _BLOCK_SIZE,
+                                        sampled.write_bytes))
+
+
+class ProcessSampler:
+    """Samples the resources used by a process and its descendants from
+    /proc on a background thread.
+
+    Attributes:
+        pid: ID of the process as an int.
+        interval: Time in seconds between samples as a float.
+    """
+
+    def __init__(self, pid: int, interval: float = 1):
+        self.pid = pid
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample_until_stopped,
+                                        daemon=True)
+        # Maps process IDs to (CPU time, read bytes, written bytes) at the
+        # latest sample
+        self._latest = {}
+        self._peak_rss = 0
+
+    def start(self) -> None:
+        """Starts sampling."""
+        if os.path.isdir('/proc'):
+            self._thread.start()
+
+    def stop(self) -> ProcessUsage:
+        """Stops sampling.
+
+        Returns:
+            ProcessUsage object with the peak total resident set size of the
+            process tree and the latest CPU time and I/O of each process
+            in it, summed over the processes.
+        """
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        return ProcessUsage(
+            cpu_time=sum(sample[0] for sample in self._latest.values()),
+            peak_rss=self._peak_rss,
+            read_bytes=sum(sample[1] for sample in self._latest.values()),
+            write_bytes=sum(sample[2] for sample in self._latest.values()))
+
+    def _sample_until_stopped(self) -> None:
+        while True:
+            self._sample()
+            if self._stopped.wait(self.interval):
+                return
+
+    def _sample(self) -> None:
+        total_rss = 0
+        for pid in _get_process_tree(self.pid):
+            stat = _read_stat(pid)
+            if not stat:
+                continue
+            cpu_time, rss = stat
+            io = _read_io(str(pid))
+            total_rss += rss
+            self._latest[pid] = (cpu_time, io[0], io[1])
+        self._peak_rss = max(self._peak_rss, total_rss)
+
+
+def _get_process_tree(root: int) -> List[int]:
+    """Returns the IDs of a process and its descendants."""
+    children = {}
+    try:
+        pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return [root]
+    for pid in pids:
+        stat = _read_stat_fields(pid)
+        if stat:
+            children.setdefault(int(stat[1]), []).append(pid)
+    tree = []
+    pending = [root]
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, ()))
+    return tree
+
+
+def _read_stat_fields(pid: int) -> Optional[List[str]]:
+    """Returns the fields of /proc/<pid>/stat after the command name,
+    starting with the state, or None if the process does not exist."""
+    try:
+        with open(f'/proc/{pid}/stat') as file:
+            content = file.read()
+    except OSError:
+        return None
+    # The command name is in parentheses and may contain spaces
+    return content[content.rfind(')') + 2:].split()
+
+
+def _read_stat(pid: int) -> Optional[tuple]:
+    """Returns the CPU time in seconds and the resident set size in bytes of
+    a process, or None if the process does not exist."""
+    fields = _read_stat_fields(pid)
+    if not fields:
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    # utime and stime are fields 14 and 15 and rss is field 24 of
+    # /proc/<pid>/stat, counting from 1 with the state being field 3.
+    cpu_time = (int(fields[11]) + int(fields[12])) / ticks
+    return cpu_time, int(fields[21]) * _PAGE_SIZE
+
+
+def _read_io(pid: str) -> tuple:
+    """Returns the bytes read from and written to storage by a process
+    according to /proc/<pid>/io, or zeros if it cannot be read."""
+    read_bytes = write_bytes = 0
+    try:
+        with open(f'/proc/{pid}/io') as file:
+            for line in file:
+                key, _, value = line.partition(':')
+                if key == 'read_bytes':
+                    read_bytes = int(value)
+                elif key == 'write_bytes':
+                    write_bytes = int(value)
+    except (OSError, ValueError):
+        pass
+    return read_bytes, write_bytes
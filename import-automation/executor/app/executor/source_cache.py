@@ -0,0 +1,249 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Persistent cache of downloaded source files keyed by URL.
+
+The latest version of the file at a URL is stored in
+<cache_dir>/files/<key>/<filename>, where <key> is a hash of the URL, along
+with <cache_dir>/files/<key>.json recording its ETag and Last-Modified
+headers and its SHA-256 digest. Downloads send the headers back as
+If-None-Match and If-Modified-Since and copy the cached file on a 304
+response.
+
+The cache also records a fingerprint of the code and inputs of each import
+after it succeeds, in <cache_dir>/imports/<key>.json, so that an import whose
+fingerprint has not changed since then can be skipped.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import dataclasses
+from typing import Dict, Iterable, Optional
+
+from app import utils
+
+_FILES_DIR = 'files'
+_IMPORTS_DIR = 'imports'
+
+
+@dataclasses.dataclass
+class SourceEntry:
+    """Cached version of the file at a URL.
+
+    Attributes:
+        url: URL of the file as a string.
+        filename: Name of the file as a string.
+        path: Path to the cached file as a string.
+        sha256: Hex SHA-256 digest of the file as a string.
+        etag: ETag header of the file as a string. Empty if not sent.
+        last_modified: Last-Modified header of the file as a string. Empty
+            if not sent.
+    """
+    url: str
+    filename: str
+    path: str
+    sha256: str
+    etag: str = ''
+    last_modified: str = ''
+
+
+class SourceCache:
+    """Persistent cache of downloaded source files keyed by URL.
+
+    Attributes:
+        cache_dir: Path to the directory storing the files, as a string.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(os.path.join(self.cache_dir, _FILES_DIR), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, _IMPORTS_DIR), exist_ok=True)
+        logging.info('SourceCache.__init__: Initialized with directory %s',
+                     self.cache_dir)
+
+    def get(self, url: str) -> Optional[SourceEntry]:
+        """Returns the cached version of the file at a URL, or None if it is
+        not cached."""
+        try:
+            with open(self._entry_path(url)) as file:
+                entry = SourceEntry(**json.load(file))
+        except (OSError, ValueError, TypeError):
+            return None
+        if entry.url != url or not os.path.exists(entry.path):
+            return None
+        return entry
+
+    def get_conditional_headers(self, url: str) -> Dict[str, str]:
+        """Returns the headers that make a GET request for a URL return 304
+        if the file has not changed since it was cached."""
+        entry = self.get(url)
+        headers = {}
+        if entry and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def put(self,
+            url: str,
+            path: str,
+            sha256: str,
+            etag: str = '',
+            last_modified: str = '') -> Optional[SourceEntry]:
+        """Caches a downloaded file, replacing the previous version.
+
+        Files without an ETag or Last-Modified header are not cached since
+        their freshness cannot be checked.
+
+        Args:
+            url: URL the file was downloaded from, as a string.
+            path: Path to the downloaded file, as a string.
+            sha256: Hex SHA-256 digest of the file, as a string.
+            etag: ETag header of the file, as a string.
+            last_modified: Last-Modified header of the file, as a string.
+
+        Returns:
+            The SourceEntry of the cached file, or None if it is not cached.
+        """
+        if not etag and not last_modified:
+            return None
+        key = _hash(url)
+        file_dir = os.path.join(self.cache_dir, _FILES_DIR, key)
+        os.makedirs(file_dir, exist_ok=True)
+        filename = os.path.basename(path)
+        entry = SourceEntry(url=url,
+                            filename=filename,
+                            path=os.path.join(file_dir, filename),
+                            sha256=sha256,
+                            etag=etag,
+                            last_modified=last_modified)
+        previous = self.get(url)
+        _atomic_copy(path, entry.path)
+        utils.write_json_atomically(self._entry_path(url),
+                                    dataclasses.asdict(entry))
+        if previous and previous.path != entry.path:
+            os.remove(previous.path)
+        return entry
+
+    def restore(self, entry: SourceEntry, dest_dir: str) -> str:
+        """Copies a cached file into a directory.
+
+        Returns:
+            Path to the copied file of the form <dest_dir>/<filename>.
+        """
+        dest = os.path.join(dest_dir, entry.filename)
+        # Not hard linked since user scripts may modify the file in place
+        shutil.copyfile(entry.path, dest)
+        return dest
+
+    def get_fingerprint(self, code_digest: str,
+                        urls: Iterable[str]) -> Optional[Dict]:
+        """Returns the fingerprint of an import.
+
+        Args:
+            code_digest: Digest of the code of the import as returned by
+                get_code_digest, as a string.
+            urls: The data_download_url of the import, each as a string.
+
+        Returns:
+            A dict with the code digest and the SHA-256 of the cached file of
+            each URL. None if any of the files is not cached.
+        """
+        inputs = {}
+        for url in urls:
+            entry = self.get(url)
+            if not entry:
+                return None
+            inputs[url] = entry.sha256
+        return {'code': code_digest, 'inputs': inputs}
+
+    def is_unchanged(self, absolute_import_name: str,
+                     fingerprint: Optional[Dict]) -> bool:
+        """Returns whether an import had the same fingerprint when it last
+        succeeded."""
+        if not fingerprint:
+            return False
+        try:
+            with open(self._import_path(absolute_import_name)) as file:
+                return json.load(file).get('fingerprint') == fingerprint
+        except (OSError, ValueError):
+            return False
+
+    def record_success(self, absolute_import_name: str,
+                       fingerprint: Optional[Dict]) -> None:
+        """Records the fingerprint of an import that succeeded."""
+        if not fingerprint:
+            return
+        utils.write_json_atomically(
+            self._import_path(absolute_import_name), {
+                'absolute_import_name': absolute_import_name,
+                'fingerprint': fingerprint
+            })
+
+    def _entry_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, _FILES_DIR, _hash(url) + '.json')
+
+    def _import_path(self, absolute_import_name: str) -> str:
+        return os.path.join(self.cache_dir, _IMPORTS_DIR,
+                            _hash(absolute_import_name) + '.json')
+
+
+def get_code_digest(import_dir: str,
+                    import_spec: Dict,
+                    extra_paths: Iterable[str] = ()) -> str:
+    """Returns a hex digest of the import specification, the files in the
+    import directory, and some other files, e.g., the central requirements
+    file. Files that do not exist are skipped."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(import_spec, sort_keys=True).encode())
+    paths = []
+    for root, dirs, files in os.walk(import_dir):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files))
+    paths.extend(extra_paths)
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        digest.update(os.path.relpath(path, import_dir).encode() + b'\0')
+        digest.update(sha256_file(path).encode())
+    return digest.hexdigest()
+
+
+def sha256_file(path: str, buffer_size: int = 1024**2) -> str:
+    """Returns the hex SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(buffer_size), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def _hash(key: str) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def _atomic_copy(src: str, dest: str) -> None:
+    """Copies a file so that readers of dest never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest))
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,380 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Runs commands in subprocesses with bounded memory for their output.
+
+stdout and stderr are read incrementally by background threads. Only the
+last max_output_size characters of each are kept for the returned
+subprocess.CompletedProcess, and the output can be forwarded as it is
+produced, in chunks of bounded size at a bounded rate.
+
+The command is waited for with wait4 so that the resources it used can be
+added to the resource_usage stage of the calling thread, if any. Limits on
+the resources of the command, e.g., admission.ProcessLimits, are set in the
+process before it executes the command where possible and applied right
+after it starts otherwise. The command can also be started by a spawner, e.g.,
+a zygote.Zygote forking it from a process with modules preloaded, instead of
+subprocess.Popen.
+"""
+
+import codecs
+import collections
+import functools
+import os
+import signal
+import resource
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, IO, List, Tuple
+
+from app.executor import resource_usage
+
+# Number of bytes to read from a pipe at once
+_READ_SIZE = 64 * 1024
+# Maximum time in seconds to wait for the output after killing a command
+_KILL_JOIN_TIMEOUT = 5
+
+OutputCallback = Callable[[str, str], None]
+
+
+class OutputBuffer:
+    """Thread-safe buffer of the output written to a stream.
+
+    Keeps the last max_size characters written, as well as up to
+    max_pending characters written since pop_pending was last called.
+
+    Attributes:
+        max_size: Maximum number of characters to keep, as an int.
+        max_pending: Maximum number of characters to keep until
+            pop_pending is called, as an int.
+    """
+
+    def __init__(self, max_size: int, max_pending: int):
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._tail = collections.deque()
+        self._tail_size = 0
+        self._truncated = 0
+        self._pending = collections.deque()
+        self._pending_size = 0
+        self._skipped = 0
+
+    def write(self, text: str) -> None:
+        """Appends text to the buffer, discarding the oldest characters
+        if it is full."""
+        if not text:
+            return
+        with self._lock:
+            self._tail.append(text)
+            self._tail_size += len(text)
+            self._truncated += _trim(self._tail, self._tail_size, self.max_size)
+            self._tail_size = min(self._tail_size, self.max_size)
+            self._pending.append(text)
+            self._pending_size += len(text)
+            self._skipped += _trim(self._pending, self._pending_size,
+                                   self.max_pending)
+            self._pending_size = min(self._pending_size, self.max_pending)
+
+    def getvalue(self) -> str:
+        """Returns the last max_size characters written, preceded by a note
+        on the number of characters discarded, if any."""
+        with self._lock:
+            value = ''.join(self._tail)
+            if self._truncated:
+                value = f'[{self._truncated} characters truncated]\n' + value
+            return value
+
+    def pop_pending(self) -> str:
+        """Returns and clears the characters written since the last call,
+        preceded by a note on the number of characters skipped because
+        there were more than max_pending of them."""
+        with self._lock:
+            pending = ''.join(self._pending)
+            if self._skipped:
+                pending = f'[{self._skipped} characters skipped]\n' + pending
+            self._pending.clear()
+            self._pending_size = 0
+            self._skipped = 0
+            return pending
+
+
+def _trim(chunks: collections.deque, size: int, max_size: int) -> int:
+    """Removes characters from the front of a deque of strings of total
+    length size so that at most max_size are left. Returns the number of
+    characters removed."""
+    removed = 0
+    while size - removed > max_size:
+        excess = size - removed - max_size
+        if len(chunks[0]) <= excess:
+            removed += len(chunks.popleft())
+        else:
+            chunks[0] = chunks[0][excess:]
+            removed += excess
+    return removed
+
+
+def _read(pipe: IO[bytes], buffer: OutputBuffer) -> None:
+    """Reads a pipe until EOF and writes the decoded text to a buffer."""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    while True:
+        data = pipe.read1(_READ_SIZE)
+        if not data:
+            break
+        buffer.write(decoder.decode(data))
+    buffer.write(decoder.decode(b'', final=True))
+    pipe.close()
+
+
+class _Reaper(threading.Thread):
+    """Thread waiting for a process to exit with wait4, or by calling wait
+    if it is given, which returns the return code and the rusage like
+    _wait4.
+
+    Attributes:
+        pid: ID of the process as an int.
+        returncode: Return code of the process as in
+            subprocess.Popen.returncode, or None if it was not waited for
+            by this thread.
+        rusage: Resources used by the process and its waited-for
+            descendants as returned by os.wait4, or None.
+        done: threading.Event set when the thread finishes.
+    """
+
+    def __init__(self, pid: int, wait: Callable[[], Tuple[int, Any]] = None):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.returncode = None
+        self.rusage = None
+        self.done = threading.Event()
+        self._wait = wait or functools.partial(_wait4, pid)
+
+    def run(self):
+        try:
+            self.returncode, self.rusage = self._wait()
+        except ChildProcessError:
+            # Already waited for by subprocess.Popen
+            pass
+        finally:
+            self.done.set()
+
+
+def _wait4(pid: int) -> Tuple[int, Any]:
+    """Waits for a child process to exit.
+
+    Returns:
+        Tuple of the return code as in subprocess.Popen.returncode and the
+        rusage returned by os.wait4.
+    """
+    _, status, rusage = os.wait4(pid, 0)
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status), rusage
+    return os.WEXITSTATUS(status), rusage
+
+
+def _kill_group(pid: int) -> None:
+    """Kills the process group led by a process, or only the process if
+    it does not lead a group."""
+    try:
+        if os.getpgid(pid) == pid:
+            os.killpg(pid, signal.SIGKILL)
+            return
+    except ProcessLookupError:
+        # The process has been waited for but its group may still exist
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        return
+    # Not process.kill, which may wait for the process.
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _set_rlimits(rlimits: Dict[str, int]) -> None:
+    """Sets the resource limits of the current process.
+
+    This runs in the child process between fork and exec, so it neither
+    logs nor raises. A limit that cannot be set is left as is.
+
+    Args:
+        rlimits: Dict mapping names of the RLIMIT_* constants of the
+            resource module to limits, each as an int.
+    """
+    for name, limit in rlimits.items():
+        try:
+            resource.setrlimit(getattr(resource, name), (limit, limit))
+        except (AttributeError, OSError, ValueError):
+            pass
+
+
+def run(args: List[str],
+        timeout: float,
+        cwd: str = None,
+        output_callback: OutputCallback = None,
+        callback_interval: float = 10,
+        max_output_size: int = 1024**2,
+        max_callback_size: int = 64 * 1024,
+        limits: Any = None,
+        spawner: Any = None) -> subprocess.CompletedProcess:
+    """Runs a command in a subprocess.
+
+    Args:
+        args: Command to run as a list. Each element is a string.
+        timeout: Maximum time the command can run for in seconds as a float.
+        cwd: Current working directory of the process as a string.
+        output_callback: Function called with the name of a stream, 'stdout'
+            or 'stderr', and the text written to it since the last call, as
+            the command runs. It is called from the calling thread at most
+            once per callback_interval seconds for each stream.
+        callback_interval: Minimum time in seconds between two calls of
+            output_callback for a stream, as a float.
+        max_output_size: Maximum number of characters of stdout and stderr
+            each to keep for the returned object, as an int. Earlier output
+            is discarded.
+        max_callback_size: Maximum number of characters of a stream to pass
+            to one call of output_callback, as an int. If more is written
+            within callback_interval, the earliest characters are skipped.
+        limits: Object with a get_rlimits() method returning the resource
+            limits to set before the command starts as a dict mapping names
+            of RLIMIT_* constants of the resource module to limits, an
+            apply(pid) method applying the other limits to the process and
+            returning a handle, and a release(handle) method called once the
+            process exits, e.g., admission.ProcessLimits.
+        spawner: Object with a spawn(args, cwd, rlimits) method starting the
+            command with the resource limits set and its stdout and stderr
+            connected to pipes and returning an
+            object with the pid, stdout, stderr, and returncode attributes
+            and the wait method of subprocess.Popen, a wait_status method
+            like _wait4, and usable as a context manager, e.g.,
+            zygote.Zygote. If None, the command is started with
+            subprocess.Popen.
+
+    Returns:
+        subprocess.CompletedProcess object whose stdout and stderr are the
+        last max_output_size characters of the output as strings.
+
+    Raises:
+        subprocess.TimeoutExpired: The command did not finish within timeout,
+            or processes it started kept its stdout or stderr open past
+            timeout. The process group of the command is killed. The output
+            and stderr attributes are the last characters of the output as
+            strings.
+        Same exceptions as subprocess.Popen or spawner.spawn.
+    """
+    buffers = {
+        'stdout': OutputBuffer(max_output_size, max_callback_size),
+        'stderr': OutputBuffer(max_output_size, max_callback_size)
+    }
+    deadline = time.monotonic() + timeout
+    wait = None
+    rlimits = limits.get_rlimits() if limits else {}
+    if spawner:
+        process = spawner.spawn(args, cwd, rlimits)
+        wait = process.wait_status
+    else:
+        process = subprocess.Popen(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            # The process group is killed on timeouts, including processes
+            # the command leaves running in the background.
+            start_new_session=True,
+            preexec_fn=functools.partial(_set_rlimits, rlimits)
+            if rlimits else None)
+    with process:
+        limits_handle = limits.apply(process.pid) if limits else None
+        readers = [
+            threading.Thread(target=_read,
+                             args=(process.stdout, buffers['stdout']),
+                             daemon=True),
+            threading.Thread(target=_read,
+                             args=(process.stderr, buffers['stderr']),
+                             daemon=True)
+        ]
+        for reader in readers:
+            reader.start()
+        reaper = _Reaper(process.pid, wait)
+        reaper.start()
+        sampler = None
+        if resource_usage.is_recording():
+            sampler = resource_usage.ProcessSampler(process.pid)
+            sampler.start()
+
+        finished = []
+
+        def finish():
+            if finished:
+                return
+            finished.append(True)
+            # Lets subprocess.Popen know the process has been waited for.
+            if reaper.returncode is not None:
+                process.returncode = reaper.returncode
+            else:
+                process.wait()
+            if limits:
+                limits.release(limits_handle)
+            if sampler:
+                resource_usage.record_process(
+                    resource_usage.from_rusage(reaper.rusage, sampler.stop()))
+
+        def forward_output():
+            if not output_callback:
+                return
+            for name, buffer in buffers.items():
+                text = buffer.pop_pending()
+                if text:
+                    output_callback(name, text)
+
+        def kill_and_raise():
+            _kill_group(process.pid)
+            reaper.done.wait(_KILL_JOIN_TIMEOUT)
+            finish()
+            for reader in readers:
+                # Processes that left the process group may still hold the
+                # pipes open, so do not wait for them indefinitely.
+                reader.join(_KILL_JOIN_TIMEOUT)
+            forward_output()
+            raise subprocess.TimeoutExpired(
+                args,
+                timeout,
+                output=buffers['stdout'].getvalue(),
+                stderr=buffers['stderr'].getvalue())
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                kill_and_raise()
+            if reaper.done.wait(min(remaining, callback_interval)):
+                break
+            forward_output()
+        finish()
+        # Processes started by the command in the background may keep the
+        # pipes open after it exits, so the output is only read until the
+        # deadline.
+        for reader in readers:
+            while reader.is_alive():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    kill_and_raise()
+                reader.join(min(remaining, callback_interval))
+                forward_output()
+        forward_output()
+        return subprocess.CompletedProcess(args, process.returncode,
+                                           buffers['stdout'].getvalue(),
+                                           buffers['stderr'].getvalue())
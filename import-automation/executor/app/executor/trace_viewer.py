@@ -0,0 +1,211 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Renders the tracing spans written by tracing.JsonLinesExporter as waterfall
+charts, one for each trace, i.e., for each system run.
+
+Each row of a chart is a span, placed under its parent and ordered by start
+time, with a bar spanning the time the span was open.
+"""
+
+import json
+import html
+import dataclasses
+from typing import Dict, Iterable, List, Optional
+
+from app.executor import tracing
+
+_SVG_WIDTH = 1200
+_LABEL_WIDTH = 360
+_ROW_HEIGHT = 18
+_COLORS = ('#4285f4', '#34a853', '#fbbc04', '#46bdc6', '#7baaf7', '#ab47bc')
+_ERROR_COLOR = '#ea4335'
+
+
+@dataclasses.dataclass
+class Row:
+    """Span in a waterfall chart.
+
+    Attributes:
+        span: The span as a dict in the format of tracing.Span.to_dict.
+        depth: Number of ancestors of the span in the trace, as an int.
+    """
+    span: Dict
+    depth: int
+
+
+@dataclasses.dataclass
+class Trace:
+    """Spans of a trace.
+
+    Attributes:
+        trace_id: ID of the trace as a string.
+        root: Root span as a dict, or None if it was not exported.
+        rows: List of Row objects, each span following its parent and
+            preceding its later siblings.
+        start_time: Start time of the earliest span in seconds since epoch as
+            a float.
+        end_time: End time of the latest span in seconds since epoch as a
+            float.
+    """
+    trace_id: str
+    root: Optional[Dict]
+    rows: List[Row]
+    start_time: float
+    end_time: float
+
+    @property
+    def run_id(self) -> Optional[str]:
+        """ID of the system run of the trace, if known."""
+        if self.root:
+            return self.root['attributes'].get('run_id')
+        return None
+
+
+def load_spans(path: str) -> List[Dict]:
+    """Loads the spans written to a JSON-lines file, skipping lines that
+    are not valid JSON, e.g., partially written ones."""
+    spans = []
+    with open(path) as file:
+        for line in file:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+def group_traces(spans: Iterable[Dict]) -> List[Trace]:
+    """Groups spans into traces.
+
+    Spans whose parent is missing are shown as roots.
+
+    Returns:
+        List of Trace objects ordered by start time.
+    """
+    by_trace = {}
+    for span in spans:
+        by_trace.setdefault(span['trace_id'], []).append(span)
+
+    traces = []
+    for trace_id, trace_spans in by_trace.items():
+        ids = {span['span_id'] for span in trace_spans}
+        children = {}
+        for span in trace_spans:
+            parent_id = span.get('parent_id')
+            if parent_id not in ids:
+                parent_id = None
+            children.setdefault(parent_id, []).append(span)
+        for siblings in children.values():
+            siblings.sort(key=lambda span: span['start_time'])
+
+        rows = []
+        pending = [(span, 0) for span in reversed(children.get(None, []))]
+        while pending:
+            span, depth = pending.pop()
+            rows.append(Row(span=span, depth=depth))
+            pending.extend(
+                (child, depth + 1)
+                for child in reversed(children.get(span['span_id'], [])))
+        roots = [span for span in trace_spans if not span.get('parent_id')]
+        traces.append(
+            Trace(trace_id=trace_id,
+                  root=roots[0] if roots else None,
+                  rows=rows,
+                  start_time=min(span['start_time'] for span in trace_spans),
+                  end_time=max(_end_time(span) for span in trace_spans)))
+    traces.sort(key=lambda trace: trace.start_time)
+    return traces
+
+
+def _end_time(span: Dict) -> float:
+    return span.get('end_time') or span['start_time']
+
+
+def _title(trace: Trace) -> str:
+    if not trace.root:
+        return f'Trace {trace.trace_id}'
+    attributes = ', '.join(
+        f'{key}={value}' for key, value in trace.root['attributes'].items())
+    return f'{trace.root["name"]} ({attributes})'
+
+
+def render_text(trace: Trace, width: int = 60) -> str:
+    """Renders a trace as a text waterfall chart.
+
+    Args:
+        trace: Trace object to render.
+        width: Number of characters of the time axis, as an int.
+
+    Returns:
+        The chart as a string.
+    """
+    duration = max(trace.end_time - trace.start_time, 1e-9)
+    lines = [f'{_title(trace)}: {duration:.3f}s']
+    for row in trace.rows:
+        start = row.span['start_time'] - trace.start_time
+        end = _end_time(row.span) - trace.start_time
+        first = min(width - 1, int(start / duration * width))
+        last = max(first + 1, int(round(end / duration * width)))
+        mark = 'X' if row.span['status'] == tracing.ERROR else '#'
+        bar = ' ' * first + mark * (last - first)
+        label = '  ' * row.depth + row.span['name']
+        lines.append(f'{label:<40.40}|{bar:<{width}}| '
+                     f'{end - start:8.3f}s')
+    return '\n'.join(lines)
+
+
+def render_html(traces: List[Trace]) -> str:
+    """Renders traces as an HTML page with an SVG waterfall chart for each.
+
+    Hovering over a bar shows the attributes of its span.
+
+    Returns:
+        The page as a string.
+    """
+    sections = []
+    for trace in traces:
+        duration = max(trace.end_time - trace.start_time, 1e-9)
+        scale = (_SVG_WIDTH - _LABEL_WIDTH) / duration
+        height = (len(trace.rows) + 1) * _ROW_HEIGHT
+        elements = []
+        for i, row in enumerate(trace.rows):
+            span = row.span
+            x = _LABEL_WIDTH + (span['start_time'] - trace.start_time) * scale
+            bar_width = max(1.0, (_end_time(span) - span['start_time']) * scale)
+            y = i * _ROW_HEIGHT
+            color = (_ERROR_COLOR if span['status'] == tracing.ERROR else
+                     _COLORS[row.depth % len(_COLORS)])
+            details = [
+                f'{span["name"]}: '
+                f'{_end_time(span) - span["start_time"]:.3f}s'
+            ]
+            details.extend(
+                f'{key}: {value}' for key, value in span['attributes'].items())
+            if span.get('error'):
+                details.append(f'error: {span["error"]}')
+            elements.append(
+                f'<text x="{4 + 12 * row.depth}" y="{y + 13}">'
+                f'{html.escape(span["name"])}</text>'
+                f'<rect x="{x:.1f}" y="{y + 2}" width="{bar_width:.1f}" '
+                f'height="{_ROW_HEIGHT - 4}" fill="{color}">'
+                f'<title>{html.escape(chr(10).join(details))}</title></rect>')
+        sections.append(
+            f'<h2>{html.escape(_title(trace))}: {duration:.3f}s</h2>\n'
+            f'<svg width="{_SVG_WIDTH}" height="{height}" '
+            f'font-family="monospace" font-size="12">'
+            f'{"".join(elements)}</svg>')
+    return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+            '<title>Import executor traces</title></head><body>\n' +
+            '\n'.join(sections) + '\n</body></html>\n')
@@ -0,0 +1,380 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tracing spans of the work done by the executor.
+
+A trace is started with Tracer.trace, which opens its root span. Spans
+opened with span in the same thread within it become its children, and so
+on. Work handed to other threads passes the parent explicitly, e.g.,
+
+    parent = tracing.current_span()
+    pool.submit(lambda: run_in_span(parent))
+
+where run_in_span opens tracing.span(name, parent=parent). Spans opened
+outside a trace are not exported.
+
+Finished spans are exported by the exporters of the tracer of their trace:
+JsonLinesExporter appends them to a local JSON-lines file and
+CollectorExporter posts them to a collector accepting the OTLP/HTTP JSON
+encoding. view_traces.py renders the exported spans.
+"""
+
+import os
+import json
+import time
+import logging
+import secrets
+import threading
+import contextlib
+from concurrent import futures
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+OK = 'ok'
+ERROR = 'error'
+
+_LOCAL = threading.local()
+
+
+class Span:
+    """Timed operation in a trace.
+
+    Attributes:
+        name: Name of the operation as a string.
+        trace_id: ID of the trace as a hex string.
+        span_id: ID of the span as a hex string.
+        parent_id: ID of the parent span as a hex string, or None for the
+            root span of a trace.
+        start_time: Time the span started in seconds since epoch as a float.
+        end_time: Time the span ended in seconds since epoch as a float, or
+            None if it has not ended.
+        attributes: Dict mapping attribute names to values, each a string,
+            number, or boolean.
+        status: 'ok', or 'error' if the operation raised an exception.
+        error: Exception raised by the operation as a string, if any.
+        tracer: Tracer object exporting the span, or None if the span is not
+            exported.
+    """
+
+    def __init__(self,
+                 name: str,
+                 trace_id: str,
+                 parent_id: Optional[str] = None,
+                 attributes: Dict[str, Any] = None,
+                 tracer: 'Tracer' = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_time = time.time()
+        self.end_time = None
+        self.attributes = {}
+        self.status = OK
+        self.error = None
+        self.tracer = tracer
+        for key, value in (attributes or {}).items():
+            self.set_attribute(key, value)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Sets an attribute of the span. None values are ignored and values
+        that are not strings, numbers, or booleans are converted to
+        strings."""
+        if value is None:
+            return
+        if not isinstance(value, (str, int, float, bool)):
+            value = str(value)
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict:
+        """Returns the span as a JSON-serializable dict."""
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'attributes': self.attributes,
+            'status': self.status,
+            'error': self.error
+        }
+
+
+class Tracer:
+    """Starts traces and exports their spans.
+
+    Attributes:
+        exporters: List of exporters, each an object with an
+            export(span: Span) method and a flush() method.
+    """
+
+    def __init__(self, exporters: List[Any] = None):
+        self.exporters = list(exporters or [])
+
+    @contextlib.contextmanager
+    def trace(self, name: str, **attributes) -> Iterator[Span]:
+        """Starts a trace and opens its root span in the calling thread.
+
+        The exporters are flushed when the context exits.
+
+        Args:
+            name: Name of the root span as a string.
+            **attributes: Attributes of the root span.
+
+        Yields:
+            The root Span.
+        """
+        root = Span(name,
+                    trace_id=secrets.token_hex(16),
+                    attributes=attributes,
+                    tracer=self if self.exporters else None)
+        try:
+            with _open(root):
+                yield root
+        finally:
+            for exporter in self.exporters:
+                try:
+                    exporter.flush()
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception('Tracer.trace: Failed to flush spans')
+
+    def export(self, span: Span) -> None:
+        """Exports a finished span to all exporters. Errors are logged."""
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('Tracer.export: Failed to export span %s',
+                                  span.name)
+
+
+def current_span() -> Optional[Span]:
+    """Returns the innermost span open in the calling thread, if any."""
+    return getattr(_LOCAL, 'span', None)
+
+
+@contextlib.contextmanager
+def span(name: str, parent: Span = None, **attributes) -> Iterator[Span]:
+    """Opens a span in the calling thread.
+
+    Args:
+        name: Name of the span as a string.
+        parent: Parent Span. If None, the innermost span open in the calling
+            thread is the parent. If there is none, the span is not
+            exported.
+        **attributes: Attributes of the span.
+
+    Yields:
+        The Span. If the context raises an exception, the status of the span
+        is set to 'error' and the exception is re-raised.
+    """
+    parent = parent or current_span()
+    if parent:
+        opened = Span(name,
+                      trace_id=parent.trace_id,
+                      parent_id=parent.span_id,
+                      attributes=attributes,
+                      tracer=parent.tracer)
+    else:
+        opened = Span(name, trace_id=secrets.token_hex(16))
+    with _open(opened):
+        yield opened
+
+
+@contextlib.contextmanager
+def _open(opened: Span) -> Iterator[None]:
+    """Makes a span the current span of the calling thread within the
+    context, and ends and exports it when the context exits."""
+    previous = current_span()
+    _LOCAL.span = opened
+    try:
+        yield
+    except BaseException as exc:
+        opened.status = ERROR
+        opened.error = f'{type(exc).__name__}: {exc}'
+        raise
+    finally:
+        _LOCAL.span = previous
+        opened.end_time = time.time()
+        if opened.tracer:
+            opened.tracer.export(opened)
+
+
+class JsonLinesExporter:
+    """Appends spans to a file, one JSON object per line.
+
+    Attributes:
+        path: Path to the file as a string.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, exported: Span) -> None:
+        """Appends a span to the file."""
+        line = json.dumps(exported.to_dict()) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as file:
+                file.write(line)
+
+    def flush(self) -> None:
+        """Does nothing since spans are written as they are exported."""
+
+
+class CollectorExporter:
+    """Posts spans to a collector in batches using the OTLP/HTTP JSON
+    encoding, e.g., to http://localhost:4318/v1/traces.
+
+    A batch is posted on a background thread once max_batch_size spans are
+    queued, and the remaining spans are posted when flush is called. Batches
+    that fail to post are logged and dropped.
+
+    Attributes:
+        url: URL of the collector's traces endpoint as a string.
+        service_name: Name of the service reported to the collector as a
+            string.
+        max_batch_size: Maximum number of spans to post in one request, as an
+            int.
+        timeout: Maximum time in seconds to wait for a response, as a float.
+    """
+
+    def __init__(self,
+                 url: str,
+                 service_name: str = 'import-executor',
+                 max_batch_size: int = 100,
+                 timeout: float = 10):
+        self.url = url
+        self.service_name = service_name
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._queue = []
+        self._pending = []
+        self._pool = futures.ThreadPoolExecutor(max_workers=1)
+
+    def export(self, exported: Span) -> None:
+        """Queues a span to be posted."""
+        with self._lock:
+            self._queue.append(exported)
+            if len(self._queue) >= self.max_batch_size:
+                self._submit()
+
+    def flush(self) -> None:
+        """Posts the queued spans and blocks until all batches are posted or
+        given up on."""
+        with self._lock:
+            if self._queue:
+                self._submit()
+            pending = self._pending
+            self._pending = []
+        futures.wait(pending)
+
+    def _submit(self) -> None:
+        """Hands the queued spans to the background thread. Must be called
+        with the lock held."""
+        batch = self._queue
+        self._queue = []
+        self._pending = [task for task in self._pending if not task.done()]
+        self._pending.append(self._pool.submit(self._post, batch))
+
+    def _post(self, batch: List[Span]) -> None:
+        try:
+            logging.info('CollectorExporter._post: Posting %d spans to %s',
+                         len(batch), self.url)
+            response = requests.post(self.url,
+                                     json=to_otlp(batch, self.service_name),
+                                     timeout=self.timeout)
+            response.raise_for_status()
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('CollectorExporter._post: Failed to post spans')
+
+
+def to_otlp(spans: List[Span], service_name: str) -> Dict:
+    """Encodes spans as an OTLP ExportTraceServiceRequest in JSON."""
+    return {
+        'resourceSpans': [{
+            'resource': {
+                'attributes': [_otlp_attribute('service.name', service_name)]
+            },
+            'scopeSpans': [{
+                'scope': {
+                    'name': __name__
+                },
+                'spans': [_otlp_span(exported) for exported in spans]
+            }]
+        }]
+    }
+
+
+def _otlp_span(exported: Span) -> Dict:
+    encoded = {
+        'traceId': exported.trace_id,
+        'spanId': exported.span_id,
+        'name': exported.name,
+        # SPAN_KIND_INTERNAL
+        'kind': 1,
+        'startTimeUnixNano': str(int(exported.start_time * 1e9)),
+        'endTimeUnixNano': str(int((exported.end_time or time.time()) * 1e9)),
+        'attributes': [
+            _otlp_attribute(key, value)
+            for key, value in exported.attributes.items()
+        ],
+        # STATUS_CODE_OK and STATUS_CODE_ERROR
+        'status': {
+            'code': 2,
+            'message': exported.error
+        } if exported.status == ERROR else {
+            'code': 1
+        }
+    }
+    if exported.parent_id:
+        encoded['parentSpanId'] = exported.parent_id
+    return encoded
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict:
+    if isinstance(value, bool):
+        encoded = {'boolValue': value}
+    elif isinstance(value, int):
+        encoded = {'intValue': str(value)}
+    elif isinstance(value, float):
+        encoded = {'doubleValue': value}
+    else:
+        encoded = {'stringValue': str(value)}
+    return {'key': key, 'value': encoded}
+
+
+def create_tracer(trace_file: str = '', collector_url: str = '') -> Tracer:
+    """Creates a Tracer exporting to a JSON-lines file and a collector.
+
+    Args:
+        trace_file: Path to the JSON-lines file as a string. Spans are not
+            written to a file if empty.
+        collector_url: URL of the collector's OTLP/HTTP traces endpoint as a
+            string. Spans are not posted if empty.
+
+    Returns:
+        Tracer object. Its traces are not exported if both are empty.
+    """
+    exporters = []
+    if trace_file:
+        exporters.append(JsonLinesExporter(trace_file))
+    if collector_url:
+        exporters.append(CollectorExporter(collector_url))
+    return Tracer(exporters)
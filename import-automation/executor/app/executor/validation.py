@@ -30,6 +30,7 @@ _MANIFEST_REQUIRED_FIELDS = ['import_specifications']
 _IMPORT_SPECIFICATION_REQUIRED_FIELDS = [
     'import_name', 'provenance_url', 'provenance_description', 'curator_emails'
 ]
+_RESOURCES_FIELDS = ['cpus', 'memory_mb']
 
 
 def is_task_info_valid(task_info: typing.Dict):
@@ -178,6 +179,10 @@ def _is_import_spec_valid(import_spec, repo_dir, import_dir):
     Checks that:
         1) Required fields are present.
         2) Script paths exist.
+        3) The resources field, if present, only has positive numbers for
+           cpus and memory_mb.
+        4) The depends_on field, if present, is a list of relative or
+           absolute import names other than the import itself.
 
     Args:
         import_spec: The import specification to check as a dict.
@@ -203,6 +208,37 @@ def _is_import_spec_valid(import_spec, repo_dir, import_dir):
     if missing_paths:
         raise ValueError(f'{utils.list_to_str(missing_paths)} not found')
 
+    resources = import_spec.get('resources')
+    if resources is not None:
+        if not isinstance(resources, dict):
+            raise ValueError(f'resources must be an object in import '
+                             f'specification ({import_spec})')
+        for key, value in resources.items():
+            if key not in _RESOURCES_FIELDS:
+                raise ValueError(f'Unknown field {key} in resources of import '
+                                 f'specification ({import_spec})')
+            if (isinstance(value, bool) or
+                    not isinstance(value, (int, float)) or value <= 0):
+                raise ValueError(f'{key} in resources must be a positive '
+                                 f'number in import specification '
+                                 f'({import_spec})')
+
+    depends_on = import_spec.get('depends_on', [])
+    if not isinstance(depends_on, list):
+        raise ValueError(f'depends_on must be a list in import '
+                         f'specification ({import_spec})')
+    own_names = (import_spec['import_name'],
+                 import_target.get_absolute_import_name(
+                     import_dir, import_spec['import_name']))
+    for name in depends_on:
+        if (not isinstance(name, str) or
+            (not import_target.is_relative_import_name(name) and
+             not import_target.is_absolute_import_name(name))):
+            raise ValueError(f'{name} in depends_on is not an import name in '
+                             f'import specification ({import_spec})')
+        if name in own_names:
+            raise ValueError(f'{name} depends on itself')
+
 
 def _filter_missing_paths(paths: typing.List[str]) -> typing.List[str]:
     """Given a list of paths, returns the paths that point to files and
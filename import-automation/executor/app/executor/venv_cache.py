@@ -0,0 +1,255 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Persistent cache of Python virtual environments shared by imports with the
+same requirements.
+
+Each cached virtual environment lives in <cache_dir>/<key>, where <key> is a
+hash of the Python version and the contents of the requirement files, and is
+guarded by the lock file <cache_dir>/<key>.lock. The lock is held exclusively
+while the environment is being created and shared while it is in use, so
+environments in use are never evicted. The modification time of the lock file
+records the last time the environment was used.
+"""
+
+import os
+import fcntl
+import shutil
+import hashlib
+import logging
+import functools
+import tempfile
+import subprocess
+import contextlib
+from typing import IO, Iterable, Iterator, Optional, Tuple
+
+from app.executor import subprocess_runner
+from app.executor import tracing
+
+_LOCK_SUFFIX = '.lock'
+# Written into a virtual environment after it has been successfully created.
+_COMPLETE_MARKER = '.complete'
+
+
+class VenvCache:
+    """Persistent cache of Python virtual environments.
+
+    Attributes:
+        cache_dir: Path to the directory storing the virtual environments,
+            as a string.
+        max_size: Maximum total size of the virtual environments in bytes,
+            as an int. Least recently used environments are evicted when
+            the limit is exceeded.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+        logging.info('VenvCache.__init__: Initialized with directory %s',
+                     self.cache_dir)
+
+    @contextlib.contextmanager
+    def venv(
+        self, requirements_path: Iterable[str], timeout: float
+    ) -> Iterator[Tuple[str, Optional[subprocess.CompletedProcess]]]:
+        """Gets a virtual environment with the requirements installed,
+        creating it if it is not in the cache.
+
+        The virtual environment must not be used after the context exits.
+
+        Args:
+            requirements_path: List of paths to pip requirement files listing
+                the dependencies to install, each as a string.
+            timeout: Maximum time creating the environment can take in seconds
+                as a float.
+
+        Yields:
+            A tuple consisting of the path to the interpreter as a string and
+            the subprocess.CompletedProcess object used to create the
+            environment. The latter is None if the environment is reused. If
+            the creation failed, the environment is not cached and the return
+            code of the process is non-zero.
+
+        Raises:
+            Same exceptions as subprocess.run.
+        """
+        requirements_path = list(requirements_path)
+        key = get_key(requirements_path)
+        venv_dir = os.path.join(self.cache_dir, key)
+        interpreter_path = os.path.join(venv_dir, 'bin/python3')
+        lock = _open_locked(venv_dir + _LOCK_SUFFIX, fcntl.LOCK_SH)
+        if not os.path.exists(os.path.join(venv_dir, _COMPLETE_MARKER)):
+            # Imports reusing the environment only share the lock, so that
+            # they do not wait for each other.
+            lock.close()
+            lock = _open_locked(venv_dir + _LOCK_SUFFIX)
+        with lock:
+            process = None
+            if os.path.exists(os.path.join(venv_dir, _COMPLETE_MARKER)):
+                logging.info('VenvCache.venv: Reusing %s', venv_dir)
+            else:
+                logging.info('VenvCache.venv: Creating %s', venv_dir)
+                shutil.rmtree(venv_dir, ignore_errors=True)
+                _, process = create_venv(requirements_path, venv_dir, timeout)
+                if process.returncode:
+                    shutil.rmtree(venv_dir, ignore_errors=True)
+                else:
+                    with open(os.path.join(venv_dir, _COMPLETE_MARKER), 'w'):
+                        pass
+            os.utime(lock.name)
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            if process:
+                self.evict()
+            yield interpreter_path, process
+
+    def evict(self) -> None:
+        """Evicts least recently used virtual environments not in use until
+        the total size is within max_size."""
+        entries = []
+        total_size = 0
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(_LOCK_SUFFIX):
+                continue
+            lock_path = os.path.join(self.cache_dir, filename)
+            venv_dir = lock_path[:-len(_LOCK_SUFFIX)]
+            size = _get_dir_size(venv_dir)
+            total_size += size
+            entries.append((os.path.getmtime(lock_path), lock_path, size))
+
+        entries.sort()
+        for _, lock_path, size in entries:
+            if total_size <= self.max_size:
+                break
+            with open(lock_path, 'a') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # In use
+                    continue
+                venv_dir = lock_path[:-len(_LOCK_SUFFIX)]
+                logging.info('VenvCache.evict: Evicting %s', venv_dir)
+                shutil.rmtree(venv_dir, ignore_errors=True)
+                os.remove(lock_path)
+                total_size -= size
+
+
+def create_venv(requirements_path: Iterable[str], venv_dir: str,
+                timeout: float) -> Tuple[str, subprocess.CompletedProcess]:
+    """Creates a Python virtual environment.
+
+    The virtual environment is created with --system-site-packages set,
+    which allows it to access modules installed on the host. This provides
+    the opportunity to use the requirements.txt file for this project as
+    a central requirement file for all user scripts.
+
+    Args:
+        requirements_path: List of paths to pip requirement files listing the
+            dependencies to install, each as a string.
+        venv_dir: Path to the directory to create the virtual environment in
+            as a string.
+        timeout: Maximum time the creation script can run for in seconds
+            as a float.
+
+    Returns:
+        A tuple consisting of the path to the created interpreter as a string
+        and a subprocess.CompletedProcess object used to create the environment.
+
+    Raises:
+        Same exceptions as subprocess_runner.run.
+    """
+    requirements_path = [
+        path for path in requirements_path if os.path.exists(path)
+    ]
+    with tracing.span('create_venv',
+                      requirements=','.join(requirements_path)) as span:
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.sh') as script:
+            script.write(f'python3 -m venv --system-site-packages {venv_dir}\n')
+            script.write(f'. {venv_dir}/bin/activate\n')
+            for path in requirements_path:
+                script.write('python3 -m pip install --no-cache-dir '
+                             f'--requirement {path}\n')
+            script.flush()
+
+            process = subprocess_runner.run(['bash', script.name], timeout)
+        span.set_attribute('returncode', process.returncode)
+        return os.path.join(venv_dir, 'bin/python3'), process
+
+
+def _open_locked(path: str, operation: int = fcntl.LOCK_EX) -> IO:
+    """Opens a lock file, creating it if it does not exist, and locks it.
+
+    If the lock file is removed by VenvCache.evict while waiting for the lock,
+    a new one is created and locked.
+
+    Args:
+        path: Path to the lock file as a string.
+        operation: fcntl.LOCK_EX to lock the file exclusively or
+            fcntl.LOCK_SH to share the lock.
+
+    Returns:
+        The opened lock file.
+    """
+    while True:
+        lock = open(path, 'a')
+        fcntl.flock(lock, operation)
+        try:
+            if os.stat(path).st_ino == os.fstat(lock.fileno()).st_ino:
+                return lock
+        except FileNotFoundError:
+            pass
+        lock.close()
+
+
+def get_key(requirements_path: Iterable[str]) -> str:
+    """Computes the cache key of a virtual environment from the Python
+    version and the contents of the requirement files that exist.
+
+    Args:
+        requirements_path: List of paths to pip requirement files, each as
+            a string.
+
+    Returns:
+        Hex digest of the key as a string.
+    """
+    digest = hashlib.sha256(_get_python_version().encode())
+    for path in requirements_path:
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                content = file.read()
+            digest.update(hashlib.sha256(content).digest())
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_python_version() -> str:
+    """Returns the full version string of the python3 interpreter used to
+    create virtual environments."""
+    return subprocess.run(['python3', '-c', 'import sys; print(sys.version)'],
+                          capture_output=True,
+                          text=True,
+                          check=True).stdout
+
+
+def _get_dir_size(path: str) -> int:
+    """Returns the total size in bytes of the files in a directory and its
+    subdirectories. Symbolic links are not followed."""
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+            except FileNotFoundError:
+                pass
+    return size
@@ -0,0 +1,313 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Fork servers ("zygotes") that start user scripts with the modules they
+commonly import already loaded.
+
+A Zygote runs zygote_server.py with the interpreter of a virtual
+environment, which imports the configured modules once and then forks a
+child for each user script, so the scripts skip the startup of the
+interpreter and the imports of the preloaded modules. Each child runs in its
+own session with its own working directory, arguments, stdout, and stderr,
+and a Zygote is a spawner for subprocess_runner.run, which applies the same
+timeouts, limits, and resource accounting as to other subprocesses.
+
+A ZygotePool keeps one Zygote for each interpreter, restarting it if it
+exits, e.g., after being idle, or if its virtual environment is recreated.
+"""
+
+import os
+import json
+import array
+import shutil
+import select
+import socket
+import logging
+import tempfile
+import threading
+import subprocess
+import types
+from typing import Any, Dict, IO, List, Tuple
+
+_SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'zygote_server.py')
+
+
+class ZygoteError(Exception):
+    """Exception to signal that a zygote failed to start or to fork a
+    script. The script has not started when this is raised."""
+
+
+class ForkedProcess:
+    """User script forked by a Zygote.
+
+    Has the parts of the interface of subprocess.Popen used by
+    subprocess_runner.run.
+
+    Attributes:
+        pid: ID of the process as an int.
+        stdout: File object reading the stdout of the process.
+        stderr: File object reading the stderr of the process.
+        returncode: Return code of the process as in
+            subprocess.Popen.returncode, or None if it has not been waited
+            for.
+    """
+
+    def __init__(self, pid: int, stdout: IO[bytes], stderr: IO[bytes],
+                 conn: socket.socket, replies: IO[str]):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        self._conn = conn
+        self._replies = replies
+
+    def wait_status(self) -> Tuple[int, Any]:
+        """Waits for the process to exit.
+
+        Returns:
+            Tuple of the return code and an object with the fields of the
+            rusage returned by os.wait4 that resource_usage.from_rusage
+            uses. The rusage is None and the return code is 1 if the zygote
+            exited before reporting them.
+        """
+        line = self._replies.readline()
+        if not line:
+            logging.warning(
+                'ForkedProcess.wait_status: Zygote exited before '
+                'process %d', self.pid)
+            return 1, None
+        reply = json.loads(line)
+        return reply['returncode'], types.SimpleNamespace(**reply['rusage'])
+
+    def wait(self, timeout: float = None) -> int:
+        """Waits for the process to exit and returns its return code."""
+        del timeout
+        if self.returncode is None:
+            self.returncode, _ = self.wait_status()
+        return self.returncode
+
+    def __enter__(self) -> 'ForkedProcess':
+        return self
+
+    def __exit__(self, *args) -> None:
+        for file in (self.stdout, self.stderr, self._replies):
+            file.close()
+        self._conn.close()
+
+
+class Zygote:
+    """Fork server with modules preloaded for the interpreter of a virtual
+    environment.
+
+    Attributes:
+        interpreter_path: Path to the interpreter as a string.
+        modules: List of names of the modules to preload, each as a string.
+            Modules that fail to import are skipped.
+        idle_timeout: Time in seconds after which the server exits if it
+            forks no script, as a float.
+        preloaded: List of names of the modules preloaded, each as a string.
+    """
+
+    def __init__(self,
+                 interpreter_path: str,
+                 modules: List[str],
+                 idle_timeout: float = 600):
+        self.interpreter_path = interpreter_path
+        self.modules = list(modules)
+        self.idle_timeout = idle_timeout
+        self.preloaded = []
+        self._process = None
+        self._socket_dir = None
+
+    def start(self, timeout: float) -> None:
+        """Starts the server and waits for it to preload the modules.
+
+        Args:
+            timeout: Maximum time to wait in seconds as a float.
+
+        Raises:
+            ZygoteError: The server failed to start within timeout.
+        """
+        self._socket_dir = tempfile.mkdtemp(prefix='zygote-')
+        self._process = subprocess.Popen([
+            self.interpreter_path, _SERVER_PATH,
+            self._socket_path(),
+            str(self.idle_timeout)
+        ] + self.modules,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL,
+                                         stdin=subprocess.DEVNULL)
+        readable, _, _ = select.select([self._process.stdout], [], [], timeout)
+        line = self._process.stdout.readline() if readable else b''
+        if not line:
+            self.stop()
+            raise ZygoteError(f'Zygote for {self.interpreter_path} failed to '
+                              f'start within {timeout} seconds')
+        status = json.loads(line)
+        self.preloaded = status['imported']
+        logging.info('Zygote.start: Started for %s with %s preloaded',
+                     self.interpreter_path, ', '.join(self.preloaded))
+        if status['failed']:
+            logging.warning('Zygote.start: Failed to preload %s',
+                            ', '.join(status['failed']))
+
+    def is_alive(self) -> bool:
+        """Returns whether the server is running."""
+        return self._process is not None and self._process.poll() is None
+
+    def spawn(self,
+              args: List[str],
+              cwd: str = None,
+              rlimits: Dict[str, int] = None) -> ForkedProcess:
+        """Forks a child running a Python script.
+
+        Args:
+            args: Command as a list of strings, the interpreter followed by
+                the path to the script and its arguments.
+            cwd: Current working directory of the script as a string.
+            rlimits: Dict mapping names of the RLIMIT_* constants of the
+                resource module to limits to set in the child before the
+                script starts, each as an int.
+
+        Returns:
+            ForkedProcess object whose stdout and stderr read the output of
+            the script.
+
+        Raises:
+            ZygoteError: The script could not be forked.
+        """
+        request = json.dumps({
+            'args': list(args[1:]),
+            'cwd': os.path.abspath(cwd) if cwd else None,
+            'rlimits': rlimits or {}
+        }).encode('utf-8')
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self._socket_path())
+            conn.sendmsg([request],
+                         [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                           array.array('i', [stdout_write, stderr_write]))])
+            conn.shutdown(socket.SHUT_WR)
+            replies = conn.makefile('r')
+            line = replies.readline()
+        except OSError as exc:
+            for fd in (stdout_read, stderr_read):
+                os.close(fd)
+            conn.close()
+            raise ZygoteError(f'Failed to connect to zygote for '
+                              f'{self.interpreter_path}: {exc}')
+        finally:
+            os.close(stdout_write)
+            os.close(stderr_write)
+        reply = json.loads(line) if line else {'error': 'Zygote exited'}
+        if 'pid' not in reply:
+            replies.close()
+            conn.close()
+            for fd in (stdout_read, stderr_read):
+                os.close(fd)
+            raise ZygoteError(f'Zygote for {self.interpreter_path} failed to '
+                              f'fork {args[1]}: {reply["error"]}')
+        return ForkedProcess(pid=reply['pid'],
+                             stdout=os.fdopen(stdout_read, 'rb'),
+                             stderr=os.fdopen(stderr_read, 'rb'),
+                             conn=conn,
+                             replies=replies)
+
+    def stop(self) -> None:
+        """Stops the server. Scripts it forked keep running."""
+        if self._process:
+            if self._process.poll() is None:
+                self._process.terminate()
+            self._process.wait()
+            self._process.stdout.close()
+        if self._socket_dir:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+
+    def _socket_path(self) -> str:
+        return os.path.join(self._socket_dir, 'socket')
+
+
+class ZygotePool:
+    """Zygotes for the interpreters of cached virtual environments.
+
+    Attributes:
+        modules: See Zygote.
+        idle_timeout: See Zygote.
+        start_timeout: Maximum time to wait for a zygote to start in seconds
+            as a float.
+    """
+
+    def __init__(self,
+                 modules: List[str],
+                 idle_timeout: float = 600,
+                 start_timeout: float = 120):
+        self.modules = list(modules)
+        self.idle_timeout = idle_timeout
+        self.start_timeout = start_timeout
+        self._lock = threading.Lock()
+        # Maps interpreter paths to locks held while starting their zygotes
+        self._start_locks = {}
+        # Maps interpreter paths to tuples of the Zygote and the identity of
+        # the virtual environment it was started for
+        self._zygotes = {}
+
+    def get(self, interpreter_path: str) -> Zygote:
+        """Returns the running zygote for an interpreter, starting one if
+        there is none, it exited, or the virtual environment of the
+        interpreter was recreated since it started.
+
+        The virtual environment must not be evicted while the zygote is
+        used.
+
+        Raises:
+            ZygoteError: The zygote failed to start.
+        """
+        with self._lock:
+            start_lock = self._start_locks.setdefault(interpreter_path,
+                                                      threading.Lock())
+        with start_lock:
+            identity = _get_venv_identity(interpreter_path)
+            zygote, started_for = self._zygotes.get(interpreter_path,
+                                                    (None, None))
+            if zygote and zygote.is_alive() and started_for == identity:
+                return zygote
+            if zygote:
+                zygote.stop()
+            zygote = Zygote(interpreter_path, self.modules, self.idle_timeout)
+            zygote.start(self.start_timeout)
+            self._zygotes[interpreter_path] = (zygote, identity)
+            return zygote
+
+    def close(self) -> None:
+        """Stops all zygotes."""
+        with self._lock:
+            zygotes = dict(self._zygotes)
+            self._zygotes.clear()
+        for zygote, _ in zygotes.values():
+            zygote.stop()
+
+
+def _get_venv_identity(interpreter_path: str) -> Tuple:
+    """Returns a tuple that changes when the virtual environment of an
+    interpreter is recreated: the inode and modification time of its
+    pyvenv.cfg."""
+    venv_dir = os.path.dirname(os.path.dirname(interpreter_path))
+    try:
+        stat = os.stat(os.path.join(venv_dir, 'pyvenv.cfg'))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
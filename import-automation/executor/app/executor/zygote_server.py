@@ -0,0 +1,234 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Fork server run with the interpreter of a virtual environment by zygote.py.
+
+Usage: <interpreter> zygote_server.py <socket path> <idle timeout> [module...]
+
+The server imports the modules, listens on the Unix socket, and prints a
+JSON line with the modules it imported and those it failed to import to
+stdout. For each connection, it receives a JSON request
+
+    {"args": [<script path>, <argument>...], "cwd": <directory>,
+     "rlimits": {<name of a resource.RLIMIT_* constant>: <limit>...}}
+
+along with the file descriptors for the stdout and stderr of the script, and
+forks a child that sets the resource limits and runs the script as
+__main__. It replies with a JSON line
+{"pid": <pid>} once the child is forked, and with a JSON line
+{"returncode": <code>, "rusage": {...}} once the child exits. The server
+exits after being idle for the timeout in seconds, or once the process that
+started it exits.
+
+This file is run outside the executor, so it must only use the standard
+library.
+"""
+
+import os
+import sys
+import json
+import time
+import array
+import runpy
+import resource
+import select
+import signal
+import socket
+import importlib
+import traceback
+
+_MAX_REQUEST_SIZE = 1024**2
+_RUSAGE_FIELDS = ('ru_utime', 'ru_stime', 'ru_maxrss', 'ru_inblock',
+                  'ru_oublock')
+
+
+def _preload(modules):
+    """Imports modules, returning the names of those imported and those that
+    failed to import."""
+    imported, failed = [], []
+    for module in modules:
+        try:
+            importlib.import_module(module)
+            imported.append(module)
+        except Exception:  # pylint: disable=broad-except
+            failed.append(module)
+    return imported, failed
+
+
+def _receive(conn):
+    """Receives a request and the file descriptors sent with it."""
+    fds = array.array('i')
+    data, ancdata, _, _ = conn.recvmsg(_MAX_REQUEST_SIZE,
+                                       socket.CMSG_LEN(2 * fds.itemsize))
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) -
+                                    (len(cmsg_data) % fds.itemsize)])
+    # The client shuts down its side of the connection after the request
+    chunks = [data]
+    while data:
+        data = conn.recv(_MAX_REQUEST_SIZE)
+        chunks.append(data)
+    return json.loads(b''.join(chunks).decode('utf-8')), list(fds)
+
+
+def _run_child(request, stdout_fd, stderr_fd, close_fds):
+    """Runs a script in a forked child. Never returns."""
+    code = 1
+    try:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for fd in close_fds:
+            os.close(fd)
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        for fd in (devnull, stdout_fd, stderr_fd):
+            os.close(fd)
+        if request.get('cwd'):
+            os.chdir(request['cwd'])
+        for name, limit in (request.get('rlimits') or {}).items():
+            try:
+                resource.setrlimit(getattr(resource, name), (limit, limit))
+            except (AttributeError, OSError, ValueError):
+                pass
+        script_path = os.path.abspath(request['args'][0])
+        sys.argv = [script_path] + list(request['args'][1:])
+        sys.path.insert(0, os.path.dirname(script_path))
+        # The global state of numpy's random module would otherwise be the
+        # same in every child. The random module reseeds itself on fork.
+        if 'numpy' in sys.modules:
+            sys.modules['numpy'].random.seed()
+        try:
+            runpy.run_path(script_path, run_name='__main__')
+            code = 0
+        except SystemExit as exc:
+            if exc.code is None:
+                code = 0
+            elif isinstance(exc.code, int):
+                code = exc.code
+            else:
+                print(exc.code, file=sys.stderr)
+                code = 1
+    except BaseException:  # pylint: disable=broad-except
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)  # pylint: disable=protected-access
+
+
+def _send(conn, message):
+    """Sends a JSON line, ignoring clients that went away."""
+    try:
+        conn.sendall((json.dumps(message) + '\n').encode('utf-8'))
+    except OSError:
+        pass
+
+
+def _serve(listener, wakeup_fds, idle_timeout):
+    wakeup_fd = wakeup_fds[0]
+    parent = os.getppid()
+    children = {}
+    idle_since = time.monotonic()
+    while True:
+        readable, _, _ = select.select([listener, wakeup_fd], [], [], 1)
+        if wakeup_fd in readable:
+            try:
+                os.read(wakeup_fd, 4096)
+            except BlockingIOError:
+                pass
+        if listener in readable:
+            conn, _ = listener.accept()
+            fds = []
+            try:
+                request, fds = _receive(conn)
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    # Not passing on the connections of the other children
+                    _run_child(
+                        request, fds[0], fds[1],
+                        [listener.fileno(), conn.fileno()] + list(wakeup_fds) +
+                        [other.fileno() for other in children.values()])
+                children[pid] = conn
+                _send(conn, {'pid': pid})
+            except Exception:  # pylint: disable=broad-except
+                _send(conn, {'error': traceback.format_exc()})
+                conn.close()
+            finally:
+                for fd in fds:
+                    os.close(fd)
+        while children:
+            try:
+                pid, status, rusage = os.wait4(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if not pid:
+                break
+            conn = children.pop(pid, None)
+            if not conn:
+                continue
+            if os.WIFSIGNALED(status):
+                returncode = -os.WTERMSIG(status)
+            else:
+                returncode = os.WEXITSTATUS(status)
+            _send(
+                conn, {
+                    'returncode': returncode,
+                    'rusage': {
+                        field: getattr(rusage, field) for field in _RUSAGE_FIELDS
+                    }
+                })
+            conn.close()
+        if children or listener in readable:
+            idle_since = time.monotonic()
+        if os.getppid() != parent:
+            return
+        if not children and time.monotonic() - idle_since > idle_timeout:
+            return
+
+
+def main(argv):
+    # Not the directory of this file, so that its modules do not shadow
+    # those of the user scripts.
+    del sys.path[0]
+    socket_path, idle_timeout, modules = argv[1], float(argv[2]), argv[3:]
+    imported, failed = _preload(modules)
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_read, False)
+    os.set_blocking(wakeup_write, False)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.set_wakeup_fd(wakeup_write)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(64)
+    print(json.dumps({'imported': imported, 'failed': failed}), flush=True)
+    try:
+        _serve(listener, (wakeup_read, wakeup_write), idle_timeout)
+    finally:
+        listener.close()
+        try:
+            os.remove(socket_path)
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    main(sys.argv)
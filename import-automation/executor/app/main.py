@@ -19,17 +19,31 @@ The endpoints are:
 2) '/update': Endpoint for updating imports.
 3) '/schedule': Endpoint for scheduling cron jobs for updating imports upon
                 GitHub commits.
+4) '/jobs/<job_id>': Endpoint for getting the status and result of a request
+                     to one of the endpoints above.
+
+Requests to the first three endpoints are added to a durable job queue and
+run by a pool of background workers. The endpoints respond right away with
+the ID of the job.
 """
 
+import os
+import tempfile
+import functools
+import threading
 import dataclasses
+from typing import Callable, Dict
 
 import flask
 from google.cloud import scheduler
 
 from app import configs
+from app.executor import admission
 from app.executor import validation
 from app.executor import update_scheduler
 from app.executor import import_executor
+from app.executor import job_queue
+from app.executor import zygote
 from app.service import file_uploader
 from app.service import dashboard_api
 from app.service import github_api
@@ -44,6 +58,67 @@ def create_app():
 
 FLASK_APP = create_app()
 
+_JOBS_LOCK = threading.Lock()
+_JOBS = None
+_WORKERS = None
+_ADMISSION_LOCK = threading.Lock()
+_ADMISSION_CONTROLLERS = {}
+_ZYGOTES_LOCK = threading.Lock()
+_ZYGOTE_POOLS = {}
+
+
+def _get_jobs() -> job_queue.JobQueue:
+    """Returns the job queue of the process, starting its workers on the
+    first call."""
+    global _JOBS, _WORKERS
+    with _JOBS_LOCK:
+        if not _JOBS:
+            config = configs.ExecutorConfig()
+            path = config.job_queue_path or os.path.join(
+                tempfile.gettempdir(), 'executor_jobs.sqlite')
+            _JOBS = job_queue.JobQueue(path)
+            _WORKERS = job_queue.JobWorkerPool(
+                _JOBS, {
+                    'execute_imports': _execute_imports,
+                    'scheduled_updates': _scheduled_updates,
+                    'schedule_crons': _schedule_crons
+                },
+                num_workers=config.job_queue_workers)
+            _WORKERS.start()
+        return _JOBS
+
+
+def _get_admission_controller(
+        config: configs.ExecutorConfig) -> admission.AdmissionController:
+    """Returns the AdmissionController of the process for the budget and
+    usage history in config, so that imports executed for concurrent
+    requests share the budget of the host."""
+    key = (config.admission_cpu_budget, config.admission_memory_budget_mb,
+           config.resource_history_dir)
+    with _ADMISSION_LOCK:
+        if key not in _ADMISSION_CONTROLLERS:
+            _ADMISSION_CONTROLLERS[key] = (
+                import_executor.create_admission_controller(config))
+        return _ADMISSION_CONTROLLERS[key]
+
+
+def _get_zygote_pool(config: configs.ExecutorConfig) -> zygote.ZygotePool:
+    """Returns the ZygotePool of the process for the preloaded modules in
+    config, so that its zygotes outlive single requests."""
+    key = (tuple(config.user_script_preload_modules),
+           config.user_script_zygote_idle_timeout)
+    with _ZYGOTES_LOCK:
+        if key not in _ZYGOTE_POOLS:
+            _ZYGOTE_POOLS[key] = zygote.ZygotePool(*key)
+        return _ZYGOTE_POOLS[key]
+
+
+def _enqueue(kind: str, task_info: Dict):
+    """Enqueues a job and returns the response with its ID."""
+    job_id = _get_jobs().enqueue(kind, task_info)
+    _WORKERS.notify()
+    return {'job_id': job_id, 'status': job_queue.QUEUED}, 202
+
 
 @FLASK_APP.route('/', methods=['POST'])
 def execute_imports():
@@ -51,6 +126,21 @@ def execute_imports():
     task_info = flask.request.get_json(force=True)
     if 'COMMIT_SHA' not in task_info:
         return {'error': 'COMMIT_SHA not found'}
+    return _enqueue('execute_imports', task_info)
+
+
+def _report_imports(report: Callable[..., None], imports: Dict) -> None:
+    """Reports the progress of the imports of a system run to the job
+    queue, with the status and stage of each import in the details of the
+    job."""
+    finished = sum(1 for progress in imports.values()
+                   if progress['status'] not in ('queued', 'running'))
+    report(f'{finished} of {len(imports)} imports finished',
+           {'imports': imports})
+
+
+def _execute_imports(task_info: Dict, report: Callable[..., None]) -> Dict:
+    """Executes imports on a GitHub commit. See execute_imports."""
     commit_sha = task_info['COMMIT_SHA']
     repo_name = task_info.get('REPO_NAME')
     branch_name = task_info.get('BRANCH_NAME')
@@ -58,18 +148,21 @@ def execute_imports():
 
     task_configs = task_info.get('configs', {})
     config = configs.ExecutorConfig(**task_configs)
+    dashboard = _create_dashboard(config)
     executor = import_executor.ImportExecutor(
         uploader=file_uploader.GCSFileUploader(
             project_id=config.gcs_project_id,
             bucket_name=config.storage_dev_bucket_name,
-            path_prefix=config.storage_executor_output_prefix),
+            path_prefix=config.storage_executor_output_prefix,
+            chunk_size=config.upload_chunk_size),
         github=github_api.GitHubRepoAPI(
             repo_owner_username=config.github_repo_owner_username,
             repo_name=config.github_repo_name,
             auth_username=config.github_auth_username,
-            auth_access_token=config.github_auth_access_token),
+            auth_access_token=config.github_auth_access_token,
+            cache_dir=config.repo_cache_dir),
         config=config,
-        dashboard=dashboard_api.DashboardAPI(config.dashboard_oauth_client_id),
+        dashboard=dashboard,
         notifier=email_notifier.EmailNotifier(config.email_account,
                                               config.email_token),
         importer=import_service.ImportServiceClient(
@@ -78,11 +171,18 @@ def execute_imports():
             importer_output_prefix=config.storage_importer_output_prefix,
             unresolved_mcf_bucket_name=config.storage_dev_bucket_name,
             resolved_mcf_bucket_name=config.storage_importer_bucket_name,
-            client_id=config.importer_oauth_client_id))
-    result = executor.execute_imports_on_commit(commit_sha=commit_sha,
-                                                repo_name=repo_name,
-                                                branch_name=branch_name,
-                                                pr_number=pr_number)
+            client_id=config.importer_oauth_client_id),
+        admission_controller=_get_admission_controller(config),
+        zygotes=_get_zygote_pool(config),
+        progress_callback=functools.partial(_report_imports, report))
+    report(f'Executing imports on commit {commit_sha}')
+    try:
+        result = executor.execute_imports_on_commit(commit_sha=commit_sha,
+                                                    repo_name=repo_name,
+                                                    branch_name=branch_name,
+                                                    pr_number=pr_number)
+    finally:
+        dashboard.close()
     return dataclasses.asdict(result)
 
 
@@ -92,21 +192,36 @@ def scheduled_updates():
     task_info = flask.request.get_json(force=True)
     if 'absolute_import_name' not in task_info:
         return {'error': 'absolute_import_name not found'}
+    return _enqueue('scheduled_updates', task_info)
+
+
+def _scheduled_updates(task_info: Dict, report: Callable[..., None]) -> Dict:
+    """Updates an import. See scheduled_updates."""
     task_configs = task_info.get('configs', {})
     config = configs.ExecutorConfig(**task_configs)
+    dashboard = _create_dashboard(config)
     executor = import_executor.ImportExecutor(
         uploader=file_uploader.GCSFileUploader(
             project_id=config.gcs_project_id,
-            bucket_name=config.storage_prod_bucket_name),
+            bucket_name=config.storage_prod_bucket_name,
+            chunk_size=config.upload_chunk_size),
         github=github_api.GitHubRepoAPI(
             repo_owner_username=config.github_repo_owner_username,
             repo_name=config.github_repo_name,
             auth_username=config.github_auth_username,
-            auth_access_token=config.github_auth_access_token),
-        dashboard=dashboard_api.DashboardAPI(config.dashboard_oauth_client_id),
-        config=config)
-    result = executor.execute_imports_on_update(
-        task_info['absolute_import_name'])
+            auth_access_token=config.github_auth_access_token,
+            cache_dir=config.repo_cache_dir),
+        dashboard=dashboard,
+        config=config,
+        admission_controller=_get_admission_controller(config),
+        zygotes=_get_zygote_pool(config),
+        progress_callback=functools.partial(_report_imports, report))
+    report(f'Updating {task_info["absolute_import_name"]}')
+    try:
+        result = executor.execute_imports_on_update(
+            task_info['absolute_import_name'])
+    finally:
+        dashboard.close()
     return dataclasses.asdict(result)
 
 
@@ -117,6 +232,11 @@ def schedule_crons():
     task_info = flask.request.get_json(force=True)
     if 'COMMIT_SHA' not in task_info:
         return 'COMMIT_SHA not found'
+    return _enqueue('schedule_crons', task_info)
+
+
+def _schedule_crons(task_info: Dict, report: Callable[[str], None]) -> Dict:
+    """Schedules cron jobs for a GitHub commit. See schedule_crons."""
     task_configs = task_info.get('configs', {})
     config = configs.ExecutorConfig(**task_configs)
     import_scheduler = update_scheduler.UpdateScheduler(
@@ -125,15 +245,38 @@ def schedule_crons():
             repo_owner_username=config.github_repo_owner_username,
             repo_name=config.github_repo_name,
             auth_username=config.github_auth_username,
-            auth_access_token=config.github_auth_access_token),
+            auth_access_token=config.github_auth_access_token,
+            cache_dir=config.repo_cache_dir),
         config=config)
+    report(f'Scheduling updates on commit {task_info["COMMIT_SHA"]}')
     return dataclasses.asdict(
         import_scheduler.schedule_on_commit(task_info['COMMIT_SHA']))
 
 
+@FLASK_APP.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id: str):
+    """Endpoint for getting the status, progress, and result of a job."""
+    job = _get_jobs().get(job_id)
+    if not job:
+        return {'error': f'Job {job_id} not found'}, 404
+    job = dataclasses.asdict(job)
+    del job['payload']
+    return job
+
+
+def _create_dashboard(config: configs.ExecutorConfig):
+    """Creates a DashboardAPI that posts progress logs as configured."""
+    return dashboard_api.DashboardAPI(
+        config.dashboard_oauth_client_id,
+        log_batch_size=config.dashboard_log_batch_size,
+        log_flush_interval=config.dashboard_log_flush_interval)
+
+
 @FLASK_APP.route('/_ah/start')
 def start():
     """Handles start up calls from App Engine."""
+    # Resumes the jobs queued before the instance was shut down
+    _get_jobs()
     return ''
 
 
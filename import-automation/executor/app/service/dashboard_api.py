@@ -15,8 +15,11 @@
 Import progress dashboard API client.
 """
 
+import atexit
 import logging
-from typing import Dict
+import threading
+import time
+from typing import Dict, List
 
 from app import utils
 from app.service import iap_request
@@ -30,6 +33,7 @@ _DASHBOARD_ATTEMPT_LIST = _DASHBOARD_API_HOST + '/import_attempts'
 _DASHBOARD_ATTEMPT_BY_ID = _DASHBOARD_ATTEMPT_LIST + '/{attempt_id}'
 
 _DASHBOARD_LOG_LIST = _DASHBOARD_API_HOST + '/logs'
+_DASHBOARD_LOG_BATCH = _DASHBOARD_LOG_LIST + '/batch'
 _DASHBOARD_LOG_BY_ID = _DASHBOARD_LOG_LIST + '/{log_id}'
 
 
@@ -44,6 +48,168 @@ class LogLevel:
     DEBUG: str = 'debug'
 
 
+class LogShipper:
+    """Posts progress logs to the import progress dashboard in batches on
+    a background thread.
+
+    A batch is posted once max_batch_size logs are queued or the oldest
+    queued log has waited for flush_interval seconds. Posting a batch is
+    retried with exponential backoff. Queued logs are posted before the
+    interpreter exits, or when flush or close is called.
+
+    The dashboard rejects a whole batch if any of its logs is invalid, so
+    logs without a run_id, which the dashboard requires, are dropped before
+    posting, and the logs of a batch rejected with a client error are posted
+    one by one so that only the invalid ones are lost.
+
+    Attributes:
+        iap: IAPRequest object used to post the logs.
+        max_batch_size: Maximum number of logs to post in one request, as an
+            int.
+        flush_interval: Maximum time in seconds a log is queued before
+            being posted, as a float.
+        max_retries: Number of times to retry posting a batch before
+            giving up on it, as an int.
+    """
+
+    def __init__(self,
+                 iap: iap_request.IAPRequest,
+                 max_batch_size: int = 100,
+                 flush_interval: float = 2,
+                 max_retries: int = 3):
+        self.iap = iap
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._condition = threading.Condition()
+        self._queue = []
+        # Monotonic time at which the oldest log in the queue was queued
+        self._oldest_time = None
+        # Number of logs taken from the queue but not yet posted
+        self._num_posting = 0
+        self._num_flushing = 0
+        self._closed = False
+        self._thread = None
+
+    def put(self, log: Dict) -> None:
+        """Queues a log to be posted.
+
+        Raises:
+            ValueError: The shipper has been closed.
+        """
+        with self._condition:
+            if self._closed:
+                raise ValueError('LogShipper is closed')
+            if not self._queue:
+                self._oldest_time = time.monotonic()
+            self._queue.append(log)
+            if not self._thread:
+                self._thread = threading.Thread(target=self._ship, daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            self._condition.notify_all()
+
+    def flush(self) -> None:
+        """Blocks until all logs queued so far are posted or given up on."""
+        with self._condition:
+            self._num_flushing += 1
+            self._condition.notify_all()
+            while self._queue or self._num_posting:
+                self._condition.wait()
+            self._num_flushing -= 1
+
+    def close(self) -> None:
+        """Posts the queued logs and stops the background thread."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread:
+            thread.join()
+            atexit.unregister(self.close)
+
+    def _ship(self) -> None:
+        """Posts batches of logs until closed."""
+        while True:
+            with self._condition:
+                while not self._should_post():
+                    if self._closed and not self._queue:
+                        return
+                    timeout = None
+                    if self._queue:
+                        timeout = (self._oldest_time + self.flush_interval -
+                                   time.monotonic())
+                    self._condition.wait(timeout)
+                batch = self._queue[:self.max_batch_size]
+                del self._queue[:self.max_batch_size]
+                self._oldest_time = time.monotonic()
+                self._num_posting = len(batch)
+            try:
+                self._post(batch)
+            finally:
+                with self._condition:
+                    self._num_posting = 0
+                    self._condition.notify_all()
+
+    def _should_post(self) -> bool:
+        """Returns whether a batch should be posted now. Must be called with
+        the condition held."""
+        if not self._queue:
+            return False
+        return (self._closed or self._num_flushing or
+                len(self._queue) >= self.max_batch_size or
+                time.monotonic() >= self._oldest_time + self.flush_interval)
+
+    def _post(self, batch: List[Dict]) -> None:
+        """Posts a batch of logs, retrying on failures. Logs the batch
+        locally if it cannot be posted."""
+        invalid = [log for log in batch if not log.get('run_id')]
+        if invalid:
+            logging.error('LogShipper._post: Dropping logs without run_id %s',
+                          invalid)
+            batch = [log for log in batch if log.get('run_id')]
+            if not batch:
+                return
+        for retry in range(self.max_retries + 1):
+            try:
+                logging.info('LogShipper._post: Posting %d logs to %s',
+                             len(batch), _DASHBOARD_LOG_BATCH)
+                response = self.iap.post(_DASHBOARD_LOG_BATCH,
+                                         json={'logs': batch})
+                if _is_client_error(response) and len(batch) > 1:
+                    logging.error(
+                        'LogShipper._post: Batch rejected with %s, posting '
+                        'logs one by one', response.status_code)
+                    self._post_one_by_one(batch)
+                    return
+                response.raise_for_status()
+                return
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('LogShipper._post: Failed to post logs')
+                if retry < self.max_retries:
+                    time.sleep(2**retry)
+        logging.error('LogShipper._post: Giving up on logs %s', batch)
+
+    def _post_one_by_one(self, batch: List[Dict]) -> None:
+        """Posts the logs of a rejected batch to the endpoint for single
+        logs, without retrying. Logs the logs that cannot be posted
+        locally."""
+        for log in batch:
+            try:
+                response = self.iap.post(_DASHBOARD_LOG_LIST, json=log)
+                response.raise_for_status()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception(
+                    'LogShipper._post_one_by_one: Giving up on log %s', log)
+
+
+def _is_client_error(response) -> bool:
+    """Returns whether a response has a 4xx status code."""
+    return 400 <= response.status_code < 500
+
+
 class DashboardAPI:
     """Import progress dashboard API client.
 
@@ -53,17 +219,46 @@ class DashboardAPI:
     Attributes:
         iap: IAPRequest object for making HTTP requests to
             Identity-Aware Proxy protected resources.
+        log_shipper: LogShipper object for posting progress logs
+            asynchronously. If None, progress logs are posted one by one
+            before the logging methods return.
     """
 
-    def __init__(self, client_id: str):
+    def __init__(self,
+                 client_id: str,
+                 log_batch_size: int = 0,
+                 log_flush_interval: float = 2):
         """Constructs a DashboardAPI.
 
         Args:
             client_id: Oauth2 client id for authentication.
+            log_batch_size: Maximum number of progress logs to post in one
+                request, as an int. If 0, the logs are posted one by one
+                synchronously.
+            log_flush_interval: If log_batch_size is not 0, the maximum time
+                in seconds a progress log is queued before being posted.
         """
         self.iap = iap_request.IAPRequest(client_id)
+        self.log_shipper = None
+        if log_batch_size:
+            self.log_shipper = LogShipper(self.iap, log_batch_size,
+                                          log_flush_interval)
         logging.info('DashboardAPI.__init__: Initialized')
 
+    def flush(self) -> None:
+        """Blocks until all progress logs queued so far are posted."""
+        if self.log_shipper:
+            self.log_shipper.flush()
+
+    def close(self) -> None:
+        """Posts all queued progress logs and stops posting asynchronously.
+        Progress logs are posted synchronously afterwards."""
+        if self.log_shipper:
+            self.log_shipper.close()
+            self.log_shipper = None
+        logging.info('DashboardAPI.close: Request stats %s',
+                     self.iap.get_stats())
+
     def critical(self,
                  message: str,
                  attempt_id: str = None,
@@ -214,7 +409,9 @@ class DashboardAPI:
                 as a string.
 
         Returns:
-            The posted progress log as a dict.
+            The posted progress log as a dict. If the logs are posted
+            asynchronously, the log is returned without log_id as soon as it
+            is queued.
 
         Raises:
             ValueError: Neither run_id nor attempt_id is specified.
@@ -230,6 +427,9 @@ class DashboardAPI:
             log['run_id'] = run_id
         if attempt_id:
             log['attempt_id'] = attempt_id
+        if self.log_shipper:
+            self.log_shipper.put(log)
+            return log
         logging.info('DashboardAPI._log_helper: Logging %s to %s', log,
                      _DASHBOARD_LOG_LIST)
         response = self.iap.post(_DASHBOARD_LOG_LIST, json=log)
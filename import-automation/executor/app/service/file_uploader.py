@@ -16,11 +16,44 @@ File uploaders for uploading generated data files.
 """
 
 import os
+import time
+import fcntl
+import errno
 import logging
 import shutil
+import threading
+import dataclasses
+from concurrent import futures
+from typing import List, Tuple
 
 from google.cloud import storage
 
+# Linux ioctl request to make a file share the extents of another file
+_FICLONE = 0x40049409
+
+
+@dataclasses.dataclass
+class UploadResult:
+    """Outcome of the upload of a file.
+
+    Attributes:
+        src: Path to the uploaded file as a string.
+        dest: Destination of the file as a string.
+        size: Size of the file in bytes as an int.
+        duration: Time the upload took in seconds as a float.
+    """
+    src: str
+    dest: str
+    size: int
+    duration: float
+
+    @property
+    def throughput(self) -> float:
+        """Upload speed in bytes per second."""
+        if not self.duration:
+            return float(self.size)
+        return self.size / self.duration
+
 
 class FileUploader:
     """Base class for all file uploaders."""
@@ -29,6 +62,51 @@ class FileUploader:
         """Uploads the file at src to a file at dest."""
         raise NotImplementedError
 
+    def exists(self, dest: str) -> bool:
+        """Returns whether a file has been uploaded to dest."""
+        raise NotImplementedError
+
+    def copy(self, src: str, dest: str) -> None:
+        """Copies the uploaded file at src to dest without uploading it
+        again."""
+        raise NotImplementedError
+
+    def upload_files(self,
+                     files: List[Tuple[str, str]],
+                     max_workers: int = 1) -> List[UploadResult]:
+        """Uploads files concurrently.
+
+        Args:
+            files: List of tuples each consisting of the path to a file to
+                upload and its destination, both as strings. See
+                upload_file.
+            max_workers: Maximum number of files to upload at the same time,
+                as an int.
+
+        Returns:
+            List of UploadResult objects, one for each file in the same order
+            as files.
+
+        Raises:
+            Same exceptions as upload_file. If multiple uploads fail, the
+            exception of the first one in files is raised after all uploads
+            have finished.
+        """
+
+        def upload(src: str, dest: str) -> UploadResult:
+            size = os.path.getsize(src)
+            start = time.monotonic()
+            self.upload_file(src, dest)
+            return UploadResult(src=src,
+                                dest=dest,
+                                size=size,
+                                duration=time.monotonic() - start)
+
+        with futures.ThreadPoolExecutor(
+                max_workers=max(1, max_workers)) as executor:
+            tasks = [executor.submit(upload, src, dest) for src, dest in files]
+        return [task.result() for task in tasks]
+
     def upload_string(self, string: str, dest: str) -> None:
         """Uploads the string to a file at dest."""
         raise NotImplementedError
@@ -42,12 +120,16 @@ class GCSFileUploader(FileUploader):
             uploaded to.
         path_prefix: Path prefix in the bucket as a string. Destinations
             will be prepended by this prefix.
+        chunk_size: Size in bytes of the chunks files of at least this size
+            are uploaded in, as an int. Each chunk is retried on its own if
+            its upload fails. Must be a multiple of 256 KiB.
     """
 
     def __init__(self,
                  project_id: str,
                  bucket_name: str,
-                 path_prefix: str = ''):
+                 path_prefix: str = '',
+                 chunk_size: int = 32 * 1024**2):
         """Constructs a GCSFileUploader.
 
         Args:
@@ -57,6 +139,8 @@ class GCSFileUploader(FileUploader):
                 as a string.
             path_prefix: Path prefix in the bucket as a string. Destinations
                 will be prepended by this prefix.
+            chunk_size: Size in bytes of the chunks of resumable uploads, as
+                an int. Files smaller than this are uploaded in one request.
 
         Raises:
             ValueError: project_id or bucket_name is None, empty, or all spaces.
@@ -64,6 +148,7 @@ class GCSFileUploader(FileUploader):
         _strings_not_empty(project_id, bucket_name)
         self.bucket = storage.Client(project=project_id).bucket(bucket_name)
         self.path_prefix = path_prefix
+        self.chunk_size = chunk_size
         logging.info('GCSFileUploader.__init__: '
                      'Initialized with bucket %s at prefix %s on project %s',
                      bucket_name, path_prefix, project_id)
@@ -84,10 +169,47 @@ class GCSFileUploader(FileUploader):
         logging.info('GCSFileUploader.upload_file: Uploading %s to %s',
                      src, dest)
         blob = self.bucket.blob(dest)
+        if os.path.isfile(src) and os.path.getsize(src) >= self.chunk_size:
+            # Makes the upload resumable and chunked
+            blob.chunk_size = self.chunk_size
         blob.upload_from_filename(src)
         logging.info('GCSFileUploader.upload_file: Uploaded %s to %s',
                      src, dest)
 
+    def exists(self, dest: str) -> bool:
+        """Returns whether a file exists in the bucket.
+
+        Args:
+            dest: Relative path in the bucket as a string. The actual path
+                would be {self.path_prefix}/{dest}.
+
+        Raises:
+            ValueError: dest is None, empty, or all spaces.
+        """
+        _strings_not_empty(dest)
+        return self.bucket.blob(self._fix_path(dest)).exists()
+
+    def copy(self, src: str, dest: str) -> None:
+        """Copies a file in the bucket to another location in the bucket.
+
+        The copy is made by Cloud Storage without downloading the file.
+
+        Args:
+            src: Relative path of the file in the bucket as a string. The
+                actual path would be {self.path_prefix}/{src}.
+            dest: Relative destination in the bucket as a string. The actual
+                destination would be {self.path_prefix}/{dest}.
+
+        Raises:
+            ValueError: src or dest is None, empty, or all spaces.
+        """
+        _strings_not_empty(src, dest)
+        src = self._fix_path(src)
+        dest = self._fix_path(dest)
+        logging.info('GCSFileUploader.copy: Copying %s to %s', src, dest)
+        self.bucket.copy_blob(self.bucket.blob(src), self.bucket, dest)
+        logging.info('GCSFileUploader.copy: Copied %s to %s', src, dest)
+
     def upload_string(self, string: str, dest: str) -> None:
         """Uploads a string to a file in the bucket, overwriting it.
 
@@ -116,20 +238,30 @@ class GCSFileUploader(FileUploader):
 class LocalFileUploader(FileUploader):
     """Class for copying files to a different location in the local filesystem.
 
+    Files are cloned if the filesystem supports it, or hard linked if
+    allow_hard_links is set, to avoid copying their bytes.
+
     Attributes:
         output_dir: Path to the directory files are copied to. E.g.,
             LocalFileUploader('/tmp').upload_file('/foo/file', 'bar/file') will
             copy '/foo/file' to '/tmp/bar/file'.
+        allow_hard_links: Whether files that cannot be cloned may be hard
+            linked instead of copied, as a boolean. A hard linked file
+            changes if its source is modified in place. Files copied with
+            copy are always hard linked if they cannot be cloned since both
+            are uploaded files.
     """
 
-    def __init__(self, output_dir: str = ''):
+    def __init__(self, output_dir: str = '', allow_hard_links: bool = False):
         self.output_dir = os.path.abspath(output_dir)
+        self.allow_hard_links = allow_hard_links
         logging.info('LocalFileUploader.__init__: '
                      'Initialized with output directory %s',
                      output_dir)
 
     def upload_file(self, src: str, dest: str) -> None:
-        """Copies the file at src to a file at <output_dir>/<dest>.
+        """Copies the file at src to a file at <output_dir>/<dest>,
+        overwriting any existing file.
 
         Raises:
             Same exceptions as shutil.copyfile.
@@ -140,9 +272,35 @@ class LocalFileUploader(FileUploader):
         logging.info('LocalFileUploader.upload_file: Uploading %s to %s',
                      src, dest)
         os.makedirs(os.path.dirname(dest), exist_ok=True)
-        shutil.copyfile(src, dest)
-        logging.info('LocalFileUploader.upload_file: Uploaded %s to %s',
-                     src, dest)
+        method = _link_or_copy(src, dest, self.allow_hard_links)
+        logging.info('LocalFileUploader.upload_file: Uploaded %s to %s (%s)',
+                     src, dest, method)
+
+    def exists(self, dest: str) -> bool:
+        """Returns whether the file <output_dir>/<dest> exists.
+
+        Raises:
+            ValueError: dest is None, empty, or all spaces.
+        """
+        _strings_not_empty(dest)
+        return os.path.isfile(os.path.join(self.output_dir, dest))
+
+    def copy(self, src: str, dest: str) -> None:
+        """Copies the file <output_dir>/<src> to <output_dir>/<dest>,
+        overwriting any existing file.
+
+        Raises:
+            Same exceptions as shutil.copyfile.
+            ValueError: src or dest is None, empty, or all spaces.
+        """
+        _strings_not_empty(src, dest)
+        src = os.path.join(self.output_dir, src)
+        dest = os.path.join(self.output_dir, dest)
+        logging.info('LocalFileUploader.copy: Copying %s to %s', src, dest)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        method = _link_or_copy(src, dest, allow_hard_links=True)
+        logging.info('LocalFileUploader.copy: Copied %s to %s (%s)', src, dest,
+                     method)
 
     def upload_string(self, string: str, dest: str) -> None:
         """Writes a string into a file at <output_dir>/<dest>, overwriting any
@@ -163,6 +321,44 @@ class LocalFileUploader(FileUploader):
                      string, dest)
 
 
+def _link_or_copy(src: str, dest: str, allow_hard_links: bool) -> str:
+    """Clones, hard links, or copies a file, whichever is possible first.
+
+    Returns:
+        'cloned', 'linked', or 'copied'.
+    """
+    if os.path.exists(dest) and os.path.samefile(src, dest):
+        return 'linked'
+    if os.path.lexists(dest):
+        # A hard linked dest must not be overwritten in place.
+        os.remove(dest)
+    # Cloned and copied to a temporary file first so that a failed or
+    # interrupted write does not leave an empty or partial file at dest.
+    tmp_dest = f'{dest}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        try:
+            with open(src, 'rb') as src_file, open(tmp_dest, 'wb') as dest_file:
+                fcntl.ioctl(dest_file.fileno(), _FICLONE, src_file.fileno())
+            os.replace(tmp_dest, dest)
+            return 'cloned'
+        except OSError as exc:
+            if exc.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL,
+                                 errno.ENOTTY, errno.EBADF):
+                raise
+        if allow_hard_links:
+            try:
+                os.link(src, dest)
+                return 'linked'
+            except OSError:
+                pass
+        shutil.copyfile(src, tmp_dest)
+        os.replace(tmp_dest, dest)
+        return 'copied'
+    finally:
+        if os.path.lexists(tmp_dest):
+            os.remove(tmp_dest)
+
+
 def _strings_not_empty(*args: str):
     """Ensures that the strings are not None, empty, or all spaces.
 
@@ -16,11 +16,13 @@ GitHub API client for querying information about a repository.
 """
 
 import os
+import json
 import logging
+import shutil
 import tarfile
 import tempfile
 import http
-from typing import Dict, Set, List, Tuple
+from typing import Callable, Dict, Set, List, Tuple, Iterable
 
 import requests
 
@@ -42,6 +44,17 @@ _GITHUB_DOWNLOAD_API = (
     _GITHUB_API_HOST +
     '/repos/{owner_username}/{repo_name}/tarball/{commit_sha}')
 
+# Media type for getting only the SHA of a commit from the commit API.
+# See https://docs.github.com/en/rest/reference/repos#get-a-commit.
+_GITHUB_SHA_MEDIA_TYPE = 'application/vnd.github.v3.sha'
+
+# Name of the file in the cache directory that stores the SHA and ETag of the
+# most recently resolved HEAD commit.
+_HEAD_CACHE_FILENAME = 'HEAD.json'
+
+# Maximum number of repository tarballs kept in the cache directory.
+_MAX_CACHED_REPOS = 10
+
 
 class GitHubRepoAPI:
     """GitHub API client for querying information about a repository.
@@ -54,13 +67,17 @@ class GitHubRepoAPI:
         repo: Name of the repository as a string.
         auth: Tuple consisting of the username of the account to authenticate
             with GitHub and the access token.
+        cache_dir: Path to the directory to cache downloaded repository
+            tarballs in, keyed by commit SHA, as a string. If empty,
+            the repository is downloaded every time.
     """
 
     def __init__(self,
                  repo_owner_username: str,
                  repo_name: str,
                  auth_username: str = '',
-                 auth_access_token: str = ''):
+                 auth_access_token: str = '',
+                 cache_dir: str = ''):
         """Constructs a GitHubRepoAPI.
 
         Args:
@@ -69,10 +86,14 @@ class GitHubRepoAPI:
             auth_username: The username of the account to authenticate
                 with GitHub, as a string.
             auth_access_token: The corresponding access token as a string.
+            cache_dir: See cache_dir in Attributes.
         """
         self.owner = repo_owner_username
         self.repo = repo_name
         self.auth = (auth_username, auth_access_token)
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
         logging.info('GitHubRepoAPI.__init__: Initialized with repository %s',
                      self._format_repo_name())
 
@@ -139,12 +160,56 @@ class GitHubRepoAPI:
                      found_dirs)
         return found_dirs
 
+    def resolve_commit_sha(self, commit_sha: str = 'HEAD') -> str:
+        """Resolves a commit reference to the full SHA of the commit.
+
+        If cache_dir is set, the SHA of HEAD is cached along with the ETag of
+        the response and revalidated with a conditional request, so that
+        resolving an unchanged HEAD transfers no data.
+
+        Args:
+            commit_sha: Commit reference as a string, e.g., a branch name,
+                'HEAD', or an abbreviated commit SHA.
+
+        Returns:
+            The full SHA of the commit as a string.
+        """
+        headers = {'Accept': _GITHUB_SHA_MEDIA_TYPE}
+        cached = {}
+        head_cache_path = None
+        if self.cache_dir and commit_sha == 'HEAD':
+            head_cache_path = os.path.join(self.cache_dir, _HEAD_CACHE_FILENAME)
+            cached = _read_head_cache(head_cache_path)
+            if cached:
+                headers['If-None-Match'] = cached['etag']
+
+        commit_query = self._build_commit_query(commit_sha)
+        logging.info('GitHubRepoAPI.resolve_commit_sha: Querying %s',
+                     commit_query)
+        response = requests.get(commit_query, auth=self.auth, headers=headers)
+        if response.status_code == http.HTTPStatus.NOT_MODIFIED:
+            logging.info('GitHubRepoAPI.resolve_commit_sha: '
+                         '%s not modified since %s', commit_sha, cached['sha'])
+            return cached['sha']
+        response.raise_for_status()
+        sha = response.text.strip()
+        etag = response.headers.get('ETag')
+        if head_cache_path and etag:
+            _write_head_cache(head_cache_path, {'sha': sha, 'etag': etag})
+        logging.info('GitHubRepoAPI.resolve_commit_sha: Resolved %s to %s',
+                     commit_sha, sha)
+        return sha
+
     def download_repo(self,
                       dest_dir: str,
                       commit_sha: str = None,
-                      timeout: float = None) -> str:
+                      timeout: float = None,
+                      paths: Iterable[str] = None) -> str:
         """Downloads the repository.
 
+        If cache_dir is set, the tarball of the repository at the commit is
+        taken from the cache if present and added to the cache otherwise.
+
         Example:
             Assume the repository is named 'data-demo' owned by 'intrepiditee'.
             The method call
@@ -159,6 +224,10 @@ class GitHubRepoAPI:
             timeout: Maximum time downloading the repository can take in
                 seconds, as a float. The actual timeout will be a rough
                 approximation to this, likely several seconds larger.
+            paths: List of paths to files or directories relative to the root
+                directory of the repository, each as a string. If supplied,
+                only these are extracted. Otherwise, the whole repository
+                is extracted.
 
         Returns:
             Path to a directory containing the downloaded repository,
@@ -171,6 +240,40 @@ class GitHubRepoAPI:
         logging.info('GitHubRepoAPI.download_repo: '
                      'Downloading repository %s at commit %s to %s',
                      f'{self._format_repo_name()}', commit_sha, dest_dir)
+        if self.cache_dir:
+            if not commit_sha:
+                commit_sha = self.resolve_commit_sha()
+            cached_tar = os.path.join(
+                self.cache_dir, f'{self.owner}-{self.repo}-{commit_sha}.tar.gz')
+            try:
+                # Marks the tarball as recently used. It may be evicted by
+                # another process at any time, so it is not checked first.
+                os.utime(cached_tar)
+                logging.info('GitHubRepoAPI.download_repo: Found cached tar %s',
+                             cached_tar)
+            except FileNotFoundError:
+                with tempfile.TemporaryDirectory(dir=self.cache_dir) as tmpdir:
+                    repo_tar = self._download_tar(tmpdir, commit_sha, timeout)
+                    os.replace(repo_tar, cached_tar)
+                self._evict_cached_tars()
+            return _extract_repo(cached_tar, dest_dir, paths)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            repo_tar = self._download_tar(tmpdir, commit_sha, timeout)
+            return _extract_repo(repo_tar, dest_dir, paths)
+
+    def _download_tar(self, dest_dir: str, commit_sha: str,
+                      timeout: float) -> str:
+        """Downloads the tarball of the repository at a commit.
+
+        Args:
+            dest_dir: Directory to download the tarball into as a string.
+            commit_sha: See download_repo.
+            timeout: See download_repo.
+
+        Returns:
+            Path to the downloaded tarball as a string.
+        """
         if not commit_sha:
             commit_sha = ''
         download_query = _GITHUB_DOWNLOAD_API.format_map({
@@ -178,23 +281,33 @@ class GitHubRepoAPI:
             'repo_name': self.repo,
             'commit_sha': commit_sha
         })
+        repo_tar = utils.download_file(download_query, dest_dir, timeout)
+        logging.info('GitHubRepoAPI._download_tar: Downloaded tar %s', repo_tar)
+        return repo_tar
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            repo_tar = utils.download_file(download_query, tmpdir, timeout)
-            logging.info('GitHubRepoAPI.download_repo: Downloaded tar %s',
-                         repo_tar)
-            with tarfile.open(repo_tar) as tar:
-                files = tar.getnames()
-                if not files:
-                    raise FileNotFoundError(
-                        'Downloaded tar file does not contain the repository')
-                tar.extractall(dest_dir)
-                repo_dir = os.path.join(dest_dir,
-                                        _get_path_first_component(files[0]))
-                logging.info('GitHubRepoAPI.download_repo: '
-                             'Extracted repository %s',
-                             repo_dir)
-                return repo_dir
+    def _evict_cached_tars(self) -> None:
+        """Removes the least recently used tarballs from cache_dir until at
+        most _MAX_CACHED_REPOS remain.
+
+        Other processes sharing cache_dir may remove the same tarballs
+        concurrently, so tarballs that disappear are skipped.
+        """
+        tars = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.tar.gz'):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                tars.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+        tars.sort(reverse=True)
+        for _, path in tars[_MAX_CACHED_REPOS:]:
+            logging.info('GitHubRepoAPI._evict_cached_tars: Removing %s', path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
 
     def _build_content_query(self, commit_sha: str, path: str) -> str:
         """Formats the URL for querying the contents of a directory at the
@@ -413,6 +526,86 @@ class GitHubRepoAPI:
         return f'{self.owner}/{self.repo}'
 
 
+class LocalRepoAPI:
+    """Stand-in for GitHubRepoAPI that copies the working tree of a local
+    checkout of the repository instead of downloading it, for
+    ImportExecutor.execute_imports_on_update.
+
+    Attributes:
+        repo_dir: Path to the root directory of the checkout as a string.
+    """
+
+    def __init__(self, repo_dir: str):
+        self.repo_dir = os.path.abspath(repo_dir)
+        logging.info('LocalRepoAPI.__init__: Initialized with directory %s',
+                     self.repo_dir)
+
+    def resolve_commit_sha(self, commit_sha: str = 'HEAD') -> None:
+        """Returns None since the working tree is not a commit."""
+        del commit_sha
+        return None
+
+    def download_repo(self,
+                      dest_dir: str,
+                      commit_sha: str = None,
+                      timeout: float = None,
+                      paths: Iterable[str] = None) -> str:
+        """Copies the working tree, without the .git directory and Python
+        bytecode, so that the downloads and outputs of imports do not
+        modify the checkout.
+
+        Args:
+            dest_dir: Directory to copy the repository into as a string.
+            commit_sha: Ignored.
+            timeout: Ignored.
+            paths: See GitHubRepoAPI.download_repo. Paths that do not exist
+                are skipped.
+
+        Returns:
+            Path to the copy of the repository of the form
+            <dest_dir>/<name of repo_dir>, as a string.
+        """
+        del commit_sha, timeout
+        dest = os.path.join(dest_dir, os.path.basename(self.repo_dir))
+        logging.info('LocalRepoAPI.download_repo: Copying %s to %s',
+                     self.repo_dir, dest)
+        ignore = shutil.ignore_patterns('.git', '__pycache__', '*.pyc')
+        if paths is None:
+            paths = ['']
+        for path in paths:
+            src = os.path.normpath(os.path.join(self.repo_dir, path))
+            if os.path.isdir(src):
+                _merge_tree(src, os.path.normpath(os.path.join(dest, path)),
+                            ignore)
+            elif os.path.isfile(src):
+                os.makedirs(os.path.dirname(os.path.join(dest, path)),
+                            exist_ok=True)
+                shutil.copy2(src, os.path.join(dest, path))
+        os.makedirs(dest, exist_ok=True)
+        return dest
+
+
+def _merge_tree(src: str, dest: str, ignore: Callable) -> None:
+    """Copies a directory tree into a directory that may already exist,
+    replacing existing files, like shutil.copytree with dirs_exist_ok on
+    Python 3.8 and later.
+
+    Args:
+        src: Path to the directory to copy as a string.
+        dest: Path to the directory to copy into as a string.
+        ignore: Function like the ignore argument of shutil.copytree.
+    """
+    for dir_path, dir_names, file_names in os.walk(src):
+        ignored = ignore(dir_path, dir_names + file_names)
+        dir_names[:] = [name for name in dir_names if name not in ignored]
+        dest_dir = os.path.join(dest, os.path.relpath(dir_path, src))
+        os.makedirs(dest_dir, exist_ok=True)
+        for name in file_names:
+            if name not in ignored:
+                shutil.copy2(os.path.join(dir_path, name),
+                             os.path.join(dest_dir, name))
+
+
 def _get_path_first_component(path: str) -> str:
     """Returns the first component of a path.
 
@@ -426,3 +619,89 @@ def _get_path_first_component(path: str) -> str:
     if index != -1:
         return path[:index]
     return path
+
+
+def _read_head_cache(path: str) -> Dict[str, str]:
+    """Reads the cached SHA and ETag of HEAD written by _write_head_cache.
+
+    Args:
+        path: Path to the cache file as a string.
+
+    Returns:
+        Dict with the 'sha' and 'etag' keys, or an empty dict if the file
+        does not exist or is corrupt.
+    """
+    try:
+        with open(path) as file:
+            cached = json.load(file)
+        if cached['sha'] and cached['etag']:
+            return cached
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError, KeyError):
+        logging.warning('github_api._read_head_cache: Ignoring corrupt %s',
+                        path,
+                        exc_info=True)
+    return {}
+
+
+def _write_head_cache(path: str, cached: Dict[str, str]) -> None:
+    """Atomically writes the SHA and ETag of HEAD to path, so that
+    concurrent readers never see a partially written file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump(cached, tmp)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _extract_repo(repo_tar: str,
+                  dest_dir: str,
+                  paths: Iterable[str] = None) -> str:
+    """Extracts a repository tarball downloaded from GitHub.
+
+    Args:
+        repo_tar: Path to the tarball as a string.
+        dest_dir: Directory to extract the repository into as a string.
+        paths: See GitHubRepoAPI.download_repo.
+
+    Returns:
+        Path to the directory containing the extracted repository as a string.
+
+    Raises:
+        FileNotFoundError: The tarball does not contain the repository.
+    """
+    with tarfile.open(repo_tar) as tar:
+        members = tar.getmembers()
+        if not members:
+            raise FileNotFoundError(
+                'Downloaded tar file does not contain the repository')
+        root = _get_path_first_component(members[0].name)
+        if paths is not None:
+            prefixes = [
+                os.path.normpath(os.path.join(root, path)) for path in paths
+            ]
+            members = [
+                member for member in members
+                if _is_path_under(member.name, prefixes)
+            ]
+        tar.extractall(dest_dir, members=members)
+    repo_dir = os.path.join(dest_dir, root)
+    os.makedirs(repo_dir, exist_ok=True)
+    logging.info('github_api._extract_repo: Extracted repository %s', repo_dir)
+    return repo_dir
+
+
+def _is_path_under(path: str, prefixes: Iterable[str]) -> bool:
+    """Checks if a path is one of the prefixes or is under one of them.
+
+    Example:
+        _is_path_under('data/util/foo.py', ['data/util']) returns True.
+        _is_path_under('data/utils.py', ['data/util']) returns False.
+    """
+    path = os.path.normpath(path)
+    return any(path == prefix or path.startswith(prefix + os.path.sep)
+               for prefix in prefixes)
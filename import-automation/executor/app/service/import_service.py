@@ -17,9 +17,11 @@ Data Commons importer client.
 
 import os
 import time
+import random
 import logging
+import threading
 import dataclasses
-from typing import Dict, Iterable
+from typing import Callable, Dict, Iterable, Tuple
 
 import requests
 from google.cloud import storage
@@ -99,9 +101,136 @@ class ImportFailedError(Exception):
         self.log = log
 
 
+class ImportLogWaiter:
+    """Waits for imports to finish by polling the import logs.
+
+    Waiters for imports with the same curator email share the polling:
+    a waiter reuses the logs fetched by another waiter if they are recent
+    enough, and waits for a fetch that is already in progress instead of
+    starting another one. Fetched logs are indexed by import ID.
+
+    Each waiter polls with exponential backoff and jitter. The interval
+    starts at min_interval, is reset to it whenever the state of the import
+    changes, and is multiplied by multiplier after each poll, up to
+    max_interval.
+    """
+
+    def __init__(self, get_logs: Callable[[str], Iterable[Dict]]):
+        """Constructs an ImportLogWaiter.
+
+        Args:
+            get_logs: Function that takes a curator email and returns the
+                log entries of the imports submitted with the email.
+        """
+        self._get_logs = get_logs
+        self._condition = threading.Condition()
+        # Maps each curator email to a tuple of the monotonic time at which
+        # the latest fetch started and the fetched logs indexed by import ID
+        self._logs: Dict[str, Tuple[float, Dict[str, Dict]]] = {}
+        # Curator emails for which a fetch is in progress
+        self._fetching = set()
+
+    def wait(self,
+             import_id: str,
+             import_name: str,
+             curator_email: str,
+             timeout: float = None,
+             min_interval: float = 5,
+             max_interval: float = 60,
+             multiplier: float = 2,
+             jitter: float = 0.5) -> Dict:
+        """Blocks the calling thread until the import fails or succeeds.
+
+        Args:
+            import_id: ID of the import request assigned by the importer.
+            import_name: Import name submitted to the importer.
+            curator_email: Email submitted to the importer.
+            timeout: Maximum time to block in seconds.
+            min_interval: Minimum time between polls in seconds.
+            max_interval: Maximum time between polls in seconds.
+            multiplier: Factor by which the interval grows after each poll.
+            jitter: Fraction of the interval to randomly shorten each
+                sleep by, between 0 and 1.
+
+        Returns:
+            Log entry for the import.
+
+        Raises:
+            Same exceptions as the get_logs function.
+            ImportNotFoundError: Import not found in the import logs.
+            ImportFailedError: Import fails on the importer's side.
+            TimeoutError: Timeout expired.
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        fetched_after = start
+        interval = min(min_interval, max_interval)
+        state = None
+        while True:
+            log = self._get_indexed_logs(curator_email,
+                                         fetched_after).get(import_id)
+            if log is None:
+                raise ImportNotFoundError(import_name, curator_email, import_id)
+            if _is_import_finished(log):
+                if log['state'] != 'SUCCESSFUL':
+                    raise ImportFailedError(log)
+                return log
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                raise TimeoutError('Timeout expired blocking on '
+                                   f'{import_name} ({curator_email})')
+            if log['state'] != state:
+                state = log['state']
+                interval = min(min_interval, max_interval)
+            sleep = interval * random.uniform(1 - jitter, 1)
+            if deadline is not None:
+                sleep = min(sleep, deadline - now)
+            time.sleep(sleep)
+            interval = min(interval * multiplier, max_interval)
+            # Logs fetched by other waiters during the second half of the
+            # sleep are recent enough.
+            fetched_after = time.monotonic() - sleep / 2
+
+    def _get_indexed_logs(self, curator_email: str,
+                          fetched_after: float) -> Dict[str, Dict]:
+        """Returns the logs of the curator email indexed by import ID,
+        fetching them unless the latest fetch started after fetched_after.
+
+        Args:
+            curator_email: Email submitted to the importer.
+            fetched_after: Monotonic time after which the fetch must have
+                started.
+
+        Raises:
+            Same exceptions as the get_logs function.
+        """
+        with self._condition:
+            while True:
+                fetched = self._logs.get(curator_email)
+                if fetched and fetched[0] >= fetched_after:
+                    return fetched[1]
+                if curator_email not in self._fetching:
+                    break
+                self._condition.wait()
+            self._fetching.add(curator_email)
+        try:
+            fetch_start = time.monotonic()
+            logs = {log['id']: log for log in self._get_logs(curator_email)}
+            with self._condition:
+                self._logs[curator_email] = (fetch_start, logs)
+            return logs
+        finally:
+            with self._condition:
+                self._fetching.discard(curator_email)
+                self._condition.notify_all()
+
+
 class ImportServiceClient:
     """Data Commons importer client."""
-    # Number of seconds between each get_import_log call for
+    # Minimum number of seconds between each get_import_log call for
+    # blocking on imports.
+    _MIN_SLEEP_DURATION: float = 5
+    # Maximum number of seconds between each get_import_log call for
     # blocking on imports.
     _SLEEP_DURATION: float = 60
     # Enum value for ImportLogEntry.BIGQUERY
@@ -138,6 +267,8 @@ class ImportServiceClient:
         self.importer_output_prefix = importer_output_prefix
         self.executor_output_prefix = executor_output_prefix
         self.iap = iap_request.IAPRequest(client_id)
+        self.log_waiter = ImportLogWaiter(
+            lambda curator_email: self.get_import_log(curator_email)['entry'])
 
     def smart_import(self,
                      import_dir: str,
@@ -417,25 +548,18 @@ class ImportServiceClient:
             Log entry for the import.
 
         Raises:
-            Same exceptions as ImportServiceClient.get_import_log.
-            ImportFailedError: Import fails on the importer's side.
-            TimeoutError: Timeout expired.
+            Same exceptions as ImportLogWaiter.wait.
         """
         logging.info(
             'ImportServiceClient._block_on_import: Blocking on %s',
             f'<{_format_import_info(import_name, curator_email, import_id)}>')
-        start = time.time()
-        while True:
-            log = _get_log(import_id, import_name, curator_email,
-                           self.get_import_log(curator_email)['entry'])
-            if _is_import_finished(log):
-                if log['state'] != 'SUCCESSFUL':
-                    raise ImportFailedError(log)
-                return log
-            if timeout is not None and time.time() - start > timeout:
-                raise TimeoutError('Timeout expired blocking on '
-                                   f'{import_name} ({curator_email})')
-            time.sleep(ImportServiceClient._SLEEP_DURATION)
+        return self.log_waiter.wait(
+            import_id,
+            import_name,
+            curator_email,
+            timeout,
+            min_interval=ImportServiceClient._MIN_SLEEP_DURATION,
+            max_interval=ImportServiceClient._SLEEP_DURATION)
 
 
 def _get_fixed_absolute_import_name(import_dir: str, import_name: str) -> str:
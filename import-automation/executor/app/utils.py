@@ -18,8 +18,10 @@ Utility functions.
 import time
 import os
 import re
+import json
 import datetime
-from typing import List
+import tempfile
+from typing import Dict, List
 
 import pytz
 import requests
@@ -110,6 +112,30 @@ def download_file(url: str, dest_dir: str, timeout: float = None) -> str:
         return path
 
 
+def write_json_atomically(path: str, content: Dict) -> None:
+    """Writes a dict as JSON to a file so that readers never see a partial
+    file.
+
+    The JSON is written to a temporary file in the same directory that then
+    replaces the file at path.
+
+    Args:
+        path: Path to the file as a string.
+        content: The dict to write.
+
+    Raises:
+        Same exceptions as open and json.dump.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(content, file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
 def parse_tag_list(message: str, tag: str, allowed_chars: str) -> List[str]:
     """Parses a comma separated list following a tag.
 
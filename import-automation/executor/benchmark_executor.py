@@ -0,0 +1,131 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Offline benchmark of the import executor. Run
+'python3 -m benchmark_executor --help' for usage.
+
+The benchmark runs the executor on a synthetic repository against local
+fakes of GitHub, Google Cloud Storage, the import progress dashboard, and
+the importer, so it needs no credentials or network access. See
+app/executor/benchmark.py for the workload.
+
+The result is printed and saved to --results_dir. If a baseline is given
+with --baseline, or --compare_latest is set and a previous result exists in
+--results_dir, the result is compared against it and the regressions beyond
+--tolerance and --min_delta are printed.
+
+--config takes a JSON object of ExecutorConfig fields to benchmark the
+executor with, e.g., '{"import_max_workers": 4, "venv_cache_dir": "/tmp/v"}'.
+"""
+
+import sys
+import json
+import tempfile
+
+from absl import app
+from absl import flags
+
+from app import configs
+from app.executor import benchmark
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer(name='num_manifests',
+                     default=4,
+                     help='Number of directories with a manifest.')
+flags.DEFINE_integer(name='imports_per_manifest',
+                     default=2,
+                     help='Number of imports specified by each manifest.')
+flags.DEFINE_integer(name='data_size',
+                     default=1024**2,
+                     help='Size in bytes of the source file of each import.')
+flags.DEFINE_integer(
+    name='rounds',
+    default=1,
+    help=('Number of times to execute all the imports. Later rounds run with '
+          'the caches filled by the earlier ones.'))
+flags.DEFINE_float(
+    name='import_latency',
+    default=0,
+    help='Time in seconds the fake importer takes for each request.')
+flags.DEFINE_string(name='config',
+                    default='{}',
+                    help='JSON object of ExecutorConfig fields.')
+flags.DEFINE_string(name='work_dir',
+                    default='',
+                    help=('Directory to generate the repository and write '
+                          'the outputs into. A temporary directory if empty.'))
+flags.DEFINE_string(name='results_dir',
+                    default='benchmark_results',
+                    help='Directory to save the result into.')
+flags.DEFINE_string(name='baseline',
+                    default='',
+                    help='Path to a saved result to compare against.')
+flags.DEFINE_bool(
+    name='compare_latest',
+    default=False,
+    help='Compare against the latest result saved in --results_dir.')
+flags.DEFINE_float(
+    name='min_delta',
+    default=0.05,
+    help=('Minimum increase in seconds of the latency of a stage reported as '
+          'a regression.'))
+flags.DEFINE_float(
+    name='tolerance',
+    default=0.1,
+    help=('Fraction by which a metric may get worse before it is reported '
+          'as a regression.'))
+
+
+def _run(work_dir: str) -> benchmark.BenchmarkResult:
+    params = benchmark.BenchmarkParams(
+        num_manifests=FLAGS.num_manifests,
+        imports_per_manifest=FLAGS.imports_per_manifest,
+        data_size=FLAGS.data_size,
+        rounds=FLAGS.rounds,
+        import_latency=FLAGS.import_latency)
+    config = configs.ExecutorConfig(**json.loads(FLAGS.config))
+    return benchmark.run_benchmark(work_dir, params, config)
+
+
+def main(_):
+    """Runs the benchmark."""
+    baseline = None
+    if FLAGS.baseline:
+        with open(FLAGS.baseline) as file:
+            baseline = benchmark.BenchmarkResult.from_json(file.read())
+    elif FLAGS.compare_latest:
+        baseline = benchmark.load_latest_result(FLAGS.results_dir)
+
+    if FLAGS.work_dir:
+        result = _run(FLAGS.work_dir)
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            result = _run(work_dir)
+    print(benchmark.format_result(result))
+    print(f'Saved to {benchmark.save_result(result, FLAGS.results_dir)}')
+
+    if baseline:
+        regressions = benchmark.compare_results(baseline, result,
+                                                FLAGS.tolerance,
+                                                FLAGS.min_delta)
+        print(f'Compared with the result started at {baseline.time_started}')
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions')
+
+
+if __name__ == '__main__':
+    app.run(main)
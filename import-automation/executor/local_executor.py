@@ -15,8 +15,16 @@
 Local import executor. Run '. run_local_executor.sh --help' for usage.
 
 The local executor downloads the main branch of a repository and produces
-the data files of an import specified by its absolute import name of the form
-<path to the directory containing the manifest>:<import name>.
+the data files of the imports specified by their absolute import names of the
+form <path to the directory containing the manifest>:<import name>. Imports
+that do not depend on each other run in parallel.
+
+With --repo_dir, the imports are run against the working tree of a local
+checkout of the repository instead. Virtual environments and downloaded files
+are cached in --cache_dir, and an import whose directory, scripts, and
+downloaded files are unchanged since it last succeeded is skipped, so
+re-running after editing one of several imports only runs that import. Pass
+--force to run all of them.
 
 username and access_token are used for authentication with GitHub to access
 private repositories and get higher rate limits. They need to be both absent or
@@ -29,6 +37,8 @@ owner_username and repo_name uniquely identify a repository. E.g., in
 and 'data' is the repo_name.
 """
 
+import os
+
 from absl import flags
 from absl import app
 
@@ -43,11 +53,11 @@ _IMPORT_NAME_FORM = '''
 '''.strip()
 
 FLAGS = flags.FLAGS
-flags.DEFINE_string(
+flags.DEFINE_multi_string(
     name='import_name',
     default=None,
-    help=('Absolute import name of the import to execute of the form '
-          f'{_IMPORT_NAME_FORM}.'),
+    help=('Absolute import name of an import to execute of the form '
+          f'{_IMPORT_NAME_FORM}. Can be repeated.'),
     short_name='i')
 flags.DEFINE_string(name='output_dir',
                     default='.',
@@ -72,24 +82,62 @@ flags.DEFINE_string(name='access_token',
                     help='GitHub access token for authentication.',
                     short_name='t')
 
+flags.DEFINE_string(
+    name='repo_dir',
+    default='',
+    help=('Path to a local checkout of the repository to run the imports '
+          'against instead of downloading the main branch.'),
+    short_name='d')
+flags.DEFINE_string(
+    name='cache_dir',
+    default=os.path.join('~', '.cache', 'import_executor'),
+    help=('Path to the directory to cache virtual environments and '
+          'downloaded files in. Nothing is cached if empty.'),
+    short_name='c')
+flags.DEFINE_integer(name='max_workers',
+                     default=4,
+                     help='Maximum number of imports to run in parallel.',
+                     short_name='w')
+flags.DEFINE_bool(name='force',
+                  default=False,
+                  help='Whether to also run imports that are unchanged.',
+                  short_name='f')
+
 flags.mark_flag_as_required('import_name')
-flags.register_validator('import_name',
-                         import_target.is_absolute_import_name,
-                         message=('--import_name must be of the form '
-                                  f'{_IMPORT_NAME_FORM}.'))
+flags.register_validator(
+    'import_name',
+    lambda names: all(map(import_target.is_absolute_import_name, names)),
+    message=('--import_name must be of the form '
+             f'{_IMPORT_NAME_FORM}.'))
 
 
 def main(_):
     """Runs the local executor."""
+    cache_dir = os.path.expanduser(FLAGS.cache_dir)
     config = configs.ExecutorConfig(
         github_repo_name=FLAGS.repo_name,
         github_repo_owner_username=FLAGS.owner_username,
         github_auth_username=FLAGS.username,
-        github_auth_access_token=FLAGS.access_token)
+        github_auth_access_token=FLAGS.access_token,
+        import_max_workers=FLAGS.max_workers,
+        skip_unchanged_imports=not FLAGS.force)
+    if cache_dir:
+        config.venv_cache_dir = os.path.join(cache_dir, 'venvs')
+        config.source_cache_dir = os.path.join(cache_dir, 'sources')
+    if FLAGS.repo_dir:
+        # Only the directories of the imports and their dependencies are
+        # copied from the working tree.
+        config.repo_sparse_extraction = True
+        config.skip_unchanged_without_downloads = True
+        github = github_api.LocalRepoAPI(FLAGS.repo_dir)
+    else:
+        github = github_api.GitHubRepoAPI(config.github_repo_owner_username,
+                                          config.github_repo_name,
+                                          config.github_auth_username,
+                                          config.github_auth_access_token)
     executor = import_executor.ImportExecutor(
         uploader=file_uploader.LocalFileUploader(output_dir=FLAGS.output_dir),
-        github=github_api.GitHubRepoAPI(config.github_repo_owner_username,
-                                        config.github_repo_name),
+        github=github,
         config=config)
     results = executor.execute_imports_on_update(FLAGS.import_name)
     print(results)
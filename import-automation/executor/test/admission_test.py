@@ -0,0 +1,198 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for admission.py.
+"""
+
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from app.executor import admission
+from app.executor import resource_usage
+from app.executor import subprocess_runner
+from app.executor import zygote
+
+_MIB = 1024**2
+
+
+class EstimateTest(unittest.TestCase):
+
+    def test_estimate_request(self):
+        default = admission.ResourceRequest(cpus=1, memory=1024 * _MIB)
+        self.assertEqual(default, admission.estimate_request({}, None, default))
+        spec = {'resources': {'memory_mb': 4096}}
+        self.assertEqual(admission.ResourceRequest(cpus=1, memory=4096 * _MIB),
+                         admission.estimate_request(spec, None, default))
+        history = admission.ResourceRequest(cpus=0.5, memory=100 * _MIB)
+        self.assertEqual(history,
+                         admission.estimate_request(spec, history, default))
+
+    def test_observed_usage(self):
+        usage = resource_usage.StageUsage(stage='scripts',
+                                          wall_time=10,
+                                          child_cpu_time=20,
+                                          child_peak_rss=100)
+        self.assertEqual(admission.ResourceRequest(cpus=2, memory=100),
+                         admission.get_observed_usage(usage))
+        usage.child_peak_rss = 0
+        self.assertIsNone(admission.get_observed_usage(usage))
+
+    def test_limits(self):
+        request = admission.ResourceRequest(cpus=1, memory=1024 * _MIB)
+        limits = admission.get_limits(request, {
+            'cpus': 2,
+            'memory_mb': 512
+        }, 1.5)
+        self.assertEqual(1536 * _MIB, limits.memory)
+        self.assertEqual(3, limits.cpus)
+        self.assertIsNone(admission.get_limits(request, {}, 0))
+        # Never below the declared resources
+        limits = admission.get_limits(request, {
+            'cpus': 2,
+            'memory_mb': 2048
+        }, 0.5)
+        self.assertEqual(2048 * _MIB, limits.memory)
+        self.assertEqual(2, limits.cpus)
+
+
+class UsageHistoryTest(unittest.TestCase):
+
+    def test_record_and_estimate(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            history = admission.UsageHistory(tmpdir, max_samples=2)
+            self.assertIsNone(history.estimate('foo:a', 0.5))
+            for memory in (300, 100, 200):
+                history.record(
+                    'foo:a',
+                    admission.ResourceRequest(cpus=memory / 100,
+                                              memory=memory * _MIB))
+            # Reloaded from the directory, without the oldest run
+            history = admission.UsageHistory(tmpdir, max_samples=2)
+            self.assertEqual([100 * _MIB, 200 * _MIB],
+                             [sample.memory for sample in history.get('foo:a')])
+            self.assertEqual(
+                admission.ResourceRequest(cpus=3, memory=300 * _MIB),
+                history.estimate('foo:a', 0.5))
+            self.assertEqual([], history.get('foo:b'))
+
+
+class AdmissionControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = admission.AdmissionController(
+            admission.ResourceRequest(cpus=2, memory=1000))
+
+    def _acquire_in_thread(self, name, cpus, memory, admitted):
+
+        def acquire():
+            admitted.append((name,
+                             self.controller.acquire(
+                                 name,
+                                 admission.ResourceRequest(cpus=cpus,
+                                                           memory=memory))))
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        return thread
+
+    def _wait_until_waiting(self, count):
+        while True:
+            with self.controller._condition:
+                if len(self.controller._waiting) == count:
+                    return
+
+    def test_queued_until_released(self):
+        first = self.controller.acquire(
+            'a', admission.ResourceRequest(cpus=1.5, memory=100))
+        admitted = []
+        thread = self._acquire_in_thread('b', 1, 100, admitted)
+        self._wait_until_waiting(1)
+        self.assertEqual([], admitted)
+        self.controller.release(first)
+        thread.join()
+        self.assertEqual('b', admitted[0][0])
+        self.assertEqual(admission.ResourceRequest(cpus=1, memory=100),
+                         self.controller.in_use)
+
+    def test_first_in_first_out(self):
+        first = self.controller.acquire(
+            'a', admission.ResourceRequest(cpus=1, memory=600))
+        admitted = []
+        threads = [self._acquire_in_thread('big', 1, 600, admitted)]
+        self._wait_until_waiting(1)
+        # Fits, but waits behind the big request
+        threads.append(self._acquire_in_thread('small', 0.5, 100, admitted))
+        self._wait_until_waiting(2)
+        self.assertEqual([], admitted)
+        self.controller.release(first)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['big', 'small'], [name for name, _ in admitted])
+
+    def test_request_larger_than_budget(self):
+        granted = self.controller.acquire(
+            'a', admission.ResourceRequest(cpus=8, memory=5000))
+        self.assertEqual(self.controller.budget, granted)
+        self.controller.release(granted)
+        self.assertEqual(admission.ResourceRequest(cpus=0, memory=0),
+                         self.controller.in_use)
+
+
+class ProcessLimitsTest(unittest.TestCase):
+
+    def _allocate(self, size, spawner=None):
+        # Allocates right away, so the limit must be set before the start
+        with tempfile.NamedTemporaryFile('w', suffix='.py') as script:
+            script.write(f'b = bytearray({size})')
+            script.flush()
+            limits = admission.ProcessLimits(memory=300 * _MIB)
+            return subprocess_runner.run([sys.executable, script.name],
+                                         timeout=60,
+                                         limits=limits,
+                                         spawner=spawner)
+
+    def test_memory_limit(self):
+        self.assertEqual(0, self._allocate(10 * _MIB).returncode)
+        process = self._allocate(600 * _MIB)
+        self.assertNotEqual(0, process.returncode)
+        self.assertIn('MemoryError', process.stderr)
+
+    def test_memory_limit_set_before_start(self):
+        limits = admission.ProcessLimits(memory=300 * _MIB)
+        spawner = mock.MagicMock()
+        spawner.spawn.side_effect = OSError
+        with mock.patch('resource.prlimit') as prlimit:
+            with self.assertRaises(OSError):
+                subprocess_runner.run(['script.py'],
+                                      timeout=60,
+                                      limits=limits,
+                                      spawner=spawner)
+            self.assertIsNone(limits.apply(123))
+        spawner.spawn.assert_called_once_with(['script.py'], None,
+                                              {'RLIMIT_DATA': 300 * _MIB})
+        prlimit.assert_not_called()
+
+    def test_memory_limit_forked(self):
+        forker = zygote.Zygote(sys.executable, [], idle_timeout=60)
+        forker.start(timeout=60)
+        try:
+            self.assertEqual(0, self._allocate(10 * _MIB, forker).returncode)
+            process = self._allocate(600 * _MIB, forker)
+            self.assertNotEqual(0, process.returncode)
+            self.assertIn('MemoryError', process.stderr)
+        finally:
+            forker.stop()
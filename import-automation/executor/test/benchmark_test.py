@@ -0,0 +1,117 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for benchmark.py.
+"""
+
+import os
+import tempfile
+import unittest
+
+from app import configs
+from app.executor import benchmark
+
+
+def _result(imports_per_hour, scripts_p50, time_started='t0'):
+    stats = {
+        'count': 1,
+        'mean': scripts_p50,
+        'p50': scripts_p50,
+        'p95': scripts_p50,
+        'max': scripts_p50
+    }
+    return benchmark.BenchmarkResult(params={},
+                                     config={},
+                                     environment={},
+                                     time_started=time_started,
+                                     elapsed=1,
+                                     num_imports=1,
+                                     num_succeeded=1,
+                                     imports_per_hour=imports_per_hour,
+                                     import_latency=stats,
+                                     stages={'scripts': stats})
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_run_benchmark(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            params = benchmark.BenchmarkParams(num_manifests=2,
+                                               imports_per_manifest=2,
+                                               data_size=10000,
+                                               rounds=2)
+            config = configs.ExecutorConfig(import_max_workers=2,
+                                            venv_cache_dir=os.path.join(
+                                                tmpdir, 'venvs'))
+            result = benchmark.run_benchmark(os.path.join(tmpdir, 'work'),
+                                             params, config)
+            self.assertEqual(8, result.num_imports)
+            self.assertEqual(8, result.num_succeeded)
+            self.assertGreater(result.imports_per_hour, 0)
+            self.assertEqual(
+                {
+                    'repo_download', 'download', 'venv', 'admission', 'scripts',
+                    'upload', 'delete_previous_import', 'import'
+                }, set(result.stages))
+            self.assertEqual(8, result.stages['scripts']['count'])
+            self.assertEqual(8, result.import_latency['count'])
+            self.assertEqual(2, result.config['import_max_workers'])
+
+            with open(
+                    os.path.join(tmpdir, 'work', 'output', 'benchmark', 'dir1',
+                                 'import1', 'latest_version.txt')) as file:
+                version = file.read()
+            with open(
+                    os.path.join(tmpdir, 'work', 'output', 'benchmark', 'dir1',
+                                 'import1', version, 'import1.csv')) as file:
+                self.assertEqual('place,date,value,doubled\n', file.readline())
+
+            results_dir = os.path.join(tmpdir, 'results')
+            benchmark.save_result(result, results_dir)
+            self.assertEqual(result, benchmark.load_latest_result(results_dir))
+
+    def test_compare_results(self):
+        baseline = _result(imports_per_hour=100, scripts_p50=1)
+        self.assertEqual([],
+                         benchmark.compare_results(
+                             baseline,
+                             _result(imports_per_hour=95, scripts_p50=1.05)))
+        self.assertEqual(['imports_per_hour: 100.0 -> 50.0'],
+                         benchmark.compare_results(
+                             baseline,
+                             _result(imports_per_hour=50, scripts_p50=1)))
+        self.assertEqual(
+            ['scripts p50: 1.000s -> 2.000s', 'scripts p95: 1.000s -> 2.000s'],
+            benchmark.compare_results(
+                baseline, _result(imports_per_hour=100, scripts_p50=2)))
+
+    def test_compare_results_ignores_small_delta(self):
+        baseline = _result(imports_per_hour=100, scripts_p50=0.001)
+        self.assertEqual([],
+                         benchmark.compare_results(
+                             baseline,
+                             _result(imports_per_hour=100, scripts_p50=0.01)))
+
+    def test_load_latest_result(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertIsNone(benchmark.load_latest_result(tmpdir))
+            benchmark.save_result(
+                _result(100, 1, time_started='2020-01-01T00:00:00+00:00'),
+                tmpdir)
+            benchmark.save_result(
+                _result(200, 1, time_started='2020-01-02T00:00:00+00:00'),
+                tmpdir)
+            self.assertEqual(
+                200,
+                benchmark.load_latest_result(tmpdir).imports_per_hour)
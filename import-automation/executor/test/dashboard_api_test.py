@@ -108,3 +108,98 @@ class DashboardAPITest(unittest.TestCase):
                  (self.dashboard.info, 'info'), (self.dashboard.debug, 'debug')]
         for func, level in funcs:
             self.assertEqual(level, func(**args)['level'])
+
+
+@mock.patch('app.utils.utctime', lambda: '2020-07-15T12:07:17.365264+00:00')
+class LogShipperTest(unittest.TestCase):
+
+    @mock.patch('app.service.iap_request.IAPRequest.post')
+    def test_batch(self, post):
+        """Tests that queued logs are posted together on flush."""
+        post.return_value = utils.ResponseMock(200)
+        dashboard = dashboard_api.DashboardAPI('client-id',
+                                               log_batch_size=10,
+                                               log_flush_interval=100)
+        for i in range(3):
+            log = dashboard.info(str(i), run_id='run')
+            self.assertNotIn('log_id', log)
+        dashboard.flush()
+        logs = [{
+            'message': str(i),
+            'level': 'info',
+            'run_id': 'run',
+            'time_logged': '2020-07-15T12:07:17.365264+00:00'
+        } for i in range(3)]
+        post.assert_called_once_with(
+            'https://datcom-data.uc.r.appspot.com/logs/batch',
+            json={'logs': logs})
+        dashboard.close()
+
+    @mock.patch('app.service.iap_request.IAPRequest.post')
+    def test_max_batch_size(self, post):
+        """Tests that a batch is posted once it is full."""
+        post.return_value = utils.ResponseMock(200)
+        dashboard = dashboard_api.DashboardAPI('client-id',
+                                               log_batch_size=2,
+                                               log_flush_interval=100)
+        for i in range(5):
+            dashboard.info(str(i), run_id='run')
+        dashboard.close()
+        batches = [[log['message']
+                    for log in call[1]['json']['logs']]
+                   for call in post.call_args_list]
+        self.assertEqual([['0', '1'], ['2', '3'], ['4']], batches)
+
+    @mock.patch('time.sleep', lambda _: None)
+    @mock.patch('app.service.iap_request.IAPRequest.post')
+    def test_retry(self, post):
+        """Tests that a failed batch is retried."""
+        post.side_effect = [utils.ResponseMock(500), utils.ResponseMock(200)]
+        dashboard = dashboard_api.DashboardAPI('client-id', log_batch_size=10)
+        dashboard.info('message', run_id='run')
+        dashboard.close()
+        self.assertEqual(2, post.call_count)
+
+    @mock.patch('app.service.iap_request.IAPRequest.post')
+    def test_log_without_run_id(self, post):
+        """Tests that a log without a run_id does not get the other logs of
+        its batch rejected."""
+        post.return_value = utils.ResponseMock(200)
+        dashboard = dashboard_api.DashboardAPI('client-id', log_batch_size=10)
+        dashboard.info('0', run_id='run')
+        dashboard.critical('1', attempt_id='attempt')
+        dashboard.info('2', run_id='run', attempt_id='attempt')
+        dashboard.close()
+        post.assert_called_once()
+        self.assertEqual(
+            ['0', '2'],
+            [log['message'] for log in post.call_args[1]['json']['logs']])
+
+    @mock.patch('time.sleep', lambda _: None)
+    @mock.patch('app.service.iap_request.IAPRequest.post')
+    def test_rejected_batch_posted_one_by_one(self, post):
+        """Tests that the logs of a batch rejected by the dashboard are
+        posted one by one."""
+
+        def respond(url, json):
+            if url.endswith('/batch'):
+                return utils.ResponseMock(400)
+            return utils.ResponseMock(404 if json['message'] == '1' else 200)
+
+        post.side_effect = respond
+        dashboard = dashboard_api.DashboardAPI('client-id', log_batch_size=10)
+        for i in range(3):
+            dashboard.info(str(i), run_id='run')
+        dashboard.close()
+        urls = [call[0][0] for call in post.call_args_list]
+        self.assertEqual(['https://datcom-data.uc.r.appspot.com/logs/batch'] +
+                         ['https://datcom-data.uc.r.appspot.com/logs'] * 3,
+                         urls)
+        self.assertEqual(
+            ['0', '1', '2'],
+            [call[1]['json']['message'] for call in post.call_args_list[1:]])
+
+    def test_put_after_close(self):
+        shipper = dashboard_api.LogShipper(iap=None)
+        shipper.close()
+        self.assertRaises(ValueError, shipper.put, {})
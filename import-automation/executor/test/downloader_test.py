@@ -0,0 +1,242 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for downloader.py.
+"""
+
+import os
+import re
+import hashlib
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+from app.executor import downloader
+from app.executor import source_cache
+
+
+class _FakeResponse:
+    """Fake streaming requests.Response that can fail after sending
+    fail_after bytes."""
+
+    def __init__(self, url, status_code, body, headers, fail_after=None):
+        self.url = url
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers
+        self.fail_after = fail_after
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(response=self)
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            if self.fail_after is not None and start >= self.fail_after:
+                raise requests.ConnectionError('Connection reset')
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _FakeSession:
+    """Fake requests.Session serving files from a dict, optionally
+    supporting range requests.
+
+    Attributes:
+        files: Dict from URL to the content of the file as bytes.
+        ranges: Whether to support range requests, as a boolean.
+        failures: Dict from URL to the number of bytes after which the next
+            response for the URL fails.
+        requests: List of tuples of the URL and the Range header, if any,
+            of each request.
+    """
+
+    def __init__(self, files, ranges=True):
+        self.files = files
+        self.ranges = ranges
+        self.failures = {}
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, **kwargs):
+        del kwargs
+        headers = headers or {}
+        with self._lock:
+            self.requests.append((url, headers.get('Range')))
+            fail_after = self.failures.pop(url, None)
+        if url not in self.files:
+            return _FakeResponse(url, 404, b'', {})
+        body = self.files[url]
+        response_headers = {'ETag': hashlib.sha1(body).hexdigest()}
+        if headers.get('If-None-Match') == response_headers['ETag']:
+            return _FakeResponse(url, 304, b'', response_headers)
+        status_code = 200
+        if self.ranges:
+            response_headers['Accept-Ranges'] = 'bytes'
+            match = re.fullmatch(r'bytes=(\d+)-(\d+)', headers.get('Range', ''))
+            if match:
+                body = body[int(match.group(1)):int(match.group(2)) + 1]
+                status_code = 206
+        response_headers['Content-Length'] = str(len(body))
+        return _FakeResponse(url, status_code, body, response_headers,
+                             fail_after)
+
+
+@mock.patch('time.sleep', lambda _: None)
+class DownloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.small = b'small file'
+        self.large = bytes(range(256)) * 40
+        self.session = _FakeSession({
+            'https://host/small.csv': self.small,
+            'https://host/large.zip': self.large
+        })
+        self.downloader = downloader.Downloader(segment_size=1000,
+                                                max_segments=4,
+                                                buffer_size=100,
+                                                session=self.session)
+
+    def _read(self, path):
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def test_download_all(self):
+        specs = downloader.parse_download_specs([
+            'https://host/small.csv', {
+                'url': 'https://host/large.zip',
+                'sha256': hashlib.sha256(self.large).hexdigest(),
+                'size': len(self.large)
+            }
+        ])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = self.downloader.download_all(specs, tmpdir)
+            self.assertEqual([
+                os.path.join(tmpdir, 'small.csv'),
+                os.path.join(tmpdir, 'large.zip')
+            ], paths)
+            self.assertEqual(self.small, self._read(paths[0]))
+            self.assertEqual(self.large, self._read(paths[1]))
+            self.assertEqual(['large.zip', 'small.csv'],
+                             sorted(os.listdir(tmpdir)))
+        ranges = sorted(byte_range for url, byte_range in self.session.requests
+                        if url == 'https://host/large.zip' and byte_range)
+        self.assertEqual([
+            'bytes=0-2559', 'bytes=2560-5119', 'bytes=5120-7679',
+            'bytes=7680-10239'
+        ], ranges)
+
+    def test_segment_retried_from_where_it_stopped(self):
+        self.downloader.segment_size = 100000
+        self.session.failures['https://host/large.zip'] = 3000
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = self.downloader.download(
+                downloader.DownloadSpec('https://host/large.zip'), tmpdir)
+            self.assertEqual(self.large, self._read(path))
+        self.assertEqual([('https://host/large.zip', None),
+                          ('https://host/large.zip', 'bytes=3000-10239')],
+                         self.session.requests)
+
+    def test_restart_without_range_support(self):
+        self.session.ranges = False
+        self.session.failures['https://host/large.zip'] = 3000
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = self.downloader.download(
+                downloader.DownloadSpec('https://host/large.zip'), tmpdir)
+            self.assertEqual(self.large, self._read(path))
+        self.assertEqual([('https://host/large.zip', None),
+                          ('https://host/large.zip', None)],
+                         self.session.requests)
+
+    def test_resume_partial_file(self):
+        self.downloader.segment_size = 100000
+        self.downloader.max_retries = 0
+        self.session.failures['https://host/large.zip'] = 3000
+        spec = downloader.DownloadSpec('https://host/large.zip')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with mock.patch('app.executor.downloader._STATE_SAVE_INTERVAL', 0):
+                self.assertRaises(requests.ConnectionError,
+                                  self.downloader.download, spec, tmpdir)
+            self.session.requests.clear()
+            path = self.downloader.download(spec, tmpdir)
+            self.assertEqual(self.large, self._read(path))
+            self.assertEqual(['large.zip'], os.listdir(tmpdir))
+        self.assertEqual([('https://host/large.zip', None),
+                          ('https://host/large.zip', 'bytes=3000-10239')],
+                         self.session.requests)
+
+    def test_checksum_mismatch(self):
+        spec = downloader.DownloadSpec('https://host/small.csv',
+                                       sha256='0' * 64)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertRaises(ValueError, self.downloader.download, spec,
+                              tmpdir)
+            self.assertEqual([], os.listdir(tmpdir))
+
+    def test_size_mismatch(self):
+        spec = downloader.DownloadSpec('https://host/small.csv', size=1)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertRaises(ValueError, self.downloader.download, spec,
+                              tmpdir)
+
+    def test_http_error(self):
+        spec = downloader.DownloadSpec('https://host/missing.csv')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertRaises(requests.HTTPError, self.downloader.download,
+                              spec, tmpdir)
+
+    def test_timeout(self):
+        spec = downloader.DownloadSpec('https://host/large.zip')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertRaises(requests.Timeout, self.downloader.download, spec,
+                              tmpdir, -1)
+
+    def test_parse_download_specs_invalid(self):
+        self.assertRaises(ValueError, downloader.parse_download_specs, [{
+            'url': 'https://host/a.csv',
+            'md5': 'abc'
+        }])
+
+    def test_source_cache(self):
+        spec = downloader.DownloadSpec('https://host/small.csv')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.downloader.source_cache = source_cache.SourceCache(
+                os.path.join(tmpdir, 'cache'))
+            first_dir = os.path.join(tmpdir, 'first')
+            second_dir = os.path.join(tmpdir, 'second')
+            os.makedirs(first_dir)
+            os.makedirs(second_dir)
+            self.downloader.download(spec, first_dir)
+            path = self.downloader.download(spec, second_dir)
+            self.assertEqual(os.path.join(second_dir, 'small.csv'), path)
+            self.assertEqual(self.small, self._read(path))
+            self.assertEqual(
+                hashlib.sha256(self.small).hexdigest(),
+                self.downloader.source_cache.get(spec.url).sha256)
+
+            self.session.files[spec.url] = b'changed'
+            path = self.downloader.download(spec, second_dir)
+            self.assertEqual(b'changed', self._read(path))
+        self.assertEqual(3, len(self.session.requests))
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import errno
 import os
 import tempfile
 import unittest
@@ -37,6 +38,36 @@ class GCSFileUploaderTest(unittest.TestCase):
             [mock.call(dest),
              mock.call().upload_from_filename(src)])
 
+    def test_upload_file_chunked(self):
+        self.io.chunk_size = 256 * 1024
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            small = os.path.join(tmp_dir, 'small.csv')
+            large = os.path.join(tmp_dir, 'large.csv')
+            with open(small, 'wb') as file:
+                file.write(b'a' * 1024)
+            with open(large, 'wb') as file:
+                file.write(b'a' * self.io.chunk_size)
+            blobs = {
+                'small.csv': mock.MagicMock(),
+                'large.csv': mock.MagicMock()
+            }
+            self.io.bucket.blob.side_effect = lambda dest: blobs[dest]
+            results = self.io.upload_files([(small, 'small.csv'),
+                                            (large, 'large.csv')],
+                                           max_workers=2)
+        self.assertEqual(
+            [(small, 'small.csv', 1024),
+             (large, 'large.csv', self.io.chunk_size)],
+            [(result.src, result.dest, result.size) for result in results])
+        self.assertIsInstance(blobs['small.csv'].chunk_size, mock.MagicMock)
+        self.assertEqual(self.io.chunk_size, blobs['large.csv'].chunk_size)
+        blobs['large.csv'].upload_from_filename.assert_called_once_with(large)
+
+    def test_copy(self):
+        self.io.copy('a/file.csv', 'b/file.csv')
+        self.io.bucket.copy_blob.assert_called_once_with(
+            self.io.bucket.blob('a/file.csv'), self.io.bucket, 'b/file.csv')
+
     def test_upload_string(self):
         version = '2020-1-20 123:20'
         dest = 'foo/bar/latest_version.txt'
@@ -68,6 +99,57 @@ class LocalFileUploaderTest(unittest.TestCase):
                                     os.path.join(tmp_dir, 'foo/bar/data.csv'),
                                     integration_test.NUM_LINES_TO_CHECK))
 
+    def test_upload_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_dir = os.path.join(tmp_dir, 'output')
+            srcs = []
+            for name in ('a.csv', 'b.csv'):
+                srcs.append(os.path.join(tmp_dir, name))
+                with open(srcs[-1], 'w') as file:
+                    file.write(name)
+            uploader = file_uploader.LocalFileUploader(output_dir)
+            results = uploader.upload_files([(srcs[0], 'foo/a.csv'),
+                                             (srcs[1], 'foo/b.csv')],
+                                            max_workers=2)
+            self.assertEqual([5, 5], [result.size for result in results])
+            for name in ('a.csv', 'b.csv'):
+                with open(os.path.join(output_dir, 'foo', name)) as file:
+                    self.assertEqual(name, file.read())
+
+            # An existing file is replaced without modifying its source
+            with open(srcs[1], 'w') as file:
+                file.write('new')
+            uploader.upload_files([(srcs[1], 'foo/a.csv')])
+            with open(os.path.join(output_dir, 'foo/a.csv')) as file:
+                self.assertEqual('new', file.read())
+            with open(srcs[0]) as file:
+                self.assertEqual('a.csv', file.read())
+
+    def test_upload_files_without_hard_links(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src = os.path.join(tmp_dir, 'a.csv')
+            with open(src, 'w') as file:
+                file.write('a')
+            uploader = file_uploader.LocalFileUploader(tmp_dir,
+                                                       allow_hard_links=False)
+            uploader.upload_files([(src, 'foo/a.csv')])
+            self.assertFalse(
+                os.path.samefile(src, os.path.join(tmp_dir, 'foo/a.csv')))
+
+    def test_upload_file_clone_fails(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src = os.path.join(tmp_dir, 'a.csv')
+            with open(src, 'w') as file:
+                file.write('a')
+            uploader = file_uploader.LocalFileUploader(tmp_dir)
+            with mock.patch('fcntl.ioctl',
+                            side_effect=OSError(errno.EIO, 'I/O error')):
+                self.assertRaises(OSError, uploader.upload_file, src,
+                                  'foo/a.csv')
+            # No empty file is left behind to be reported as uploaded
+            self.assertFalse(uploader.exists('foo/a.csv'))
+            self.assertEqual([], os.listdir(os.path.join(tmp_dir, 'foo')))
+
     def test_upload_string(self):
         with tempfile.TemporaryDirectory() as tmp_dir:
             uploader = file_uploader.LocalFileUploader(tmp_dir)
@@ -354,6 +354,112 @@ class GitHubAPITest(unittest.TestCase):
                                   self.github.download_repo, dir_path,
                                   'commit-sha')
 
+    @mock.patch('requests.get')
+    def test_download_repo_sparse(self, get):
+        tar_path = 'test/data/treasury_constant_maturity_rates.tar.gz'
+        with open(tar_path, 'rb') as tar:
+            headers = {'Content-Disposition': 'attachment; filename=abc'}
+            get.return_value = utils.ResponseMock(200, raw=tar, headers=headers)
+
+            with tempfile.TemporaryDirectory() as dir_path:
+                downloaded = self.github.download_repo(
+                    dir_path,
+                    'commit-sha',
+                    paths=['treasury_constant_maturity_rates.csv'])
+                self.assertEqual(['treasury_constant_maturity_rates.csv'],
+                                 os.listdir(downloaded))
+
+    @mock.patch('requests.get')
+    def test_download_repo_cached(self, get):
+        tar_path = 'test/data/treasury_constant_maturity_rates.tar.gz'
+        with open(tar_path, 'rb') as tar:
+            headers = {'Content-Disposition': 'attachment; filename=abc'}
+            get.return_value = utils.ResponseMock(200, raw=tar, headers=headers)
+
+            with tempfile.TemporaryDirectory() as cache_dir:
+                github = github_api.GitHubRepoAPI('ownerA',
+                                                  'repoB',
+                                                  cache_dir=cache_dir)
+                for _ in range(2):
+                    with tempfile.TemporaryDirectory() as dir_path:
+                        downloaded = github.download_repo(
+                            dir_path, 'commit-sha')
+                        self.assertEqual(
+                            f'{dir_path}/treasury_constant_maturity_rates',
+                            downloaded)
+                        self.assertIn('treasury_constant_maturity_rates.csv',
+                                      os.listdir(downloaded))
+                get.assert_called_once()
+                self.assertEqual(['ownerA-repoB-commit-sha.tar.gz'],
+                                 os.listdir(cache_dir))
+
+    @mock.patch('requests.get')
+    def test_resolve_commit_sha_head_cached(self, get):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            github = github_api.GitHubRepoAPI('ownerA',
+                                              'repoB',
+                                              cache_dir=cache_dir)
+            response = utils.ResponseMock(200, headers={'ETag': '"etag"'})
+            response.text = 'sha1\n'
+            get.return_value = response
+            self.assertEqual('sha1', github.resolve_commit_sha())
+
+            get.return_value = utils.ResponseMock(304)
+            self.assertEqual('sha1', github.resolve_commit_sha())
+            get.assert_called_with(
+                'https://api.github.com/repos/ownerA/repoB/commits/HEAD',
+                auth=('', ''),
+                headers={
+                    'Accept': 'application/vnd.github.v3.sha',
+                    'If-None-Match': '"etag"'
+                })
+
+    @mock.patch('requests.get')
+    def test_resolve_commit_sha_head_cache_corrupt(self, get):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            github = github_api.GitHubRepoAPI('ownerA',
+                                              'repoB',
+                                              cache_dir=cache_dir)
+            head_cache_path = os.path.join(cache_dir, 'HEAD.json')
+            response = utils.ResponseMock(200, headers={'ETag': '"etag"'})
+            response.text = 'sha1\n'
+            get.return_value = response
+            for corrupt in ('{"sha": "sha0", "et', '{"sha": "sha0"}'):
+                with open(head_cache_path, 'w') as file:
+                    file.write(corrupt)
+                self.assertEqual('sha1', github.resolve_commit_sha())
+                self.assertNotIn('If-None-Match', get.call_args[1]['headers'])
+            self.assertEqual(['HEAD.json'], os.listdir(cache_dir))
+            self.assertEqual({
+                'sha': 'sha1',
+                'etag': '"etag"'
+            }, github_api._read_head_cache(head_cache_path))
+
+    def test_evict_cached_tars_removed_concurrently(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            github = github_api.GitHubRepoAPI('ownerA',
+                                              'repoB',
+                                              cache_dir=cache_dir)
+            for i in range(github_api._MAX_CACHED_REPOS + 2):
+                path = os.path.join(cache_dir, f'{i}.tar.gz')
+                with open(path, 'w'):
+                    pass
+                os.utime(path, (i, i))
+            vanished = os.path.join(cache_dir, '1.tar.gz')
+            getmtime, os_remove = os.path.getmtime, os.remove
+
+            def remove_and_getmtime(path):
+                if path == vanished:
+                    os_remove(path)
+                return getmtime(path)
+
+            with mock.patch('os.path.getmtime',
+                            side_effect=remove_and_getmtime), \
+                    mock.patch('os.remove',
+                               side_effect=FileNotFoundError) as remove:
+                github._evict_cached_tars()
+            remove.assert_called_once_with(os.path.join(cache_dir, '0.tar.gz'))
+
     def test_get_path_first_component(self):
         self.assertEqual(
             'data',
@@ -362,3 +468,60 @@ class GitHubAPITest(unittest.TestCase):
             '', github_api._get_path_first_component('/data/foo/bar/README.md'))
         self.assertEqual('data', github_api._get_path_first_component('data'))
         self.assertEqual('', github_api._get_path_first_component(''))
+
+
+class LocalRepoAPITest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.repo_dir = os.path.join(self.tmpdir.name, 'data')
+        for path in ('.git/HEAD', 'requirements.txt', 'foo/manifest.json',
+                     'foo/__pycache__/a.pyc', 'util/a.py', 'bar/b.py'):
+            path = os.path.join(self.repo_dir, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as file:
+                file.write(path)
+        self.github = github_api.LocalRepoAPI(self.repo_dir)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _list(self, path):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), path)
+            for root, _, files in os.walk(path)
+            for name in files)
+
+    def test_download_repo(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            downloaded = self.github.download_repo(dir_path)
+            self.assertEqual(os.path.join(dir_path, 'data'), downloaded)
+            self.assertEqual([
+                'bar/b.py', 'foo/manifest.json', 'requirements.txt', 'util/a.py'
+            ], self._list(downloaded))
+
+    def test_download_repo_sparse(self):
+        self.assertIsNone(self.github.resolve_commit_sha())
+        with tempfile.TemporaryDirectory() as dir_path:
+            downloaded = self.github.download_repo(
+                dir_path, paths=['foo', 'requirements.txt', 'not_exist'])
+            self.assertEqual(['foo/manifest.json', 'requirements.txt'],
+                             self._list(downloaded))
+            # Dependencies are copied into the same directory
+            self.github.download_repo(dir_path, paths=['util'])
+            self.assertEqual(
+                ['foo/manifest.json', 'requirements.txt', 'util/a.py'],
+                self._list(downloaded))
+
+    def test_download_repo_into_existing_copy(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            downloaded = self.github.download_repo(dir_path, paths=['foo'])
+            with open(os.path.join(self.repo_dir, 'foo/manifest.json'),
+                      'w') as file:
+                file.write('changed')
+            self.github.download_repo(dir_path)
+            self.assertEqual([
+                'bar/b.py', 'foo/manifest.json', 'requirements.txt', 'util/a.py'
+            ], self._list(downloaded))
+            with open(os.path.join(downloaded, 'foo/manifest.json')) as file:
+                self.assertEqual('changed', file.read())
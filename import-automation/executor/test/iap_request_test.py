@@ -0,0 +1,88 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for iap_request.py.
+"""
+
+import unittest
+from unittest import mock
+
+from test import utils
+from app.service import iap_request
+
+
+@mock.patch('google.oauth2.id_token.fetch_id_token')
+class IAPRequestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.token_cache = iap_request.TokenCache(refresh_margin=300)
+        self.session = mock.Mock()
+        self.session.request.return_value = utils.ResponseMock(200)
+        self.iap = iap_request.IAPRequest('client-id',
+                                          token_cache=self.token_cache,
+                                          session=self.session)
+
+    @mock.patch('time.time', lambda: 1000)
+    @mock.patch('app.service.iap_request._get_expiry', lambda token: 2000)
+    def test_token_cached(self, fetch_id_token):
+        fetch_id_token.return_value = 'token'
+        self.iap.get('url')
+        self.iap.post('url', json={'a': 1})
+        fetch_id_token.assert_called_once()
+        self.session.request.assert_called_with(
+            'POST',
+            'url',
+            headers={'Authorization': 'Bearer token'},
+            json={'a': 1})
+        stats = self.iap.get_stats()
+        self.assertEqual(2, stats['num_requests'])
+        self.assertEqual(1, stats['token_hits'])
+        self.assertEqual(1, stats['token_misses'])
+
+    @mock.patch('app.service.iap_request._get_expiry', lambda token: 2000)
+    def test_token_refreshed_before_expiry(self, fetch_id_token):
+        fetch_id_token.side_effect = ['token-1', 'token-2']
+        with mock.patch('time.time', lambda: 1600):
+            self.assertEqual('token-1', self.token_cache.get('client-id'))
+            self.assertEqual('token-1', self.token_cache.get('client-id'))
+        with mock.patch('time.time', lambda: 1701):
+            self.assertEqual('token-2', self.token_cache.get('client-id'))
+
+    @mock.patch('app.service.iap_request._get_expiry', lambda token: 0)
+    def test_token_without_expiry_not_cached(self, fetch_id_token):
+        fetch_id_token.return_value = 'token'
+        self.token_cache.get('client-id')
+        self.token_cache.get('client-id')
+        self.assertEqual(2, fetch_id_token.call_count)
+
+    @mock.patch('time.time', lambda: 1000)
+    @mock.patch('app.service.iap_request._get_expiry', lambda token: 2000)
+    def test_unauthorized_retried_with_new_token(self, fetch_id_token):
+        fetch_id_token.side_effect = ['token-1', 'token-2']
+        self.session.request.side_effect = [
+            utils.ResponseMock(401),
+            utils.ResponseMock(200)
+        ]
+        self.assertEqual(200, self.iap.get('url').status_code)
+        self.session.request.assert_called_with(
+            'GET', 'url', headers={'Authorization': 'Bearer token-2'})
+        self.assertEqual(1, self.iap.get_stats()['num_requests'])
+
+    def test_shared_by_default(self, _):
+        self.assertIs(
+            iap_request.IAPRequest('a').session,
+            iap_request.IAPRequest('b').session)
+        self.assertIs(
+            iap_request.IAPRequest('a').token_cache,
+            iap_request.IAPRequest('b').token_cache)
@@ -15,12 +15,21 @@
 Tests for import_executor.py.
 """
 
+import os
+import sys
+import json
+import contextlib
+import functools
 import unittest
 from unittest import mock
 import subprocess
 import tempfile
+import threading
 
+from app import configs
 from app.executor import import_executor
+from app.executor import resource_usage
+from app.service import github_api
 
 
 class ImportExecutorTest(unittest.TestCase):
@@ -38,24 +47,6 @@ class ImportExecutorTest(unittest.TestCase):
                           import_executor._run_with_timeout, ['sleep', '5'],
                           0.1)
 
-    def test_create_venv(self):
-        with tempfile.NamedTemporaryFile(mode='w+') as requirements:
-            requirements.write('beautifulsoup4\nrequests\n')
-            requirements.flush()
-            with tempfile.TemporaryDirectory() as venv_dir:
-                interpreter_path, proc = import_executor._create_venv(
-                    (requirements.name,), venv_dir, 20)
-                self.assertEqual(0, proc.returncode)
-                with tempfile.NamedTemporaryFile(mode='w+') as script:
-                    script.write('import bs4\nimport requests\nprint(123)\n')
-                    script.flush()
-                    proc = subprocess.run([interpreter_path, script.name],
-                                          capture_output=True,
-                                          text=True,
-                                          timeout=2)
-                    self.assertEqual(0, proc.returncode)
-                    self.assertEqual('123\n', proc.stdout)
-
     @mock.patch('app.utils.utctime', lambda: '2020-07-28T20:22:18.311294+00:00')
     @mock.patch('app.service.dashboard_api.DashboardAPI')
     def test_run_and_handle_exception(self, dashboard):
@@ -105,3 +96,454 @@ class ImportExecutorTest(unittest.TestCase):
                     '[Subprocess command]: exit 0\n'
                     '[Subprocess return code]: 0')
         self.assertEqual(expected, message)
+
+
+class ImportAllTest(unittest.TestCase):
+
+    def _create_executor(self, **config_kwargs):
+        return import_executor.ImportExecutor(
+            uploader=mock.MagicMock(),
+            github=mock.MagicMock(),
+            config=configs.ExecutorConfig(**config_kwargs))
+
+    def test_results_in_order(self):
+        executor = self._create_executor(import_max_workers=4)
+        imports = [('foo', {'import_name': 'a'}), ('bar', {'import_name': 'b'})]
+        with mock.patch.object(executor, '_import_one') as import_one:
+            results = executor._import_all('repo', imports, 'run')
+        self.assertEqual(2, import_one.call_count)
+        self.assertEqual(['succeeded', 'succeeded'],
+                         [result.status for result in results])
+        self.assertEqual([['foo:a'], ['bar:b']],
+                         [result.imports_executed for result in results])
+
+    def test_concurrent(self):
+        """Tests that imports are executed at the same time."""
+        executor = self._create_executor(import_max_workers=3)
+        barrier = threading.Barrier(3, timeout=5)
+        imports = [('foo', {'import_name': name}) for name in 'abc']
+        with mock.patch.object(executor,
+                               '_import_one',
+                               side_effect=lambda **kwargs: barrier.wait()):
+            results = executor._import_all('repo', imports)
+        self.assertEqual(['succeeded'] * 3,
+                         [result.status for result in results])
+
+    def test_fail_fast(self):
+        executor = self._create_executor(import_max_workers=1,
+                                         import_fail_fast=True)
+        imports = [('foo', {'import_name': name}) for name in 'abc']
+        with mock.patch.object(executor,
+                               '_import_one',
+                               side_effect=[None, Exception('oops'),
+                                            None]) as import_one:
+            results = executor._import_all('repo', imports)
+        self.assertEqual(2, import_one.call_count)
+        self.assertEqual(['succeeded', 'failed', 'cancelled'],
+                         [result.status for result in results])
+        self.assertIn('oops', results[1].message)
+
+        result = import_executor._summarize_results(results)
+        self.assertEqual('failed', result.status)
+        self.assertEqual(['foo:a'], result.imports_executed)
+        self.assertIn('oops', result.message)
+
+    def test_run_to_completion(self):
+        executor = self._create_executor(import_max_workers=2,
+                                         import_fail_fast=False)
+        imports = [('foo', {'import_name': name}) for name in 'abc']
+        with mock.patch.object(executor,
+                               '_import_one',
+                               side_effect=[Exception('oops'), None,
+                                            None]) as import_one:
+            results = executor._import_all('repo', imports)
+        self.assertEqual(3, import_one.call_count)
+        result = import_executor._summarize_results(results)
+        self.assertEqual('failed', result.status)
+        self.assertEqual(2, len(result.imports_executed))
+
+    def test_dependencies(self):
+        """Tests that imports start once their dependencies succeed and that
+        a failure only cancels the imports depending on it."""
+        executor = self._create_executor(import_max_workers=4,
+                                         import_fail_fast=False)
+        imports = [('foo', {
+            'import_name': 'a'
+        }), ('foo', {
+            'import_name': 'b',
+            'depends_on': ['a']
+        }), ('foo', {
+            'import_name': 'c',
+            'depends_on': ['b']
+        }), ('bar', {
+            'import_name': 'd'
+        }), ('bar', {
+            'import_name': 'e',
+            'depends_on': ['d', 'foo:a']
+        })]
+        started = []
+
+        def import_one(import_spec, **kwargs):
+            del kwargs
+            started.append(import_spec['import_name'])
+            if import_spec['import_name'] == 'b':
+                raise Exception('oops')
+
+        with mock.patch.object(executor, '_import_one', side_effect=import_one):
+            results = executor._import_all('repo', imports)
+        self.assertEqual(
+            ['succeeded', 'failed', 'cancelled', 'succeeded', 'succeeded'],
+            [result.status for result in results])
+        self.assertIn('foo:b', results[2].message)
+        self.assertCountEqual(['a', 'b', 'd', 'e'], started)
+        self.assertLess(started.index('a'), started.index('b'))
+        self.assertLess(started.index('a'), started.index('e'))
+        self.assertLess(started.index('d'), started.index('e'))
+
+    def test_progress(self):
+        progress = []
+        executor = import_executor.ImportExecutor(
+            uploader=mock.MagicMock(),
+            github=mock.MagicMock(),
+            config=configs.ExecutorConfig(import_fail_fast=False),
+            progress_callback=progress.append)
+        imports = [('foo', {
+            'import_name': 'a'
+        }), ('foo', {
+            'import_name': 'b',
+            'depends_on': ['a']
+        })]
+
+        def import_one(absolute_import_dir, import_spec, **kwargs):
+            del absolute_import_dir, kwargs
+            recorder = resource_usage.ResourceRecorder(
+                on_stage=functools.partial(executor._report_stage,
+                                           f'foo:{import_spec["import_name"]}'))
+            with recorder.stage('scripts'):
+                raise Exception('oops')
+
+        with mock.patch.object(executor, '_import_one', side_effect=import_one):
+            executor._import_all('repo', imports)
+        self.assertEqual(
+            {
+                'foo:a': {
+                    'status': 'running',
+                    'stage': 'scripts'
+                },
+                'foo:b': {
+                    'status': 'queued'
+                }
+            }, progress[0])
+        self.assertEqual(
+            {
+                'foo:a': {
+                    'status': 'failed',
+                    'stage': 'scripts'
+                },
+                'foo:b': {
+                    'status': 'cancelled'
+                }
+            }, progress[-1])
+
+    def test_summarize_results_succeeded(self):
+        result = import_executor._summarize_results([
+            import_executor.ExecutionResult('succeeded', ['foo:a'], 'No issues')
+        ])
+        self.assertEqual(
+            import_executor.ExecutionResult('succeeded', ['foo:a'],
+                                            'No issues'), result)
+
+
+class UploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmpdir.name, 'data.csv'), 'w') as file:
+            file.write('a,b\n')
+        self.uploader = mock.MagicMock()
+        self.uploader.exists.return_value = False
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _upload(self, **config_kwargs):
+        executor = import_executor.ImportExecutor(
+            uploader=self.uploader,
+            github=mock.MagicMock(),
+            config=configs.ExecutorConfig(**config_kwargs))
+        with mock.patch.object(import_executor.utils,
+                               'pacific_time',
+                               return_value='v1'):
+            return executor._upload_import_inputs(
+                self.tmpdir.name, 'out', [{
+                    'cleaned_csv': 'data.csv'
+                }])
+
+    def test_upload_without_dedup_by_default(self):
+        uploaded = self._upload()
+        self.assertEqual('out/v1/data.csv', uploaded.cleaned_csv)
+        self.uploader.upload_files.assert_called_once_with(
+            [(os.path.join(self.tmpdir.name, 'data.csv'), 'out/v1/data.csv')],
+            max_workers=4)
+        self.uploader.copy.assert_not_called()
+
+    def test_upload_logs_have_run_id(self):
+        dashboard = mock.MagicMock()
+        executor = import_executor.ImportExecutor(
+            uploader=self.uploader,
+            github=mock.MagicMock(),
+            config=configs.ExecutorConfig(),
+            dashboard=dashboard)
+        self.uploader.upload_files.return_value = [
+            mock.MagicMock(size=4, duration=1.0, throughput=4.0)
+        ]
+        executor._upload_import_inputs(self.tmpdir.name,
+                                       'out', [{
+                                           'cleaned_csv': 'data.csv'
+                                       }],
+                                       attempt_id='attempt',
+                                       run_id='run')
+        self.assertEqual(2, dashboard.info.call_count)
+        for call in dashboard.info.call_args_list:
+            self.assertEqual({
+                'attempt_id': 'attempt',
+                'run_id': 'run'
+            }, call[1])
+
+    def test_upload_with_dedup(self):
+        uploaded = self._upload(output_dedup=True)
+        self.assertEqual('out/v1/data.csv', uploaded.cleaned_csv)
+        (files,), _ = self.uploader.upload_files.call_args
+        self.assertEqual(1, len(files))
+        self.assertTrue(files[0][1].startswith('out/blobs/'))
+        self.uploader.copy.assert_called_once_with(files[0][1],
+                                                   'out/v1/data.csv')
+
+
+class SkipUnchangedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.repo_dir = os.path.join(self.tmpdir.name, 'repo')
+        self.import_dir = os.path.join(self.repo_dir, 'foo')
+        os.makedirs(self.import_dir)
+        self._write('script.py', 'print(1)')
+        self.executor = import_executor.ImportExecutor(
+            uploader=mock.MagicMock(),
+            github=mock.MagicMock(),
+            config=configs.ExecutorConfig(
+                source_cache_dir=os.path.join(self.tmpdir.name, 'cache')),
+            dashboard=mock.MagicMock())
+        self.executor.downloader.download_all = self._download_all
+        self.executor._upload_import_inputs = mock.MagicMock()
+        self.executor._venv = mock.MagicMock(
+            return_value=contextlib.nullcontext(('python', None)))
+        self.data = 'data'
+        self.spec = {
+            'import_name': 'a',
+            'data_download_url': ['https://host/data.csv'],
+            'scripts': []
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, content):
+        with open(os.path.join(self.import_dir, name), 'w') as file:
+            file.write(content)
+
+    def _download_all(self, specs, dest_dir, timeout):
+        del timeout
+        paths = []
+        for spec in specs:
+            path = os.path.join(dest_dir, os.path.basename(spec.url))
+            with open(path, 'w') as file:
+                file.write(self.data)
+            self.executor.source_cache.put(spec.url, path, self.data, 'etag')
+            paths.append(path)
+        return paths
+
+    def _import(self, skip_unchanged=True):
+        # Every run starts from a fresh copy of the repository
+        data_path = os.path.join(self.import_dir, 'data.csv')
+        if os.path.exists(data_path):
+            os.remove(data_path)
+        return self.executor._import_one_helper(
+            repo_dir=self.repo_dir,
+            relative_import_dir='foo',
+            absolute_import_dir=os.path.join(self.repo_dir, 'foo'),
+            import_spec=self.spec,
+            attempt_id='attempt',
+            skip_unchanged=skip_unchanged)
+
+    def test_skip_unchanged(self):
+        self.assertTrue(self._import())
+        self.assertFalse(self._import())
+        self.executor.dashboard.update_attempt.assert_called_with(
+            {
+                'status': 'unchanged',
+                'time_completed': mock.ANY
+            }, 'attempt')
+
+    def test_inputs_changed(self):
+        self.assertTrue(self._import())
+        self.data = 'new data'
+        self.assertTrue(self._import())
+
+    def test_code_changed(self):
+        self.assertTrue(self._import())
+        self._write('script.py', 'print(2)')
+        self.assertTrue(self._import())
+
+    def test_skip_unchanged_without_downloads(self):
+        del self.spec['data_download_url']
+        self.spec['scripts'] = ['../common/clean.py']
+        common_dir = os.path.join(self.repo_dir, 'common')
+        os.makedirs(common_dir)
+        with open(os.path.join(common_dir, 'clean.py'), 'w') as file:
+            file.write('print(1)')
+        self.assertTrue(self._import())
+        self.assertTrue(self._import())
+
+        self.executor.config.skip_unchanged_without_downloads = True
+        self.assertTrue(self._import())
+        self.assertFalse(self._import())
+        # Scripts outside the directory of the import are fingerprinted too
+        with open(os.path.join(common_dir, 'clean.py'), 'w') as file:
+            file.write('print(2)')
+        self.assertTrue(self._import())
+
+    def test_resource_usage_recorded(self):
+        self.spec['scripts'] = ['script.py']
+        recorder = resource_usage.ResourceRecorder()
+        self.executor._venv.return_value = contextlib.nullcontext(
+            (sys.executable, None))
+        self.executor._import_one_helper(repo_dir=self.repo_dir,
+                                         relative_import_dir='foo',
+                                         absolute_import_dir=self.import_dir,
+                                         import_spec=self.spec,
+                                         attempt_id='attempt',
+                                         recorder=recorder)
+        self.assertEqual(['download', 'venv', 'admission', 'scripts', 'upload'],
+                         [stage.stage for stage in recorder.stages])
+        self.assertGreater(recorder.stages[3].child_cpu_time, 0)
+        # The usage of the scripts refines the estimate for the next run
+        history = self.executor.admission_controller.history.get('foo:a')
+        self.assertEqual(1, len(history))
+        self.assertEqual(recorder.stages[3].child_peak_rss, history[0].memory)
+        self.assertEqual(0, self.executor.admission_controller.in_use.memory)
+
+    def _import_script(self, script):
+        self._write('script.py', script)
+        self.spec['scripts'] = ['script.py']
+        self.executor._venv.return_value = contextlib.nullcontext(
+            (sys.executable, None))
+        self.executor._import_one_helper(repo_dir=self.repo_dir,
+                                         relative_import_dir='foo',
+                                         absolute_import_dir=self.import_dir,
+                                         import_spec=self.spec,
+                                         attempt_id='attempt')
+
+    def test_resource_usage_not_recorded_on_failure(self):
+        self.assertRaises(subprocess.CalledProcessError, self._import_script,
+                          'raise SystemExit(1)')
+        self.assertEqual(
+            [], self.executor.admission_controller.history.get('foo:a'))
+        self.assertEqual(0, self.executor.admission_controller.in_use.memory)
+
+    def test_resource_usage_recorded_on_kill(self):
+        # Killed like the kernel kills a script exceeding its memory limit
+        self.assertRaises(
+            subprocess.CalledProcessError, self._import_script,
+            'import os, signal\n'
+            'os.kill(os.getpid(), signal.SIGKILL)')
+        self.assertEqual(
+            1, len(self.executor.admission_controller.history.get('foo:a')))
+
+    def test_not_skipped_on_commits(self):
+        self.assertTrue(self._import())
+        self.assertTrue(self._import(skip_unchanged=False))
+        self.assertTrue(self._import(skip_unchanged=False))
+
+
+class UpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.repo_dir = os.path.join(self.tmpdir.name, 'repo')
+        self._write_manifest('foo', [{
+            'import_name': 'a'
+        }, {
+            'import_name': 'b'
+        }])
+        self._write_manifest('bar', [{
+            'import_name': 'c',
+            'depends_on': ['foo:a']
+        }])
+        self._write_manifest('baz', [{'import_name': 'd'}])
+        self.executor = import_executor.ImportExecutor(
+            uploader=mock.MagicMock(),
+            github=github_api.LocalRepoAPI(self.repo_dir),
+            config=configs.ExecutorConfig(repo_sparse_extraction=True,
+                                          import_max_workers=2))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write_manifest(self, import_dir, specs, **fields):
+        for spec in specs:
+            spec.update(provenance_url='url',
+                        provenance_description='description',
+                        curator_emails=['curator'])
+        os.makedirs(os.path.join(self.repo_dir, import_dir))
+        with open(os.path.join(self.repo_dir, import_dir, 'manifest.json'),
+                  'w') as file:
+            json.dump(dict(fields, import_specifications=specs), file)
+
+    def test_multiple_import_names(self):
+        started = []
+
+        def import_one(repo_dir, relative_import_dir, import_spec, **kwargs):
+            del kwargs
+            started.append(
+                f'{relative_import_dir}:{import_spec["import_name"]}')
+            self.assertCountEqual(['foo', 'bar'], os.listdir(repo_dir))
+
+        with mock.patch.object(self.executor,
+                               '_import_one',
+                               side_effect=import_one):
+            result = self.executor.execute_imports_on_update(
+                ['foo:b', 'bar:c', 'foo:b'])
+        self.assertEqual('succeeded', result.status)
+        self.assertCountEqual(['foo:a', 'foo:b', 'bar:c'], started)
+        self.assertLess(started.index('foo:a'), started.index('bar:c'))
+
+    def test_transitive_dependencies_extracted(self):
+        self._write_manifest('x', [{'import_name': 'e', 'depends_on': ['y:f']}])
+        self._write_manifest('y', [{
+            'import_name': 'f',
+            'depends_on': ['z:g']
+        }, {
+            'import_name': 'h',
+            'depends_on': ['baz:d']
+        }])
+        self._write_manifest('z', [{'import_name': 'g'}],
+                             repo_dependencies=['shared'])
+        os.makedirs(os.path.join(self.repo_dir, 'shared'))
+        with open(os.path.join(self.repo_dir, 'shared', 'util.py'), 'w'):
+            pass
+        started = []
+
+        def import_one(repo_dir, relative_import_dir, import_spec, **kwargs):
+            del kwargs
+            started.append(
+                f'{relative_import_dir}:{import_spec["import_name"]}')
+            self.assertCountEqual(['x', 'y', 'z', 'shared'],
+                                  os.listdir(repo_dir))
+
+        with mock.patch.object(self.executor,
+                               '_import_one',
+                               side_effect=import_one):
+            result = self.executor.execute_imports_on_update(['x:e'])
+        self.assertEqual('succeeded', result.status)
+        self.assertEqual(['z:g', 'y:f', 'x:e'], started)
@@ -17,8 +17,10 @@ Tests for import_executor.py.
 
 import unittest
 from unittest import mock
+from concurrent import futures
 
 from app.service import import_service
+from test import utils
 
 _CLIENT = 'app.service.import_service.ImportServiceClient'
 
@@ -174,3 +176,64 @@ class ImportServiceTest(unittest.TestCase):
             import_service._format_import_info('name', 'email', 'id'))
         self.assertEqual('import_name: name, curator_email: email',
                          import_service._format_import_info('name', 'email'))
+
+
+class ImportLogWaiterTest(unittest.TestCase):
+
+    @mock.patch('google.cloud.storage.Client', mock.MagicMock)
+    @mock.patch(f'{_CLIENT}.get_import_log')
+    def test_block_on_import_waits(self, get_import_log):
+        """Tests that ImportServiceClient._block_on_import waits for the
+        import with the ImportLogWaiter of the client."""
+        importer = utils.FakeImporter()
+        get_import_log.side_effect = importer.get_import_log
+        client = import_service.ImportServiceClient(
+            'project_id', 'unresolved_mcf_bucket_name',
+            'resolved_mcf_bucket_name', 'importer_output_prefix',
+            'executor_output_prefix', 'client_id')
+        import_id = importer.submit('import_name', 'curator_email')
+        self.assertEqual(
+            'SUCCESSFUL',
+            client._block_on_import(import_id, 'import_name',
+                                    'curator_email')['state'])
+
+    def test_wait_shares_polls(self):
+        importer = utils.FakeImporter(log_latency=0.01)
+        waiter = import_service.ImportLogWaiter(
+            lambda email: importer.get_import_log(email)['entry'])
+        import_ids = [
+            importer.submit(f'name{i}',
+                            'email',
+                            queue_time=0.05,
+                            run_time=0.01 * i) for i in range(20)
+        ]
+        with futures.ThreadPoolExecutor(len(import_ids)) as executor:
+            logs = list(
+                executor.map(
+                    lambda import_id: waiter.wait(import_id,
+                                                  'name',
+                                                  'email',
+                                                  timeout=10,
+                                                  min_interval=0.02,
+                                                  max_interval=0.04),
+                    import_ids))
+        self.assertEqual(['SUCCESSFUL'] * 20, [log['state'] for log in logs])
+        # Each waiter polls at least 3 times on its own
+        self.assertLess(importer.num_log_requests, 3 * 20)
+
+    def test_wait_failed(self):
+        importer = utils.FakeImporter()
+        waiter = import_service.ImportLogWaiter(
+            lambda email: importer.get_import_log(email)['entry'])
+        import_id = importer.submit('name',
+                                    'email',
+                                    run_time=0.01,
+                                    final_state='FAILED')
+        self.assertRaises(import_service.ImportFailedError,
+                          waiter.wait,
+                          import_id,
+                          'name',
+                          'email',
+                          min_interval=0.01)
+        self.assertRaises(import_service.ImportNotFoundError, waiter.wait,
+                          'id9', 'name', 'email')
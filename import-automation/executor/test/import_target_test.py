@@ -15,11 +15,26 @@
 Tests for import_target.py.
 """
 
+import json
+import os
+import tempfile
 import unittest
 
 from app.executor import import_target
 
 
+def _spec(name, depends_on=None):
+    spec = {
+        'import_name': name,
+        'provenance_url': 'url',
+        'provenance_description': 'description',
+        'curator_emails': 'curator'
+    }
+    if depends_on is not None:
+        spec['depends_on'] = depends_on
+    return spec
+
+
 class ImportTargetTest(unittest.TestCase):
 
     def test_absolute_import_name(self):
@@ -84,3 +99,49 @@ class ImportTargetTest(unittest.TestCase):
         self.assertFalse(
             import_target.is_import_targetted_by_commit(
                 'scripts/us_fed', 'treasury', ['scripts/us_fed:else']))
+
+    def test_sort_imports(self):
+        imports = [('foo', _spec('b', ['a', 'bar:c'])), ('foo', _spec('a')),
+                   ('bar', _spec('c', ['foo:a'])), ('bar', _spec('d'))]
+        self.assertEqual(
+            {
+                'foo:b': ['foo:a', 'bar:c'],
+                'foo:a': [],
+                'bar:c': ['foo:a'],
+                'bar:d': []
+            }, import_target.get_dependency_graph(imports))
+        self.assertEqual(['a', 'd', 'c', 'b'], [
+            spec['import_name']
+            for _, spec in import_target.sort_imports(imports)
+        ])
+
+    def test_sort_imports_cycle(self):
+        imports = [('foo', _spec('a', ['b'])), ('foo', _spec('b', ['a'])),
+                   ('foo', _spec('c'))]
+        with self.assertRaises(ValueError) as context:
+            import_target.sort_imports(imports)
+        self.assertIn('foo:a, foo:b', str(context.exception))
+
+    def test_add_dependencies(self):
+        with tempfile.TemporaryDirectory() as repo_dir:
+            manifests = {
+                'foo': [_spec('a', ['bar:c']),
+                        _spec('b', ['a'])],
+                'bar': [_spec('c'), _spec('d')]
+            }
+            for import_dir, specs in manifests.items():
+                os.makedirs(os.path.join(repo_dir, import_dir))
+                with open(os.path.join(repo_dir, import_dir, 'manifest.json'),
+                          'w') as file:
+                    json.dump({'import_specifications': specs}, file)
+            imports = import_target.add_dependencies(
+                [('foo', manifests['foo'][1])], 'manifest.json', repo_dir)
+            self.assertEqual([('bar', 'c'), ('foo', 'a'), ('foo', 'b')],
+                             [(import_dir, spec['import_name'])
+                              for import_dir, spec in imports])
+
+            manifests['foo'][1]['depends_on'] = ['bar:e']
+            with self.assertRaises(ValueError) as context:
+                import_target.add_dependencies([('foo', manifests['foo'][1])],
+                                               'manifest.json', repo_dir)
+            self.assertIn('bar:e', str(context.exception))
@@ -0,0 +1,142 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for job_queue.py.
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+import unittest
+
+from app.executor import job_queue
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'jobs.sqlite')
+        self.queue = job_queue.JobQueue(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _wait(self, job_id, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = self.queue.get(job_id)
+            if job.status in (job_queue.SUCCEEDED, job_queue.FAILED):
+                return job
+            time.sleep(0.01)
+        self.fail(f'Job {job_id} did not finish')
+
+    def test_claim_in_order(self):
+        first = self.queue.enqueue('a', {'n': 1})
+        second = self.queue.enqueue('b', {'n': 2})
+        job = self.queue.claim()
+        self.assertEqual((first, 'a', {
+            'n': 1
+        }, job_queue.RUNNING), (job.id, job.kind, job.payload, job.status))
+        self.assertEqual(second, self.queue.claim().id)
+        self.assertIsNone(self.queue.claim())
+
+    def test_worker_pool(self):
+
+        def handler(payload, report):
+            report('started')
+            report('halfway', {'done': 1})
+            if payload['fail']:
+                raise ValueError('bad payload')
+            return {'doubled': payload['n'] * 2}
+
+        pool = job_queue.JobWorkerPool(self.queue, {'double': handler},
+                                       num_workers=2)
+        pool.start()
+        try:
+            succeeded = self.queue.enqueue('double', {'n': 2, 'fail': False})
+            failed = self.queue.enqueue('double', {'n': 2, 'fail': True})
+            unknown = self.queue.enqueue('triple', {})
+            pool.notify()
+            job = self._wait(succeeded)
+            self.assertEqual(job_queue.SUCCEEDED, job.status)
+            self.assertEqual({'doubled': 4}, job.result)
+            self.assertEqual('halfway', job.progress)
+            self.assertEqual({'done': 1}, job.details)
+            self.assertIsNotNone(job.finished_at)
+            job = self._wait(failed)
+            self.assertEqual(job_queue.FAILED, job.status)
+            self.assertIn('ValueError: bad payload', job.error)
+            self.assertEqual(job_queue.FAILED, self._wait(unknown).status)
+        finally:
+            pool.stop(timeout=5)
+
+    def _set_running(self, job_id, token, lease_expires, pid=None):
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, worker_pid = ?, worker_token = ?, '
+                'lease_expires = ? WHERE id = ?',
+                (job_queue.RUNNING, pid, token, lease_expires, job_id))
+        connection.close()
+
+    def test_orphans_requeued_after_restart_with_same_pid(self):
+        """Tests that jobs of a crashed process are queued again by a
+        restarted process with the same PID once their lease expires."""
+        expired = self.queue.enqueue('a', {})
+        leased = self.queue.enqueue('b', {})
+        self._set_running(expired, 'crashed', time.time() - 1, os.getpid())
+        self._set_running(leased, 'crashed', time.time() + 0.5, os.getpid())
+        queue = job_queue.JobQueue(self.path)
+        self.assertEqual(job_queue.QUEUED, queue.get(expired).status)
+        self.assertEqual(job_queue.RUNNING, queue.get(leased).status)
+        self.assertEqual(expired, queue.claim().id)
+        time.sleep(0.6)
+        self.assertEqual(leased, queue.claim().id)
+        self.assertIsNone(queue.get('missing'))
+
+    def test_leases_renewed(self):
+        queue = job_queue.JobQueue(self.path, lease_duration=0.3)
+        job_id = queue.enqueue('a', {})
+        queue.claim()
+        other = job_queue.JobQueue(self.path)
+        for _ in range(3):
+            time.sleep(0.2)
+            queue.renew_leases()
+            self.assertIsNone(other.claim())
+        # Jobs claimed by a queue are never requeued by itself
+        time.sleep(0.4)
+        self.assertIsNone(queue.claim())
+        self.assertEqual(job_id, other.claim().id)
+
+    def test_migrates_old_schema(self):
+        os.remove(self.path)
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute(
+                'CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, '
+                'payload TEXT NOT NULL, status TEXT NOT NULL, '
+                "progress TEXT NOT NULL DEFAULT '', result TEXT, error TEXT, "
+                'worker_pid INTEGER, created_at REAL NOT NULL, '
+                'started_at REAL, finished_at REAL)')
+            connection.execute(
+                'INSERT INTO jobs (id, kind, payload, status, worker_pid, '
+                "created_at) VALUES ('old', 'a', '{}', ?, ?, 0)",
+                (job_queue.RUNNING, os.getpid()))
+        connection.close()
+        queue = job_queue.JobQueue(self.path)
+        self.assertEqual(job_queue.QUEUED, queue.get('old').status)
+        queue.set_progress('old', 'started', {'imports': {}})
+        self.assertEqual({'imports': {}}, queue.get('old').details)
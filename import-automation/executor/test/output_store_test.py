@@ -0,0 +1,107 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for output_store.py.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import unittest
+
+from app.executor import output_store
+from app.service import file_uploader
+
+
+class OutputStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output_dir = os.path.join(self.tmpdir.name, 'output')
+        self.uploader = file_uploader.LocalFileUploader(self.output_dir)
+        self.store = output_store.OutputStore(self.uploader)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def _read(self, path):
+        with open(os.path.join(self.output_dir, path)) as file:
+            return file.read()
+
+    def test_put_version(self):
+        csv = self._write('data.csv', 'a,b')
+        tmcf = self._write('data.tmcf', 'Node: E:data->E0')
+        manifest = self.store.put_version([(csv, 'foo/v1/data.csv'),
+                                           (tmcf, 'foo/v1/data.tmcf')],
+                                          output_dir='foo',
+                                          version='v1',
+                                          max_workers=2)
+        csv_sha256 = hashlib.sha256(b'a,b').hexdigest()
+        self.assertEqual(f'foo/blobs/{csv_sha256}.csv', manifest.files[0].blob)
+        self.assertEqual([False, False],
+                         [output_file.reused for output_file in manifest.files])
+        self.assertEqual(2, len(manifest.uploads))
+        self.assertEqual('a,b', self._read('foo/v1/data.csv'))
+        self.assertEqual('a,b', self._read(f'foo/blobs/{csv_sha256}.csv'))
+        self.assertEqual('Node: E:data->E0', self._read('foo/v1/data.tmcf'))
+
+        uploaded = json.loads(self._read('foo/v1/manifest.json'))
+        self.assertEqual('v1', uploaded['version'])
+        self.assertEqual(
+            {
+                'dest': 'foo/v1/data.csv',
+                'blob': f'foo/blobs/{csv_sha256}.csv',
+                'sha256': csv_sha256,
+                'size': 3,
+                'reused': False
+            }, uploaded['files'][0])
+
+    def test_unchanged_files_reused(self):
+        csv = self._write('data.csv', 'a,b')
+        tmcf = self._write('data.tmcf', 'Node: E:data->E0')
+        self.store.put_version([(csv, 'foo/v1/data.csv'),
+                                (tmcf, 'foo/v1/data.tmcf')],
+                               output_dir='foo',
+                               version='v1')
+        self._write('data.csv', 'a,b,c')
+        manifest = self.store.put_version([(csv, 'foo/v2/data.csv'),
+                                           (tmcf, 'foo/v2/data.tmcf')],
+                                          output_dir='foo',
+                                          version='v2')
+        self.assertEqual([False, True],
+                         [output_file.reused for output_file in manifest.files])
+        self.assertEqual([csv], [result.src for result in manifest.uploads])
+        self.assertEqual('a,b,c', self._read('foo/v2/data.csv'))
+        self.assertEqual('Node: E:data->E0', self._read('foo/v2/data.tmcf'))
+        self.assertEqual('a,b', self._read('foo/v1/data.csv'))
+        self.assertEqual(
+            3, len(os.listdir(os.path.join(self.output_dir, 'foo/blobs'))))
+
+    def test_identical_files_uploaded_once(self):
+        first = self._write('first.csv', 'a,b')
+        second = self._write('second.csv', 'a,b')
+        manifest = self.store.put_version([(first, 'foo/v1/first.csv'),
+                                           (second, 'foo/v1/second.csv')],
+                                          output_dir='foo',
+                                          version='v1')
+        self.assertEqual(1, len(manifest.uploads))
+        self.assertEqual(manifest.files[0].blob, manifest.files[1].blob)
+        self.assertEqual('a,b', self._read('foo/v1/second.csv'))
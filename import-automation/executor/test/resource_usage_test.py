@@ -0,0 +1,87 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for resource_usage.py.
+"""
+
+import os
+import sys
+import time
+import unittest
+import subprocess
+import threading
+
+from app.executor import resource_usage
+from app.executor import subprocess_runner
+
+# Allocates about 64 MiB and spins the CPU for about 0.3 seconds
+_BUSY_SCRIPT = ('import time\n'
+                'data = bytearray(64 * 1024 ** 2)\n'
+                'start = time.process_time()\n'
+                'while time.process_time() - start < 0.3: pass\n')
+
+
+class ResourceRecorderTest(unittest.TestCase):
+
+    def test_stages(self):
+        recorder = resource_usage.ResourceRecorder(
+            [resource_usage.StageUsage('shared', wall_time=1)])
+        with recorder.stage('sleep'):
+            time.sleep(0.1)
+        with recorder.stage('busy'):
+            process = subprocess_runner.run(
+                [sys.executable, '-c', _BUSY_SCRIPT], timeout=30)
+        process.check_returncode()
+
+        self.assertEqual(['shared', 'sleep', 'busy'],
+                         [stage['stage'] for stage in recorder.to_list()])
+        sleep, busy = recorder.stages[1:]
+        self.assertGreaterEqual(sleep.wall_time, 0.1)
+        self.assertEqual(0, sleep.child_cpu_time)
+        self.assertGreaterEqual(busy.child_cpu_time, 0.25)
+        self.assertGreaterEqual(busy.child_peak_rss, 64 * 1024**2)
+        self.assertGreater(busy.peak_rss, 0)
+
+    def test_stage_recorded_on_exception(self):
+        recorder = resource_usage.ResourceRecorder()
+        with self.assertRaises(ValueError):
+            with recorder.stage('failed'):
+                raise ValueError()
+        self.assertEqual('failed', recorder.stages[0].stage)
+        self.assertFalse(resource_usage.is_recording())
+
+    def test_stages_are_per_thread(self):
+        recorder = resource_usage.ResourceRecorder()
+        with recorder.stage('main'):
+            thread = threading.Thread(
+                target=subprocess_runner.run,
+                args=([sys.executable, '-c', _BUSY_SCRIPT], 30))
+            thread.start()
+            thread.join()
+        self.assertEqual(0, recorder.stages[0].child_cpu_time)
+
+
+@unittest.skipUnless(os.path.isdir('/proc'), 'Requires /proc')
+class ProcessSamplerTest(unittest.TestCase):
+
+    def test_sample_process_tree(self):
+        # The Python process is a child of the shell
+        process = subprocess.Popen(
+            ['bash', '-c', f'{sys.executable} -c "{_BUSY_SCRIPT}"; true'])
+        sampler = resource_usage.ProcessSampler(process.pid, interval=0.05)
+        sampler.start()
+        process.wait()
+        usage = sampler.stop()
+        self.assertGreaterEqual(usage.peak_rss, 64 * 1024**2)
+        self.assertGreater(usage.cpu_time, 0)
@@ -0,0 +1,107 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for source_cache.py.
+"""
+
+import os
+import tempfile
+import unittest
+
+from app.executor import source_cache
+
+
+class SourceCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = source_cache.SourceCache(
+            os.path.join(self.tmpdir.name, 'cache'))
+        self.path = self._write('data.csv', 'a,b\n')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def test_put_and_restore(self):
+        self.cache.put('https://host/data.csv', self.path, 'sha', 'etag',
+                       'yesterday')
+        self.assertEqual(
+            {
+                'If-None-Match': 'etag',
+                'If-Modified-Since': 'yesterday'
+            }, self.cache.get_conditional_headers('https://host/data.csv'))
+        dest_dir = os.path.join(self.tmpdir.name, 'dest')
+        os.makedirs(dest_dir)
+        entry = self.cache.get('https://host/data.csv')
+        path = self.cache.restore(entry, dest_dir)
+        self.assertEqual(os.path.join(dest_dir, 'data.csv'), path)
+        with open(path) as file:
+            self.assertEqual('a,b\n', file.read())
+
+    def test_not_cached_without_validators(self):
+        self.assertIsNone(
+            self.cache.put('https://host/data.csv', self.path, 'sha'))
+        self.assertIsNone(self.cache.get('https://host/data.csv'))
+        self.assertEqual(
+            {}, self.cache.get_conditional_headers('https://host/data.csv'))
+
+    def test_replace_previous_version(self):
+        self.cache.put('https://host/data', self.path, 'sha-1', 'etag-1')
+        old_path = self.cache.get('https://host/data').path
+        new_path = self._write('data.zip', 'zip')
+        self.cache.put('https://host/data', new_path, 'sha-2', 'etag-2')
+        entry = self.cache.get('https://host/data')
+        self.assertEqual('data.zip', entry.filename)
+        self.assertEqual('sha-2', entry.sha256)
+        self.assertFalse(os.path.exists(old_path))
+
+    def test_fingerprint(self):
+        self.cache.put('https://host/data.csv', self.path, 'sha', 'etag')
+        self.assertIsNone(
+            self.cache.get_fingerprint('code', ['https://host/missing.csv']))
+        fingerprint = self.cache.get_fingerprint('code',
+                                                 ['https://host/data.csv'])
+        self.assertFalse(self.cache.is_unchanged('foo:a', fingerprint))
+        self.cache.record_success('foo:a', fingerprint)
+        self.assertTrue(self.cache.is_unchanged('foo:a', fingerprint))
+        self.assertFalse(self.cache.is_unchanged('foo:b', fingerprint))
+        self.assertFalse(
+            self.cache.is_unchanged('foo:a', {
+                'code': 'new code',
+                'inputs': fingerprint['inputs']
+            }))
+
+    def test_code_digest(self):
+        import_dir = os.path.join(self.tmpdir.name, 'import')
+        os.makedirs(import_dir)
+        with open(os.path.join(import_dir, 'script.py'), 'w') as file:
+            file.write('print(1)')
+        digest = source_cache.get_code_digest(import_dir, {'a': 1}, [self.path])
+        self.assertEqual(
+            digest,
+            source_cache.get_code_digest(import_dir, {'a': 1}, [self.path]))
+        self.assertNotEqual(
+            digest,
+            source_cache.get_code_digest(import_dir, {'a': 2}, [self.path]))
+        with open(os.path.join(import_dir, 'script.py'), 'w') as file:
+            file.write('print(2)')
+        self.assertNotEqual(
+            digest,
+            source_cache.get_code_digest(import_dir, {'a': 1}, [self.path]))
@@ -0,0 +1,92 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for subprocess_runner.py.
+"""
+
+import time
+import subprocess
+import unittest
+
+from app.executor import subprocess_runner
+
+
+class OutputBufferTest(unittest.TestCase):
+
+    def test_tail(self):
+        buffer = subprocess_runner.OutputBuffer(max_size=5, max_pending=100)
+        buffer.write('abc')
+        self.assertEqual('abc', buffer.getvalue())
+        buffer.write('defg')
+        buffer.write('h')
+        self.assertEqual('[3 characters truncated]\ndefgh', buffer.getvalue())
+
+    def test_pending(self):
+        buffer = subprocess_runner.OutputBuffer(max_size=100, max_pending=4)
+        buffer.write('ab')
+        self.assertEqual('ab', buffer.pop_pending())
+        self.assertEqual('', buffer.pop_pending())
+        buffer.write('cdefgh')
+        self.assertEqual('[2 characters skipped]\nefgh', buffer.pop_pending())
+        self.assertEqual('abcdefgh', buffer.getvalue())
+
+
+class RunTest(unittest.TestCase):
+
+    def test_output(self):
+        process = subprocess_runner.run(
+            ['bash', '-c', 'echo out; echo err >&2; exit 3'], timeout=10)
+        self.assertEqual(3, process.returncode)
+        self.assertEqual('out\n', process.stdout)
+        self.assertEqual('err\n', process.stderr)
+
+    def test_bounded_output(self):
+        process = subprocess_runner.run(
+            ['bash', '-c', 'for i in $(seq 1000); do echo $i; done'],
+            timeout=10,
+            max_output_size=9)
+        self.assertTrue(process.stdout.endswith('\n999\n1000\n'))
+        self.assertIn('characters truncated', process.stdout)
+
+    def test_output_callback(self):
+        chunks = []
+        subprocess_runner.run(
+            ['bash', '-c', 'echo first; sleep 0.5; echo second'],
+            timeout=10,
+            output_callback=lambda stream, text: chunks.append((stream, text)),
+            callback_interval=0.1)
+        self.assertEqual([('stdout', 'first\n'), ('stdout', 'second\n')],
+                         chunks)
+
+    def test_timeout(self):
+        with self.assertRaises(subprocess.TimeoutExpired) as context:
+            subprocess_runner.run(['bash', '-c', 'echo started; sleep 5'],
+                                  timeout=0.5)
+        self.assertEqual('started\n', context.exception.output)
+
+    def test_timeout_background_process(self):
+        """Tests that a process left running in the background holding the
+        output pipes open is killed on timeout."""
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired) as context:
+            subprocess_runner.run(['sh', '-c', '(sleep 8 &); echo hi'],
+                                  timeout=1)
+        self.assertLess(time.monotonic() - start, 4)
+        self.assertEqual('hi\n', context.exception.output)
+
+    def test_background_process_exits_before_timeout(self):
+        process = subprocess_runner.run(
+            ['sh', '-c', '(sleep 0.5; echo later) & echo hi'], timeout=10)
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('hi\nlater\n', process.stdout)
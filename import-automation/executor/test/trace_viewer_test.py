@@ -0,0 +1,83 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for trace_viewer.py.
+"""
+
+import unittest
+
+from app.executor import trace_viewer
+
+
+def _span(name, span_id, parent_id, start, end, status='ok', **attributes):
+    return {
+        'name': name,
+        'trace_id': 'trace',
+        'span_id': span_id,
+        'parent_id': parent_id,
+        'start_time': start,
+        'end_time': end,
+        'attributes': attributes,
+        'status': status,
+        'error': None
+    }
+
+
+class TraceViewerTest(unittest.TestCase):
+
+    def setUp(self):
+        # In the order they are exported, i.e., children before parents
+        self.spans = [
+            _span('download_repo', 'c', 'b', 100.5, 101),
+            _span('repo_download', 'b', 'a', 100.5, 101),
+            _span('import_one', 'e', 'a', 101, 104, import_name='x'),
+            _span('import_one', 'd', 'a', 101, 110, 'error', import_name='y'),
+            _span('execute_imports_on_commit',
+                  'a',
+                  None,
+                  100,
+                  110,
+                  run_id='run'),
+            _span('other', 'f', None, 50, 60)
+        ]
+        self.spans[-1]['trace_id'] = 'earlier'
+
+    def test_group_traces(self):
+        traces = trace_viewer.group_traces(self.spans)
+        self.assertEqual(['earlier', 'trace'],
+                         [trace.trace_id for trace in traces])
+        trace = traces[1]
+        self.assertEqual('run', trace.run_id)
+        self.assertEqual(100, trace.start_time)
+        self.assertEqual(110, trace.end_time)
+        self.assertEqual(
+            [('a', 0), ('b', 1), ('c', 2), ('e', 1), ('d', 1)],
+            [(row.span['span_id'], row.depth) for row in trace.rows])
+
+    def test_render_text(self):
+        trace = trace_viewer.group_traces(self.spans)[1]
+        lines = trace_viewer.render_text(trace, width=10).split('\n')
+        self.assertEqual('execute_imports_on_commit (run_id=run): 10.000s',
+                         lines[0])
+        self.assertEqual(
+            f'{"execute_imports_on_commit":<40}|##########|   10.000s',
+            lines[1])
+        self.assertEqual(f'{"  import_one":<40}| XXXXXXXXX|    9.000s',
+                         lines[5])
+
+    def test_render_html(self):
+        page = trace_viewer.render_html(trace_viewer.group_traces(self.spans))
+        self.assertEqual(2, page.count('<svg'))
+        self.assertIn('import_name: y', page)
+        self.assertIn('fill="#ea4335"', page)
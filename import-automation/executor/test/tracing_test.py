@@ -0,0 +1,150 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for tracing.py.
+"""
+
+import os
+import json
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from app.executor import tracing
+
+
+class ListExporter:
+
+    def __init__(self):
+        self.spans = []
+        self.num_flushes = 0
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def flush(self):
+        self.num_flushes += 1
+
+
+class TracingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = ListExporter()
+        self.tracer = tracing.Tracer([self.exporter])
+
+    def test_nested_spans(self):
+        with self.tracer.trace('root', run_id='run') as root:
+            with tracing.span('child', path=['a', 'b']) as child:
+                with tracing.span('grandchild') as grandchild:
+                    self.assertIs(grandchild, tracing.current_span())
+            root.set_attribute('result', 'succeeded')
+        self.assertIsNone(tracing.current_span())
+        self.assertEqual(['grandchild', 'child', 'root'],
+                         [span.name for span in self.exporter.spans])
+        self.assertEqual(1, self.exporter.num_flushes)
+        self.assertIsNone(root.parent_id)
+        self.assertEqual(root.span_id, child.parent_id)
+        self.assertEqual(child.span_id, grandchild.parent_id)
+        self.assertEqual({root.trace_id},
+                         {span.trace_id for span in self.exporter.spans})
+        self.assertEqual({
+            'run_id': 'run',
+            'result': 'succeeded'
+        }, root.attributes)
+        self.assertEqual({'path': "['a', 'b']"}, child.attributes)
+        self.assertLessEqual(root.start_time, child.start_time)
+        self.assertLessEqual(child.end_time, root.end_time)
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.trace('root'):
+                with tracing.span('child'):
+                    raise ValueError('bad')
+        self.assertEqual([tracing.ERROR, tracing.ERROR],
+                         [span.status for span in self.exporter.spans])
+        self.assertEqual('ValueError: bad', self.exporter.spans[0].error)
+
+    def test_parent_in_other_thread(self):
+        with self.tracer.trace('root') as root:
+            parent = tracing.current_span()
+
+            def run():
+                self.assertIsNone(tracing.current_span())
+                with tracing.span('child', parent=parent):
+                    pass
+
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join()
+        self.assertEqual(root.span_id, self.exporter.spans[0].parent_id)
+
+    def test_span_outside_trace_not_exported(self):
+        with tracing.span('orphan') as orphan:
+            with tracing.span('child') as child:
+                pass
+        self.assertIsNone(orphan.tracer)
+        self.assertIsNone(child.tracer)
+        self.assertEqual(orphan.span_id, child.parent_id)
+
+    def test_json_lines_exporter(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'traces', 'spans.jsonl')
+            tracer = tracing.create_tracer(trace_file=path)
+            with tracer.trace('root', commit_sha='abc'):
+                with tracing.span('child'):
+                    pass
+            with open(path) as file:
+                spans = [json.loads(line) for line in file]
+        self.assertEqual(['child', 'root'], [span['name'] for span in spans])
+        self.assertEqual({'commit_sha': 'abc'}, spans[1]['attributes'])
+        self.assertEqual(spans[1]['span_id'], spans[0]['parent_id'])
+
+    @mock.patch('requests.post')
+    def test_collector_exporter(self, post):
+        exporter = tracing.CollectorExporter('http://collector/v1/traces',
+                                             max_batch_size=2)
+        tracer = tracing.Tracer([exporter])
+        with tracer.trace('root'):
+            for i in range(3):
+                with tracing.span('child', index=i, ratio=0.5, ok=True):
+                    pass
+        # One batch of two spans when the queue fills up and one with the
+        # remaining two spans when the trace ends
+        self.assertEqual(2, post.call_count)
+        body = post.call_args_list[0][1]['json']
+        spans = body['resourceSpans'][0]['scopeSpans'][0]['spans']
+        self.assertEqual(2, len(spans))
+        self.assertEqual([{
+            'key': 'index',
+            'value': {
+                'intValue': '0'
+            }
+        }, {
+            'key': 'ratio',
+            'value': {
+                'doubleValue': 0.5
+            }
+        }, {
+            'key': 'ok',
+            'value': {
+                'boolValue': True
+            }
+        }], spans[0]['attributes'])
+        self.assertEqual({'code': 1}, spans[0]['status'])
+        last = post.call_args_list[1][1]['json']
+        root = last['resourceSpans'][0]['scopeSpans'][0]['spans'][-1]
+        self.assertEqual('root', root['name'])
+        self.assertNotIn('parentSpanId', root)
+        self.assertEqual(root['spanId'], spans[0]['parentSpanId'])
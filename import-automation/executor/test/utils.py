@@ -15,6 +15,9 @@
 Testing utilities.
 """
 
+import time
+import threading
+
 import requests.exceptions
 import google.api_core.exceptions
 
@@ -123,3 +126,68 @@ class SchedulerClientMock:
 
     def job_path(self, project, location, job):
         return f'projects/{project}/locations/{location}/jobs/{job}'
+
+
+class FakeImporter:
+    """Fake Data Commons importer that runs imports in simulated time.
+
+    An import is QUEUED for queue_time seconds after being submitted, then
+    RUNNING for run_time seconds, then ends in its final state.
+
+    Attributes:
+        num_log_requests: Number of get_import_log calls made, as an int.
+    """
+
+    def __init__(self, log_latency=0):
+        """Constructs a FakeImporter.
+
+        Args:
+            log_latency: Time each get_import_log call takes in seconds,
+                as a float.
+        """
+        self.log_latency = log_latency
+        self.num_log_requests = 0
+        self._imports = []
+        self._lock = threading.Lock()
+
+    def submit(self,
+               import_name,
+               curator_email,
+               queue_time=0,
+               run_time=0,
+               final_state='SUCCESSFUL'):
+        """Submits an import and returns its ID."""
+        with self._lock:
+            import_id = f'id{len(self._imports)}'
+            self._imports.append(
+                (import_id, import_name, curator_email, time.monotonic(),
+                 queue_time, run_time, final_state))
+        return import_id
+
+    def get_import_log(self, curator_email):
+        """Returns the logs of the imports submitted with the email in the
+        format of the importer's GetImportLog response."""
+        with self._lock:
+            self.num_log_requests += 1
+            imports = list(self._imports)
+        time.sleep(self.log_latency)
+        now = time.monotonic()
+        entries = []
+        for (import_id, import_name, email, submitted, queue_time, run_time,
+             final_state) in imports:
+            if email != curator_email:
+                continue
+            elapsed = now - submitted
+            if elapsed < queue_time:
+                state = 'QUEUED'
+            elif elapsed < queue_time + run_time:
+                state = 'RUNNING'
+            else:
+                state = final_state
+            entries.append({
+                'id': import_id,
+                'importName': import_name,
+                'userEmail': email,
+                'state': state
+            })
+        return {'entry': entries}
@@ -167,6 +167,40 @@ class ValidationTest(unittest.TestCase):
                                              'scripts/us_fed')
             self.assertIn('dir/foo.py, dir/../bar.py', str(context.exception))
 
+    def test_import_spec_valid_resources(self):
+        spec = {
+            'import_name': 'treausry',
+            'provenance_url': 'url',
+            'provenance_description': 'description',
+            'curator_emails': 'curator',
+            'resources': {
+                'cpus': 0.5,
+                'memory_mb': 2048
+            }
+        }
+        validation._is_import_spec_valid(spec, self.repo_dir, 'scripts/us_fed')
+        for resources in ({'memory_mb': 0}, {'cpus': '2'}, {'disk_mb': 1}, []):
+            spec['resources'] = resources
+            with self.assertRaises(ValueError):
+                validation._is_import_spec_valid(spec, self.repo_dir,
+                                                 'scripts/us_fed')
+
+    def test_import_spec_valid_depends_on(self):
+        spec = {
+            'import_name': 'treausry',
+            'provenance_url': 'url',
+            'provenance_description': 'description',
+            'curator_emails': 'curator',
+            'depends_on': ['other', 'scripts/us_bls:cpi']
+        }
+        validation._is_import_spec_valid(spec, self.repo_dir, 'scripts/us_fed')
+        for depends_on in ('other', ['treausry'], ['scripts/us_fed:treausry'],
+                           ['not valid']):
+            spec['depends_on'] = depends_on
+            with self.assertRaises(ValueError):
+                validation._is_import_spec_valid(spec, self.repo_dir,
+                                                 'scripts/us_fed')
+
     def test_manifest_valid_fields_absent(self):
         with self.assertRaises(ValueError) as context:
             validation.is_manifest_valid({}, self.repo_dir, 'scripts/us_fed')
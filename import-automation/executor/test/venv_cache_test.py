@@ -0,0 +1,152 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for venv_cache.py.
+"""
+
+import os
+import subprocess
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from app.executor import venv_cache
+
+
+def _create_venv_mock(requirements_path, venv_dir, timeout):
+    """Creates a fake virtual environment of 100 bytes."""
+    del requirements_path, timeout
+    os.makedirs(os.path.join(venv_dir, 'bin'))
+    with open(os.path.join(venv_dir, 'bin/python3'), 'w') as file:
+        file.write('a' * 100)
+    return (os.path.join(venv_dir,
+                         'bin/python3'), subprocess.CompletedProcess([], 0))
+
+
+def _write_requirements(requirements_dir, name, content):
+    path = os.path.join(requirements_dir, name)
+    with open(path, 'w') as file:
+        file.write(content)
+    return path
+
+
+@mock.patch('app.executor.venv_cache.create_venv', _create_venv_mock)
+class VenvCacheTest(unittest.TestCase):
+
+    def test_reuse(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = _write_requirements(tmpdir, 'requirements.txt', 'pandas\n')
+            cache = venv_cache.VenvCache(os.path.join(tmpdir, 'cache'), 1000)
+            with cache.venv([path], 10) as (interpreter, process):
+                self.assertEqual(0, process.returncode)
+                self.assertTrue(os.path.exists(interpreter))
+            with cache.venv([path], 10) as (reused, process):
+                self.assertIsNone(process)
+                self.assertEqual(interpreter, reused)
+
+    def test_reuse_while_in_use(self):
+        """Tests that a cached environment in use can be reused without
+        waiting for it to be released."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = _write_requirements(tmpdir, 'requirements.txt', 'pandas\n')
+            cache = venv_cache.VenvCache(os.path.join(tmpdir, 'cache'), 1000)
+            with cache.venv([path], 10):
+                pass
+            reused = []
+
+            def reuse():
+                with cache.venv([path], 10) as (_, process):
+                    reused.append(process)
+
+            with cache.venv([path], 10):
+                thread = threading.Thread(target=reuse, daemon=True)
+                thread.start()
+                thread.join(5)
+                self.assertEqual([None], reused)
+
+    def test_different_requirements(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path_1 = _write_requirements(tmpdir, '1.txt', 'pandas\n')
+            path_2 = _write_requirements(tmpdir, '2.txt', 'numpy\n')
+            same_as_1 = _write_requirements(tmpdir, '3.txt', 'pandas\n')
+            self.assertNotEqual(venv_cache.get_key([path_1]),
+                                venv_cache.get_key([path_2]))
+            self.assertEqual(venv_cache.get_key([path_1]),
+                             venv_cache.get_key([same_as_1]))
+            self.assertEqual(venv_cache.get_key([path_1]),
+                             venv_cache.get_key([path_1, 'does/not/exist']))
+
+    def test_failed_creation_not_cached(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = _write_requirements(tmpdir, 'requirements.txt', 'pandas\n')
+            cache = venv_cache.VenvCache(os.path.join(tmpdir, 'cache'), 1000)
+            failed = (None, subprocess.CompletedProcess([], 1))
+            with mock.patch('app.executor.venv_cache.create_venv',
+                            return_value=failed):
+                with cache.venv([path], 10) as (_, process):
+                    self.assertEqual(1, process.returncode)
+            with cache.venv([path], 10) as (_, process):
+                self.assertEqual(0, process.returncode)
+
+    def test_evict_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [
+                _write_requirements(tmpdir, f'{i}.txt', f'module{i}\n')
+                for i in range(3)
+            ]
+            cache = venv_cache.VenvCache(os.path.join(tmpdir, 'cache'), 250)
+            interpreters = []
+            for i, path in enumerate(paths[:2]):
+                with cache.venv([path], 10) as (interpreter, _):
+                    interpreters.append(interpreter)
+                lock_path = os.path.dirname(
+                    os.path.dirname(interpreter)) + '.lock'
+                os.utime(lock_path, (i, i))
+            with cache.venv([paths[2]], 10) as (interpreter, _):
+                interpreters.append(interpreter)
+                self.assertFalse(os.path.exists(interpreters[0]))
+                self.assertTrue(os.path.exists(interpreters[1]))
+                self.assertTrue(os.path.exists(interpreters[2]))
+
+    def test_evict_skips_venvs_in_use(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path_1 = _write_requirements(tmpdir, '1.txt', 'pandas\n')
+            path_2 = _write_requirements(tmpdir, '2.txt', 'numpy\n')
+            cache = venv_cache.VenvCache(os.path.join(tmpdir, 'cache'), 150)
+            with cache.venv([path_1], 10) as (interpreter_1, _):
+                with cache.venv([path_2], 10) as (interpreter_2, _):
+                    self.assertTrue(os.path.exists(interpreter_1))
+                    self.assertTrue(os.path.exists(interpreter_2))
+
+
+class CreateVenvTest(unittest.TestCase):
+
+    def test_create_venv(self):
+        with tempfile.NamedTemporaryFile(mode='w+') as requirements:
+            requirements.write('beautifulsoup4\nrequests\n')
+            requirements.flush()
+            with tempfile.TemporaryDirectory() as venv_dir:
+                interpreter_path, proc = venv_cache.create_venv(
+                    (requirements.name,), venv_dir, 20)
+                self.assertEqual(0, proc.returncode)
+                with tempfile.NamedTemporaryFile(mode='w+') as script:
+                    script.write('import bs4\nimport requests\nprint(123)\n')
+                    script.flush()
+                    proc = subprocess.run([interpreter_path, script.name],
+                                          capture_output=True,
+                                          text=True,
+                                          timeout=2)
+                    self.assertEqual(0, proc.returncode)
+                    self.assertEqual('123\n', proc.stdout)
@@ -0,0 +1,130 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for zygote.py.
+"""
+
+import os
+import sys
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from app.executor import import_executor
+from app.executor import resource_usage
+from app.executor import subprocess_runner
+from app.executor import zygote
+
+
+class ZygoteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.zygote = zygote.Zygote(sys.executable,
+                                    ['colorsys', 'not_a_module'],
+                                    idle_timeout=60)
+        self.zygote.start(timeout=60)
+
+    def tearDown(self):
+        self.zygote.stop()
+        self.tmpdir.cleanup()
+
+    def _write(self, code):
+        path = os.path.join(self.tmpdir.name, 'script.py')
+        with open(path, 'w') as file:
+            file.write(code)
+        return path
+
+    def _run(self, script_path, *args, timeout=60):
+        return subprocess_runner.run([sys.executable, script_path] + list(args),
+                                     timeout=timeout,
+                                     cwd=self.tmpdir.name,
+                                     spawner=self.zygote)
+
+    def test_preloaded(self):
+        self.assertEqual(['colorsys'], self.zygote.preloaded)
+        process = self._run(
+            self._write('import sys\n'
+                        'print("colorsys" in sys.modules, __name__)'))
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('True __main__\n', process.stdout)
+
+    def test_argv_cwd_and_output(self):
+        script_path = self._write(
+            'import os, sys\n'
+            'print(sys.argv[1:], os.getcwd() == os.path.dirname(sys.argv[0]))\n'
+            'print("err", file=sys.stderr)\n'
+            'sys.exit(3)')
+        recorder = resource_usage.ResourceRecorder()
+        with recorder.stage('scripts'):
+            process = self._run(script_path, 'a', 'b')
+        self.assertEqual(3, process.returncode)
+        self.assertEqual("['a', 'b'] True\n", process.stdout)
+        self.assertEqual('err\n', process.stderr)
+        self.assertGreater(recorder.stages[0].child_peak_rss, 0)
+
+    def test_exception(self):
+        process = self._run(self._write('raise ValueError("oops")'))
+        self.assertEqual(1, process.returncode)
+        self.assertIn('ValueError: oops', process.stderr)
+
+    def test_timeout(self):
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self._run(self._write('import time\ntime.sleep(60)'), timeout=1)
+        # The zygote keeps serving
+        self.assertEqual(0, self._run(self._write('pass')).returncode)
+
+    def test_spawn_fails_when_stopped(self):
+        script_path = self._write('pass')
+        self.zygote.stop()
+        with self.assertRaises(zygote.ZygoteError):
+            self.zygote.spawn([sys.executable, script_path])
+
+    def test_run_user_script_falls_back(self):
+        script_path = self._write('print("ok")')
+        self.zygote.stop()
+        process = import_executor._run_user_script(sys.executable,
+                                                   script_path,
+                                                   timeout=60,
+                                                   spawner=self.zygote)
+        self.assertEqual('ok\n', process.stdout)
+
+
+class ZygotePoolTest(unittest.TestCase):
+
+    def test_restarts_exited_zygote(self):
+        pool = zygote.ZygotePool([], idle_timeout=60, start_timeout=60)
+        try:
+            first = pool.get(sys.executable)
+            self.assertIs(first, pool.get(sys.executable))
+            first.stop()
+            second = pool.get(sys.executable)
+            self.assertIsNot(first, second)
+            self.assertTrue(second.is_alive())
+        finally:
+            pool.close()
+
+    def test_restarts_for_recreated_venv(self):
+        pool = zygote.ZygotePool([], idle_timeout=60, start_timeout=60)
+        try:
+            with mock.patch.object(zygote,
+                                   '_get_venv_identity',
+                                   side_effect=[1, 2]):
+                first = pool.get(sys.executable)
+                second = pool.get(sys.executable)
+            self.assertIsNot(first, second)
+            self.assertFalse(first.is_alive())
+        finally:
+            pool.close()
@@ -0,0 +1,68 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Trace viewer. Run 'python3 -m view_traces --help' for usage.
+
+Renders the tracing spans the executor wrote to the file configured by
+trace_file as a waterfall chart for each system run. The charts are printed
+as text, or written to an HTML page with --output.
+"""
+
+from absl import app
+from absl import flags
+
+from app.executor import trace_viewer
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string(name='trace_file',
+                    default=None,
+                    help='Path to the JSON-lines file with the spans.',
+                    short_name='f')
+flags.DEFINE_string(name='run_id',
+                    default='',
+                    help='ID of the system run to show. All if empty.')
+flags.DEFINE_integer(name='last',
+                     default=0,
+                     help='Only show the latest this many runs if positive.')
+flags.DEFINE_string(name='output',
+                    default='',
+                    help=('Path to write an HTML page with the charts to. '
+                          'The charts are printed as text if empty.'),
+                    short_name='o')
+flags.DEFINE_integer(name='width',
+                     default=60,
+                     help='Width of the time axis of the text charts.')
+
+flags.mark_flag_as_required('trace_file')
+
+
+def main(_):
+    """Renders the traces."""
+    traces = trace_viewer.group_traces(trace_viewer.load_spans(
+        FLAGS.trace_file))
+    if FLAGS.run_id:
+        traces = [trace for trace in traces if trace.run_id == FLAGS.run_id]
+    if FLAGS.last > 0:
+        traces = traces[-FLAGS.last:]
+    if FLAGS.output:
+        with open(FLAGS.output, 'w') as file:
+            file.write(trace_viewer.render_html(traces))
+        print(f'Wrote {len(traces)} traces to {FLAGS.output}')
+    else:
+        print('\n\n'.join(
+            trace_viewer.render_text(trace, FLAGS.width) for trace in traces))
+
+
+if __name__ == '__main__':
+    app.run(main)
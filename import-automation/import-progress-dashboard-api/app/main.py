@@ -29,6 +29,7 @@ from app.resource import import_attempt
 from app.resource import progress_log
 from app.resource import progress_log_list
 from app.resource import system_run
+from app.resource import resource_usage_history
 
 
 def create_app(logging=True):
@@ -55,7 +56,10 @@ def create_api(app):
     api.add_resource(progress_log.ProgressLogByRunID,
                      '/system_runs/<string:run_id>/logs')
     api.add_resource(progress_log_list.ProgressLogList, '/logs')
+    api.add_resource(progress_log_list.ProgressLogBatch, '/logs/batch')
     api.add_resource(progress_log.ProgressLog, '/logs/<string:log_id>')
+    api.add_resource(resource_usage_history.ResourceUsageHistory,
+                     '/resource_usage')
     return api
 
 
@@ -55,6 +55,45 @@ class ImportAttempt:
     # List of import inputs. Each import input is a dict with three fields:
     # import_input_url, node_mcf_url, and csv_url.
     import_inputs = 'import_inputs'
+    # List of the resources used by the stages of the import attempt, e.g.,
+    # downloading the repository, running the user scripts, and waiting for
+    # the importer. Each is a dict whose fields are defined by
+    # StageResourceUsage.
+    resource_usage = 'resource_usage'
+
+
+class StageResourceUsage:
+    """Fields of the resources used by a stage of an import attempt.
+
+    Like ImportAttempt, the class variables below are the field names. All
+    fields except stage are non-negative numbers.
+    """
+    # Name of the stage as a string, e.g., 'repo_download', 'venv',
+    # 'scripts', 'upload', or 'import'.
+    stage = 'stage'
+    # Elapsed time in seconds.
+    wall_time = 'wall_time'
+    # CPU time in seconds of the executor process.
+    cpu_time = 'cpu_time'
+    # CPU time in seconds of the subprocesses run by the stage.
+    child_cpu_time = 'child_cpu_time'
+    # Peak resident set size in bytes of the executor process.
+    peak_rss = 'peak_rss'
+    # Peak resident set size in bytes of the subprocesses run by the stage.
+    child_peak_rss = 'child_peak_rss'
+    # Bytes read from and written to storage by the executor process,
+    # including the subprocesses it waited for.
+    read_bytes = 'read_bytes'
+    write_bytes = 'write_bytes'
+    # Bytes read from and written to storage by the subprocesses run by the
+    # stage.
+    child_read_bytes = 'child_read_bytes'
+    child_write_bytes = 'child_write_bytes'
+
+
+STAGE_RESOURCE_USAGE_NUMBER_FIELDS = frozenset(
+    value for name, value in vars(StageResourceUsage).items()
+    if not name.startswith('_') and value != StageResourceUsage.stage)
 
 
 class ImportAttemptStatus(enum.Enum):
@@ -65,6 +104,9 @@ class ImportAttemptStatus(enum.Enum):
     CREATED = 'created'
     SUCCEEDED = 'succeeded'
     FAILED = 'failed'
+    # The import was skipped because its code and inputs have not changed
+    # since it last succeeded.
+    UNCHANGED = 'unchanged'
 
 
 IMPORT_ATTEMPT_STATUS = frozenset(
@@ -58,7 +58,8 @@ class ImportAttempt(base_resource.BaseResource):
                        (_MODEL.provenance_description,), (_MODEL.status,),
                        (_MODEL.time_created,), (_MODEL.time_completed,),
                        (_MODEL.logs, str, 'append'), (_MODEL.import_inputs,
-                                                      dict, 'append'))
+                                                      dict, 'append'),
+                       (_MODEL.resource_usage, dict, 'append'))
     utils.add_fields(parser, optional_fields, required=False)
 
     def __init__(self, client=None):
@@ -12,13 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """
-Progress log list resource associated with the endpoint '/logs'.
+Progress log list resources associated with the endpoints '/logs' and
+'/logs/batch'.
 See app/model/progress_log_model.py and app/resource/progress_log.py for what
 a progress log is.
 """
 
 import http
 
+from flask_restful import reqparse
+
 from app import utils
 from app.resource import progress_log
 from app.model import import_attempt_model
@@ -30,6 +33,14 @@ _ATTEMPT = import_attempt_model.ImportAttempt
 _RUN = system_run_model.SystemRun
 _LOG = progress_log_model.ProgressLog
 
+# Fields of a progress log that can be set in a request body
+_LOG_FIELDS = (_LOG.level, _LOG.message, _LOG.time_logged, _LOG.run_id,
+               _LOG.attempt_id)
+# Maximum number of progress logs created by a request to '/logs/batch'.
+# A Datastore commit can write at most 500 entities, including the system
+# runs and import attempts the logs are linked to.
+_MAX_BATCH_SIZE = 200
+
 
 def add_log_to_entity(log_id, entity):
     """Adds a progress log pointer to an entity.
@@ -70,12 +81,7 @@ class ProgressLogList(progress_log.ProgressLog):
         args.pop(_LOG.log_id, None)
         args.setdefault('time_logged', utils.utctime())
 
-        valid, err, code = validation.is_progress_log_valid(args)
-        if not valid:
-            return err, code
-
-        valid, err, code = validation.required_fields_present(
-            (_LOG.run_id, _LOG.level, _LOG.message), args)
+        valid, err, code = _validate_log(args)
         if not valid:
             return err, code
 
@@ -111,3 +117,105 @@ class ProgressLogList(progress_log.ProgressLog):
                 self.attempt_database.save(
                     add_log_to_entity(log.key.name, attempt))
             return log
+
+
+class ProgressLogBatch(progress_log.ProgressLog):
+    """API associated with the endpoint '/logs/batch' for creating multiple
+    progress logs at once.
+
+    The content type of the request must be 'application/json'.
+
+    Attributes:
+        See ProgressLog.
+    """
+    batch_parser = reqparse.RequestParser()
+    batch_parser.add_argument('logs',
+                              type=dict,
+                              action='append',
+                              location='json',
+                              required=True,
+                              nullable=False)
+
+    def post(self):
+        """Creates new progress logs with the fields provided in the logs
+        field of the request body, a list of at most _MAX_BATCH_SIZE
+        progress logs.
+
+        Each progress log must be valid for ProgressLogList.post. The logs are
+        created in one transaction, so either all or none are created.
+
+        Returns:
+            The created progress logs as a list of datastore Entity objects
+            with log_id set, in the order of the request. Otherwise,
+            (error message, error code), where the error message is a string
+            and the error code is an int.
+        """
+        logs = ProgressLogBatch.batch_parser.parse_args()['logs']
+        if len(logs) > _MAX_BATCH_SIZE:
+            return (f'at most {_MAX_BATCH_SIZE} progress logs can be created '
+                    'at once', http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        logs = [{
+            field: value for field, value in log.items() if field in _LOG_FIELDS
+        } for log in logs]
+        for args in logs:
+            args.setdefault(_LOG.time_logged, utils.utctime())
+            valid, err, code = _validate_log(args)
+            if not valid:
+                return err, code
+
+        runs = {}
+        attempts = {}
+        with self.client.transaction():
+            for args in logs:
+                run_id = args[_LOG.run_id]
+                attempt_id = args.get(_LOG.attempt_id)
+                if run_id not in runs:
+                    runs[run_id] = self.run_database.get(run_id)
+                    if not runs[run_id]:
+                        return validation.get_not_found_error(
+                            _RUN.run_id, run_id)
+                if not attempt_id:
+                    continue
+                if attempt_id not in attempts:
+                    attempts[attempt_id] = self.attempt_database.get(attempt_id)
+                    if not attempts[attempt_id]:
+                        return validation.get_not_found_error(
+                            _ATTEMPT.attempt_id, attempt_id)
+                if attempt_id not in runs[run_id].get(_RUN.import_attempts, []):
+                    return ('The import attempt specified by the attempt_id '
+                            f'{attempt_id} in the request body is not '
+                            'executed by the system run specified by the '
+                            f'run_id {run_id} in the request body',
+                            http.HTTPStatus.CONFLICT)
+
+            created = []
+            for args in logs:
+                log = self.log_database.get(make_new=True)
+                log.update(args)
+                log = self.log_database.save(log, save_content=True)
+                add_log_to_entity(log.key.name, runs[args[_LOG.run_id]])
+                if args.get(_LOG.attempt_id):
+                    add_log_to_entity(log.key.name,
+                                      attempts[args[_LOG.attempt_id]])
+                created.append(log)
+            for run in runs.values():
+                self.run_database.save(run)
+            for attempt in attempts.values():
+                self.attempt_database.save(attempt)
+            return created
+
+
+def _validate_log(log):
+    """Validates a progress log to be created.
+
+    Args:
+        log: Progress log as a dict.
+
+    Returns:
+        See app/service/validation.py.
+    """
+    valid, err, code = validation.is_progress_log_valid(log)
+    if not valid:
+        return valid, err, code
+    return validation.required_fields_present(
+        (_LOG.run_id, _LOG.level, _LOG.message), log)
@@ -0,0 +1,81 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Resource usage history resource associated with the endpoint
+'/resource_usage'.
+"""
+
+from flask_restful import reqparse
+
+from app import utils
+from app.model import import_attempt_model
+from app.resource import import_attempt
+
+_ATTEMPT = import_attempt_model.ImportAttempt
+_STAGE = import_attempt_model.StageResourceUsage
+
+
+class ResourceUsageHistory(import_attempt.ImportAttempt):
+    """API for querying the resources used by the import attempts of an
+    import over time, to spot regressions.
+
+    See ImportAttempt.
+    """
+    parser = reqparse.RequestParser()
+    utils.add_fields(parser, ((_ATTEMPT.absolute_import_name,),), required=True)
+    # stage restricts the history to one stage, e.g., 'scripts'. limit is
+    # the maximum number of import attempts returned.
+    utils.add_fields(parser, ((_STAGE.stage,), ('limit', int)), required=False)
+
+    def get(self):
+        """Retrieves the resource usage of the import attempts of an import,
+        from the most recent to the oldest.
+
+        Import attempts without resource usage, or without the requested
+        stage, are omitted.
+
+        Returns:
+            A list of dicts each with the attempt_id, run_id, status,
+            time_created, and resource_usage fields of an import attempt.
+        """
+        args = ResourceUsageHistory.parser.parse_args()
+        attempts = self.database.filter({
+            _ATTEMPT.absolute_import_name: args[_ATTEMPT.absolute_import_name]
+        })
+        # Sorted here rather than by the query, which would need a composite
+        # index.
+        attempts.sort(
+            key=lambda attempt: attempt.get(_ATTEMPT.time_created, ''),
+            reverse=True)
+        stage = args.get(_STAGE.stage)
+        history = []
+        for attempt in attempts:
+            usage = attempt.get(_ATTEMPT.resource_usage) or []
+            if stage:
+                usage = [
+                    stage_usage for stage_usage in usage
+                    if stage_usage.get(_STAGE.stage) == stage
+                ]
+            if not usage:
+                continue
+            history.append({
+                _ATTEMPT.attempt_id: attempt.get(_ATTEMPT.attempt_id),
+                _ATTEMPT.run_id: attempt.get(_ATTEMPT.run_id),
+                _ATTEMPT.status: attempt.get(_ATTEMPT.status),
+                _ATTEMPT.time_created: attempt.get(_ATTEMPT.time_created),
+                _ATTEMPT.resource_usage: usage
+            })
+            if len(history) == args.get('limit'):
+                break
+        return history
@@ -16,8 +16,8 @@ Functions for validating system runs, import attempts, and progress logs
 without querying the database.
 
 is_import_attempt_valid, is_system_run_valid, is_progress_log_valid, and
-required_fields_present, _is_value_defined, _id_matches, _is_field_iso_utc
-return a tuple consisting of:
+required_fields_present, _is_value_defined, _id_matches, _is_field_iso_utc,
+_is_resource_usage_valid return a tuple consisting of:
 1) a boolean indicating whether the import attempt is valid;
 2) an error message, as a string, explaining the error;
 3) the appropriate HTTP status code, as an int, for the error.
@@ -37,6 +37,9 @@ from app.resource import system_run
 from app.model import import_attempt_model
 from app.model import progress_log_model
 
+_ATTEMPT = import_attempt_model.ImportAttempt
+_STAGE = import_attempt_model.StageResourceUsage
+
 
 def is_import_attempt_valid(attempt, attempt_id=None):
     """Validates an import attempt.
@@ -50,6 +53,8 @@ def is_import_attempt_valid(attempt, attempt_id=None):
             UTC timezone.
         4) The time_completed field, if present, is in ISO 8601 format with
             UTC timezone.
+        5) Each stage in the resource_usage field, if present, has a stage
+           name and only non-negative numbers in its other fields.
 
     Args:
         attempt: Import attempt to validate as a dict.
@@ -76,6 +81,10 @@ def is_import_attempt_valid(attempt, attempt_id=None):
     if not valid:
         return valid, err, code
 
+    valid, err, code = _is_resource_usage_valid(attempt)
+    if not valid:
+        return valid, err, code
+
     return True, None, None
 
 
@@ -265,6 +274,35 @@ def _is_field_iso_utc(entity, field_name):
     return True, None, None
 
 
+def _is_resource_usage_valid(attempt):
+    """Checks if the resource_usage field of an import attempt is valid if
+    present.
+
+    Args:
+        attempt: Import attempt as a dict.
+
+    Returns:
+        See module docstring.
+    """
+    for usage in attempt.get(_ATTEMPT.resource_usage) or []:
+        stage = usage.get(_STAGE.stage)
+        if not stage or not isinstance(stage, str):
+            return (False, f'{_ATTEMPT.resource_usage} {usage} does not have '
+                    f'a {_STAGE.stage}', http.HTTPStatus.FORBIDDEN)
+        for field, value in usage.items():
+            if field == _STAGE.stage:
+                continue
+            if (field not in
+                    import_attempt_model.STAGE_RESOURCE_USAGE_NUMBER_FIELDS):
+                return (False, f'{field} of stage {stage} is not allowed',
+                        http.HTTPStatus.FORBIDDEN)
+            if (isinstance(value, bool) or
+                    not isinstance(value, (int, float)) or value < 0):
+                return (False, f'{field} {value} of stage {stage} is not a '
+                        f'non-negative number', http.HTTPStatus.FORBIDDEN)
+    return True, None, None
+
+
 def _is_iso_utc(time):
     """Checks if a time string is in ISO 8601 format with UTC timezone.
 
@@ -203,3 +203,114 @@ class ProgressLogListTest(unittest.TestCase):
             self.assertEqual(posted[_LOG.run_id], run_id)
             self.assertEqual(posted[_LOG.attempt_id], attempt_id)
             self.assertIn(_LOG.time_logged, posted)
+
+
+class ProgressLogBatchTest(unittest.TestCase):
+    """Tests for ProgressLogBatch."""
+
+    @mock.patch('app.service.log_message_manager.LogMessageManager',
+                utils.LogMessageManagerMock)
+    def setUp(self):
+        """Injects a system run with two import attempts and another system
+        run to the database before every test."""
+        client = utils.create_test_datastore_client()
+        self.resource = progress_log_list.ProgressLogBatch(client)
+        run_list_resource = system_run_list.SystemRunList(client)
+        attempt_list_resource = import_attempt_list.ImportAttemptList(client)
+        self.runs = utils.ingest_system_runs(run_list_resource, [{
+            _RUN.pr_number: 0
+        }, {
+            _RUN.pr_number: 1
+        }])
+        self.attempts = utils.ingest_import_attempts(
+            run_list_resource,
+            attempt_list_resource, [{
+                _ATTEMPT.import_name: 'cpi-u'
+            }, {
+                _ATTEMPT.import_name: 'cpi-w'
+            }],
+            system_run=self.runs[0])
+
+    @mock.patch(utils.PARSE_ARGS)
+    def test_post(self, parse_args):
+        """Tests POSTing progress logs linked to system runs and import
+        attempts."""
+        run_id = self.runs[0][_RUN.run_id]
+        logs = [{
+            _LOG.level: 'info',
+            _LOG.message: f'hello {i}',
+            _LOG.run_id: run_id,
+            _LOG.attempt_id: attempt[_ATTEMPT.attempt_id]
+        } for i, attempt in enumerate(self.attempts)]
+        logs.append({
+            _LOG.level: 'warning',
+            _LOG.message: 'bye',
+            _LOG.run_id: self.runs[1][_RUN.run_id]
+        })
+        parse_args.return_value = {'logs': logs}
+        posted = self.resource.post()
+        self.assertEqual(3, len(posted))
+        for log, expected in zip(posted, logs):
+            self.assertEqual(log[_LOG.log_id], log[_LOG.message])
+            self.assertEqual(expected[_LOG.level], log[_LOG.level])
+            self.assertEqual(expected.get(_LOG.attempt_id),
+                             log.get(_LOG.attempt_id))
+            self.assertIn(_LOG.time_logged, log)
+
+        run = self.resource.run_database.get(run_id)
+        self.assertEqual([log[_LOG.log_id] for log in posted[:2]],
+                         run[_RUN.logs])
+        for log, attempt in zip(posted, self.attempts):
+            attempt = self.resource.attempt_database.get(
+                attempt[_ATTEMPT.attempt_id])
+            self.assertEqual([log[_LOG.log_id]], attempt[_ATTEMPT.logs])
+
+    @mock.patch(utils.PARSE_ARGS)
+    def test_invalid_log(self, parse_args):
+        """Tests that no progress log is created if any of them is
+        invalid."""
+        run_id = self.runs[0][_RUN.run_id]
+        parse_args.return_value = {
+            'logs': [{
+                _LOG.level: 'info',
+                _LOG.message: 'hello',
+                _LOG.run_id: run_id
+            }, {
+                _LOG.level: 'not-exist',
+                _LOG.message: 'hello',
+                _LOG.run_id: run_id
+            }]
+        }
+        message, code = self.resource.post()
+        self.assertEqual(403, code)
+        self.assertIn('level', message)
+        self.assertNotIn(_RUN.logs, self.resource.run_database.get(run_id))
+
+    @mock.patch(utils.PARSE_ARGS)
+    def test_attempt_not_linked_to_run(self, parse_args):
+        """Tests that POSTing a progress log with unrelated attempt_id and
+        run_id returns CONFLICT."""
+        parse_args.return_value = {
+            'logs': [{
+                _LOG.level: 'info',
+                _LOG.message: 'hello',
+                _LOG.run_id: self.runs[1][_RUN.run_id],
+                _LOG.attempt_id: self.attempts[0][_ATTEMPT.attempt_id]
+            }]
+        }
+        _, code = self.resource.post()
+        self.assertEqual(409, code)
+
+    @mock.patch(utils.PARSE_ARGS)
+    def test_too_many_logs(self, parse_args):
+        """Tests that POSTing too many progress logs at once returns
+        REQUEST ENTITY TOO LARGE."""
+        parse_args.return_value = {
+            'logs': [{
+                _LOG.level: 'info',
+                _LOG.message: 'hello',
+                _LOG.run_id: self.runs[0][_RUN.run_id]
+            }] * 201
+        }
+        _, code = self.resource.post()
+        self.assertEqual(413, code)
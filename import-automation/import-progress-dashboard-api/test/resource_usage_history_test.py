@@ -0,0 +1,92 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for resource_usage_history.py.
+"""
+
+import unittest
+from unittest import mock
+
+from test import utils
+from app.resource import import_attempt_list
+from app.resource import resource_usage_history
+from app.resource import system_run_list
+from app.model import import_attempt_model
+
+_ATTEMPT = import_attempt_model.ImportAttempt
+
+
+def setUpModule():
+    utils.EMULATOR.start_emulator()
+
+
+class ResourceUsageHistoryTest(unittest.TestCase):
+    """Tests for ResourceUsageHistory."""
+
+    def setUp(self):
+        """Injects several import attempts of two imports to the database."""
+        client = utils.create_test_datastore_client()
+        self.resource = resource_usage_history.ResourceUsageHistory(client)
+        attempt_list_resource = import_attempt_list.ImportAttemptList(client)
+        run_list_resource = system_run_list.SystemRunList(client)
+
+        attempts = []
+        for i, name in enumerate(['foo:a', 'foo:a', 'foo:b', 'foo:a']):
+            attempts.append({
+                _ATTEMPT.absolute_import_name:
+                    name,
+                _ATTEMPT.time_created:
+                    f'2020-07-0{i + 1}T00:00:00+00:00',
+                _ATTEMPT.resource_usage: [{
+                    'stage': 'scripts',
+                    'wall_time': i
+                }, {
+                    'stage': 'upload',
+                    'wall_time': 10 * i
+                }]
+            })
+        # An attempt without resource usage is omitted.
+        attempts.append({_ATTEMPT.absolute_import_name: 'foo:a'})
+        self.attempts = utils.ingest_import_attempts(run_list_resource,
+                                                     attempt_list_resource,
+                                                     attempts)
+
+    @mock.patch(utils.PARSE_ARGS,
+                lambda self: {_ATTEMPT.absolute_import_name: 'foo:a'})
+    def test_get(self):
+        """Tests that the history is in reverse chronological order."""
+        history = self.resource.get()
+        self.assertEqual([
+            self.attempts[3][_ATTEMPT.attempt_id],
+            self.attempts[1][_ATTEMPT.attempt_id],
+            self.attempts[0][_ATTEMPT.attempt_id]
+        ], [attempt[_ATTEMPT.attempt_id] for attempt in history])
+        self.assertEqual(2, len(history[0][_ATTEMPT.resource_usage]))
+
+    @mock.patch(
+        utils.PARSE_ARGS, lambda self: {
+            _ATTEMPT.absolute_import_name: 'foo:a',
+            'stage': 'upload',
+            'limit': 2
+        })
+    def test_get_stage(self):
+        """Tests filtering by stage and limiting the number of attempts."""
+        history = self.resource.get()
+        self.assertEqual([[{
+            'stage': 'upload',
+            'wall_time': 30
+        }], [{
+            'stage': 'upload',
+            'wall_time': 10
+        }]], [attempt[_ATTEMPT.resource_usage] for attempt in history])
@@ -64,6 +64,34 @@ class ValidationTest(unittest.TestCase):
         valid, _, _ = validation.is_import_attempt_valid(attempt, 'not-match')
         self.assertFalse(valid)
 
+    def test_is_resource_usage_valid(self):
+        """Tests the validation of the resource_usage field."""
+        attempt = {
+            'resource_usage': [{
+                'stage': 'scripts',
+                'wall_time': 1.5,
+                'child_peak_rss': 1024
+            }]
+        }
+        valid, _, _ = validation.is_import_attempt_valid(attempt)
+        self.assertTrue(valid)
+
+        # stage missing
+        attempt = {'resource_usage': [{'wall_time': 1.5}]}
+        valid, _, _ = validation.is_import_attempt_valid(attempt)
+        self.assertFalse(valid)
+
+        # Negative number
+        attempt = {'resource_usage': [{'stage': 'scripts', 'wall_time': -1}]}
+        valid, _, _ = validation.is_import_attempt_valid(attempt)
+        self.assertFalse(valid)
+
+        # Unknown field
+        attempt = {'resource_usage': [{'stage': 'scripts', 'foo': 1}]}
+        valid, _, code = validation.is_import_attempt_valid(attempt)
+        self.assertFalse(valid)
+        self.assertEqual(403, code)
+
     def test_is_system_run_valid(self):
         """Tests is_system_run_valid."""
         run = {
@@ -13,43 +13,175 @@
 # limitations under the License.
 """
 Class for making HTTP requests to Identity-Aware Proxy-protected applications.
+
+OpenID Connect tokens are cached until shortly before they expire and
+requests are sent through a shared session that keeps connections alive, so
+that repeated requests skip both the metadata server round trip and the TLS
+handshake.
 """
 
+import threading
+import time
+from typing import Dict
+
 import requests
+from requests import adapters
 
 import google.auth.transport.requests
+from google.auth import jwt
 from google.oauth2 import id_token
 
+# Number of connections kept alive per host by the shared session
+_POOL_MAXSIZE = 16
+
+
+class TokenCache:
+    """Thread-safe cache of OpenID Connect tokens keyed by client ID.
+
+    Tokens are refreshed refresh_margin seconds before they expire.
+    Tokens whose expiry cannot be determined are not cached.
+
+    Attributes:
+        refresh_margin: Time in seconds before the expiry of a token at
+            which it is refreshed, as a float.
+        hits: Number of tokens served from the cache, as an int.
+        misses: Number of tokens fetched, as an int.
+        fetch_time: Total time in seconds spent fetching tokens, as a float.
+    """
+
+    def __init__(self, refresh_margin: float = 300):
+        self.refresh_margin = refresh_margin
+        self.hits = 0
+        self.misses = 0
+        self.fetch_time = 0.0
+        self._lock = threading.Lock()
+        # Maps client IDs to tuples of (token, expiry in seconds since epoch)
+        self._tokens = {}
+
+    def get(self, client_id: str) -> str:
+        """Returns a token for the client ID, fetching a new one if no cached
+        token is valid for at least refresh_margin seconds.
+
+        Raises:
+            Same exceptions as google.oauth2.id_token.fetch_id_token.
+        """
+        with self._lock:
+            token, expiry = self._tokens.get(client_id, (None, 0))
+            if time.time() < expiry - self.refresh_margin:
+                self.hits += 1
+                return token
+            # Tokens are fetched with the lock held so that concurrent
+            # requests for an expired token result in only one fetch.
+            start = time.monotonic()
+            token = id_token.fetch_id_token(
+                google.auth.transport.requests.Request(), client_id)
+            self.fetch_time += time.monotonic() - start
+            self.misses += 1
+            expiry = _get_expiry(token)
+            if expiry:
+                self._tokens[client_id] = (token, expiry)
+            return token
+
+    def invalidate(self, client_id: str) -> None:
+        """Removes the cached token for the client ID, if any."""
+        with self._lock:
+            self._tokens.pop(client_id, None)
+
+    def clear(self) -> None:
+        """Removes all cached tokens."""
+        with self._lock:
+            self._tokens.clear()
+
+
+def _get_expiry(token: str) -> float:
+    """Returns the expiry of a token in seconds since epoch, or 0 if it
+    cannot be determined."""
+    try:
+        return float(jwt.decode(token, verify=False)['exp'])
+    except (ValueError, KeyError, TypeError):
+        return 0
+
+
+def create_session(pool_maxsize: int = _POOL_MAXSIZE) -> requests.Session:
+    """Creates a requests.Session that keeps up to pool_maxsize connections
+    alive per host."""
+    session = requests.Session()
+    adapter = adapters.HTTPAdapter(pool_connections=pool_maxsize,
+                                   pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_DEFAULT_TOKEN_CACHE = TokenCache()
+_DEFAULT_SESSION = create_session()
+
 
 class IAPRequest:
     """Class for making HTTP requests to Identity-Aware Proxy-protected
     applications.
 
+    By default, all IAPRequest objects share a token cache and a session.
+
     Attributes:
         client_id: Oauth client ID used to authenticate with
             Identity-Aware Proxy, as a string.
+        token_cache: TokenCache object for obtaining tokens.
+        session: requests.Session object for sending requests.
+        num_requests: Number of requests made, as an int.
+        request_time: Total time in seconds spent making requests, including
+            obtaining tokens, as a float.
     """
 
-    def __init__(self, client_id: str):
+    def __init__(self,
+                 client_id: str,
+                 token_cache: TokenCache = None,
+                 session: requests.Session = None):
         self.client_id = client_id
+        self.token_cache = token_cache or _DEFAULT_TOKEN_CACHE
+        self.session = session or _DEFAULT_SESSION
+        self.num_requests = 0
+        self.request_time = 0.0
+        self._stats_lock = threading.Lock()
 
-    def get(self, url: str, **kwargs):
+    def get(self, url: str, **kwargs) -> requests.Response:
         """Makes a GET request. See _request."""
         return self._request(url, 'GET', **kwargs)
 
-    def put(self, url: str, **kwargs):
+    def put(self, url: str, **kwargs) -> requests.Response:
         """Makes a PUT request. See _request."""
         return self._request(url, 'PUT', **kwargs)
 
-    def post(self, url: str, **kwargs):
+    def post(self, url: str, **kwargs) -> requests.Response:
         """Makes a POST request. See _request."""
         return self._request(url, 'POST', **kwargs)
 
-    def patch(self, url: str, **kwargs):
+    def patch(self, url: str, **kwargs) -> requests.Response:
         """Makes a PATCH request. See _request."""
         return self._request(url, 'PATCH', **kwargs)
 
-    def _request(self, url, method, **kwargs):
+    def get_stats(self) -> Dict:
+        """Returns the request and token cache counters as a dict.
+
+        The token counters are those of the token cache and may include
+        tokens obtained by other IAPRequest objects sharing it.
+        """
+        with self._stats_lock:
+            num_requests = self.num_requests
+            request_time = self.request_time
+        average_request_time = 0.0
+        if num_requests:
+            average_request_time = request_time / num_requests
+        return {
+            'num_requests': num_requests,
+            'request_time': request_time,
+            'average_request_time': average_request_time,
+            'token_hits': self.token_cache.hits,
+            'token_misses': self.token_cache.misses,
+            'token_fetch_time': self.token_cache.fetch_time
+        }
+
+    def _request(self, url: str, method: str, **kwargs) -> requests.Response:
         """Makes a request to an application protected by Identity-Aware Proxy.
 
         For valid values for method and kwargs, see
@@ -64,17 +196,34 @@ class IAPRequest:
             The response as a request.Response object.
 
         Raises:
+            Same exceptions as google.oauth2.id_token.fetch_id_token.
             Same exceptions as request.request.
         """
-        # Obtain an OpenID Connect (OIDC) token from metadata server or
-        # using service account.
-        google_open_id_connect_token = id_token.fetch_id_token(
-            google.auth.transport.requests.Request(), self.client_id)
+        start = time.monotonic()
+        try:
+            response = self._request_with_token(url, method, **kwargs)
+            if response.status_code == 401:
+                # The cached token may have been revoked. Retry once with a
+                # new token.
+                self.token_cache.invalidate(self.client_id)
+                response = self._request_with_token(url, method, **kwargs)
+        finally:
+            with self._stats_lock:
+                self.num_requests += 1
+                self.request_time += time.monotonic() - start
+
+        return response
+
+    def _request_with_token(self, url: str, method: str,
+                            **kwargs) -> requests.Response:
+        """Makes a request with a token from the token cache."""
+        # Obtain an OpenID Connect (OIDC) token from the cache, metadata
+        # server, or using service account.
+        google_open_id_connect_token = self.token_cache.get(self.client_id)
 
         # Fetch the Identity-Aware Proxy-protected URL, including an
         # Authorization header containing "Bearer " followed by a
         # Google-issued OpenID Connect token for the service account.
-        headers = kwargs.setdefault('headers', {})
+        headers = dict(kwargs.pop('headers', None) or {})
         headers['Authorization'] = f'Bearer {google_open_id_connect_token}'
-
-        return requests.request(method, url, **kwargs)
+        return self.session.request(method, url, headers=headers, **kwargs)
@@ -15,24 +15,20 @@
 from sys import path
 path.insert(1, '../../../')
 
-from os import remove, path as ospath
-from csv import DictReader
+from os import fstat, remove, replace, path as ospath
+from csv import DictReader, reader
+from multiprocessing import Pool
+from shutil import copyfileobj
 from urllib.request import urlopen
 
-import util.name_to_alpha2 as name_to_alpha2
-import util.alpha2_to_dcid as alpha2_to_dcid
-import util.county_to_dcid as county_to_dcid
+from util import place_resolver
+from util.sharding_writer import ShardingWriter
 
 # Dictionary that maps a row name in the CSV file is mapped to a Schema place.
 # key = CSV's row name
 # value = Schema.org place
 from config import PLACE_CATEGORIES
 
-USSTATE_TO_ALPHA2 = name_to_alpha2.USSTATE_MAP
-COUNTRY_MAP = alpha2_to_dcid.COUNTRY_MAP
-USSTATE_MAP = alpha2_to_dcid.USSTATE_MAP
-COUNTY_MAP = county_to_dcid.COUNTY_MAP
-
 
 def covid_mobility(input_path: str = 'data.csv',
                    output_path='covid_mobility_output.mcf') -> None:
@@ -54,50 +50,149 @@ def covid_mobility(input_path: str = 'data.csv',
     csv_to_mcf(input_path, output_path)
 
 
-def csv_to_mcf(input_path: str, output_path: str) -> None:
+def csv_to_mcf(input_path: str,
+               output_path: str,
+               processes: int = None,
+               chunk_size: int = 64 * 1024 * 1024,
+               shard_size: int = None) -> None:
     """Converts the Mobility data to MCF.
 
+    The CSV file is split into chunks of about chunk_size bytes at line
+    boundaries, which are converted in parallel. The output is identical to
+    converting the rows one after another.
+
     Args:
         input_path (str): The path to the CSV file containing the data.
         output_path (str): The path to write the output MCF file.
+        processes (int): Number of processes converting the chunks.
+            Defaults to the number of CPUs.
+        chunk_size (int): Approximate size in bytes of each chunk.
+        shard_size (int): If set, the output is sharded into files of about
+            this many bytes named <output_path>_<i>.mcf using ShardingWriter,
+            instead of being written to output_path.
     """
 
-    visited_dcids: set = set()
-
     # If output file already exists, remove it.
     if ospath.exists(output_path):
         remove(output_path)
 
-    # Input file.
-    f_input = open(input_path, 'r')
-    # Output file.
-    f_output = open(output_path, 'a+')
+    with open(input_path, 'rb') as f_input:
+        header_line = f_input.readline()
+        chunks = _split_into_chunks(f_input, chunk_size)
+    header = next(reader([header_line.decode('utf-8')]))
+
+    # When this script was written, there were 14 columns.
+    # If there aren't exactly 14 columns, fail.
+    if len(header) != 14:
+        raise Exception("Incompatible Google Mobility CSV file. " +
+                        "There must be exactly 14 columns in file. " +
+                        "Script must be updated!")
+
+    if shard_size:
+        f_output = ShardingWriter(output_path, shard_size=shard_size)
+    else:
+        f_output = open(output_path, 'w')
+
+    tasks = [(input_path, header, start, end) for start, end in chunks]
+    visited_dcids: set = set()
+    with f_output:
+        if len(tasks) > 1 and processes != 1:
+            with Pool(processes) as pool:
+                _write_chunks(pool.imap(_convert_chunk, tasks), f_output,
+                              visited_dcids)
+        else:
+            _write_chunks(map(_convert_chunk, tasks), f_output, visited_dcids)
+
+
+def _split_into_chunks(f_input, chunk_size: int) -> list:
+    """Splits the rest of a file into byte ranges ending at line boundaries.
+
+    Fields must not contain newlines, which holds for the Mobility data.
+
+    Args:
+        f_input: The input file opened in binary mode.
+        chunk_size (int): Approximate size in bytes of each chunk.
+
+    Returns:
+        list: (start, end) offsets of the chunks.
+    """
+    chunks = []
+    start = f_input.tell()
+    file_size = fstat(f_input.fileno()).st_size
+    while start < file_size:
+        f_input.seek(max(start + chunk_size - 1, start))
+        f_input.readline()
+        end = min(f_input.tell(), file_size)
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def _write_chunks(converted_chunks, f_output, visited_dcids: set) -> None:
+    """Writes converted chunks in order.
 
-    csv_reader: DictReader = DictReader(f_input)
+    The population nodes of a region are only written the first time the
+    region is seen across all chunks.
 
-    for row in csv_reader:
-        # When this script was written, there were 14 columns.
-        # If there aren't exactly 14 columns, fail.
+    Args:
+        converted_chunks: Iterable of the lists returned by _convert_chunk.
+        f_output: File or ShardingWriter to write the MCF to.
+        visited_dcids (set): The dcids of the regions already written.
+    """
+    for runs in converted_chunks:
+        for region_dcid, first_row, first_row_populations, rest in runs:
+            if region_dcid in visited_dcids:
+                mcf = first_row + rest
+            else:
+                visited_dcids.add(region_dcid)
+                mcf = first_row_populations + rest
+            if mcf:
+                f_output.write(mcf)
+
+
+def _convert_chunk(task: tuple) -> list:
+    """Converts the rows in a byte range of the CSV file to MCF.
+
+    Args:
+        task (tuple): The path to the CSV file, its header, and the start and
+            end offsets of the chunk.
+
+    Returns:
+        list: A (region_dcid, first_row, first_row_populations, rest) tuple
+        for each run of consecutive rows of the same region. first_row is the
+        MCF of the first row of the run, first_row_populations is the same
+        with the population nodes of the region, to be used if the region
+        has not been seen before, and rest is the MCF of the other rows.
+    """
+    input_path, header, start, end = task
+    with open(input_path, 'rb') as f_input:
+        f_input.seek(start)
+        lines = f_input.read(end - start).decode('utf-8').splitlines()
+
+    runs = []
+    dcid_cache = {}
+    current_dcid = None
+    rest = []
+
+    for row in DictReader(lines, fieldnames=header):
+        # Rows with more columns than the header have an extra None key.
         if len(row) != 14:
             raise Exception("Incompatible Google Mobility CSV file. " +
                             "There must be exactly 14 columns in file. " +
                             "Script must be updated!")
 
-        # Get the region names.
-        # If the column doesn't exist, skip the row.
-        try:
-            # metro_area is also considered a sub_region_1.
-            # They can not be combined. It's either or.
-            sub_region1: str = row['sub_region_1'] or row['metro_area']
-            sub_region2: str = row['sub_region_2']
-            country_code: str = row['country_region_code']
-            date = row['date']
-        except KeyError:
-            continue
+        # metro_area is also considered a sub_region_1.
+        # They can not be combined. It's either or.
+        sub_region1: str = row['sub_region_1'] or row['metro_area']
+        sub_region2: str = row['sub_region_2']
+        country_code: str = row['country_region_code']
+        date = row['date']
 
         # Convert the region name to a dcid/geoId.
-        region_dcid: str = _get_region_dcid(sub_region2, sub_region1,
-                                            country_code)
+        region_key = (sub_region2, sub_region1, country_code)
+        if region_key not in dcid_cache:
+            dcid_cache[region_key] = _get_region_dcid(*region_key)
+        region_dcid: str = dcid_cache[region_key]
 
         # If no dcid, skip the row.
         if not region_dcid:
@@ -107,65 +202,90 @@ def csv_to_mcf(input_path: str, output_path: str) -> None:
         if not date:
             continue
 
-        # Iterate through all places in the row.
-        for place in PLACE_CATEGORIES:
-            # Type of place using Schema notation.
-            schema_place = PLACE_CATEGORIES[place]
+        if region_dcid == current_dcid:
+            rest.append(_convert_row(row, region_dcid, date, False))
+            continue
 
-            population_id = f"{region_dcid}_{schema_place}"
-            population_id = convert_to_ascii(population_id)
+        if current_dcid:
+            runs[-1].append(''.join(rest))
+        current_dcid = region_dcid
+        rest = []
+        runs.append([
+            region_dcid,
+            _convert_row(row, region_dcid, date, False),
+            _convert_row(row, region_dcid, date, True)
+        ])
 
-            observation_id = f"{population_id}_{date}"
+    if current_dcid:
+        runs[-1].append(''.join(rest))
+    return [tuple(run) for run in runs]
 
-            try:
-                # Get the value for the current place.
-                value = row[place]
-            except KeyError:
-                continue
 
-            # If this is the first time vieweing this dcid.
-            # Write the population node for the place.
-            if region_dcid not in visited_dcids:
-                f_output.write(f"Node: {population_id}\n"
-                               "typeOf: schema:StatisticalPopulation\n"
-                               f"location: dcid:{region_dcid}\n"
-                               "populationType: dcs:PlaceVisitEvent\n"
-                               f"placeCategory: dcs:{schema_place}\n\n")
+def _convert_row(row: dict, region_dcid: str, date: str,
+                 with_populations: bool) -> str:
+    """Converts a row to MCF.
 
-            # If the value is None, skip the place.
-            if not value:
-                continue
+    Args:
+        row (dict): The row of the CSV file.
+        region_dcid (str): The dcid of the region of the row.
+        date (str): The date of the row.
+        with_populations (bool): Whether to also write the population node
+            of each place.
 
-            # Write observation node for value.
-            f_output.write(f"Node: {observation_id}\n"
-                           "typeOf: schema:Observation\n"
-                           f"observedNode: l:{population_id}\n"
-                           f'observationDate: "{date}"\n'
-                           "measuredProperty: dcs:covid19MobilityTrend\n"
-                           f"measuredValue: {value}\n"
-                           "unit: dcs:Percent\n\n")
+    Returns:
+        str: The MCF.
+    """
+    nodes = []
+
+    # Iterate through all places in the row.
+    for place, schema_place in PLACE_CATEGORIES.items():
+        population_id = f"{region_dcid}_{schema_place}"
+        population_id = convert_to_ascii(population_id)
+
+        # Write the population node for the place.
+        if with_populations:
+            nodes.append(f"Node: {population_id}\n"
+                         "typeOf: schema:StatisticalPopulation\n"
+                         f"location: dcid:{region_dcid}\n"
+                         "populationType: dcs:PlaceVisitEvent\n"
+                         f"placeCategory: dcs:{schema_place}\n\n")
+
+        # Get the value for the current place.
+        value = row[place]
+
+        # If the value is None, skip the place.
+        if not value:
+            continue
 
-        # Add dcid to the list of visited.
-        visited_dcids.add(region_dcid)
+        # Write observation node for value.
+        nodes.append(f"Node: {population_id}_{date}\n"
+                     "typeOf: schema:Observation\n"
+                     f"observedNode: l:{population_id}\n"
+                     f'observationDate: "{date}"\n'
+                     "measuredProperty: dcs:covid19MobilityTrend\n"
+                     f"measuredValue: {value}\n"
+                     "unit: dcs:Percent\n\n")
 
-    f_input.close()
-    f_output.close()
+    return ''.join(nodes)
 
 
 def _download_data(url: str, download_as: str) -> None:
     """Download the data file from the input url.
 
+    The response is streamed to disk in blocks so that the file is never
+    held in memory as a whole.
+
     Args:
         url (str): URL of the file.
         download_as (str): path to save the file.
     """
 
-    # Request data from url.
-    data: str = urlopen(url).read().decode('utf-8')
-
-    # Store the data as a download_as.
-    with open(download_as, 'w+') as input_file:
-        input_file.write(data)
+    # Write to a temporary file first so that an interrupted download
+    # does not leave a truncated file at download_as.
+    tmp_path = download_as + '.tmp'
+    with urlopen(url) as response, open(tmp_path, 'wb') as input_file:
+        copyfileobj(response, input_file, 1024 * 1024)
+    replace(tmp_path, download_as)
 
 
 def _get_region_dcid(sub_region_2: str, sub_region_1: str,
@@ -179,48 +299,10 @@ def _get_region_dcid(sub_region_2: str, sub_region_1: str,
         country_code (str): Country Code. Examples: ES, US.
 
     Returns:
-        str: the dcid of the region.
+        str: the dcid of the region, or None if it can not be resolved.
+        Only US sub-regions are resolved.
     """
-
-    # Get rid of sub_region_1 whitespaces.
-    # Hashmap keys don't contain whitespaces.
-    sub_region_1 = sub_region_1.replace(" ", "")
-
-    if sub_region_1:
-        # Only US sub-regions are allowed.
-        if country_code != 'US' or sub_region_1 not in USSTATE_TO_ALPHA2:
-            return None
-
-        # Convert the State name to Alpha2.
-        # Example: Florida->FL.
-        sub_region_1_alpha2 = USSTATE_TO_ALPHA2[sub_region_1]
-
-    # If the sub_region_1 is not a key in COUNTY_MAP.
-    if sub_region_2 and sub_region_1_alpha2 not in COUNTY_MAP:
-        print("sub_region_1_alpha2 not in COUNTY_MAP")
-        return None
-
-    # If the sub_region_1_alpha2 is not a key in COUNTY_MAP[State].
-    if sub_region_2 and sub_region_2 not in COUNTY_MAP[sub_region_1_alpha2]:
-        print(sub_region_2)
-        print("sub_region_2 not in COUNTY_MAP[sub_region_1_alpha2]")
-        return None
-
-    # If the sub_region_1_alpha2 is not a key in USSATE_MAP.
-    if sub_region_1 and sub_region_1_alpha2 not in USSTATE_MAP:
-        print("sub_region_1 and sub_region_1_alpha2 not in USSTATE_MAP")
-        return None
-
-    # Counties.
-    if sub_region_2:
-        dcid = COUNTY_MAP[sub_region_1_alpha2][sub_region_2]
-    # States or Provinces.
-    elif sub_region_1:
-        dcid = USSTATE_MAP[sub_region_1_alpha2]
-    # Countries.
-    else:
-        dcid = COUNTRY_MAP[country_code]
-    return dcid
+    return place_resolver.resolve(country_code, sub_region_1, sub_region_2)
 
 
 def convert_to_ascii(string: str) -> str:
@@ -12,9 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import tempfile
 import unittest
 from covidmobility import csv_to_mcf
-from os import path
+from os import listdir, path
 
 
 class TestCovidMobility(unittest.TestCase):
@@ -36,6 +37,38 @@ class TestCovidMobility(unittest.TestCase):
         """Tests a row with an empty date."""
         self._test_mcf_output('./tests/test4')
 
+    def test_chunks(self):
+        """Tests that converting small chunks in parallel gives the same
+        output, including regions spanning several chunks."""
+        for test in ('test1', 'test2', 'test3', 'test4'):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                output_path = path.join(tmp_dir, "output.mcf")
+                csv_to_mcf(path.join('./tests', test, 'data.csv'),
+                           output_path,
+                           processes=2,
+                           chunk_size=1)
+                with open(output_path) as actual_f:
+                    actual = actual_f.read()
+            with open(path.join('./tests', test, 'expected.mcf')) as f:
+                self.assertEqual(actual, f.read())
+
+    def test_shards(self):
+        """Tests that the output is sharded in order."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            base_path = path.join(tmp_dir, "output")
+            csv_to_mcf('./tests/test2/data.csv',
+                       base_path,
+                       chunk_size=1,
+                       shard_size=1024)
+            shards = sorted(listdir(tmp_dir), key=lambda name: int(name[7:-4]))
+            self.assertGreater(len(shards), 1)
+            actual = ''
+            for shard in shards:
+                with open(path.join(tmp_dir, shard)) as actual_f:
+                    actual += actual_f.read()
+        with open('./tests/test2/expected.mcf') as expected_f:
+            self.assertEqual(actual, expected_f.read())
+
     def _test_mcf_output(self, dir_path: str):
         """Generates an MCF file, given an input data file.
         Compares the expected.mcf to the output.mcf file
@@ -25,14 +25,24 @@ import itertools
 import requests
 import zipfile
 import io
+import csv
+import json
+import os
 import time
-import re
+from concurrent import futures
 
 FLAGS = flags.FLAGS
 flags.DEFINE_boolean("fetchFromSource", False,
                      "Whether to bypass cached CSVs and fetch from source.")
 flags.DEFINE_string("indicatorSchemaFile", None,
                     "Path to indicator schema CSV file.")
+flags.DEFINE_integer("maxWorkers", 8,
+                     "Number of countries to fetch concurrently.")
+flags.DEFINE_string(
+    "sourceCacheDir", "source_cache",
+    "Directory to cache the downloaded ZIP files in. Cached files are "
+    "revalidated with the server and only downloaded again if they changed. "
+    "Set to empty to disable the cache.")
 
 # Remaps the columns provided by World Bank API.
 WORLDBANK_COL_REMAP = {
@@ -64,7 +74,11 @@ measurementDenominator: dcs:{measurementDenominator}
 """
 
 
-def read_worldbank(iso3166alpha3, fetchFromSource):
+def read_worldbank(iso3166alpha3,
+                   fetchFromSource,
+                   session=None,
+                   cache_dir=None,
+                   indicators_to_keep=None):
     """ Fetches and tidies all ~1500 World Bank indicators
         for a given ISO 3166 alpha 3 code.
 
@@ -76,9 +90,20 @@ def read_worldbank(iso3166alpha3, fetchFromSource):
 
         Args:
             iso3166alpha3: ISO 3166 alpha 3 for a country, as a string.
+            fetchFromSource: Whether to fetch from the World Bank API instead
+                of reading the preprocessed CSV, as a bool.
+            session: requests.Session to reuse connections with. Defaults to
+                a new connection per request.
+            cache_dir: Directory to cache the ZIP file in, as a string. See
+                fetch_country_zip.
+            indicators_to_keep: Indicator codes to keep, as a collection of
+                strings. Rows of other indicators are dropped after the
+                preprocessed CSV is written, so that the CSV keeps all
+                indicators for later runs with other indicators. Defaults to
+                all indicators.
 
         Returns:
-            A tidied pandas dataframe with all indicator codes for a particular
+            A tidied pandas dataframe with the indicator codes for a particular
             country in the format of (country, indicator, year, value).
 
         Notes:
@@ -86,18 +111,8 @@ def read_worldbank(iso3166alpha3, fetchFromSource):
             tidy one country in a Jupyter notebook.
     """
     if fetchFromSource:
-        logging.info('Downloading %s', iso3166alpha3)
-        country_zip = ("http://api.worldbank.org/v2/en/country/" +
-                       iso3166alpha3 + "?downloadformat=csv")
-        r = retry_call(requests.get,
-                       fargs=[country_zip],
-                       tries=3,
-                       delay=20,
-                       backoff=1.5)
-        if r.status_code != 200:
-            logging.info('Failed to retrieve %s', iso3166alpha3)
-
-        filebytes = io.BytesIO(r.content)
+        filebytes = io.BytesIO(
+            fetch_country_zip(iso3166alpha3, session, cache_dir))
         myzipfile = zipfile.ZipFile(filebytes)
 
         # We need to select the data file which starts with "API",
@@ -110,22 +125,8 @@ def read_worldbank(iso3166alpha3, fetchFromSource):
         assert file_to_open is not None, \
             "Failed to find data for" + iso3166alpha3
 
-        df = None
-        # Captures any text contained in double quotatations.
-        line_match = re.compile(r"\"([^\"]*)\"")
-
-        for line in myzipfile.open(file_to_open).readlines():
-            # Cells are contained in quotations and comma separated.
-            cols = line_match.findall(line.decode("utf-8"))
-
-            # CSVs include header informational lines which should be ignored.
-            if len(cols) > 2:
-                # Use first row as the header.
-                if df is None:
-                    df = pd.DataFrame(columns=cols)
-                else:
-                    df = df.append(pd.DataFrame([cols], columns=df.columns),
-                                   ignore_index=True)
+        with myzipfile.open(file_to_open) as data_file:
+            df = _parse_worldbank_csv(data_file)
 
         df = df.rename(columns=WORLDBANK_COL_REMAP)
 
@@ -137,16 +138,128 @@ def read_worldbank(iso3166alpha3, fetchFromSource):
         df.name = "Value"
         df = df.reset_index()
 
-        # Convert to numeric and drop empty values.
-        df['Value'] = pd.to_numeric(df['Value'])
-        df = df.dropna()
+        # Drop empty values.
+        df = df.dropna(subset=['Value'])
         df.to_csv('preprocessed_source_csv/' + iso3166alpha3 + '.csv',
                   index=False)
     else:
         df = pd.read_csv('preprocessed_source_csv/' + iso3166alpha3 + '.csv')
+
+    if indicators_to_keep is not None:
+        df = df[df['IndicatorCode'].isin(indicators_to_keep)]
     return df
 
 
+def _parse_worldbank_csv(data_file):
+    """ Parses a World Bank API CSV file in the wide format.
+
+        The informational lines before the header are skipped and the rest of
+        the file is handed to the CSV parser at once.
+
+        Args:
+            data_file: The CSV file, as a binary file object.
+
+        Returns:
+            A pandas dataframe with a string column for each of Country Name,
+            Country Code, Indicator Name and Indicator Code, and a float column
+            for each year.
+    """
+    lines = io.TextIOWrapper(data_file, encoding='utf-8-sig')
+    for header in lines:
+        if header.startswith('"Country Name"'):
+            break
+    else:
+        raise ValueError('Missing header in World Bank CSV')
+
+    # Lines end with a comma, which adds a column without a name.
+    columns = [column for column in next(csv.reader([header])) if column]
+    id_columns = columns[:4]
+    year_columns = columns[4:]
+
+    dtypes = {column: str for column in id_columns}
+    dtypes.update({column: 'float64' for column in year_columns})
+    return pd.read_csv(io.StringIO(header + lines.read()),
+                       usecols=columns,
+                       dtype=dtypes,
+                       keep_default_na=False,
+                       na_values={column: [''] for column in year_columns})
+
+
+def fetch_country_zip(iso3166alpha3, session=None, cache_dir=None):
+    """ Downloads the ZIP file with all indicators for a country.
+
+        If cache_dir is set, the file is stored in <cache_dir>/<alpha 3>.zip
+        along with the ETag and Last-Modified headers of the response in
+        <cache_dir>/<alpha 3>.json. Later calls revalidate the cached file
+        with a conditional request and only download it again if it changed.
+        A cache entry with unreadable metadata is downloaded again.
+
+        Args:
+            iso3166alpha3: ISO 3166 alpha 3 for a country, as a string.
+            session: requests.Session to reuse connections with. Defaults to
+                a new connection per request.
+            cache_dir: Directory to cache the ZIP file in, as a string.
+
+        Returns:
+            Content of the ZIP file, as bytes.
+    """
+    country_zip = ("http://api.worldbank.org/v2/en/country/" + iso3166alpha3 +
+                   "?downloadformat=csv")
+    headers = {}
+    if cache_dir:
+        zip_path = os.path.join(cache_dir, iso3166alpha3 + '.zip')
+        metadata_path = os.path.join(cache_dir, iso3166alpha3 + '.json')
+        if os.path.exists(zip_path) and os.path.exists(metadata_path):
+            try:
+                with open(metadata_path) as f_in:
+                    metadata = json.load(f_in)
+            except (OSError, ValueError):
+                logging.warning('Ignoring corrupt cache entry for %s',
+                                iso3166alpha3)
+                metadata = {}
+            if metadata.get('etag'):
+                headers['If-None-Match'] = metadata['etag']
+            if metadata.get('last_modified'):
+                headers['If-Modified-Since'] = metadata['last_modified']
+
+    logging.info('Downloading %s', iso3166alpha3)
+    r = retry_call(_get,
+                   fargs=[session or requests, country_zip, headers],
+                   tries=3,
+                   delay=20,
+                   backoff=1.5)
+
+    if r.status_code == 304:
+        logging.info('%s has not changed, using cached copy', iso3166alpha3)
+        with open(zip_path, 'rb') as f_in:
+            return f_in.read()
+
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write the ZIP file before its metadata, so that a partially
+        # written cache entry is never revalidated.
+        with open(zip_path + '.tmp', 'wb') as f_out:
+            f_out.write(r.content)
+        os.replace(zip_path + '.tmp', zip_path)
+        with open(metadata_path + '.tmp', 'w') as f_out:
+            json.dump(
+                {
+                    'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified')
+                }, f_out)
+        os.replace(metadata_path + '.tmp', metadata_path)
+    return r.content
+
+
+def _get(session, url, headers):
+    """ Sends a GET request, raising requests.HTTPError on error statuses so
+        that retry_call retries them. """
+    r = session.get(url, headers=headers, timeout=300)
+    if r.status_code != 304:
+        r.raise_for_status()
+    return r
+
+
 def build_stat_vars_from_indicator_list(row):
     """ Generates World Bank StatVar for a row in the indicators dataframe. """
 
@@ -241,38 +354,52 @@ def group_stat_vars_by_observation_properties(indicator_codes):
     return tmcfs_for_stat_vars
 
 
-def download_indicator_data(worldbank_countries, indicator_codes,
-                            fetchFromSource):
+def download_indicator_data(worldbank_countries,
+                            indicator_codes,
+                            fetchFromSource,
+                            max_workers=1,
+                            cache_dir=None):
     """ Downloads World Bank country data for all countries and
             indicators provided.
 
-        Retains only the unique indicator codes provided.
+        Retains only the unique indicator codes provided. Countries are
+        fetched concurrently over a shared connection pool.
 
         Args:
             worldbank_countries: Dataframe with ISO 3166 alpha 3 code for each
                 country.
             indicator_code: Dataframe with INDICATOR_CODES to include.
+            fetchFromSource: Whether to fetch from the World Bank API, as a
+                bool.
+            max_workers: Number of countries to fetch concurrently, as an int.
+            cache_dir: Directory to cache the downloaded ZIP files in, as a
+                string. See fetch_country_zip.
 
         Returns:
             worldbank_dataframe: A tidied pandas dataframe where each row has
             the format (indicator code, ISO 3166 alpha 3, year, value)
             for all countries and all indicators provided.
     """
-    worldbank_dataframe = pd.DataFrame()
     indicators_to_keep = list(indicator_codes['IndicatorCode'].unique())
 
-    for index, country_code in enumerate(worldbank_countries['ISO3166Alpha3']):
-        country_df = read_worldbank(country_code, fetchFromSource)
-
-        # Remove unneccessary indicators.
-        country_df = country_df[country_df['IndicatorCode'].isin(
-            indicators_to_keep)]
+    def read_country(country_code):
+        # Unneccessary indicators are removed after reading.
+        country_df = read_worldbank(country_code, fetchFromSource, session,
+                                    cache_dir, indicators_to_keep).copy()
 
         # Map country codes to ISO.
         country_df['ISO3166Alpha3'] = country_code
-
-        # Add new row to main datframe.
-        worldbank_dataframe = worldbank_dataframe.append(country_df)
+        return country_df
+
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        with futures.ThreadPoolExecutor(max_workers) as executor:
+            # Concatenate all countries at once, in order.
+            worldbank_dataframe = pd.concat(
+                executor.map(read_country,
+                             worldbank_countries['ISO3166Alpha3']))
 
     # Map indicator codes to unique Statistical Variable.
     worldbank_dataframe['StatisticalVariable'] = (
@@ -392,7 +519,9 @@ def main(_):
     worldbank_countries = pd.read_csv("WorldBankCountries.csv")
     worldbank_dataframe = download_indicator_data(worldbank_countries,
                                                   indicator_codes,
-                                                  FLAGS.fetchFromSource)
+                                                  FLAGS.fetchFromSource,
+                                                  FLAGS.maxWorkers,
+                                                  FLAGS.sourceCacheDir)
 
     # Remap columns to match expected format.
     worldbank_dataframe['Value'] = pd.to_numeric(worldbank_dataframe['Value'])
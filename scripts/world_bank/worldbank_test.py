@@ -0,0 +1,255 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests the worldbank.py script.
+
+    Typical usage:
+
+    python3 worldbank_test.py
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+
+import pandas as pd
+
+# Allows the following module import to work when running as a script
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import worldbank
+
+# _MODULE_DIR is the path to where this test is running from.
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_TEST_DATA_DIR = os.path.join(_MODULE_DIR, 'test_data')
+
+_TEST_CSV = 'API_ABW_DS2_en_csv_v2.csv'
+
+
+def _make_zip():
+    """Returns a World Bank country ZIP file with the test CSV, as bytes."""
+    zip_bytes = io.BytesIO()
+    with zipfile.ZipFile(zip_bytes, 'w') as zip_file:
+        zip_file.writestr('Metadata_Indicator_API_ABW_DS2_en_csv_v2.csv',
+                          'unused')
+        zip_file.write(os.path.join(_TEST_DATA_DIR, _TEST_CSV), _TEST_CSV)
+    return zip_bytes.getvalue()
+
+
+def _make_response(status_code, content=b'', headers=None):
+    response = mock.MagicMock()
+    response.status_code = status_code
+    response.content = content
+    response.headers = headers or {}
+    return response
+
+
+class ParseWorldBankCSVTest(unittest.TestCase):
+
+    def test_parse(self):
+        with open(os.path.join(_TEST_DATA_DIR, _TEST_CSV), 'rb') as data_file:
+            df = worldbank._parse_worldbank_csv(data_file)
+
+        self.assertEqual([
+            'Country Name', 'Country Code', 'Indicator Name', 'Indicator Code',
+            '2017', '2018', '2019'
+        ], list(df.columns))
+        self.assertEqual(['SP.POP.TOTL', 'SP.DYN.LE00.IN', 'SL.UEM.TOTL.ZS'],
+                         list(df['Indicator Code']))
+        self.assertEqual('Unemployment, total (% of total labor force)',
+                         df['Indicator Name'][2])
+        self.assertEqual(105845.0, df['2018'][0])
+        self.assertEqual(76.152, df['2018'][1])
+        self.assertTrue(pd.isna(df['2019'][1]))
+        self.assertTrue(df.loc[2, ['2017', '2018', '2019']].isna().all())
+
+    def test_missing_header(self):
+        data_file = io.BytesIO(b'"Data Source","World Development Indicators"')
+        self.assertRaises(ValueError, worldbank._parse_worldbank_csv, data_file)
+
+
+class ReadWorldBankTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        os.mkdir('preprocessed_source_csv')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    @mock.patch('worldbank.fetch_country_zip')
+    def test_cache_keeps_all_indicators(self, fetch_country_zip):
+        fetch_country_zip.return_value = _make_zip()
+
+        df = worldbank.read_worldbank('ABW',
+                                      True,
+                                      indicators_to_keep=['SP.POP.TOTL'])
+        self.assertEqual({'SP.POP.TOTL'}, set(df['IndicatorCode']))
+        self.assertEqual(['2017', '2018', '2019'], list(df['year']))
+        self.assertEqual([105366.0, 105845.0, 106314.0], list(df['Value']))
+
+        # A later run with other indicators reads them from the cache.
+        df = worldbank.read_worldbank('ABW',
+                                      False,
+                                      indicators_to_keep=['SP.DYN.LE00.IN'])
+        self.assertEqual({'SP.DYN.LE00.IN'}, set(df['IndicatorCode']))
+        self.assertEqual([76.01, 76.152], list(df['Value']))
+
+        cached = pd.read_csv('preprocessed_source_csv/ABW.csv')
+        self.assertEqual({'SP.POP.TOTL', 'SP.DYN.LE00.IN'},
+                         set(cached['IndicatorCode']))
+
+
+class FetchCountryZipTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_revalidate(self):
+        session = mock.MagicMock()
+        session.get.side_effect = [
+            _make_response(200, b'zip', {
+                'ETag': '"v1"',
+                'Last-Modified': 'Wed, 01 Jul 2020 00:00:00 GMT'
+            }),
+            _make_response(304)
+        ]
+
+        self.assertEqual(
+            b'zip', worldbank.fetch_country_zip('ABW', session, self.cache_dir))
+        _, kwargs = session.get.call_args
+        self.assertEqual({}, kwargs['headers'])
+        with open(os.path.join(self.cache_dir, 'ABW.json')) as f_in:
+            self.assertEqual(
+                {
+                    'etag': '"v1"',
+                    'last_modified': 'Wed, 01 Jul 2020 00:00:00 GMT'
+                }, json.load(f_in))
+
+        # The server reports the file has not changed.
+        self.assertEqual(
+            b'zip', worldbank.fetch_country_zip('ABW', session, self.cache_dir))
+        _, kwargs = session.get.call_args
+        self.assertEqual(
+            {
+                'If-None-Match': '"v1"',
+                'If-Modified-Since': 'Wed, 01 Jul 2020 00:00:00 GMT'
+            }, kwargs['headers'])
+        self.assertEqual([], [
+            name for name in os.listdir(self.cache_dir) if name.endswith('.tmp')
+        ])
+
+    def test_changed(self):
+        session = mock.MagicMock()
+        session.get.side_effect = [
+            _make_response(200, b'v1', {'ETag': '"v1"'}),
+            _make_response(200, b'v2', {'ETag': '"v2"'})
+        ]
+
+        worldbank.fetch_country_zip('ABW', session, self.cache_dir)
+        self.assertEqual(
+            b'v2', worldbank.fetch_country_zip('ABW', session, self.cache_dir))
+        with open(os.path.join(self.cache_dir, 'ABW.zip'), 'rb') as f_in:
+            self.assertEqual(b'v2', f_in.read())
+
+    def test_corrupt_metadata(self):
+        os.makedirs(self.cache_dir)
+        with open(os.path.join(self.cache_dir, 'ABW.zip'), 'wb') as f_out:
+            f_out.write(b'stale')
+        with open(os.path.join(self.cache_dir, 'ABW.json'), 'w') as f_out:
+            f_out.write('{"etag": ')
+        session = mock.MagicMock()
+        session.get.return_value = _make_response(200, b'zip', {'ETag': '"v1"'})
+
+        self.assertEqual(
+            b'zip', worldbank.fetch_country_zip('ABW', session, self.cache_dir))
+        _, kwargs = session.get.call_args
+        self.assertEqual({}, kwargs['headers'])
+        with open(os.path.join(self.cache_dir, 'ABW.json')) as f_in:
+            self.assertEqual('"v1"', json.load(f_in)['etag'])
+
+    def test_no_cache(self):
+        session = mock.MagicMock()
+        session.get.return_value = _make_response(200, b'zip')
+
+        self.assertEqual(b'zip', worldbank.fetch_country_zip('ABW', session))
+        _, kwargs = session.get.call_args
+        self.assertEqual({}, kwargs['headers'])
+
+
+class DownloadIndicatorDataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        os.mkdir('preprocessed_source_csv')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    @mock.patch('requests.Session')
+    def test_concurrent_fetch(self, session_cls):
+        countries = ['ABW', 'AFG', 'AGO', 'ALB']
+        zip_content = _make_zip()
+        lock = threading.Lock()
+        all_started = threading.Barrier(len(countries), timeout=10)
+        thread_names = set()
+
+        def get(url, headers, timeout):
+            with lock:
+                thread_names.add(threading.current_thread().name)
+            # Only returns once all countries are being fetched at once.
+            all_started.wait()
+            return _make_response(200, zip_content)
+
+        session = session_cls.return_value.__enter__.return_value
+        session.get.side_effect = get
+
+        df = worldbank.download_indicator_data(
+            pd.DataFrame({'ISO3166Alpha3': countries}),
+            pd.DataFrame({'IndicatorCode': ['SP.POP.TOTL', 'SP.POP.TOTL']}),
+            True,
+            max_workers=len(countries))
+
+        self.assertEqual(len(countries), session.get.call_count)
+        self.assertEqual(len(countries), len(thread_names))
+        # Countries are concatenated in order.
+        self.assertEqual([code for code in countries for _ in range(3)],
+                         list(df['ISO3166Alpha3']))
+        self.assertEqual({'SP.POP.TOTL'}, set(df['IndicatorCode']))
+        self.assertEqual({'WorldBank/SP_POP_TOTL'},
+                         set(df['StatisticalVariable']))
+        self.assertEqual(['2017', '2018', '2019'] * len(countries),
+                         list(df['Year']))
+        for country in countries:
+            self.assertTrue(
+                os.path.exists(
+                    os.path.join('preprocessed_source_csv', country + '.csv')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,9 +32,19 @@ import re
 
 import logging
 
+_VAR_REGEX = re.compile(r'\{(.*?)\}')
+_PV_LINE_REGEX = re.compile(r'\{p[0-9]\}:\s\{v[0-9]\}')
+_NAME_LINE_PREFIXES = ('Node: ', 'observedNode: ')
+
 
 class Filler:
-    """Helper class for filling in MCF Templates and removing unused PVs."""
+    """Helper class for filling in MCF Templates and removing unused PVs.
+
+    The template is parsed once into a list of lines and the variables they
+    use. The pruned template for each distinct set of variables present in
+    the dicts to fill is built on first use and memoized, so filling many
+    dicts with the same keys only costs a `format_map` call per dict.
+    """
 
     def __init__(self, template, required_vars=None):
         for node in template.strip().split('\n\n'):
@@ -43,35 +53,40 @@ class Filler:
                 raise ValueError(
                     'Each node in template must start with Node: <name>".')
         self._template = template
-        self._required_vars = required_vars
+        self._required_vars = set(required_vars or ())
+        self._lines = self._compile()
+        self._vars = frozenset(
+            var for _, line_vars, _ in self._lines for var in line_vars)
+        # Maps frozensets of present variables to pruned templates.
+        self._pruned_templates = {}
 
-    def _validate_and_prune(self, template_dict):
-        """Validate template and remove lines with missing optional variables."""
-        template_copy = []
+    def _compile(self):
+        """Parses the template into a list of (line, variables, is_name_line)
+        tuples, one for each non-empty line."""
+        lines = []
         for line in self._template.split('\n'):
             line = line.strip()
             if not line:
                 # Exclude empty lines.
                 continue
-            matches = re.findall(r'\{(.*?)\}', line)
-            if not matches:
-                # Completed line.
-                template_copy.append(line)
-                continue
-            if not (line.startswith(('Node: ', 'observedNode: ')) or
-                    re.fullmatch(r'\{p[0-9]\}:\s\{v[0-9]\}', line)):
+            matches = _VAR_REGEX.findall(line)
+            is_name_line = line.startswith(_NAME_LINE_PREFIXES)
+            if matches and not (is_name_line or _PV_LINE_REGEX.fullmatch(line)):
                 assert (len(set(matches)) == 1
                        ), 'Line should have only 1 var:\n%s' % line
+            lines.append((line, tuple(matches), is_name_line))
+        return lines
+
+    def _validate_and_prune(self, present_vars):
+        """Validate template and remove lines with missing optional variables."""
+        template_copy = []
+        for line, line_vars, is_name_line in self._lines:
             write_line = True
-            for template_var in matches:
-                if template_var in template_dict:
-                    if not isinstance(template_dict[template_var],
-                                      (int, float)):
-                        assert template_dict[
-                            template_var], 'Non-truthy value: %s' % template_var
-                    # Non-mval variable is present with truthy value.
-                elif template_var not in self._required_vars:
-                    if line.startswith(('Node: ', 'observedNode: ')):
+            for template_var in line_vars:
+                if template_var in present_vars:
+                    continue
+                if template_var not in self._required_vars:
+                    if is_name_line:
                         # Remove from template.
                         line = line.replace('{%s}' % template_var, '')
                     else:
@@ -89,10 +104,22 @@ class Filler:
                 template_copy.append(line)
         return template_copy
 
+    def _get_pruned_template(self, template_dict):
+        """Returns the pruned template for the variables in template_dict."""
+        present_vars = self._vars.intersection(template_dict)
+        for template_var in present_vars:
+            value = template_dict[template_var]
+            if not isinstance(value, (int, float)):
+                assert value, 'Non-truthy value: %s' % template_var
+        pruned = self._pruned_templates.get(present_vars)
+        if pruned is None:
+            pruned = '\n'.join(self._validate_and_prune(present_vars))
+            self._pruned_templates[present_vars] = pruned
+        return pruned
+
     def fill(self, template_dict):
         """Fill in the template with provided dict and return the MCF."""
-        template_lines = self._validate_and_prune(template_dict)
-        final_template = '\n'.join(template_lines)
+        final_template = self._get_pruned_template(template_dict)
         try:
             mcf = final_template.format_map(template_dict)
         except KeyError:
@@ -100,3 +127,15 @@ class Filler:
                           final_template, template_dict)
             raise
         return '%s\n' % mcf
+
+    def fill_many(self, template_dicts):
+        """Fill in the template with each dict in an iterable.
+
+        Args:
+            template_dicts: Iterable of dicts, e.g., a generator of CSV rows.
+
+        Yields:
+            The MCF for each dict, in order.
+        """
+        for template_dict in template_dicts:
+            yield self.fill(template_dict)
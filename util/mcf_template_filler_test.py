@@ -208,6 +208,63 @@ location: dcid:badPlace
         with self.assertRaises(ValueError):
             mcf_template_filler.Filler(POP_TEMPLATE + bad_node)
 
+    def test_fill_many(self):
+        templater = mcf_template_filler.Filler(
+            OBS_TEMPLATE, required_vars=['year', 'mprop', 'mval'])
+        rows = [{
+            'geo_id': 'geoId/06',
+            'year': str(year),
+            'mprop': 'count',
+            'mval': year - 2000
+        } for year in (2000, 2001)]
+        rows.append({'year': '2002', 'mprop': 'count', 'mval': 5})
+        result = list(templater.fill_many(rows))
+
+        expected = [
+            """
+Node: Obs_on_Pop_payroll_est_geoId/06____2000_count
+typeOf: schema:Observation
+observedNode: l:Pop_payroll_est_geoId/06___
+observationDate: "2000"
+measuredProperty: dcs:count
+measuredValue: 0
+""", """
+Node: Obs_on_Pop_payroll_est_geoId/06____2001_count
+typeOf: schema:Observation
+observedNode: l:Pop_payroll_est_geoId/06___
+observationDate: "2001"
+measuredProperty: dcs:count
+measuredValue: 1
+""", """
+Node: Obs_on_Pop_payroll_est_____2002_count
+typeOf: schema:Observation
+observedNode: l:Pop_payroll_est____
+observationDate: "2002"
+measuredProperty: dcs:count
+measuredValue: 5
+"""
+        ]
+        self.assertEqual(result, expected)
+        # Rows with the same keys share a pruned template.
+        self.assertEqual(len(templater._pruned_templates), 2)
+
+    def test_non_truthy_value(self):
+        templater = mcf_template_filler.Filler(POP_TEMPLATE)
+        with self.assertRaises(AssertionError):
+            templater.fill({'geo_id': 'geoId/06', 'naics_code': ''})
+
+    def test_no_required_vars(self):
+        templater = mcf_template_filler.Filler(
+            NAMELESS_OBS_TEMPLATE.replace('typeOf', 'Node: Obs\ntypeOf'))
+        result = templater.fill({'year': '2000'})
+        expected = """
+Node: Obs
+typeOf: schema:Observation
+observedNode: l:Pop_payroll_est____
+observationDate: "2000"
+"""
+        self.assertEqual(result, expected)
+
 
 if __name__ == '__main__':
     unittest.main()
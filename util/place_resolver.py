@@ -0,0 +1,261 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Resolves countries, US states and US counties to their dcids.
+
+Lookups are served from a sorted index built once from the alpha2_to_dcid,
+name_to_alpha2 and county_to_dcid maps and memory-mapped on first use, so
+importing this module does not load the maps and later processes skip
+compiling them altogether. The index is stored in ~/.cache/datacommons, or in
+$DC_PLACE_INDEX_DIR if set, under a name derived from the contents of the
+maps, so it is rebuilt whenever they change.
+
+Names are normalized by removing whitespace and ignoring case, so
+'District of Columbia' and 'DistrictOfColumbia' resolve to the same state.
+
+Usage:
+
+    place_resolver.resolve('US', 'Florida', 'Miami-Dade County')
+    # 'geoId/12086'
+
+    df['dcid'] = place_resolver.resolve_many(df['country_code'],
+                                             df['state'], df['county'])
+"""
+
+import array
+import functools
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+
+_MAGIC = b'DCPLACE1'
+_HEADER = struct.Struct('<8sI')
+_SEPARATOR = '|'
+_SOURCES = ('alpha2_to_dcid.py', 'name_to_alpha2.py', 'county_to_dcid.py')
+
+
+def normalize_name(name):
+    """Returns a name without whitespace and in case-folded form."""
+    return ''.join(name.split()).casefold()
+
+
+def make_key(country_code, sub_region_1='', sub_region_2=''):
+    """Returns the index key of a place.
+
+    Args:
+        country_code: Alpha2 code of the country.
+        sub_region_1: Name of the US state, or empty for a country.
+        sub_region_2: Name of the US county, or empty for a country or state.
+    """
+    parts = [country_code.strip().upper()]
+    if sub_region_1:
+        parts.append(normalize_name(sub_region_1))
+    if sub_region_2:
+        parts.append(normalize_name(sub_region_2))
+    return _SEPARATOR.join(parts)
+
+
+def build_entries():
+    """Returns a dict from index key to dcid built from the util maps.
+
+    Raises:
+        ValueError: Two names normalize to the same key but map to
+            different dcids.
+    """
+    # pylint: disable=import-outside-toplevel
+    from util import alpha2_to_dcid
+    from util import county_to_dcid
+    from util import name_to_alpha2
+
+    entries = {}
+
+    def add(key, dcid):
+        if entries.setdefault(key, dcid) != dcid:
+            raise ValueError('Conflicting dcids for %s: %s and %s' %
+                             (key, entries[key], dcid))
+
+    for alpha2, dcid in alpha2_to_dcid.COUNTRY_MAP.items():
+        add(make_key(alpha2), dcid)
+    for name, alpha2 in name_to_alpha2.USSTATE_MAP.items():
+        if alpha2 in alpha2_to_dcid.USSTATE_MAP:
+            add(make_key('US', name), alpha2_to_dcid.USSTATE_MAP[alpha2])
+        for county, dcid in county_to_dcid.COUNTY_MAP.get(alpha2, {}).items():
+            add(make_key('US', name, county), dcid)
+    return entries
+
+
+def build_index(entries):
+    """Serializes a dict from key to dcid into the index format.
+
+    The index consists of a header with the number of entries, an array of
+    native unsigned ints with the offset of each entry, and the entries
+    'key\\tdcid\\n' sorted by key.
+    """
+    offsets = array.array('I')
+    data = bytearray()
+    for key in sorted(entry.encode('utf-8') for entry in entries):
+        offsets.append(len(data))
+        data += key + b'\t' + entries[key.decode('utf-8')].encode('utf-8')
+        data += b'\n'
+    return _HEADER.pack(_MAGIC, len(offsets)) + offsets.tobytes() + data
+
+
+class PlaceResolver:
+    """Resolves places to dcids using a memory-mapped index.
+
+    The index is loaded on the first lookup.
+    """
+
+    def __init__(self, index_path=None):
+        """Constructs a PlaceResolver.
+
+        Args:
+            index_path: Path to the index file. It is built if it does not
+                exist. Defaults to a file in the cache directory.
+        """
+        self._index_path = index_path
+        self._buffer = None
+        self._offsets = None
+        self._data_start = 0
+
+    def resolve(self, country_code, sub_region_1='', sub_region_2=''):
+        """Returns the dcid of a place, or None if it is not found.
+
+        Args:
+            country_code: Alpha2 code of the country.
+            sub_region_1: Name of the US state, or empty for a country.
+            sub_region_2: Name of the US county, or empty for a country or
+                state.
+        """
+        return self.lookup(make_key(country_code, sub_region_1, sub_region_2))
+
+    def resolve_many(self,
+                     country_codes,
+                     sub_regions_1=None,
+                     sub_regions_2=None):
+        """Resolves places given as parallel sequences, such as pandas
+        columns.
+
+        Each distinct place is only looked up once. Values that are not
+        strings, such as None and NaN, are treated as empty.
+
+        Returns:
+            A list of dcids, with None for places that are not found.
+        """
+        country_codes = list(country_codes)
+        if sub_regions_1 is None:
+            sub_regions_1 = [''] * len(country_codes)
+        if sub_regions_2 is None:
+            sub_regions_2 = [''] * len(country_codes)
+        resolved = {}
+        dcids = []
+        for place in zip(country_codes, sub_regions_1, sub_regions_2):
+            place = tuple(
+                part if isinstance(part, str) else '' for part in place)
+            if place not in resolved:
+                resolved[place] = self.resolve(*place)
+            dcids.append(resolved[place])
+        return dcids
+
+    def lookup(self, key):
+        """Returns the dcid of an index key, or None if it is not found."""
+        if self._buffer is None:
+            self._load()
+        target = key.encode('utf-8')
+        low, high = 0, len(self._offsets)
+        while low < high:
+            mid = (low + high) // 2
+            start = self._data_start + self._offsets[mid]
+            tab = self._buffer.find(b'\t', start)
+            entry_key = self._buffer[start:tab]
+            if entry_key < target:
+                low = mid + 1
+            elif entry_key > target:
+                high = mid
+            else:
+                end = self._buffer.find(b'\n', tab)
+                return self._buffer[tab + 1:end].decode('utf-8')
+        return None
+
+    def _load(self):
+        index_path = self._index_path or _get_default_index_path()
+        if not os.path.exists(index_path):
+            try:
+                _write_index(index_path)
+            except OSError:
+                # The index cannot be cached, e.g., because the directory
+                # is read-only. Serve lookups from memory instead.
+                self._set_buffer(build_index(build_entries()))
+                return
+        with open(index_path, 'rb') as index:
+            self._set_buffer(
+                mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _set_buffer(self, buffer):
+        magic, count = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError('Not a place index')
+        offsets_end = _HEADER.size + count * array.array('I').itemsize
+        self._offsets = memoryview(buffer)[_HEADER.size:offsets_end].cast('I')
+        self._data_start = offsets_end
+        self._buffer = buffer
+
+
+def _write_index(index_path):
+    """Builds the index and atomically writes it to index_path."""
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    index = build_index(build_entries())
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path))
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(index)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _get_default_index_path():
+    """Returns the path of the index in the cache directory, named after a
+    hash of the source maps."""
+    digest = hashlib.sha256(_MAGIC)
+    util_dir = os.path.dirname(os.path.abspath(__file__))
+    for source in _SOURCES:
+        with open(os.path.join(util_dir, source), 'rb') as source_file:
+            digest.update(hashlib.sha256(source_file.read()).digest())
+    cache_dir = os.environ.get(
+        'DC_PLACE_INDEX_DIR',
+        os.path.join(os.path.expanduser('~'), '.cache', 'datacommons'))
+    return os.path.join(cache_dir,
+                        'place_index_%s.bin' % digest.hexdigest()[:16])
+
+
+@functools.lru_cache(maxsize=None)
+def _get_default_resolver():
+    return PlaceResolver()
+
+
+def resolve(country_code, sub_region_1='', sub_region_2=''):
+    """Resolves a place with the default PlaceResolver. See
+    PlaceResolver.resolve."""
+    return _get_default_resolver().resolve(country_code, sub_region_1,
+                                           sub_region_2)
+
+
+def resolve_many(country_codes, sub_regions_1=None, sub_regions_2=None):
+    """Resolves places with the default PlaceResolver. See
+    PlaceResolver.resolve_many."""
+    return _get_default_resolver().resolve_many(country_codes, sub_regions_1,
+                                                sub_regions_2)
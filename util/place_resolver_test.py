@@ -0,0 +1,75 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for util.place_resolver."""
+
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import tempfile
+import unittest
+
+from util import place_resolver
+
+
+class PlaceResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._index_path = os.path.join(self._tmp_dir.name, 'index.bin')
+        self._resolver = place_resolver.PlaceResolver(self._index_path)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_resolve(self):
+        self.assertEqual('country/ARE', self._resolver.resolve('AE'))
+        self.assertEqual('geoId/12', self._resolver.resolve('US', 'Florida'))
+        self.assertEqual(
+            'geoId/12086',
+            self._resolver.resolve('US', 'Florida', 'Miami-Dade County'))
+
+    def test_normalization(self):
+        self.assertEqual('geoId/11',
+                         self._resolver.resolve('us', 'District of Columbia'))
+        self.assertEqual(
+            'geoId/17037',
+            self._resolver.resolve('US', 'ILLINOIS', 'De Kalb County'))
+
+    def test_not_found(self):
+        self.assertIsNone(self._resolver.resolve('XX'))
+        self.assertIsNone(self._resolver.resolve('US', 'Atlantis'))
+        self.assertIsNone(self._resolver.resolve('ES', 'Florida'))
+        self.assertIsNone(self._resolver.resolve('US', '', 'Miami-Dade County'))
+
+    def test_resolve_many(self):
+        self.assertEqual(['country/USA', 'geoId/06', 'geoId/06', None],
+                         self._resolver.resolve_many(
+                             ['US', 'US', 'US', 'US'],
+                             [None, 'California', 'California', 'Atlantis']))
+
+    def test_index_reused(self):
+        self._resolver.resolve('US')
+        self.assertTrue(os.path.exists(self._index_path))
+        with open(self._index_path, 'rb') as index:
+            self.assertEqual(
+                place_resolver.build_index(place_resolver.build_entries()),
+                index.read())
+        reloaded = place_resolver.PlaceResolver(self._index_path)
+        self.assertEqual('geoId/06', reloaded.resolve('US', 'California'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,32 +11,173 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""General class to shard while writing strings to file."""
+"""General class to shard while writing strings to file.
+
+Strings are encoded as UTF-8 and collected in a buffer that is written to
+disk by a background thread once full, so that producers do not wait on file
+I/O. Shard sizes are measured in encoded bytes before compression.
+
+Usage:
+
+    with ShardingWriter('/tmp/output', write_manifest=True) as writer:
+        for node in nodes:
+            writer.write(node)
+
+writes /tmp/output_0.mcf, /tmp/output_1.mcf, ... and /tmp/output_manifest.json,
+which lists the shards with the number of strings and bytes written to each.
+The writer must be closed, either explicitly or by using it as a context
+manager, for the last shard to be written.
+"""
+
+import gzip
+import json
+import os
+import queue
+import threading
 
 
 class ShardingWriter:
-    """Helper class for writing strings to sharded files."""
+    """Helper class for writing strings to sharded files.
 
-    def __init__(self, base_path, file_extension='mcf', shard_size=104857600):
+    Strings are buffered in memory, so the last buffer is lost unless the
+    writer is closed. Writing to a closed writer raises a ValueError.
+    """
+
+    def __init__(self,
+                 base_path,
+                 file_extension='mcf',
+                 shard_size=104857600,
+                 buffer_size=8388608,
+                 compress=False,
+                 write_manifest=False):
+        """Constructs a ShardingWriter.
+
+        Args:
+            base_path: Path prefix of the shards. Shard i is written to
+                <base_path>_<i>.<file_extension>.
+            file_extension: Extension of the shards. '.gz' is appended to it
+                if compress is set.
+            shard_size: A new shard is started once the current one exceeds
+                this many bytes. Strings are never split across shards.
+            buffer_size: Number of bytes to collect before handing them to
+                the background thread. At most two buffers are pending at any
+                time.
+            compress: Whether to gzip the shards.
+            write_manifest: Whether to write <base_path>_manifest.json on
+                close.
+        """
         self._base_path = base_path
         self._file_extension = file_extension
+        if compress:
+            self._file_extension += '.gz'
         self._shard_size = shard_size
+        self._buffer_size = buffer_size
+        self._compress = compress
+        self._write_manifest = write_manifest
         self._shard_id = 0
         self._nbytes = 0
-        self._fptr = None
+        self._nrows = 0
+        self._buffer = []
+        self._nbuffered = 0
+        self._shards = []
+        self._closed = False
+        self._error = None
+        self._queue = queue.Queue(maxsize=2)
+        self._thread = threading.Thread(target=self._flush_worker, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def write(self, data):
-        """Write to current sharded file if the file has not exceeded size limit."""
-        if not self._fptr:
-            dest_file = '%s_%s.%s' % (self._base_path, self._shard_id,
-                                      self._file_extension)
-            self._fptr = open(dest_file, 'w')
-
-        self._fptr.write(data)
-        self._nbytes += len(data)
+        """Write to current sharded file if the file has not exceeded size limit.
+
+        Raises:
+            ValueError: The writer is closed.
+        """
+        if self._closed:
+            raise ValueError('write to closed ShardingWriter')
+        self._raise_error()
+        encoded = data.encode('utf-8')
+        self._buffer.append(encoded)
+        self._nbuffered += len(encoded)
+        self._nbytes += len(encoded)
+        self._nrows += 1
         if self._nbytes > self._shard_size:
             # Rollover shard.
-            self._fptr.close()
-            self._fptr = None
-            self._nbytes = 0
-            self._shard_id += 1
+            self._end_shard()
+        elif self._nbuffered >= self._buffer_size:
+            self._flush_buffer(close_shard=False)
+
+    def close(self):
+        """Writes the remaining data and waits for all writes to finish."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._nrows:
+            self._end_shard()
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+        if self._write_manifest:
+            with open('%s_manifest.json' % self._base_path, 'w') as out:
+                json.dump({'shards': self._shards}, out, indent=2)
+
+    def get_shards(self):
+        """Returns a list of dicts, one for each finished shard, with the keys
+        'path', 'rows' and 'bytes'."""
+        return list(self._shards)
+
+    def _shard_path(self, shard_id):
+        return '%s_%s.%s' % (self._base_path, shard_id, self._file_extension)
+
+    def _end_shard(self):
+        self._flush_buffer(close_shard=True)
+        self._shards.append({
+            'path': os.path.basename(self._shard_path(self._shard_id)),
+            'rows': self._nrows,
+            'bytes': self._nbytes
+        })
+        self._shard_id += 1
+        self._nbytes = 0
+        self._nrows = 0
+
+    def _flush_buffer(self, close_shard):
+        """Hands the buffer to the background thread, blocking if two
+        buffers are already pending."""
+        self._queue.put((self._shard_id, b''.join(self._buffer), close_shard))
+        self._buffer = []
+        self._nbuffered = 0
+
+    def _flush_worker(self):
+        """Writes buffers from the queue until None is received."""
+        fptr = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error:
+                # Keep draining the queue so that writers do not block.
+                continue
+            shard_id, data, close_shard = item
+            try:
+                if not fptr:
+                    if self._compress:
+                        fptr = gzip.open(self._shard_path(shard_id), 'wb')
+                    else:
+                        fptr = open(self._shard_path(shard_id), 'wb')
+                fptr.write(data)
+                if close_shard:
+                    fptr.close()
+                    fptr = None
+            except Exception as exc:  # pylint: disable=broad-except
+                self._error = exc
+        if fptr:
+            fptr.close()
+
+    def _raise_error(self):
+        if self._error:
+            raise IOError('Failed to write shard') from self._error
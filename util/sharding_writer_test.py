@@ -0,0 +1,105 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for util.sharding_writer."""
+
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from util import sharding_writer
+
+
+class ShardingWriterTest(unittest.TestCase):
+
+    def test_rollover(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            base_path = os.path.join(tmp_dir, 'out')
+            with sharding_writer.ShardingWriter(base_path,
+                                                shard_size=10,
+                                                buffer_size=4) as writer:
+                for i in range(5):
+                    writer.write('node%d\n' % i)
+            self.assertEqual(['out_0.mcf', 'out_1.mcf', 'out_2.mcf'],
+                             sorted(os.listdir(tmp_dir)))
+            with open(base_path + '_0.mcf') as shard:
+                self.assertEqual('node0\nnode1\n', shard.read())
+            with open(base_path + '_2.mcf') as shard:
+                self.assertEqual('node4\n', shard.read())
+
+    def test_counts_encoded_bytes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            base_path = os.path.join(tmp_dir, 'out')
+            # 'é' is one character but two bytes.
+            with sharding_writer.ShardingWriter(base_path,
+                                                shard_size=3) as writer:
+                writer.write('éé')
+                writer.write('a')
+            self.assertEqual([{
+                'path': 'out_0.mcf',
+                'rows': 1,
+                'bytes': 4
+            }, {
+                'path': 'out_1.mcf',
+                'rows': 1,
+                'bytes': 1
+            }], writer.get_shards())
+
+    def test_compress_and_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            base_path = os.path.join(tmp_dir, 'out')
+            with sharding_writer.ShardingWriter(base_path,
+                                                compress=True,
+                                                write_manifest=True) as writer:
+                writer.write('Node: a\n\n')
+                writer.write('Node: b\n\n')
+            with gzip.open(base_path + '_0.mcf.gz', 'rt') as shard:
+                self.assertEqual('Node: a\n\nNode: b\n\n', shard.read())
+            with open(base_path + '_manifest.json') as manifest:
+                self.assertEqual(
+                    {
+                        'shards': [{
+                            'path': 'out_0.mcf.gz',
+                            'rows': 2,
+                            'bytes': 18
+                        }]
+                    }, json.load(manifest))
+
+    def test_no_writes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            writer = sharding_writer.ShardingWriter(os.path.join(
+                tmp_dir, 'out'))
+            writer.close()
+            writer.close()
+            self.assertEqual([], os.listdir(tmp_dir))
+
+    def test_write_after_close(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'out')
+            with sharding_writer.ShardingWriter(path, buffer_size=1) as writer:
+                writer.write('a')
+            self.assertRaises(ValueError, writer.write, 'b')
+            self.assertRaises(ValueError, writer.write, 'c')
+            self.assertRaises(ValueError, writer.write, 'd')
+            with open(path + '_0.mcf') as shard:
+                self.assertEqual('a', shard.read())
+
+
+if __name__ == '__main__':
+    unittest.main()